@@ -188,7 +188,12 @@ done
 # Make some files available to the runtime builder Docker context
 mkdir -p builder/gen-dockerfile/data
 for file in \
+  scripts/async_frameworks.py \
+  scripts/build_context.py \
   scripts/gen_dockerfile.py \
+  scripts/gunicorn_config.py \
+  scripts/ignore_rules.py \
+  scripts/pinned_requirements.py \
   scripts/validation_utils.py \
   scripts/data/* \
   ; do
@@ -50,7 +50,13 @@ def lint(session):
         'flake8',
         '--import-order-style', 'google',
         '--application-import-names',
-        'gen_dockerfile,local_cloudbuild,validation_utils',
+        ('async_frameworks,benchmark_backends,benchmark_cold_import,'
+         'benchmark_image_size,benchmark_pinned_install,'
+         'benchmark_staging,benchmark_tooling,build_analysis,'
+         'build_context,build_trace,buildkit_cache,docker_api,'
+         'gen_dockerfile,gunicorn_config,ignore_rules,local_cloudbuild,'
+         'pinned_requirements,source_watch,'
+         'step_cache,step_executor,validation_utils,workspace_sync'),
         'scripts',
         'nox.py',
     )
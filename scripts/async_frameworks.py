@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Find the async framework of an application, and its gunicorn worker.
+
+ASGI applications (FastAPI, Starlette, Quart) and aiohttp ones don't
+run on gunicorn's default synchronous worker at all, and applications
+built on gevent or eventlet only serve one request at a time per
+worker.  A framework is recognized by the imports of the module the
+entrypoint names (or `main.py` without an entrypoint), or else by the
+packages in its requirements.  aiohttp is only recognized by imports
+of `aiohttp.web`, since it is often just an HTTP client.
+"""
+
+import collections
+import os
+import re
+
+import gunicorn_config
+
+
+# A framework and the gunicorn worker class that runs its applications.
+# `imports` and `requirements` are the module and package names it is
+# recognized by, `min_python_version` is the first version it supports,
+# and `server` is the package the worker class comes from, if it isn't
+# the framework's.
+Framework = collections.namedtuple(
+    'Framework',
+    'imports min_python_version name requirements server worker_class')
+
+UVICORN_WORKER = 'uvicorn.workers.UvicornWorker'
+
+# In order of precedence.  FastAPI is built on Starlette.
+FRAMEWORKS = (
+    Framework(imports=('fastapi',), min_python_version=(3, 6),
+              name='FastAPI', requirements=('fastapi',), server='uvicorn',
+              worker_class=UVICORN_WORKER),
+    Framework(imports=('starlette',), min_python_version=(3, 6),
+              name='Starlette', requirements=('starlette',),
+              server='uvicorn', worker_class=UVICORN_WORKER),
+    Framework(imports=('quart',), min_python_version=(3, 7),
+              name='Quart', requirements=('quart',), server='uvicorn',
+              worker_class=UVICORN_WORKER),
+    Framework(imports=('aiohttp.web',), min_python_version=(3, 5),
+              name='aiohttp', requirements=(), server=None,
+              worker_class='aiohttp.GunicornWebWorker'),
+    Framework(imports=('gevent',), min_python_version=None,
+              name='gevent', requirements=('gevent',), server=None,
+              worker_class='gevent'),
+    Framework(imports=('eventlet',), min_python_version=None,
+              name='eventlet', requirements=('eventlet',), server=None,
+              worker_class='eventlet'),
+)
+
+# Module and variable of applications without an entrypoint
+DEFAULT_APP = 'main:app'
+
+# `module:variable` argument of gunicorn
+APP_REGEX = re.compile(r'^([A-Za-z_][\w.]*):[A-Za-z_]')
+
+# Import statements, at the start of a line
+IMPORT_REGEX = re.compile(
+    r'^[ \t]*(?:from[ \t]+([\w.]+)[ \t]+import[ \t]+\(?([\w \t,]+)'
+    r'|import[ \t]+([\w \t.,]+))', re.MULTILINE)
+
+# Name of the package of a requirements.txt line
+REQUIREMENT_REGEX = re.compile(r'^\s*([A-Za-z0-9][A-Za-z0-9._-]*)')
+
+
+def normalize(name):
+    """Normalize a package name, like pip does (PEP 503)"""
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def get_requirement_names(text):
+    """Return the normalized package names of a requirements file"""
+    names = set()
+    for line in text.splitlines():
+        match = REQUIREMENT_REGEX.match(line)
+        if match:
+            names.add(normalize(match.group(1)))
+    return names
+
+
+def get_imports(text):
+    """Return the modules a Python source file imports.
+
+    Python 2 sources are read too.  `from a import b` imports both `a`
+    and `a.b`, since `b` might be a module.
+    """
+    modules = set()
+    for match in IMPORT_REGEX.finditer(text):
+        from_module, from_names, imports = match.groups()
+        if from_module:
+            modules.add(from_module)
+            for name in from_names.split(','):
+                words = name.split()
+                if words:
+                    modules.add(from_module + '.' + words[0])
+        else:
+            for name in imports.split(','):
+                words = name.split()
+                if words:
+                    modules.add(words[0])
+    return modules
+
+
+def get_app_module(entrypoint):
+    """Return the module of the application an entrypoint runs.
+
+    Args:
+        entrypoint (str): Entrypoint, with or without `exec `, or ''
+
+    Returns:
+        str: Module name, or None if the entrypoint doesn't run gunicorn
+    """
+    if not entrypoint:
+        return DEFAULT_APP.split(':')[0]
+    for argument in gunicorn_config.get_arguments(entrypoint) or []:
+        match = APP_REGEX.match(argument)
+        if match:
+            return match.group(1)
+    return None
+
+
+def _read(path):
+    """Return the contents of a file of the application, or None"""
+    try:
+        with open(path, 'r', encoding='utf8', errors='replace') as f:
+            return f.read()
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def read_requirements(source_dir):
+    """Return the contents of requirements.txt, or ''"""
+    return _read(os.path.join(source_dir, 'requirements.txt')) or ''
+
+
+def read_module(source_dir, module):
+    """Return the source of a module of the application, or ''"""
+    if module is None:
+        return ''
+    base = os.path.join(source_dir, *module.split('.'))
+    for path in (base + '.py', os.path.join(base, '__init__.py')):
+        source = _read(path)
+        if source is not None:
+            return source
+    return ''
+
+
+def _imports(modules, name):
+    return any(module == name or module.startswith(name + '.')
+               for module in modules)
+
+
+def detect(source, requirements):
+    """Find the async framework of an application.
+
+    Args:
+        source (str): Source of the module the entrypoint runs
+        requirements (str): Contents of the application's requirements
+
+    Returns:
+        Framework: Framework found, or None
+    """
+    modules = get_imports(source)
+    for framework in FRAMEWORKS:
+        if any(_imports(modules, name) for name in framework.imports):
+            return framework
+    names = get_requirement_names(requirements)
+    for framework in FRAMEWORKS:
+        if names.intersection(framework.requirements):
+            return framework
+    return None
+
+
+def python_version_problem(framework, python_version):
+    """Describe why an interpreter can't run a framework, if it can't.
+
+    Args:
+        framework (Framework): Framework of the application
+        python_version (str): Value of AppConfig.dockerfile_python_version
+
+    Returns:
+        str: Problem, or None
+    """
+    version = tuple(int(part) for part in python_version.split('.')
+                    if part) or (2, 7)
+    minimum = framework.min_python_version
+    if minimum is None or version >= minimum:
+        return None
+    return ('{} needs Python {} or later, but the "python_version" of the '
+            '"runtime_config" section of app.yaml selects Python {}'.format(
+                framework.name, '.'.join(str(part) for part in minimum),
+                '.'.join(str(part) for part in version)))
+
+
+def server_problem(framework, requirements):
+    """Describe which package of a worker class is missing, if any"""
+    if framework.server and normalize(framework.server) not in (
+            get_requirement_names(requirements)):
+        return ('The {} worker needs the "{}" package, which is not in the '
+                'requirements of the application'.format(
+                    framework.worker_class, framework.server))
+    return None
+
+
+def get_entrypoint(entrypoint, framework):
+    """Return a gunicorn entrypoint running a framework's worker class.
+
+    Args:
+        entrypoint (str): Entrypoint of app.yaml, with `exec `, or ''
+        framework (Framework): Framework of the application
+
+    Returns:
+        str: Entrypoint, unchanged if it chooses a worker class or runs
+            something other than gunicorn
+    """
+    worker_arguments = ['--worker-class', framework.worker_class]
+    if not entrypoint:
+        return 'exec gunicorn -b :$PORT {} {}'.format(
+            ' '.join(worker_arguments), DEFAULT_APP)
+    arguments = gunicorn_config.get_arguments(entrypoint)
+    if arguments is None or gunicorn_config.sets_worker_class(arguments):
+        return entrypoint
+    return gunicorn_config.insert_arguments(entrypoint, worker_arguments)
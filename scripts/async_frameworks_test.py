@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit test for async_frameworks.py"""
+
+import pytest
+
+import async_frameworks
+
+
+def _framework(name):
+    for framework in async_frameworks.FRAMEWORKS:
+        if framework.name == name:
+            return framework
+    raise KeyError(name)
+
+
+def test_get_imports():
+    assert async_frameworks.get_imports(
+        'import os, sys as system\n'
+        'from fastapi import FastAPI, Request\n'
+        '    from aiohttp import (web,\n'
+        'from . import views\n'
+        '# import gevent\n'
+        'x = "import eventlet"\n'
+    ) == {'os', 'sys', 'fastapi', 'fastapi.FastAPI', 'fastapi.Request',
+          'aiohttp', 'aiohttp.web', '.', '..views'}
+
+
+def test_get_requirement_names():
+    assert async_frameworks.get_requirement_names(
+        '# comment\n'
+        'Flask==1.0\n'
+        'uvicorn[standard]>=0.20 ; python_version >= "3.7"\n'
+        '  aiohttp_jinja2\n'
+        '-r other.txt\n'
+        'gevent \\\n    --hash=sha256:abc\n'
+    ) == {'flask', 'uvicorn', 'aiohttp-jinja2', 'gevent'}
+
+
+@pytest.mark.parametrize('source, requirements, expected', [
+    ('', '', None),
+    ('import flask\n', 'Flask\n', None),
+    ('from fastapi import FastAPI\n', '', 'FastAPI'),
+    ('from starlette.applications import Starlette\n', '', 'Starlette'),
+    ('import quart\n', '', 'Quart'),
+    ('from aiohttp import web\n', '', 'aiohttp'),
+    ('import aiohttp.web\n', '', 'aiohttp'),
+    ('import eventlet\neventlet.monkey_patch()\n', '', 'eventlet'),
+    # FastAPI is built on Starlette
+    ('import starlette\nimport fastapi\n', '', 'FastAPI'),
+    # Imports of the module win over requirements
+    ('import gevent\n', 'fastapi\nuvicorn\n', 'gevent'),
+    # Requirements, when the module doesn't tell
+    ('import flask\n', 'Flask\nEventlet==0.24.1\n', 'eventlet'),
+    ('', 'fastapi\nuvicorn\n', 'FastAPI'),
+    # aiohttp as an HTTP client
+    ('import aiohttp\n', '', None),
+    ('import flask\n', 'aiohttp\n', None),
+])
+def test_detect(source, requirements, expected):
+    framework = async_frameworks.detect(source, requirements)
+    assert (framework and framework.name) == expected
+
+
+@pytest.mark.parametrize('entrypoint, expected', [
+    ('', 'main'),
+    ('exec gunicorn -b :$PORT app.wsgi:application', 'app.wsgi'),
+    ('exec gunicorn -k gevent -b :$PORT server:app', 'server'),
+    ('exec uvicorn main:app', None),
+    ('exec python main.py', None),
+])
+def test_get_app_module(entrypoint, expected):
+    assert async_frameworks.get_app_module(entrypoint) == expected
+
+
+def test_read_module(tmpdir):
+    tmpdir.join('main.py').write('import quart\n')
+    tmpdir.mkdir('app').join('__init__.py').write('import gevent\n')
+    assert async_frameworks.read_module(str(tmpdir), 'main') == (
+        'import quart\n')
+    assert async_frameworks.read_module(str(tmpdir), 'app') == (
+        'import gevent\n')
+    assert async_frameworks.read_module(str(tmpdir), 'main.views') == ''
+    assert async_frameworks.read_module(str(tmpdir), 'missing') == ''
+    assert async_frameworks.read_module(str(tmpdir), None) == ''
+
+
+@pytest.mark.parametrize('name, python_version, expected', [
+    ('FastAPI', '3.6', None),
+    ('Quart', '3.7', None),
+    ('Quart', '3.6', 'Quart needs Python 3.7 or later, but the '
+     '"python_version" of the "runtime_config" section of app.yaml '
+     'selects Python 3.6'),
+    ('aiohttp', '', 'aiohttp needs Python 3.5 or later, but the '
+     '"python_version" of the "runtime_config" section of app.yaml '
+     'selects Python 2.7'),
+    ('gevent', '', None),
+])
+def test_python_version_problem(name, python_version, expected):
+    assert async_frameworks.python_version_problem(
+        _framework(name), python_version) == expected
+
+
+def test_server_problem():
+    fastapi = _framework('FastAPI')
+    assert async_frameworks.server_problem(
+        fastapi, 'fastapi\nUvicorn\n') is None
+    assert 'uvicorn' in async_frameworks.server_problem(fastapi, 'fastapi\n')
+    assert async_frameworks.server_problem(_framework('aiohttp'), '') is None
+
+
+@pytest.mark.parametrize('entrypoint, name, expected', [
+    ('', 'FastAPI', 'exec gunicorn -b :$PORT --worker-class '
+     'uvicorn.workers.UvicornWorker main:app'),
+    ('exec gunicorn -b :$PORT main:app', 'eventlet',
+     'exec gunicorn --worker-class eventlet -b :$PORT main:app'),
+    ('exec gunicorn -b :$PORT main:app', 'aiohttp',
+     'exec gunicorn --worker-class aiohttp.GunicornWebWorker -b :$PORT '
+     'main:app'),
+    # The user's choice of worker class wins
+    ('exec gunicorn -k sync -b :$PORT main:app', 'gevent',
+     'exec gunicorn -k sync -b :$PORT main:app'),
+    # Something other than gunicorn
+    ('exec uvicorn --port $PORT main:app', 'FastAPI',
+     'exec uvicorn --port $PORT main:app'),
+])
+def test_get_entrypoint(entrypoint, name, expected):
+    assert async_frameworks.get_entrypoint(
+        entrypoint, _framework(name)) == expected
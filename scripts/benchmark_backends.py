@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare the per-step overhead of local_cloudbuild's Docker backends.
+
+Runs the same trivial step (`true`) a number of times, one after the
+other, with a `docker run` process per step and with the Engine API,
+and prints the median and mean wall time per step.  The step itself
+does nothing, so the times are what each backend adds to every step.
+
+With --fake, the stand-ins for the docker CLI and daemon from the
+unit tests are used instead of a real daemon.  Steps then run on the
+host and the times only show the client side of the overhead.
+"""
+
+import argparse
+import io
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import docker_api
+import local_cloudbuild
+import step_executor
+
+
+FAKE_DOCKER_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'testdata', 'fake_docker')
+
+
+def make_steps(image, count):
+    step = local_cloudbuild.Step(
+        args=['true'], dir_='', env=[], id_='', name=image, timeout=0,
+        volumes=[], wait_for=None)
+    return [
+        step_executor.ExecutableStep(
+            command=local_cloudbuild.generate_command(step, {}, set()),
+            container=local_cloudbuild.generate_container(step, {}, set()),
+            dependencies=[],
+            id_='',
+            image=image,
+            timeout=0,
+        )
+        for _ in range(count)]
+
+
+def time_steps(steps, workspace, client):
+    """Return the wall time of each step, run one at a time"""
+    times = []
+    env = dict(os.environ, HOST_WORKSPACE=workspace)
+    for step in steps:
+        start = time.perf_counter()
+        results = step_executor.run_steps(
+            [step], env, jobs=1, client=client, out=io.StringIO(),
+            err=io.StringIO())
+        times.append(time.perf_counter() - start)
+        if results[0].status != step_executor.STATUS_SUCCESS:
+            raise RuntimeError('Step failed with backend {}'.format(
+                'api' if client else 'cli'))
+    return times
+
+
+def start_fake_daemon(socket_path):
+    server = subprocess.Popen([
+        sys.executable, os.path.join(FAKE_DOCKER_DIR, 'dockerd'),
+        socket_path])
+    while not os.path.exists(socket_path):
+        time.sleep(0.01)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--image', default=local_cloudbuild.DEBIAN_IMAGE)
+    parser.add_argument('--docker-socket',
+                        default=docker_api.default_socket_path())
+    parser.add_argument('--fake', action='store_true',
+                        help='Use the stand-ins from the unit tests')
+    args = parser.parse_args(sys.argv[1:])
+
+    root = tempfile.mkdtemp(prefix='benchmark_backends_')
+    server = None
+    try:
+        socket_path = args.docker_socket
+        if args.fake:
+            os.environ['PATH'] = FAKE_DOCKER_DIR + os.pathsep + (
+                os.environ['PATH'])
+            socket_path = os.path.join(root, 'docker.sock')
+            server = start_fake_daemon(socket_path)
+        workspace = os.path.join(root, 'workspace')
+        os.mkdir(workspace)
+        client = docker_api.DockerClient(socket_path)
+        client.ping()
+
+        steps = make_steps(args.image, args.steps)
+        # Make sure the image is present before timing anything
+        step_executor.pull_image(args.image, client)
+        print('{} steps of `true` in {}'.format(args.steps, args.image))
+        for label, backend_client in [('docker run per step', None),
+                                      ('Engine API', client)]:
+            times = time_steps(steps, workspace, backend_client)
+            print('{:<24} p50 {:>8.1f}ms  mean {:>8.1f}ms'.format(
+                label, statistics.median(times) * 1000,
+                statistics.mean(times) * 1000))
+        client.close()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit test for benchmark_backends.py"""
+
+import os
+import sys
+import unittest.mock
+
+import pytest
+
+import benchmark_backends
+
+
+def test_main_fake(monkeypatch, capsys):
+    # main() puts the stand-ins first on $PATH
+    monkeypatch.setenv('PATH', os.environ['PATH'])
+    argv = ['benchmark_backends', '--fake', '--steps=2']
+    with unittest.mock.patch.object(sys, 'argv', argv):
+        benchmark_backends.main()
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].startswith('2 steps of `true` in ')
+    assert lines[1].startswith('docker run per step ')
+    assert lines[2].startswith('Engine API ')
+
+
+def test_time_steps_failure(monkeypatch, tmpdir):
+    monkeypatch.setenv('PATH', benchmark_backends.FAKE_DOCKER_DIR +
+                       os.pathsep + os.environ['PATH'])
+    steps = benchmark_backends.make_steps('debian', 1)
+    steps[0].command[-1] = 'false'
+    with pytest.raises(RuntimeError, match='backend cli'):
+        benchmark_backends.time_steps(steps, str(tmpdir), None)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare cold imports with and without precompiled bytecode.
+
+Builds an application image (by default the hello_world test app)
+with and without `runtime_config.compile_bytecode`.  Then the app's
+module is imported a number of times, each time in a new container,
+the way a new instance would import it.  The median and mean wall
+times of the imports are printed.
+"""
+
+import argparse
+import io
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+import gen_dockerfile
+
+
+HELLO_WORLD_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'testdata', 'hello_world')
+
+# Local name of the images built
+IMAGE_NAME = 'benchmark_cold_import'
+
+
+def build_image(app_dir, workdir, base_image, compile_bytecode):
+    """Build an app with or without precompiled bytecode"""
+    tag = 'compiled' if compile_bytecode else 'plain'
+    source_dir = os.path.join(workdir, tag)
+    shutil.copytree(app_dir, source_dir)
+    config_file = os.path.join(source_dir, 'app.yaml')
+    with io.open(config_file, 'r', encoding='utf8') as f:
+        raw_config = yaml.safe_load(f)
+    raw_config.setdefault('runtime_config', {})
+    raw_config['runtime_config']['compile_bytecode'] = compile_bytecode
+    with io.open(config_file, 'w', encoding='utf8') as f:
+        yaml.safe_dump(raw_config, f, default_flow_style=False)
+    gen_dockerfile.generate_dockerfile_command(
+        base_image, config_file, source_dir)
+    image = '{}:{}'.format(IMAGE_NAME, tag)
+    subprocess.check_call(['docker', 'build', '--tag', image, source_dir],
+                          stdout=subprocess.DEVNULL)
+    return image
+
+
+def time_imports(image, module, runs):
+    """Time importing a module in a new container, over several runs.
+
+    The time of an empty container is subtracted from each run.
+    """
+    def run(code):
+        start = time.perf_counter()
+        subprocess.check_call(
+            ['docker', 'run', '--rm', image, 'python', '-c', code])
+        return time.perf_counter() - start
+
+    times = []
+    for _ in range(runs):
+        baseline = run('pass')
+        times.append(run('import {}'.format(module)) - baseline)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app-dir', default=HELLO_WORLD_DIR)
+    parser.add_argument('--module', default='main',
+                        help='Module of the application to import')
+    parser.add_argument('--base-image',
+                        default='gcr.io/google-appengine/python:latest')
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args(sys.argv[1:])
+
+    workdir = tempfile.mkdtemp(prefix='benchmark_cold_import_')
+    try:
+        print('Cold `import {}`, {} runs'.format(args.module, args.runs))
+        for compile_bytecode in (False, True):
+            image = build_image(args.app_dir, workdir, args.base_image,
+                                compile_bytecode)
+            times = time_imports(image, args.module, args.runs)
+            print('{:<24} p50 {:>8.1f}ms  mean {:>8.1f}ms'.format(
+                'precompiled' if compile_bytecode else 'compiled on import',
+                statistics.median(times) * 1000,
+                statistics.mean(times) * 1000))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
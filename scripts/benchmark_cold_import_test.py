@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit test for benchmark_cold_import.py"""
+
+import os
+import subprocess
+import sys
+import unittest.mock
+
+import benchmark_cold_import
+
+
+def test_main(monkeypatch, capsys):
+    commands = []
+    dockerfiles = {}
+
+    def check_call(args, **kwargs):
+        commands.append(args)
+        if args[:2] == ['docker', 'build']:
+            with open(os.path.join(args[-1], 'Dockerfile')) as f:
+                dockerfiles[args[3]] = f.read()
+
+    monkeypatch.setattr(subprocess, 'check_call', check_call)
+    argv = ['benchmark_cold_import', '--runs=2', '--module=main']
+    with unittest.mock.patch.object(sys, 'argv', argv):
+        benchmark_cold_import.main()
+
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == 'Cold `import main`, 2 runs'
+    assert lines[1].startswith('compiled on import ')
+    assert lines[2].startswith('precompiled ')
+    # Only the compiled image precompiles
+    assert 'compileall' not in dockerfiles['benchmark_cold_import:plain']
+    assert 'compileall' in dockerfiles['benchmark_cold_import:compiled']
+    # An empty container and an import, twice for each image
+    runs = [command[-1] for command in commands
+            if command[:2] == ['docker', 'run']]
+    assert runs == ['pass', 'import main'] * 4
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare single-stage and multi-stage application images.
+
+Generates both Dockerfiles for an application (by default the
+hello_world test app), builds them, and prints the size of each image
+and of its gzipped layers, which is roughly what instances download.
+
+With --registry, both images are also pushed there, removed locally
+and pulled again, and the pull times are printed.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zlib
+
+import gen_dockerfile
+
+
+HELLO_WORLD_DIR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'testdata', 'hello_world')
+
+# Local name of the images built
+IMAGE_NAME = 'benchmark_image_size'
+
+
+def build_image(app_dir, workdir, tag, base_image, slim_base_image):
+    """Generate a Dockerfile for a copy of an app and build it"""
+    source_dir = os.path.join(workdir, tag)
+    shutil.copytree(app_dir, source_dir)
+    gen_dockerfile.generate_dockerfile_command(
+        base_image, os.path.join(source_dir, 'app.yaml'), source_dir,
+        slim_base_image=slim_base_image)
+    image = '{}:{}'.format(IMAGE_NAME, tag)
+    subprocess.check_call(['docker', 'build', '--tag', image, source_dir],
+                          stdout=subprocess.DEVNULL)
+    return image
+
+
+def image_size(image):
+    """Return the uncompressed size of an image, in bytes"""
+    return int(subprocess.check_output(
+        ['docker', 'image', 'inspect', '--format', '{{.Size}}', image]))
+
+
+def compressed_size(image):
+    """Return the size of an image's gzipped `docker save` archive"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    size = 0
+    process = subprocess.Popen(['docker', 'save', image],
+                               stdout=subprocess.PIPE)
+    for chunk in iter(lambda: process.stdout.read(1 << 20), b''):
+        size += len(compressor.compress(chunk))
+    size += len(compressor.flush())
+    if process.wait():
+        raise subprocess.CalledProcessError(process.returncode, 'docker save')
+    return size
+
+
+def pull_time(image, registry):
+    """Push an image, remove it locally and time pulling it back"""
+    remote = '{}/{}'.format(registry, image)
+    subprocess.check_call(['docker', 'tag', image, remote])
+    subprocess.check_call(['docker', 'push', remote],
+                          stdout=subprocess.DEVNULL)
+    subprocess.check_call(['docker', 'image', 'rm', remote],
+                          stdout=subprocess.DEVNULL)
+    start = time.perf_counter()
+    subprocess.check_call(['docker', 'pull', remote],
+                          stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app-dir', default=HELLO_WORLD_DIR)
+    parser.add_argument('--base-image',
+                        default='gcr.io/google-appengine/python:latest')
+    parser.add_argument('--slim-base-image',
+                        default=gen_dockerfile.DEFAULT_SLIM_BASE_IMAGE)
+    parser.add_argument('--registry',
+                        help='Push and pull the images to time pulls')
+    args = parser.parse_args(sys.argv[1:])
+
+    workdir = tempfile.mkdtemp(prefix='benchmark_image_size_')
+    try:
+        print('{:<14} {:>12} {:>12} {:>10}'.format(
+            'Dockerfile', 'Size', 'Gzipped', 'Pull'))
+        for tag, slim_base_image in [('single-stage', None),
+                                     ('multi-stage', args.slim_base_image)]:
+            image = build_image(args.app_dir, workdir, tag, args.base_image,
+                                slim_base_image)
+            if args.registry:
+                pull = '{:.1f}s'.format(pull_time(image, args.registry))
+            else:
+                pull = '-'
+            print('{:<14} {:>10.1f}MB {:>10.1f}MB {:>10}'.format(
+                tag, image_size(image) / 2**20,
+                compressed_size(image) / 2**20, pull))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit test for benchmark_image_size.py"""
+
+import io
+import os
+import subprocess
+import sys
+import unittest.mock
+
+import pytest
+
+import benchmark_image_size
+
+
+class FakeDocker(object):
+    """Records docker commands, and answers them without a daemon"""
+
+    def __init__(self, save_exit_code=0):
+        self.commands = []
+        self.save_exit_code = save_exit_code
+
+    def check_call(self, args, **kwargs):
+        self.commands.append(args)
+        if args[:2] == ['docker', 'build']:
+            # The Dockerfile was generated before the build
+            assert os.path.isfile(os.path.join(args[-1], 'Dockerfile'))
+
+    def check_output(self, args, **kwargs):
+        self.commands.append(args)
+        return b'3145728\n'
+
+    def popen(self, args, **kwargs):
+        self.commands.append(args)
+        process = unittest.mock.Mock()
+        process.stdout = io.BytesIO(b'layer' * 1000)
+        process.wait.return_value = self.save_exit_code
+        process.returncode = self.save_exit_code
+        return process
+
+
+@pytest.fixture
+def fake_docker(monkeypatch):
+    docker = FakeDocker()
+    monkeypatch.setattr(subprocess, 'check_call', docker.check_call)
+    monkeypatch.setattr(subprocess, 'check_output', docker.check_output)
+    monkeypatch.setattr(subprocess, 'Popen', docker.popen)
+    return docker
+
+
+@pytest.mark.parametrize('registry, pull_column', [
+    (None, '-'),
+    ('localhost:5000', 's'),
+])
+def test_main(fake_docker, capsys, registry, pull_column):
+    argv = ['benchmark_image_size']
+    if registry:
+        argv.append('--registry=' + registry)
+    with unittest.mock.patch.object(sys, 'argv', argv):
+        benchmark_image_size.main()
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split() == ['Dockerfile', 'Size', 'Gzipped', 'Pull']
+    assert [line.split()[:2] for line in lines[1:]] == [
+        ['single-stage', '3.0MB'], ['multi-stage', '3.0MB']]
+    assert all(line.endswith(pull_column) for line in lines[1:])
+    pushes = [command for command in fake_docker.commands
+              if command[:2] == ['docker', 'push']]
+    assert len(pushes) == (2 if registry else 0)
+
+
+def test_compressed_size_failure(fake_docker):
+    fake_docker.save_exit_code = 1
+    with pytest.raises(subprocess.CalledProcessError):
+        benchmark_image_size.compressed_size('image')
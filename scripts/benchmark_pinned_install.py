@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare installing requirements with and without resolving them.
+
+Installs a requirements file (by default the python3-libraries test
+set) into a new virtualenv, the way the generated Dockerfile does when
+dependencies are not fully pinned.  The installed packages are then
+frozen, hashed, and installed into another virtualenv the way fully
+pinned dependencies are, without resolving anything.  Each install
+starts with an empty pip cache.  The wall time of both installs is
+printed.
+"""
+
+import argparse
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pinned_requirements
+
+
+PYTHON3_LIBRARIES = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'tests', 'python3-libraries', 'requirements.txt')
+
+# Packages of every virtualenv, left out of the frozen requirements
+VIRTUALENV_PACKAGES = ('pip', 'pkg-resources', 'setuptools', 'wheel')
+
+
+def make_virtualenv(python, path):
+    subprocess.check_call([python, '-m', 'venv', path])
+    return os.path.join(path, 'bin', 'pip')
+
+
+def timed_install(pip, args, cache_dir):
+    """Run `pip install` with an empty cache, and return its wall time"""
+    env = dict(os.environ, PIP_CACHE_DIR=cache_dir)
+    start = time.perf_counter()
+    subprocess.check_call([pip, 'install', '--quiet'] + args, env=env)
+    return time.perf_counter() - start
+
+
+def hash_requirements(pip, frozen, download_dir):
+    """Return hash-checked requirements for frozen ones.
+
+    Each requirement is downloaded on its own, so that the file it
+    resolves to is known.
+    """
+    lines = []
+    for index, requirement in enumerate(frozen):
+        directory = os.path.join(download_dir, str(index))
+        subprocess.check_call([pip, 'download', '--quiet', '--no-deps',
+                               '--dest', directory, requirement])
+        [filename] = os.listdir(directory)
+        with open(os.path.join(directory, filename), 'rb') as f:
+            digest = 'sha256:' + hashlib.sha256(f.read()).hexdigest()
+        name, _, version = requirement.partition('==')
+        lines.append(pinned_requirements.format_requirement(
+            name, version, [digest]))
+    return ''.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requirements', default=PYTHON3_LIBRARIES)
+    parser.add_argument('--python', default=sys.executable,
+                        help='Interpreter of the virtualenvs')
+    args = parser.parse_args(sys.argv[1:])
+
+    root = tempfile.mkdtemp(prefix='benchmark_pinned_install_')
+    try:
+        pip = make_virtualenv(args.python, os.path.join(root, 'resolved'))
+        resolved = timed_install(
+            pip, ['-r', args.requirements], os.path.join(root, 'cache1'))
+
+        frozen = [
+            line for line in subprocess.check_output(
+                [pip, 'freeze', '--all']).decode('utf8').splitlines()
+            if '==' in line and
+            line.split('==')[0].lower() not in VIRTUALENV_PACKAGES]
+        pinned_path = os.path.join(root, 'requirements.pinned.txt')
+        with open(pinned_path, 'w') as f:
+            f.write(hash_requirements(pip, frozen,
+                                      os.path.join(root, 'downloads')))
+
+        pip = make_virtualenv(args.python, os.path.join(root, 'pinned'))
+        pinned = timed_install(
+            pip, ['--no-deps', '--require-hashes', '-r', pinned_path],
+            os.path.join(root, 'cache2'))
+
+        print('{} packages from {}'.format(len(frozen), args.requirements))
+        print('{:<32} {:>8.1f}s'.format('pip install -r (resolving)',
+                                        resolved))
+        print('{:<32} {:>8.1f}s'.format('pinned, --no-deps, hash-checked',
+                                        pinned))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
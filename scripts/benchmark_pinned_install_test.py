@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit test for benchmark_pinned_install.py"""
+
+import hashlib
+import os
+import subprocess
+import sys
+import unittest.mock
+
+import benchmark_pinned_install
+
+
+FREEZE = b'pip==23.0\nsix==1.16.0\nFlask==1.0.2\n-e git+https://x#egg=y\n'
+
+
+def test_main(monkeypatch, capsys, tmpdir):
+    commands = []
+    pinned = []
+
+    def check_call(args, **kwargs):
+        commands.append(args)
+        if args[1:3] == ['-m', 'venv']:
+            os.makedirs(os.path.join(args[3], 'bin'))
+        elif args[1] == 'download':
+            directory = args[args.index('--dest') + 1]
+            os.makedirs(directory)
+            with open(os.path.join(directory, args[-1] + '.whl'), 'wb') as f:
+                f.write(args[-1].encode('utf8'))
+        elif '--require-hashes' in args:
+            with open(args[-1]) as f:
+                pinned.append(f.read())
+            # The pinned install doesn't reuse the first install's cache
+            assert kwargs['env']['PIP_CACHE_DIR'].endswith('cache2')
+
+    monkeypatch.setattr(subprocess, 'check_call', check_call)
+    monkeypatch.setattr(subprocess, 'check_output',
+                        lambda args, **kwargs: FREEZE)
+    requirements = tmpdir.join('requirements.txt')
+    requirements.write('flask\n')
+    argv = ['benchmark_pinned_install', '--requirements', str(requirements),
+            '--python', 'python3']
+    with unittest.mock.patch.object(sys, 'argv', argv):
+        benchmark_pinned_install.main()
+
+    # pip and the editable requirement are left out
+    digest = hashlib.sha256(b'Flask==1.0.2').hexdigest()
+    assert 'Flask==1.0.2 \\\n    --hash=sha256:{}\n'.format(digest) in (
+        pinned[0])
+    assert 'pip==' not in pinned[0]
+    assert commands[0][:3] == ['python3', '-m', 'venv']
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == '2 packages from {}'.format(requirements)
+    assert lines[1].startswith('pip install -r (resolving) ')
+    assert lines[2].startswith('pinned, --no-deps, hash-checked ')
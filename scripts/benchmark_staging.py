@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare ways of staging a local_cloudbuild workspace.
+
+Creates a synthetic source tree and times:
+
+  * the rsync command from BUILD_SCRIPT_TEMPLATE, into a new directory
+    (skipped if rsync isn't installed)
+  * a full copy into a new directory, as the Python executor does
+    without --persistent-workspace
+  * bringing a persistent workspace up to date, with no changes and
+    with a fraction of the files changed
+
+Container-based cleanup is not timed, since it needs a Docker daemon.
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import workspace_sync
+
+
+def make_tree(root, num_files, file_size, files_per_dir=100):
+    """Create `num_files` files of `file_size` bytes below `root`"""
+    data = os.urandom(file_size)
+    for index in range(num_files):
+        subdir = os.path.join(root, 'dir{:04d}'.format(index // files_per_dir))
+        if index % files_per_dir == 0:
+            os.makedirs(subdir)
+        with open(os.path.join(subdir, 'file{}.py'.format(index)), 'wb') as f:
+            f.write(data)
+
+
+def touch_fraction(root, fraction):
+    """Rewrite a fraction of the files below `root`, returning the count"""
+    paths = []
+    for dirpath, _, filenames in os.walk(root):
+        paths.extend(os.path.join(dirpath, name) for name in filenames)
+    paths.sort()
+    changed = paths[::max(int(1 / fraction), 1)] if fraction else []
+    for path in changed:
+        with open(path, 'ab') as f:
+            f.write(b'#')
+    return len(changed)
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def rsync_fresh(source_dir):
+    workspace = tempfile.mkdtemp(prefix='benchmark_staging_')
+    try:
+        subprocess.check_call(
+            ['rsync', '-avzq', '--exclude=.git', '.', workspace],
+            cwd=source_dir)
+    finally:
+        shutil.rmtree(workspace)
+
+
+def copy_fresh(source_dir, link_mode):
+    workspace = tempfile.mkdtemp(prefix='benchmark_staging_')
+    try:
+        workspace_sync.sync_tree(source_dir, workspace, link_mode)
+    finally:
+        shutil.rmtree(workspace)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=20000)
+    parser.add_argument('--file-size', type=int, default=4096)
+    parser.add_argument('--changed-fraction', type=float, default=0.01)
+    parser.add_argument('--dir', default=None,
+                        help='Directory for the synthetic tree, default '
+                             'a temporary directory')
+    args = parser.parse_args(sys.argv[1:])
+
+    root = tempfile.mkdtemp(prefix='benchmark_staging_', dir=args.dir)
+    try:
+        source_dir = os.path.join(root, 'source')
+        make_tree(source_dir, args.files, args.file_size)
+        print('Synthetic tree: {} files of {} bytes'.format(
+            args.files, args.file_size))
+
+        rows = []
+        if shutil.which('rsync'):
+            rows.append(('rsync -avzq into new directory (current)',
+                         timed(rsync_fresh, source_dir)[0]))
+        else:
+            rows.append(('rsync -avzq into new directory (current)', None))
+        for link_mode in workspace_sync.LINK_MODES:
+            rows.append(('sync into new directory, {}'.format(link_mode),
+                         timed(copy_fresh, source_dir, link_mode)[0]))
+
+        persistent = os.path.join(root, 'persistent')
+        elapsed, _ = timed(workspace_sync.sync_tree, source_dir, persistent,
+                           workspace_sync.LINK_MODE_AUTO)
+        rows.append(('persistent workspace, first sync', elapsed))
+        elapsed, _ = timed(workspace_sync.sync_tree, source_dir, persistent,
+                           workspace_sync.LINK_MODE_AUTO)
+        rows.append(('persistent workspace, no changes', elapsed))
+        changed = touch_fraction(source_dir, args.changed_fraction)
+        elapsed, _ = timed(workspace_sync.sync_tree, source_dir, persistent,
+                           workspace_sync.LINK_MODE_AUTO)
+        rows.append(('persistent workspace, {} files changed'.format(changed),
+                     elapsed))
+
+        for label, elapsed in rows:
+            if elapsed is None:
+                print('{:<48} {:>10}'.format(label, 'n/a'))
+            else:
+                print('{:<48} {:>9.3f}s'.format(label, elapsed))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
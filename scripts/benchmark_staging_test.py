@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit test for benchmark_staging.py"""
+
+import os
+import shutil
+import sys
+import unittest.mock
+
+import pytest
+
+import benchmark_staging
+
+
+def test_make_tree_touch_fraction(tmpdir):
+    root = str(tmpdir.join('tree'))
+    benchmark_staging.make_tree(root, 5, 10, files_per_dir=2)
+    assert sorted(os.listdir(root)) == ['dir0000', 'dir0001', 'dir0002']
+    assert benchmark_staging.touch_fraction(root, 0.5) == 3
+    assert benchmark_staging.touch_fraction(root, 0) == 0
+
+
+@pytest.mark.parametrize('has_rsync', [True, False])
+def test_main(tmpdir, capsys, has_rsync):
+    argv = ['benchmark_staging', '--files=5', '--file-size=10',
+            '--changed-fraction=0.5', '--dir', str(tmpdir)]
+    which = (lambda name: '/usr/bin/' + name) if has_rsync else (
+        lambda name: None)
+    with unittest.mock.patch.object(sys, 'argv', argv), \
+            unittest.mock.patch.object(shutil, 'which', which), \
+            unittest.mock.patch.object(benchmark_staging, 'rsync_fresh'):
+        benchmark_staging.main()
+    out = capsys.readouterr().out
+    assert 'Synthetic tree: 5 files of 10 bytes' in out
+    assert 'persistent workspace, 3 files changed' in out
+    assert ('n/a' in out) != has_rsync
+    # The synthetic tree is removed
+    assert tmpdir.listdir() == []
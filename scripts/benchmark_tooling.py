@@ -0,0 +1,483 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmark the builder tooling on large synthetic inputs.
+
+The entry points of gen_dockerfile, local_cloudbuild and
+validation_utils are run on generated inputs: a cloudbuild file with
+thousands of steps that have long arguments and many `$_VAR`
+substitutions, and hundreds of service yaml files.  For each
+benchmark, the median wall time of several runs and the peak memory
+allocated by Python during one run are printed.
+
+Results can be saved as a baseline with --save-baseline.  With
+--baseline, they are compared to a saved baseline, and the exit code is
+1 if any benchmark got slower or used more memory than allowed by
+--time-tolerance and --memory-tolerance.  Times depend on the machine,
+so only compare baselines recorded on the same one.
+"""
+
+import argparse
+import collections
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import yaml
+
+import gen_dockerfile
+import gunicorn_config
+import local_cloudbuild
+import validation_utils
+
+
+# Size of the generated inputs, for a scale of 1
+SCALE_STEPS = 2000
+SCALE_SERVICES = 200
+
+# Arguments and substitution variables per step
+ARGS_PER_STEP = 20
+VARIABLES = 50
+
+# Increases of peak memory that are never regressions, since small
+# allocations vary between runs
+MEMORY_SLACK_BYTES = 64 * 1024
+
+# Measurements of a single benchmark.  `seconds` is the median wall
+# time of the runs, and `peak_bytes` the peak memory allocated by
+# Python during one run.
+Measurement = collections.namedtuple('Measurement', 'peak_bytes seconds')
+
+
+def make_substitutions(count):
+    """Return user substitution variables, like _VAR_0, with values"""
+    return {'_VAR_{}'.format(index): 'value-{}'.format(index) * 4
+            for index in range(count)}
+
+
+def make_raw_steps(count, args_per_step, variables):
+    """Return deserialized cloudbuild steps that use every variable.
+
+    Args:
+        count (int): Number of steps
+        args_per_step (int): Arguments of each step
+        variables (int): Number of substitution variables
+
+    Returns:
+        [dict]: Steps, each waiting for the one before
+    """
+    steps = []
+    for index in range(count):
+        args = []
+        for arg_index in range(args_per_step):
+            var = (index * args_per_step + arg_index) % variables
+            args.append(
+                '--flag-{}=${{_VAR_{}}}/some/long/path/$_VAR_{} '
+                'with spaces and $$literal dollars'.format(
+                    arg_index, var, (var + 1) % variables))
+        steps.append({
+            'args': args,
+            'dir': 'dir_{}'.format(index % 10),
+            'env': ['NAME_{}=$_VAR_{}'.format(index, index % variables)],
+            'id': 'step-{}'.format(index),
+            'name': 'gcr.io/cloud-builders/docker',
+            'timeout': '{}s'.format(60 + index),
+            'waitFor': ['step-{}'.format(index - 1)] if index else ['-'],
+        })
+    return steps
+
+
+def make_service_configs(count):
+    """Return the contents of service yaml files, as strings"""
+    versions = sorted(gen_dockerfile.PYTHON_INTERPRETER_VERSION_MAP)
+    return [
+        yaml.safe_dump({
+            'entrypoint': 'gunicorn -b :$PORT service_{}.main:app'.format(
+                index),
+            'env': 'flex',
+            'runtime': 'python',
+            'runtime_config': {
+                'python_version': versions[index % len(versions)]},
+            'service': 'service-{}'.format(index),
+        })
+        for index in range(count)]
+
+
+def make_source_dirs(root, configs):
+    """Write each service yaml into a source directory of its own.
+
+    Every other service has a requirements.txt.
+
+    Returns:
+        [(str, str)]: Path of each yaml file and its source directory
+    """
+    services = []
+    for index, config in enumerate(configs):
+        source_dir = os.path.join(root, 'service_{}'.format(index))
+        os.mkdir(source_dir)
+        config_file = os.path.join(source_dir, 'app.yaml')
+        with open(config_file, 'w', encoding='utf8') as f:
+            f.write(config)
+        if index % 2 == 0:
+            with open(os.path.join(source_dir, 'requirements.txt'), 'w',
+                      encoding='utf8') as f:
+                f.write('flask\n')
+        services.append((config_file, source_dir))
+    return services
+
+
+def make_args(substitutions):
+    """Return local_cloudbuild flags for the generated cloudbuild file"""
+    args = local_cloudbuild.parse_args(['benchmark_tooling'])
+    args.substitutions = substitutions
+    return args
+
+
+def bench_sub_and_quote(inputs):
+    used = set()
+    for step in inputs['raw_steps']:
+        for arg in step['args']:
+            local_cloudbuild.sub_and_quote(arg, inputs['substitutions'], used)
+
+
+def bench_get_field_value(inputs):
+    for step in inputs['raw_steps']:
+        for field_name in ['args', 'env', 'waitFor']:
+            validation_utils.get_field_value(step, field_name, list)
+        for field_name in ['dir', 'id', 'name', 'timeout', 'missing']:
+            validation_utils.get_field_value(step, field_name, str)
+
+
+def bench_get_step(inputs):
+    for step in inputs['raw_steps']:
+        local_cloudbuild.get_step(step)
+
+
+def per_field_step(raw_step):
+    """Validate a step field by field, the way get_step used to"""
+    get = validation_utils.get_field_value
+    raw_args = get(raw_step, 'args', list)
+    [get(raw_args, index, str) for index in range(len(raw_args))]
+    get(raw_step, 'dir', str)
+    raw_env = get(raw_step, 'env', list)
+    [get(raw_env, index, str) for index in range(len(raw_env))]
+    get(raw_step, 'id', str)
+    get(raw_step, 'name', str)
+    local_cloudbuild.get_duration(raw_step, 'timeout')
+    raw_volumes = get(raw_step, 'volumes', list)
+    local_cloudbuild.check_volumes([
+        local_cloudbuild.get_volume(get(raw_volumes, index, dict))
+        for index in range(len(raw_volumes))])
+    if raw_step.get('waitFor') is not None:
+        raw_wait_for = get(raw_step, 'waitFor', list)
+        local_cloudbuild.wait_for_problem(
+            [get(raw_wait_for, index, str)
+             for index in range(len(raw_wait_for))])
+
+
+def bench_steps_per_field(inputs):
+    for step in inputs['raw_steps']:
+        per_field_step(step)
+
+
+def bench_steps_schema(inputs):
+    local_cloudbuild.get_steps(inputs['raw_steps'])
+
+
+def per_field_app_yaml(raw_config):
+    """Validate the fields of APP_YAML_SCHEMA one by one"""
+    get = validation_utils.get_field_value
+    gen_dockerfile.entrypoint_problem(get(raw_config, 'entrypoint', str))
+    resources = get(raw_config, 'resources', dict)
+    gen_dockerfile.positive_problem(
+        get(resources, 'cpu', float) or gunicorn_config.DEFAULT_CPU)
+    gen_dockerfile.positive_problem(
+        get(resources, 'memory_gb', float) or
+        gunicorn_config.DEFAULT_MEMORY_GB)
+    get(raw_config, 'runtime', str)
+    runtime_config = get(raw_config, 'runtime_config', dict)
+    for field_name in ['async_worker', 'cache_mounts', 'compile_bytecode',
+                       'gunicorn_preload_app']:
+        get(runtime_config, field_name, bool)
+    for field_name in ['gunicorn_keepalive', 'gunicorn_threads',
+                       'gunicorn_workers']:
+        gen_dockerfile.negative_problem(get(runtime_config, field_name, int))
+    gen_dockerfile.python_version_problem(
+        get(runtime_config, 'python_version', str))
+
+
+def bench_app_yaml_per_field(inputs):
+    for raw_config in inputs['app_yamls']:
+        per_field_app_yaml(raw_config)
+
+
+def bench_app_yaml_schema(inputs):
+    gen_dockerfile.APP_YAML_VALIDATOR.validate_batch(inputs['app_yamls'])
+
+
+def bench_get_cloudbuild(inputs):
+    local_cloudbuild.get_cloudbuild(
+        {'steps': inputs['raw_steps']}, inputs['args'])
+
+
+def bench_generate_script(inputs):
+    local_cloudbuild.generate_script(inputs['cloudbuild'])
+
+
+def bench_generate_files(inputs):
+    for config_file, source_dir in inputs['services']:
+        with open(config_file, 'r', encoding='utf8') as f:
+            raw_config = yaml.safe_load(f)
+        app_config = gen_dockerfile.get_app_config(
+            raw_config, 'gcr.io/google-appengine/python', config_file,
+            source_dir)
+        gen_dockerfile.generate_files(app_config)
+
+
+# Benchmarks, in the order they run
+BENCHMARKS = collections.OrderedDict([
+    ('sub_and_quote', bench_sub_and_quote),
+    ('get_field_value', bench_get_field_value),
+    ('get_step', bench_get_step),
+    ('steps_per_field', bench_steps_per_field),
+    ('steps_schema', bench_steps_schema),
+    ('app_yaml_per_field', bench_app_yaml_per_field),
+    ('app_yaml_schema', bench_app_yaml_schema),
+    ('get_cloudbuild', bench_get_cloudbuild),
+    ('generate_script', bench_generate_script),
+    ('generate_files', bench_generate_files),
+])
+
+
+def make_inputs(root, scale):
+    """Generate the inputs of all benchmarks.
+
+    Args:
+        root (str): Directory to write service source directories to
+        scale (float): Multiplies the number of steps and services
+
+    Returns:
+        dict: Inputs shared by the benchmarks
+    """
+    substitutions = make_substitutions(VARIABLES)
+    raw_steps = make_raw_steps(max(int(SCALE_STEPS * scale), 1),
+                               ARGS_PER_STEP, VARIABLES)
+    args = make_args(substitutions)
+    configs = make_service_configs(max(int(SCALE_SERVICES * scale), 1))
+    services = make_source_dirs(root, configs)
+    return {
+        'app_yamls': [yaml.safe_load(config) for config in configs],
+        'args': args,
+        'cloudbuild': local_cloudbuild.get_cloudbuild(
+            {'steps': raw_steps}, args),
+        'raw_steps': raw_steps,
+        'services': services,
+        'substitutions': substitutions,
+    }
+
+
+def measure(function, inputs, repeat):
+    """Time a benchmark and measure its peak memory.
+
+    Memory is measured in a separate run, since tracing allocations
+    slows the code down.
+
+    Returns:
+        Measurement: Median time of `repeat` runs, and peak memory
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(inputs)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function(inputs)
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return Measurement(peak_bytes=peak_bytes,
+                       seconds=statistics.median(times))
+
+
+def run_benchmarks(inputs, repeat, names=None):
+    """Run benchmarks.
+
+    Args:
+        inputs (dict): From make_inputs
+        repeat (int): Timed runs of each benchmark
+        names ([str]): Benchmarks to run, default all
+
+    Returns:
+        OrderedDict: Map of benchmark name to Measurement
+    """
+    results = collections.OrderedDict()
+    for name, function in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        results[name] = measure(function, inputs, repeat)
+    return results
+
+
+def save_baseline(path, results, scale):
+    """Write results to a baseline file"""
+    with open(path, 'w', encoding='utf8') as f:
+        json.dump({
+            'benchmarks': {name: measurement._asdict()
+                           for name, measurement in results.items()},
+            'scale': scale,
+        }, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def load_baseline(path, scale):
+    """Read a baseline file.
+
+    Returns:
+        dict: Map of benchmark name to Measurement
+
+    Raises:
+        ValueError: If the file can't be read or used a different scale
+    """
+    try:
+        with open(path, 'r', encoding='utf8') as f:
+            data = json.load(f)
+        if data['scale'] != scale:
+            raise ValueError('it was recorded with --scale={}'.format(
+                data['scale']))
+        return {name: Measurement(**fields)
+                for name, fields in data['benchmarks'].items()}
+    except (OSError, KeyError, TypeError, ValueError) as e:
+        raise ValueError('Could not use baseline {}: {}'.format(path, e))
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance):
+    """Find the benchmarks that got slower or use more memory.
+
+    Args:
+        results (dict): Map of benchmark name to Measurement
+        baseline (dict): Same, from load_baseline
+        time_tolerance (float): Allowed relative increase of time
+        memory_tolerance (float): Allowed relative increase of memory
+
+    Returns:
+        [str]: Description of each regression
+    """
+    regressions = []
+    for name, measurement in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if measurement.seconds > before.seconds * (1 + time_tolerance):
+            regressions.append('{}: {:.1f}ms, baseline {:.1f}ms'.format(
+                name, measurement.seconds * 1000, before.seconds * 1000))
+        if measurement.peak_bytes > max(
+                before.peak_bytes * (1 + memory_tolerance),
+                before.peak_bytes + MEMORY_SLACK_BYTES):
+            regressions.append('{}: peak {} bytes, baseline {} bytes'.format(
+                name, measurement.peak_bytes, before.peak_bytes))
+    return regressions
+
+
+def format_results(results, baseline=None):
+    """Describe results as a table, one line per benchmark"""
+    lines = ['{:<20} {:>12} {:>14}'.format('Benchmark', 'Median', 'Peak mem')]
+    for name, measurement in results.items():
+        line = '{:<20} {:>10.1f}ms {:>12.1f}KB'.format(
+            name, measurement.seconds * 1000, measurement.peak_bytes / 1024)
+        before = (baseline or {}).get(name)
+        if before is not None and before.seconds and before.peak_bytes:
+            line += '  {:+.0%} time, {:+.0%} memory'.format(
+                measurement.seconds / before.seconds - 1,
+                measurement.peak_bytes / before.peak_bytes - 1)
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--scale',
+        type=float,
+        default=1.0,
+        help=('Multiplies the size of the inputs: {} steps and {} '
+              'services at 1'.format(SCALE_STEPS, SCALE_SERVICES)),
+    )
+    parser.add_argument(
+        '--repeat',
+        type=validation_utils.validate_arg_positive_int,
+        default=5,
+        help='Timed runs of each benchmark',
+    )
+    parser.add_argument(
+        '--benchmark',
+        action='append',
+        choices=list(BENCHMARKS),
+        dest='benchmarks',
+        help='Only run this benchmark.  May be repeated',
+    )
+    parser.add_argument('--baseline', help='Baseline file to compare to')
+    parser.add_argument('--save-baseline',
+                        help='Write the results to this baseline file')
+    parser.add_argument(
+        '--time-tolerance',
+        type=float,
+        default=0.5,
+        help='Allowed relative increase of time over the baseline',
+    )
+    parser.add_argument(
+        '--memory-tolerance',
+        type=float,
+        default=0.1,
+        help='Allowed relative increase of peak memory over the baseline',
+    )
+    return parser.parse_args(argv[1:])
+
+
+def main():
+    args = parse_args(sys.argv)
+    baseline = None
+    if args.baseline:
+        baseline = load_baseline(args.baseline, args.scale)
+    root = tempfile.mkdtemp(prefix='benchmark_tooling_')
+    try:
+        inputs = make_inputs(root, args.scale)
+        print('{} steps with {} args each, {} substitutions, {} '
+              'services'.format(len(inputs['raw_steps']), ARGS_PER_STEP,
+                                VARIABLES, len(inputs['services'])))
+        results = run_benchmarks(inputs, args.repeat, args.benchmarks)
+    finally:
+        shutil.rmtree(root)
+    print(format_results(results, baseline))
+    if args.save_baseline:
+        save_baseline(args.save_baseline, results, args.scale)
+        print('Wrote baseline to {}'.format(args.save_baseline))
+    if baseline is not None:
+        regressions = compare(results, baseline, args.time_tolerance,
+                              args.memory_tolerance)
+        for regression in regressions:
+            print('Regression in {}'.format(regression))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit test for benchmark_tooling.py"""
+
+import sys
+import unittest.mock
+
+import pytest
+
+import benchmark_tooling
+
+
+def test_run_benchmarks(tmpdir):
+    inputs = benchmark_tooling.make_inputs(str(tmpdir), 0.005)
+    assert len(inputs['raw_steps']) == 10
+    assert len(inputs['services']) == 1
+    results = benchmark_tooling.run_benchmarks(inputs, 1)
+    assert list(results) == list(benchmark_tooling.BENCHMARKS)
+    for measurement in results.values():
+        assert measurement.seconds > 0
+        assert measurement.peak_bytes >= 0
+
+
+def test_baseline(tmpdir):
+    path = str(tmpdir.join('baseline.json'))
+    results = {
+        'fast': benchmark_tooling.Measurement(peak_bytes=1000, seconds=1.0),
+    }
+    benchmark_tooling.save_baseline(path, results, 0.5)
+    assert benchmark_tooling.load_baseline(path, 0.5) == results
+    with pytest.raises(ValueError):
+        benchmark_tooling.load_baseline(path, 1.0)
+    with pytest.raises(ValueError):
+        benchmark_tooling.load_baseline(str(tmpdir.join('missing')), 1.0)
+
+
+def test_compare():
+    baseline = {
+        'a': benchmark_tooling.Measurement(peak_bytes=10 ** 6, seconds=1.0),
+        'b': benchmark_tooling.Measurement(peak_bytes=10 ** 6, seconds=1.0),
+    }
+    results = {
+        'a': benchmark_tooling.Measurement(peak_bytes=10 ** 6, seconds=1.4),
+        'b': benchmark_tooling.Measurement(peak_bytes=2 * 10 ** 6,
+                                           seconds=2.0),
+        'new': benchmark_tooling.Measurement(peak_bytes=1, seconds=1.0),
+    }
+    assert benchmark_tooling.compare(results, baseline, 0.5, 0.1) == [
+        'b: 2000.0ms, baseline 1000.0ms',
+        'b: peak 2000000 bytes, baseline 1000000 bytes',
+    ]
+
+
+def test_main(tmpdir, capsys):
+    baseline = str(tmpdir.join('baseline.json'))
+    argv = ['benchmark_tooling', '--scale=0.005', '--repeat=1',
+            '--save-baseline', baseline]
+    with unittest.mock.patch.object(sys, 'argv', argv):
+        benchmark_tooling.main()
+    out = capsys.readouterr().out
+    assert out.splitlines()[0].startswith('10 steps with ')
+    assert 'Wrote baseline to {}'.format(baseline) in out
+
+    # Everything regresses against a baseline that took no time
+    benchmark_tooling.save_baseline(baseline, {
+        name: benchmark_tooling.Measurement(peak_bytes=1, seconds=1e-9)
+        for name in benchmark_tooling.BENCHMARKS}, 0.005)
+    argv = ['benchmark_tooling', '--scale=0.005', '--repeat=1',
+            '--baseline', baseline]
+    with unittest.mock.patch.object(sys, 'argv', argv), \
+            pytest.raises(SystemExit):
+        benchmark_tooling.main()
+    assert 'Regression in ' in capsys.readouterr().out
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Predict how long a build takes from the step times of earlier builds.
+
+Step durations come from a timing summary written by build_trace.  With
+unlimited parallelism, each step starts as soon as the steps it waits
+for have finished, and the longest chain of steps, the critical path,
+sets the wall time of the build.  A step's slack is how much longer it
+could take without making the build longer.  With limited parallelism,
+the build is simulated the way step_executor starts steps: whenever a
+slot is free, the lowest numbered step that is ready starts.
+"""
+
+import collections
+import heapq
+import json
+
+
+# Timing of a single step with unlimited parallelism.  `duration` is
+# in seconds, or None if no successful run of the step was recorded.
+# `start` and `finish` are the earliest possible times, and `slack` is
+# how much the step could be delayed without delaying the build.
+StepPlan = collections.namedtuple(
+    'StepPlan', 'duration finish name slack start')
+
+
+def load_durations(path, step_names, statistic='p50'):
+    """Read step durations from a timing summary file.
+
+    Args:
+        path (str): Summary file written by build_trace.update_summary
+        step_names ([str]): Name of each step
+        statistic (str): 'p50' or 'max'
+
+    Returns:
+        [float]: Seconds for each step, or None if it has no history
+    """
+    try:
+        with open(path, 'r', encoding='utf8') as f:
+            stats = json.load(f)['steps']
+        return [stats[name][statistic] if name in stats else None
+                for name in step_names]
+    except FileNotFoundError:
+        raise ValueError('No summary file {}, record one with '
+                         '--summary-out'.format(path))
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError('Could not read summary file {}: {}'.format(
+            path, e))
+
+
+def topological_order(dependencies):
+    """Return step indices ordered so that each follows its dependencies"""
+    order = []
+    done = set()
+    for root in range(len(dependencies)):
+        stack = [(root, False)]
+        while stack:
+            index, expanded = stack.pop()
+            if index in done:
+                continue
+            if expanded:
+                done.add(index)
+                order.append(index)
+                continue
+            stack.append((index, True))
+            stack.extend((dep, False) for dep in
+                         reversed(dependencies[index]) if dep not in done)
+    return order
+
+
+def plan_steps(step_names, durations, dependencies):
+    """Schedule steps with unlimited parallelism.
+
+    Steps without a duration are counted as taking no time.
+
+    Args:
+        step_names ([str]): Name of each step
+        durations ([float]): Seconds for each step, or None
+        dependencies ([[int]]): Indices of the steps each step waits for
+
+    Returns:
+        [StepPlan]: Timing of each step
+    """
+    seconds = [duration or 0.0 for duration in durations]
+    order = topological_order(dependencies)
+    start = [0.0] * len(seconds)
+    for index in order:
+        start[index] = max([start[dep] + seconds[dep]
+                            for dep in dependencies[index]] or [0.0])
+    finish = [start[index] + seconds[index] for index in range(len(seconds))]
+    total = max(finish or [0.0])
+    latest_finish = [total] * len(seconds)
+    for index in reversed(order):
+        for dep in dependencies[index]:
+            latest_finish[dep] = min(latest_finish[dep],
+                                     latest_finish[index] - seconds[index])
+    return [
+        StepPlan(duration=durations[index], finish=finish[index],
+                 name=step_names[index],
+                 slack=max(latest_finish[index] - finish[index], 0.0),
+                 start=start[index])
+        for index in range(len(seconds))]
+
+
+def critical_path(plans, dependencies):
+    """Return the indices of the chain of steps that finishes last"""
+    if not plans:
+        return []
+    index = max(range(len(plans)), key=lambda index: plans[index].finish)
+    path = [index]
+    while True:
+        # The dependency that finished last held this step back
+        deps = dependencies[index]
+        if not deps:
+            break
+        index = max(deps, key=lambda dep: plans[dep].finish)
+        path.append(index)
+    return list(reversed(path))
+
+
+def predict_wall_time(durations, dependencies, jobs):
+    """Simulate a build that runs at most `jobs` steps at a time.
+
+    Returns:
+        float: Seconds until the last step finishes
+    """
+    seconds = [duration or 0.0 for duration in durations]
+    finished = set()
+    pending = set(range(len(seconds)))
+    # (finish time, index) of running steps
+    running = []
+    now = 0.0
+    while pending or running:
+        for index in sorted(pending):
+            if len(running) >= jobs:
+                break
+            if all(dep in finished for dep in dependencies[index]):
+                pending.remove(index)
+                heapq.heappush(running, (now + seconds[index], index))
+        if not running:
+            # Only possible if steps wait for each other
+            raise ValueError('Steps wait for each other in a cycle')
+        now, index = heapq.heappop(running)
+        finished.add(index)
+    return now
+
+
+def format_analysis(plans, dependencies, jobs, pessimistic_durations=None):
+    """Describe the critical path, predicted wall time and slack.
+
+    Args:
+        plans ([StepPlan]): From plan_steps
+        dependencies ([[int]]): Indices of the steps each step waits for
+        jobs (int): Parallelism to predict the wall time for
+        pessimistic_durations ([float]): Longest recorded time of each
+            step, for a second prediction, or None
+
+    Returns:
+        str: Report for the console
+    """
+    durations = [plan.duration for plan in plans]
+    path = critical_path(plans, dependencies)
+    total = max([plan.finish for plan in plans] or [0.0])
+    lines = ['Critical path ({:.2f}s): {}'.format(
+        total, ' -> '.join(plans[index].name for index in path))]
+    lines.append('Predicted wall time: {:.2f}s with unlimited parallelism, '
+                 '{:.2f}s with --jobs={}'.format(
+                     total, predict_wall_time(durations, dependencies, jobs),
+                     jobs))
+    if pessimistic_durations is not None:
+        lines.append('Predicted wall time with the slowest recorded step '
+                     'times: {:.2f}s with --jobs={}'.format(
+                         predict_wall_time(pessimistic_durations,
+                                           dependencies, jobs), jobs))
+    lines.append('{:<32} {:>9} {:>9} {:>9} {:>9}'.format(
+        'Step', 'Duration', 'Start', 'Finish', 'Slack'))
+    for index, plan in enumerate(plans):
+        duration = ('?' if plan.duration is None
+                    else '{:.2f}s'.format(plan.duration))
+        lines.append('{:<32} {:>9} {:>8.2f}s {:>8.2f}s {:>8.2f}s{}'.format(
+            plan.name, duration, plan.start, plan.finish, plan.slack,
+            ' *' if index in path else ''))
+    missing = durations.count(None)
+    if missing:
+        lines.append('{} steps have no recorded time and are counted as '
+                     'taking none'.format(missing))
+    return '\n'.join(lines)
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit test for build_analysis.py"""
+
+import json
+
+import pytest
+
+import build_analysis
+
+
+# a -> (b, c) -> d, and e on its own
+_NAMES = ['a', 'b', 'c', 'd', 'e']
+_DEPENDENCIES = [[], [0], [0], [1, 2], []]
+_DURATIONS = [1.0, 5.0, 2.0, 1.0, 3.0]
+
+
+def test_topological_order():
+    # Steps may wait for steps that come later
+    order = build_analysis.topological_order([[2], [], [1]])
+    assert order == [1, 2, 0]
+    order = build_analysis.topological_order(_DEPENDENCIES)
+    for index, deps in enumerate(_DEPENDENCIES):
+        for dep in deps:
+            assert order.index(dep) < order.index(index)
+
+
+def test_plan_steps():
+    plans = build_analysis.plan_steps(_NAMES, _DURATIONS, _DEPENDENCIES)
+    assert [plan.start for plan in plans] == [0.0, 1.0, 1.0, 6.0, 0.0]
+    assert [plan.finish for plan in plans] == [1.0, 6.0, 3.0, 7.0, 3.0]
+    assert [plan.slack for plan in plans] == [0.0, 0.0, 3.0, 0.0, 4.0]
+    assert build_analysis.critical_path(plans, _DEPENDENCIES) == [0, 1, 3]
+
+
+def test_plan_steps_missing_duration():
+    plans = build_analysis.plan_steps(
+        _NAMES, [1.0, None, 2.0, 1.0, 3.0], _DEPENDENCIES)
+    assert plans[1].duration is None
+    assert plans[3].start == 3.0
+    assert build_analysis.critical_path(plans, _DEPENDENCIES) == [0, 2, 3]
+
+
+@pytest.mark.parametrize('jobs, expected', [
+    (1, 12.0),
+    # a and e first, then b and c, then d
+    (2, 7.0),
+    (5, 7.0),
+])
+def test_predict_wall_time(jobs, expected):
+    assert build_analysis.predict_wall_time(
+        _DURATIONS, _DEPENDENCIES, jobs) == expected
+
+
+def test_load_durations(tmpdir):
+    path = tmpdir.join('summary.json')
+    path.write(json.dumps({'runs': [], 'steps': {
+        'a': {'count': 2, 'max': 2.0, 'p50': 1.5},
+        'b': {'count': 1, 'max': 4.0, 'p50': 4.0},
+    }}))
+    assert build_analysis.load_durations(str(path), ['a', 'b', 'c']) == [
+        1.5, 4.0, None]
+    assert build_analysis.load_durations(
+        str(path), ['a', 'b', 'c'], 'max') == [2.0, 4.0, None]
+    path.write('not json')
+    with pytest.raises(ValueError):
+        build_analysis.load_durations(str(path), ['a'])
+    with pytest.raises(ValueError, match='--summary-out'):
+        build_analysis.load_durations(str(tmpdir.join('missing')), ['a'])
+
+
+def test_format_analysis():
+    plans = build_analysis.plan_steps(
+        _NAMES, _DURATIONS[:4] + [None], _DEPENDENCIES)
+    lines = build_analysis.format_analysis(
+        plans, _DEPENDENCIES, 1).splitlines()
+    assert lines[0] == 'Critical path (7.00s): a -> b -> d'
+    assert lines[1] == ('Predicted wall time: 7.00s with unlimited '
+                        'parallelism, 9.00s with --jobs=1')
+    assert lines[2].split() == ['Step', 'Duration', 'Start', 'Finish',
+                                'Slack']
+    assert lines[3].split() == ['a', '1.00s', '0.00s', '1.00s', '0.00s',
+                                '*']
+    assert lines[5].split() == ['c', '2.00s', '1.00s', '3.00s', '3.00s']
+    assert lines[7].split()[:2] == ['e', '?']
+    assert lines[8].startswith('1 steps have no recorded time')
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Keep what an application image doesn't need out of its build context.
+
+`docker build` sends the whole source directory, except what
+`.dockerignore` excludes, and `ADD . /app/` copies it into the image.
+Local virtualenvs, the caches of tools and test runners, and
+`node_modules` are never needed there.
+
+scan() walks the source directory once.  It doesn't descend into
+directories that `.dockerignore` already excludes, nor into the ones it
+finds to exclude.  Those are only added up by measure(), for a report.
+Virtualenvs are recognized by their `pyvenv.cfg`, whatever they are
+named.
+
+The generated `.dockerignore` has the fixed entries of its template,
+then the patterns found by the scan, then the entries a user added to
+the previous file.  The found patterns are replaced on every run.
+
+hash_files() hashes the files still sent, for the fingerprint of an
+image's inputs.
+"""
+
+import collections
+import concurrent.futures
+import fnmatch
+import functools
+import hashlib
+import io
+import os
+
+import ignore_rules
+
+
+# Directories never needed in an application image, at any depth
+CACHE_DIRECTORIES = (
+    '.mypy_cache',
+    '.nox',
+    '.pytest_cache',
+    '.tox',
+    '__pycache__',
+    'node_modules',
+)
+
+# Files never needed in an application image, at any depth
+CACHE_FILES = ('*.py[co]',)
+
+# File at the top of every virtualenv (PEP 405)
+PYVENV_CFG = 'pyvenv.cfg'
+
+# Comments starting the sections of a generated .dockerignore after the
+# template.  The found section ends at the next blank line.
+FOUND_HEADER = '# Found in the source directory, updated by gen_dockerfile'
+KEPT_HEADER = '# Added to .dockerignore by hand'
+
+# Number of entries in each list of format_report
+REPORT_ENTRIES = 10
+
+# Bytes read at a time while hashing a file
+HASH_CHUNK_SIZE = 2**20
+
+# Path left out of the build context.  `path` is relative to the source
+# directory with `/` separators, `file_count` and `size` add up
+# everything below a directory, or are None for directories until
+# measure(), and `pattern` is the .dockerignore entry that excludes it.
+Excluded = collections.namedtuple(
+    'Excluded', 'file_count is_dir path pattern size')
+
+# Result of scanning a source directory.  `files` maps the path of every
+# file still sent to its size, and `user_entries` are the lines a user
+# added to .dockerignore.
+Scan = collections.namedtuple('Scan', 'excluded files user_entries')
+
+
+def get_user_entries(text, template):
+    """Find the lines a user added to a .dockerignore.
+
+    Args:
+        text (str): Contents of the existing .dockerignore
+        template (str): Fixed contents of the generated .dockerignore
+
+    Returns:
+        [str]: Lines, without the template and found patterns
+    """
+    known = set(template.splitlines())
+    entries = []
+    in_found = False
+    for line in text.splitlines():
+        if line == FOUND_HEADER:
+            in_found = True
+        elif not line.strip():
+            in_found = False
+        elif not in_found and line != KEPT_HEADER and line not in known:
+            entries.append(line)
+    return entries
+
+
+def _tree_size(path):
+    """Return the number of files below a directory and their total size"""
+    count = 0
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, name)).st_size
+            except FileNotFoundError:
+                continue
+            count += 1
+    return count, size
+
+
+def _directory_pattern(path, rel_path):
+    """Return the .dockerignore entry excluding a directory, if any"""
+    name = os.path.basename(path)
+    if name in CACHE_DIRECTORIES:
+        return '**/' + name
+    if os.path.isfile(os.path.join(path, PYVENV_CFG)):
+        return rel_path
+    return None
+
+
+def scan(source_dir, template):
+    """Find what to leave out of the build context of a source directory.
+
+    Args:
+        source_dir (str): Directory containing user's source code
+        template (str): Fixed contents of the generated .dockerignore
+
+    Returns:
+        Scan: What is excluded, and what is still sent
+    """
+    try:
+        with io.open(os.path.join(source_dir, ignore_rules.DOCKERIGNORE),
+                     'r', encoding='utf8') as f:
+            user_entries = get_user_entries(f.read(), template)
+    except FileNotFoundError:
+        user_entries = []
+    ignore = ignore_rules.IgnoreRules(
+        ignore_rules.dockerignore_rules(
+            template.splitlines() + user_entries),
+        ignore_rules.STYLE_DOCKER)
+
+    excluded = []
+    files = {}
+    for root, dirnames, filenames in os.walk(source_dir):
+        rel_root = os.path.relpath(root, source_dir)
+        prefix = '' if rel_root == '.' else rel_root.replace(os.sep, '/') + '/'
+        kept = []
+        for name in sorted(dirnames):
+            path = os.path.join(root, name)
+            rel_path = prefix + name
+            if os.path.islink(path):
+                # Sent as a link, like any other file
+                filenames.append(name)
+                continue
+            if (ignore.is_ignored(rel_path, is_dir=True) and
+                    ignore.can_skip_directory(rel_path)):
+                continue
+            pattern = _directory_pattern(path, rel_path)
+            if pattern is None:
+                kept.append(name)
+                continue
+            excluded.append(Excluded(
+                file_count=None, is_dir=True, path=rel_path,
+                pattern=pattern, size=None))
+        dirnames[:] = kept
+
+        for name in filenames:
+            rel_path = prefix + name
+            if ignore.is_ignored(rel_path):
+                continue
+            size = os.lstat(os.path.join(root, name)).st_size
+            for pattern in CACHE_FILES:
+                if fnmatch.fnmatchcase(name, pattern):
+                    excluded.append(Excluded(
+                        file_count=1, is_dir=False, path=rel_path,
+                        pattern='**/' + pattern, size=size))
+                    break
+            else:
+                files[rel_path] = size
+    return Scan(excluded=excluded, files=files, user_entries=user_entries)
+
+
+def measure(source_dir, context):
+    """Add up the files of the directories a scan excluded.
+
+    Args:
+        source_dir (str): Directory that was scanned
+        context (Scan): Result of scan()
+
+    Returns:
+        Scan: The same, with the file count and size of every entry
+    """
+    excluded = []
+    for entry in context.excluded:
+        if entry.size is None:
+            count, size = _tree_size(os.path.join(source_dir, entry.path))
+            entry = entry._replace(file_count=count, size=size)
+        excluded.append(entry)
+    return context._replace(excluded=excluded)
+
+
+def format_dockerignore(template, context):
+    """Return the contents of the generated .dockerignore.
+
+    Args:
+        template (str): Fixed contents of the generated .dockerignore
+        context (Scan): Result of scanning the source directory
+
+    Returns:
+        str: The template, followed by the found and kept sections
+    """
+    sections = [template]
+    patterns = sorted(set(entry.pattern for entry in context.excluded))
+    if patterns:
+        sections.append('\n'.join([FOUND_HEADER] + patterns) + '\n')
+    if context.user_entries:
+        sections.append(
+            '\n'.join([KEPT_HEADER] + context.user_entries) + '\n')
+    return '\n'.join(sections)
+
+
+def format_size(size):
+    """Describe a number of bytes, with binary units"""
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if size < 1024 or unit == 'GiB':
+            break
+        size /= 1024
+    if unit == 'B':
+        return '{} B'.format(size)
+    return '{:.1f} {}'.format(size, unit)
+
+
+def _top_level(path, is_dir=False):
+    """Return the entry of the source directory a path is in"""
+    name, slash, _ = path.partition('/')
+    return name + ('/' if slash or is_dir else '')
+
+
+def format_report(context, entries=REPORT_ENTRIES):
+    """Describe a build context before and after the generated .dockerignore.
+
+    Lists the largest entries of the source directory, with their size
+    before and after, and the largest files still sent.
+
+    Args:
+        context (Scan): Result of scanning the source directory, see
+            measure()
+        entries (int): Maximum length of each list
+
+    Returns:
+        str: Report, several lines long
+    """
+    before = collections.Counter()
+    after = collections.Counter()
+    for path, size in context.files.items():
+        before[_top_level(path)] += size
+        after[_top_level(path)] += size
+    for entry in context.excluded:
+        before[_top_level(entry.path, entry.is_dir)] += entry.size
+    file_count = len(context.files)
+    lines = [
+        'Build context: {} in {} files before, {} in {} files after'.format(
+            format_size(sum(before.values())),
+            file_count + sum(entry.file_count for entry in context.excluded),
+            format_size(sum(after.values())), file_count),
+        '{:>10}  {:>10}  {}'.format('before', 'after', 'largest entries'),
+    ]
+    for name, size in sorted(before.items(),
+                             key=lambda item: (-item[1], item[0]))[:entries]:
+        lines.append('{:>10}  {:>10}  {}'.format(
+            format_size(size), format_size(after[name]), name))
+    largest = sorted(context.files.items(),
+                     key=lambda item: (-item[1], item[0]))[:entries]
+    if largest:
+        lines.append('{:>10}  {}'.format('after', 'largest files'))
+        for path, size in largest:
+            lines.append('{:>10}  {}'.format(format_size(size), path))
+    return '\n'.join(lines)
+
+
+def _hash_file(path):
+    """Return the kind of a file and the digest of its contents"""
+    if os.path.islink(path):
+        return 'l', hashlib.sha256(os.fsencode(os.readlink(path))).hexdigest()
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(functools.partial(f.read, HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+        executable = os.fstat(f.fileno()).st_mode & 0o111
+    return 'x' if executable else 'f', digest.hexdigest()
+
+
+def hash_files(source_dir, paths, jobs):
+    """Hash files of a source directory, several at a time.
+
+    Files are read in chunks, so large ones don't have to fit in
+    memory.  Of their mode, only whether they are executable is kept,
+    since umasks differ between checkouts.
+
+    Args:
+        source_dir (str): Directory containing user's source code
+        paths ([str]): Files to hash, relative to the source directory
+        jobs (int): Maximum number of files hashed at once
+
+    Returns:
+        [str]: `KIND DIGEST PATH` for each path, in the same order.
+            KIND is `f` for a file, `x` for an executable file, and `l`
+            for a symlink, whose target is hashed.
+    """
+    full_paths = [os.path.join(source_dir, *path.split('/'))
+                  for path in paths]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(_hash_file, full_paths))
+    return ['{} {} {}'.format(kind, digest, path)
+            for (kind, digest), path in zip(results, paths)]
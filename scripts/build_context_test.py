@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit test for build_context.py"""
+
+import hashlib
+import os
+import unittest.mock
+
+import pytest
+
+import build_context
+
+
+TEMPLATE = '# Generated\n.dockerignore\nDockerfile\n.git\n'
+
+
+@pytest.fixture
+def source_dir(tmpdir):
+    tmpdir.join('main.py').write('x' * 100)
+    tmpdir.join('static', 'app.js').write('x' * 3000, ensure=True)
+    tmpdir.join('pkg', '__pycache__', 'a.pyc').write('x' * 50, ensure=True)
+    tmpdir.join('pkg', 'module.pyc').write('x' * 10)
+    tmpdir.join('.venv', 'pyvenv.cfg').write('x' * 20, ensure=True)
+    tmpdir.join('.venv', 'lib', 'six.py').write('x' * 2000, ensure=True)
+    tmpdir.join('frontend', 'node_modules', 'a.js').write(
+        'x' * 5, ensure=True)
+    tmpdir.join('.git', 'HEAD').write('x' * 10, ensure=True)
+    return tmpdir
+
+
+def test_scan(source_dir):
+    context = build_context.scan(str(source_dir), TEMPLATE)
+    # Excluded directories are only measured for a report
+    assert [(entry.file_count, entry.size) for entry in context.excluded
+            if entry.is_dir] == [(None, None)] * 3
+    context = build_context.measure(str(source_dir), context)
+    assert sorted(context.excluded, key=lambda entry: entry.path) == [
+        build_context.Excluded(
+            file_count=2, is_dir=True, path='.venv', pattern='.venv',
+            size=2020),
+        build_context.Excluded(
+            file_count=1, is_dir=True, path='frontend/node_modules',
+            pattern='**/node_modules', size=5),
+        build_context.Excluded(
+            file_count=1, is_dir=True, path='pkg/__pycache__',
+            pattern='**/__pycache__', size=50),
+        build_context.Excluded(
+            file_count=1, is_dir=False, path='pkg/module.pyc',
+            pattern='**/*.py[co]', size=10),
+    ]
+    assert context.files == {'main.py': 100, 'static/app.js': 3000}
+    assert context.user_entries == []
+
+
+def test_scan_user_entries(source_dir):
+    # What the user excludes is neither scanned nor reported
+    source_dir.join('.dockerignore').write(
+        TEMPLATE + 'static\nfrontend\n')
+    context = build_context.scan(str(source_dir), TEMPLATE)
+    assert context.user_entries == ['static', 'frontend']
+    assert [entry.path for entry in context.excluded] == [
+        '.venv', 'pkg/__pycache__', 'pkg/module.pyc']
+    assert context.files == {'main.py': 100}
+
+
+@pytest.mark.skipif(not hasattr(os, 'symlink'), reason='No symlinks')
+def test_scan_symlink(tmpdir):
+    tmpdir.join('real', 'node_modules', 'a.js').write('x', ensure=True)
+    tmpdir.join('link').mksymlinkto(tmpdir.join('real'))
+    context = build_context.scan(str(tmpdir), TEMPLATE)
+    assert 'link' in context.files
+    assert [entry.path for entry in context.excluded] == [
+        'real/node_modules']
+
+
+def test_format_dockerignore(source_dir):
+    source_dir.join('.dockerignore').write('*.log\n!keep.log\n')
+    context = build_context.scan(str(source_dir), TEMPLATE)
+    contents = build_context.format_dockerignore(TEMPLATE, context)
+    assert contents == TEMPLATE + '\n'.join([
+        '',
+        build_context.FOUND_HEADER,
+        '**/*.py[co]',
+        '**/__pycache__',
+        '**/node_modules',
+        '.venv',
+        '',
+        build_context.KEPT_HEADER,
+        '*.log',
+        '!keep.log',
+        '',
+    ])
+    # Reading the generated file again finds the same user entries
+    assert build_context.get_user_entries(contents, TEMPLATE) == [
+        '*.log', '!keep.log']
+    assert build_context.format_dockerignore(
+        TEMPLATE, build_context.Scan([], {}, [])) == TEMPLATE
+
+
+def test_get_user_entries():
+    text = '\n'.join([
+        'Dockerfile', '', build_context.FOUND_HEADER, 'venv', '',
+        'data/', build_context.KEPT_HEADER, '*.log'])
+    assert build_context.get_user_entries(text, TEMPLATE) == [
+        'data/', '*.log']
+
+
+@pytest.mark.parametrize('size, expected', [
+    (0, '0 B'),
+    (1023, '1023 B'),
+    (1536, '1.5 KiB'),
+    (5 * 2**20, '5.0 MiB'),
+    (3 * 2**40, '3072.0 GiB'),
+])
+def test_format_size(size, expected):
+    assert build_context.format_size(size) == expected
+
+
+def test_format_report(source_dir):
+    context = build_context.measure(
+        str(source_dir), build_context.scan(str(source_dir), TEMPLATE))
+    assert build_context.format_report(context, entries=2).splitlines() == [
+        'Build context: 5.1 KiB in 7 files before, 3.0 KiB in 2 files after',
+        '    before       after  largest entries',
+        '   2.9 KiB     2.9 KiB  static/',
+        '   2.0 KiB         0 B  .venv/',
+        '     after  largest files',
+        '   2.9 KiB  static/app.js',
+        '     100 B  main.py',
+    ]
+
+
+def test_hash_files(tmpdir):
+    tmpdir.join('a.py').write('a' * 10)
+    tmpdir.join('bin', 'run').write('run', ensure=True)
+    tmpdir.join('bin', 'run').chmod(0o755)
+    paths = ['bin/run', 'a.py']
+    if hasattr(os, 'symlink'):
+        tmpdir.join('link').mksymlinkto('a.py')
+        paths.append('link')
+
+    # Files are read in chunks
+    with unittest.mock.patch.object(build_context, 'HASH_CHUNK_SIZE', 3):
+        lines = build_context.hash_files(str(tmpdir), paths, jobs=2)
+    assert lines[:2] == [
+        'x {} bin/run'.format(hashlib.sha256(b'run').hexdigest()),
+        'f {} a.py'.format(hashlib.sha256(b'a' * 10).hexdigest()),
+    ]
+    if len(paths) == 3:
+        assert lines[2] == 'l {} link'.format(
+            hashlib.sha256(b'a.py').hexdigest())
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Record where the time in a local build goes.
+
+A TraceRecorder collects timed phases of a build, such as staging the
+workspace or running a step.  Phases are placed in lanes: lane 0 holds
+whole-build work, and each running step takes the lowest free lane, so
+steps that overlap end up on separate rows.  The result can be written
+in the Chrome trace event format, for chrome://tracing or Perfetto.
+
+A summary file keeps the step timings of recent builds as JSON, along
+with the median and maximum time of each step across those builds.
+"""
+
+import collections
+import contextlib
+import datetime
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+
+# Lane for phases that belong to the whole build
+BUILD_LANE = 0
+
+# Phase covering everything done for one step, shown under the step's
+# name in traces
+STEP_PHASE = 'step'
+
+# Builds kept in a summary file, oldest dropped first
+MAX_SUMMARY_RUNS = 100
+
+# A finished phase.  `start` and `end` are seconds since the recorder
+# was created.  `step` is a step index, or None for whole-build phases.
+Phase = collections.namedtuple('Phase', 'end lane name start step')
+
+
+class TraceRecorder(object):
+    """Thread-safe collection of timed build phases"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.origin = clock()
+        self.phases = []
+        self.busy_lanes = set()
+        self.lock = threading.Lock()
+
+    def now(self):
+        """Return seconds since the recorder was created"""
+        return self.clock() - self.origin
+
+    def acquire_lane(self):
+        """Reserve the lowest free step lane"""
+        with self.lock:
+            lane = BUILD_LANE + 1
+            while lane in self.busy_lanes:
+                lane += 1
+            self.busy_lanes.add(lane)
+            return lane
+
+    def release_lane(self, lane):
+        """Make a lane from acquire_lane available again"""
+        with self.lock:
+            self.busy_lanes.discard(lane)
+
+    def add(self, name, start, end, lane=BUILD_LANE, step=None):
+        """Record a phase that has already finished"""
+        with self.lock:
+            self.phases.append(Phase(
+                end=end, lane=lane, name=name, start=start, step=step))
+
+    @contextlib.contextmanager
+    def phase(self, name, lane=BUILD_LANE, step=None):
+        """Record the time spent in a `with` block as a phase"""
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.add(name, start, self.now(), lane, step)
+
+    def step_phases(self, step):
+        """Return total seconds per phase name for one step"""
+        totals = collections.OrderedDict()
+        with self.lock:
+            phases = sorted(self.phases, key=lambda phase: phase.start)
+        for phase in phases:
+            if phase.step == step:
+                totals[phase.name] = (totals.get(phase.name, 0.0) +
+                                      phase.end - phase.start)
+        return totals
+
+    def chrome_trace(self, step_names=()):
+        """Return the phases in Chrome trace event format.
+
+        Args:
+            step_names ([str]): Display name of each step, by index
+
+        Returns:
+            dict: JSON object with a `traceEvents` list
+        """
+        with self.lock:
+            phases = sorted(self.phases, key=lambda phase: phase.start)
+        lanes = sorted(set(phase.lane for phase in phases) | {BUILD_LANE})
+        events = [{
+            'name': 'process_name', 'ph': 'M', 'pid': 1, 'tid': BUILD_LANE,
+            'args': {'name': 'local_cloudbuild'},
+        }]
+        for lane in lanes:
+            events.append({
+                'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': lane,
+                'args': {'name': ('Build' if lane == BUILD_LANE
+                                  else 'Lane {}'.format(lane))},
+            })
+        for phase in phases:
+            name = phase.name
+            if (phase.name == STEP_PHASE and phase.step is not None and
+                    phase.step < len(step_names)):
+                name = step_names[phase.step]
+            event = {
+                'name': name,
+                'cat': 'build' if phase.step is None else 'step',
+                'ph': 'X',
+                'pid': 1,
+                'tid': phase.lane,
+                'ts': round(phase.start * 1e6, 3),
+                'dur': round((phase.end - phase.start) * 1e6, 3),
+            }
+            if phase.step is not None:
+                event['args'] = {'step': phase.step}
+                if phase.step < len(step_names):
+                    event['args']['name'] = step_names[phase.step]
+            events.append(event)
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def _write_json(path, value):
+    """Write a JSON file atomically"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory)
+    with os.fdopen(fd, 'w', encoding='utf8') as f:
+        json.dump(value, f, indent=2, sort_keys=True)
+        f.write('\n')
+    os.replace(tmp_path, path)
+
+
+def write_trace(path, recorder, step_names=()):
+    """Write a recorder's phases to a Chrome trace file"""
+    _write_json(path, recorder.chrome_trace(step_names))
+
+
+def summarize_runs(runs):
+    """Compute per-step statistics over recorded builds.
+
+    Only steps that succeeded without the step cache are counted.
+
+    Args:
+        runs ([dict]): Builds as stored in a summary file
+
+    Returns:
+        dict: Map of step name to count, p50 and max seconds
+    """
+    times = collections.OrderedDict()
+    for run in runs:
+        for step in run['steps']:
+            if step['status'] == 'SUCCESS' and not step['cached']:
+                times.setdefault(step['name'], []).append(step['elapsed'])
+    return {
+        name: {
+            'count': len(elapsed),
+            'max': max(elapsed),
+            'p50': statistics.median(elapsed),
+        }
+        for name, elapsed in times.items()
+    }
+
+
+def update_summary(path, step_names, results, recorder, elapsed):
+    """Add a build to a JSON summary file, creating it if needed.
+
+    Args:
+        path (str): Summary file
+        step_names ([str]): Name of each step, used to match steps
+                            across builds
+        results ([step_executor.StepResult]): Outcome of each step
+        recorder (TraceRecorder): Phases of the build
+        elapsed (float): Wall time of the whole build in seconds
+
+    Returns:
+        dict: The updated summary
+    """
+    try:
+        with open(path, 'r', encoding='utf8') as f:
+            runs = json.load(f)['runs']
+    except FileNotFoundError:
+        runs = []
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError('Could not read summary file {}: {}'.format(
+            path, e))
+
+    steps = []
+    for index, (name, result) in enumerate(zip(step_names, results)):
+        steps.append({
+            'cached': result.cached,
+            'elapsed': round(result.elapsed, 6),
+            'name': name,
+            'phases': {phase: round(seconds, 6) for phase, seconds in
+                       recorder.step_phases(index).items()},
+            'status': result.status,
+        })
+    runs.append({
+        'elapsed': round(elapsed, 6),
+        'finished': datetime.datetime.utcnow().strftime(
+            '%Y-%m-%dT%H:%M:%SZ'),
+        'steps': steps,
+    })
+    runs = runs[-MAX_SUMMARY_RUNS:]
+    summary = {'runs': runs, 'steps': summarize_runs(runs)}
+    _write_json(path, summary)
+    return summary
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit test for build_trace.py"""
+
+import json
+
+import pytest
+
+import build_trace
+import step_executor
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.time = 100.0
+
+    def __call__(self):
+        return self.time
+
+
+def _result(elapsed, status='SUCCESS', cached=False):
+    return step_executor.StepResult(
+        cached=cached, elapsed=elapsed, exit_code=0, output_bytes=0,
+        status=status)
+
+
+def test_lanes():
+    recorder = build_trace.TraceRecorder()
+    first = recorder.acquire_lane()
+    second = recorder.acquire_lane()
+    assert (first, second) == (1, 2)
+    recorder.release_lane(first)
+    # The lowest free lane is reused
+    assert recorder.acquire_lane() == 1
+    assert recorder.acquire_lane() == 3
+
+
+def test_phases():
+    clock = FakeClock()
+    recorder = build_trace.TraceRecorder(clock)
+    with recorder.phase('stage'):
+        clock.time += 1
+    lane = recorder.acquire_lane()
+    with recorder.phase('pull', lane, 0):
+        clock.time += 2
+    with recorder.phase('run', lane, 0):
+        clock.time += 3
+    with recorder.phase('run', lane, 0):
+        clock.time += 1
+    assert recorder.step_phases(0) == {'pull': 2.0, 'run': 4.0}
+    assert recorder.step_phases(1) == {}
+    assert recorder.now() == 7.0
+
+
+def test_chrome_trace():
+    clock = FakeClock()
+    recorder = build_trace.TraceRecorder(clock)
+    with recorder.phase('stage'):
+        clock.time += 0.5
+    recorder.add(build_trace.STEP_PHASE, 0.5, 1.5, lane=1, step=0)
+    recorder.add('run', 0.6, 1.5, lane=1, step=0)
+    recorder.add(build_trace.STEP_PHASE, 0.5, 1.0, lane=2, step=1)
+    trace = recorder.chrome_trace(['build', 'Step #1'])
+
+    metadata = [event for event in trace['traceEvents']
+                if event['ph'] == 'M']
+    assert sorted(event['args']['name'] for event in metadata) == [
+        'Build', 'Lane 1', 'Lane 2', 'local_cloudbuild']
+    complete = [event for event in trace['traceEvents']
+                if event['ph'] == 'X']
+    assert [(event['name'], event['tid']) for event in complete] == [
+        ('stage', 0), ('build', 1), ('Step #1', 2), ('run', 1)]
+    assert complete[0]['ts'] == 0
+    assert complete[0]['dur'] == 500000
+    assert complete[3]['args'] == {'step': 0, 'name': 'build'}
+
+
+def test_write_trace(tmpdir):
+    recorder = build_trace.TraceRecorder()
+    with recorder.phase('stage'):
+        pass
+    path = str(tmpdir.join('trace.json'))
+    build_trace.write_trace(path, recorder)
+    with open(path) as f:
+        assert 'traceEvents' in json.load(f)
+
+
+def test_update_summary(tmpdir, monkeypatch):
+    monkeypatch.setattr(build_trace, 'MAX_SUMMARY_RUNS', 3)
+    path = str(tmpdir.join('summary.json'))
+    recorder = build_trace.TraceRecorder()
+    for elapsed in [5.0, 1.0, 2.0, 3.0]:
+        summary = build_trace.update_summary(
+            path, ['first', 'second'],
+            [_result(elapsed), _result(10.0, cached=True)], recorder,
+            elapsed)
+    # Oldest run was dropped
+    assert len(summary['runs']) == 3
+    assert summary['steps'] == {
+        'first': {'count': 3, 'max': 3.0, 'p50': 2.0},
+    }
+    with open(path) as f:
+        assert json.load(f) == summary
+
+
+def test_update_summary_invalid(tmpdir):
+    path = tmpdir.join('summary.json')
+    path.write('[]')
+    with pytest.raises(ValueError):
+        build_trace.update_summary(
+            str(path), ['first'], [_result(1.0)],
+            build_trace.TraceRecorder(), 1.0)
+
+
+def test_summarize_runs_failures_ignored():
+    runs = [{'steps': [
+        {'cached': False, 'elapsed': 1.0, 'name': 'a', 'status': 'FAILURE'},
+        {'cached': False, 'elapsed': 4.0, 'name': 'b', 'status': 'SUCCESS'},
+    ]}]
+    assert build_trace.summarize_runs(runs) == {
+        'b': {'count': 1, 'max': 4.0, 'p50': 4.0},
+    }
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
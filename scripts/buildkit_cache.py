@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Keep the layer cache of `docker build` steps between local builds.
+
+The cloudbuild files build images with `--no-cache`, so that Cloud
+Build always starts from scratch.  Locally, `docker build` steps can
+instead be run with BuildKit, importing and exporting their layer
+cache from a directory per image name.  Those directories live in a
+Docker volume, so they are kept between builds.
+
+BuildKit can only export a cache to a directory from a builder that
+runs in a container of its own, so such a builder is created once,
+before the build.  Steps report the layers they took from the cache
+in their `--progress=plain` output, which LayerStats counts.
+"""
+
+import collections
+import re
+import threading
+
+
+# Image of the steps that are rewritten
+DOCKER_BUILDER_IMAGE = 'gcr.io/cloud-builders/docker'
+
+# BuildKit builder created for the rewritten steps
+BUILDER_NAME = 'local_cloudbuild'
+
+# Arguments of a docker command that creates the builder.  This fails
+# harmlessly if it already exists.
+SETUP_ARGS = ['buildx', 'create', '--name', BUILDER_NAME,
+              '--driver', 'docker-container']
+
+# Volume holding the cache directories, and where steps mount it
+CACHE_VOLUME = 'buildkit_cache'
+CACHE_PATH = '/buildkit_cache'
+
+# Disable the layer cache, removed from rewritten steps
+NO_CACHE_FLAGS = ['--no-cache', '--no-cache=true']
+
+# Flags whose value is the image tag
+TAG_FLAGS = ['-t', '--tag']
+
+# Characters that are replaced in the name of a cache directory
+UNSAFE_CHARACTERS = re.compile(r'[^A-Za-z0-9_.-]')
+
+# BuildKit's plain progress output.  A build instruction is a vertex
+# like `#5 [stage-1 2/4] RUN pip install ...`, and `#5 CACHED` means
+# it was taken from the cache.  Internal vertices, like loading the
+# Dockerfile, have no step number.
+VERTEX_REGEX = re.compile(r'^#(\d+) \[(?:\S+ )?\d+/\d+\] (\S+)')
+CACHED_REGEX = re.compile(r'^#(\d+) CACHED\s*$')
+
+# Layers of a step's build that were or weren't taken from the cache
+LayerCounts = collections.namedtuple('LayerCounts', 'cached total')
+
+
+def is_docker_build(image, args):
+    """Return True if a step runs `docker build`"""
+    repository = image.split('@')[0]
+    if ':' in repository.split('/')[-1]:
+        repository = repository.rsplit(':', 1)[0]
+    return (repository == DOCKER_BUILDER_IMAGE and bool(args) and
+            args[0] == 'build')
+
+
+def get_tag(args):
+    """Return the value of the first --tag flag, or None"""
+    for index, arg in enumerate(args):
+        if arg in TAG_FLAGS and index + 1 < len(args):
+            return args[index + 1]
+        for flag in TAG_FLAGS:
+            if arg.startswith(flag + '='):
+                return arg[len(flag) + 1:]
+    return None
+
+
+def cache_name(tag, default):
+    """Return the cache directory name for an image tag.
+
+    The version after `:` is left out, so that builds that only differ
+    by the version they tag share their cache.
+
+    Args:
+        tag (str): Substituted image tag, or None
+        default (str): Name to use without a tag
+
+    Returns:
+        str: Name safe to use as a directory
+    """
+    if not tag:
+        return default
+    repository = tag.split('@')[0]
+    if ':' in repository.split('/')[-1]:
+        repository = repository.rsplit(':', 1)[0]
+    return UNSAFE_CHARACTERS.sub('_', repository)
+
+
+def rewrite_args(args, name):
+    """Turn the arguments of `docker build` into a cached BuildKit build.
+
+    Args:
+        args ([str]): Arguments of the step, starting with `build`
+        name (str): Cache directory name, from cache_name
+
+    Returns:
+        [str]: Arguments of a `docker buildx build` command
+    """
+    cache_dir = '{}/{}'.format(CACHE_PATH, name)
+    return [
+        'buildx', 'build',
+        '--builder', BUILDER_NAME,
+        # Images built by the builder container are not in the daemon
+        # unless they are loaded into it
+        '--load',
+        '--progress=plain',
+        '--cache-from', 'type=local,src={}'.format(cache_dir),
+        '--cache-to', 'type=local,dest={},mode=max'.format(cache_dir),
+    ] + [arg for arg in args[1:] if arg not in NO_CACHE_FLAGS]
+
+
+class LayerStats(object):
+    """Counts cached layers in the output of rewritten steps"""
+
+    def __init__(self, indices):
+        """Count the layers of the steps with these indices"""
+        self.lock = threading.Lock()
+        # Map of step index to map of vertex number to whether it was
+        # taken from the cache
+        self.vertices = {index: {} for index in indices}
+
+    def feed(self, index, line):
+        """Look at a line of a step's output.
+
+        Args:
+            index (int): Index of the step
+            line (bytes): Line of its stdout or stderr
+        """
+        vertices = self.vertices.get(index)
+        if vertices is None:
+            return
+        text = line.decode('utf8', errors='replace')
+        match = VERTEX_REGEX.match(text)
+        with self.lock:
+            if match:
+                # FROM only resolves the base image
+                if match.group(2) != 'FROM':
+                    vertices.setdefault(match.group(1), False)
+                return
+            match = CACHED_REGEX.match(text)
+            if match and match.group(1) in vertices:
+                vertices[match.group(1)] = True
+
+    def counts(self, index):
+        """Return LayerCounts for a step"""
+        with self.lock:
+            vertices = self.vertices[index]
+            return LayerCounts(cached=sum(vertices.values()),
+                               total=len(vertices))
+
+    def format(self, step_names):
+        """Describe the cache hit rate of each counted step.
+
+        Args:
+            step_names ([str]): Display name of every step
+
+        Returns:
+            str: One line per step
+        """
+        lines = []
+        for index in sorted(self.vertices):
+            counts = self.counts(index)
+            rate = ('{:.0%}'.format(counts.cached / counts.total)
+                    if counts.total else '-')
+            lines.append('{}: {} of {} layers from the BuildKit cache '
+                         '({})'.format(step_names[index], counts.cached,
+                                       counts.total, rate))
+        return '\n'.join(lines)
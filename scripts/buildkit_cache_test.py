@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit test for buildkit_cache.py"""
+
+import pytest
+
+import buildkit_cache
+
+
+@pytest.mark.parametrize('image, args, expected', [
+    ('gcr.io/cloud-builders/docker', ['build', '.'], True),
+    ('gcr.io/cloud-builders/docker:latest', ['build', '.'], True),
+    ('gcr.io/cloud-builders/docker', ['push', 'image'], False),
+    ('gcr.io/cloud-builders/docker', [], False),
+    ('gcr.io/other/docker', ['build', '.'], False),
+])
+def test_is_docker_build(image, args, expected):
+    assert buildkit_cache.is_docker_build(image, args) == expected
+
+
+@pytest.mark.parametrize('args, expected', [
+    (['build', '--tag=repo/image:v1', '.'], 'repo/image:v1'),
+    (['build', '-t', 'repo/image', '.'], 'repo/image'),
+    (['build', '--tag', 'a', '--tag', 'b', '.'], 'a'),
+    (['build', '.'], None),
+])
+def test_get_tag(args, expected):
+    assert buildkit_cache.get_tag(args) == expected
+
+
+@pytest.mark.parametrize('tag, expected', [
+    ('gcr.io/project/python:2017-10-17', 'gcr.io_project_python'),
+    ('localhost:5000/image', 'localhost_5000_image'),
+    ('image@sha256:abc', 'image'),
+    (None, 'step_3'),
+])
+def test_cache_name(tag, expected):
+    assert buildkit_cache.cache_name(tag, 'step_3') == expected
+
+
+def test_rewrite_args():
+    args = buildkit_cache.rewrite_args(
+        ['build', '--tag=image', '--no-cache', '/workspace/dir/'], 'image')
+    assert args[:2] == ['buildx', 'build']
+    assert '--no-cache' not in args
+    assert args[-2:] == ['--tag=image', '/workspace/dir/']
+    assert 'type=local,src=/buildkit_cache/image' in args
+    assert 'type=local,dest=/buildkit_cache/image,mode=max' in args
+
+
+def test_layer_stats():
+    stats = buildkit_cache.LayerStats([1])
+    output = [
+        '#1 [internal] load build definition from Dockerfile',
+        '#4 [1/4] FROM docker.io/library/debian:stable',
+        '#4 CACHED',
+        '#5 [2/4] RUN apt-get update',
+        '#5 CACHED',
+        '#6 [3/4] COPY requirements.txt /app/',
+        '#6 CACHED',
+        '#7 [4/4] RUN pip install -r /app/requirements.txt',
+        '#7 0.512 Collecting six',
+        '#7 DONE 3.2s',
+    ]
+    for line in output:
+        stats.feed(1, (line + '\n').encode('utf8'))
+        # Other steps are not counted
+        stats.feed(0, (line + '\n').encode('utf8'))
+    assert stats.counts(1) == buildkit_cache.LayerCounts(cached=2, total=3)
+    assert stats.format(['first', 'second']) == (
+        'second: 2 of 3 layers from the BuildKit cache (67%)')
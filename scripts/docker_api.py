@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Minimal client for the Docker Engine API over a unix socket.
+
+Only what local_cloudbuild needs to run steps is covered: inspecting
+and pulling images, and creating, attaching to, starting, waiting on,
+signalling and removing containers.  Short requests share a pool of
+keep-alive connections instead of paying for a `docker` CLI process
+and a new connection each.  Attaching to a container takes over its
+connection for the container's output, so every attach gets a fresh
+one.
+
+See https://docs.docker.com/engine/api/v1.24/
+"""
+
+import collections
+import http.client
+import json
+import os
+import socket
+import struct
+import subprocess
+import threading
+import urllib.parse
+
+
+# Oldest API version with everything used here (Docker 1.12)
+API_VERSION = 'v1.24'
+
+DEFAULT_SOCKET = '/var/run/docker.sock'
+
+# Placeholder for the host staging directory in volume specs, as in
+# the shell commands generated by local_cloudbuild
+WORKSPACE_PLACEHOLDER = '${HOST_WORKSPACE}'
+
+# Stream ids in the header of each frame of attached output
+STDOUT = 1
+STDERR = 2
+
+# Frame header: stream id, 3 bytes padding, big-endian payload size
+FRAME_HEADER = struct.Struct('>BxxxL')
+
+# Exit code `docker run` uses when the daemon reports an error
+DAEMON_ERROR_EXIT_CODE = 125
+
+# Container to create for a step.  `args` may be empty to use the
+# image's default command.  `env` is a list of 'KEY=VALUE' strings and
+# `volumes` a list of 'HOST:CONTAINER' strings, where HOST may contain
+# WORKSPACE_PLACEHOLDER.
+ContainerSpec = collections.namedtuple(
+    'ContainerSpec', 'args env image volumes workdir')
+
+
+class DockerError(Exception):
+    """Error response from the Docker daemon"""
+
+    def __init__(self, status, message):
+        super().__init__('Docker API error {}: {}'.format(status, message))
+        self.status = status
+        self.message = message
+
+
+def default_socket_path():
+    """Return the daemon socket from $DOCKER_HOST, or the default one"""
+    docker_host = os.environ.get('DOCKER_HOST', '')
+    if docker_host.startswith('unix://'):
+        return docker_host[len('unix://'):]
+    return DEFAULT_SOCKET
+
+
+def split_image(image):
+    """Split an image reference into the repository and tag to pull.
+
+    Returns:
+        (str, str): Repository, and tag or '' for a digest reference
+    """
+    if '@' in image:
+        return image, ''
+    repository, sep, tag = image.rpartition(':')
+    if not sep or '/' in tag:
+        return image, 'latest'
+    return repository, tag
+
+
+def create_body(spec, workspace):
+    """Return the request body that creates a container for a spec"""
+    body = {
+        'AttachStderr': True,
+        'AttachStdout': True,
+        'Env': list(spec.env),
+        'HostConfig': {
+            'Binds': [volume.replace(WORKSPACE_PLACEHOLDER, workspace)
+                      for volume in spec.volumes],
+        },
+        'Image': spec.image,
+        'WorkingDir': spec.workdir,
+    }
+    if spec.args:
+        body['Cmd'] = list(spec.args)
+    return body
+
+
+def read_frames(stream):
+    """Yield (stream id, bytes) for each frame of attached output"""
+    while True:
+        header = _read_exactly(stream, FRAME_HEADER.size)
+        if len(header) < FRAME_HEADER.size:
+            return
+        stream_id, size = FRAME_HEADER.unpack(header)
+        payload = _read_exactly(stream, size)
+        if payload:
+            yield stream_id, payload
+        if len(payload) < size:
+            return
+
+
+def _read_exactly(stream, size):
+    data = b''
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            break
+        data += chunk
+    return data
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTP connection to a unix domain socket"""
+
+    def __init__(self, socket_path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+class DockerClient(object):
+    """Thread-safe Docker Engine API client"""
+
+    def __init__(self, socket_path=DEFAULT_SOCKET):
+        self.socket_path = socket_path
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def _url(self, path, query=None):
+        url = '/{}{}'.format(API_VERSION, path)
+        if query:
+            url += '?' + urllib.parse.urlencode(sorted(query.items()))
+        return url
+
+    def _send(self, connection, method, url, body):
+        headers = {}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode('utf8')
+            headers['Content-Type'] = 'application/json'
+        connection.request(method, url, body=data, headers=headers)
+        return connection.getresponse()
+
+    def request(self, method, path, query=None, body=None):
+        """Make a request on a pooled keep-alive connection.
+
+        Returns:
+            Decoded JSON response, or None for an empty response
+        """
+        url = self._url(path, query)
+        with self.lock:
+            connection = self.idle.pop() if self.idle else None
+        if connection is not None:
+            try:
+                response = self._send(connection, method, url, body)
+                data = response.read()
+            except (http.client.HTTPException, ConnectionError):
+                # The daemon closed the idle connection, try a new one
+                connection.close()
+                connection = None
+        if connection is None:
+            connection = UnixHTTPConnection(self.socket_path)
+            try:
+                response = self._send(connection, method, url, body)
+                data = response.read()
+            except BaseException:
+                connection.close()
+                raise
+        if response.will_close:
+            connection.close()
+        else:
+            with self.lock:
+                self.idle.append(connection)
+        return _decode(response, data)
+
+    def close(self):
+        """Close all idle connections"""
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+    def ping(self):
+        """Raise an exception unless the daemon is reachable"""
+        self.request('GET', '/_ping')
+
+    def image_id(self, image):
+        """Return the local ID of an image, or '' if it isn't present"""
+        try:
+            return self.request(
+                'GET', '/images/{}/json'.format(image))['Id']
+        except DockerError as e:
+            if e.status == 404:
+                return ''
+            raise
+
+    def pull(self, image):
+        """Pull an image, waiting until it is complete"""
+        repository, tag = split_image(image)
+        query = {'fromImage': repository}
+        if tag:
+            query['tag'] = tag
+        connection = UnixHTTPConnection(self.socket_path)
+        try:
+            response = self._send(connection, 'POST',
+                                  self._url('/images/create', query), None)
+            if response.status >= 400:
+                _decode(response, response.read())
+            # Progress is streamed as JSON objects, one per line
+            for line in response:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    message = json.loads(line.decode('utf8'))
+                except ValueError:
+                    continue
+                if 'error' in message:
+                    raise DockerError(response.status, message['error'])
+        finally:
+            connection.close()
+
+    def create(self, body):
+        """Create a container, returning its ID"""
+        return self.request('POST', '/containers/create', body=body)['Id']
+
+    def attach(self, container_id):
+        """Attach to a created container's output.
+
+        Returns:
+            http.client.HTTPResponse: Stream of frames for read_frames,
+                                      which owns its connection
+        """
+        connection = UnixHTTPConnection(self.socket_path)
+        try:
+            response = self._send(
+                connection, 'POST',
+                self._url('/containers/{}/attach'.format(container_id),
+                          {'stderr': 1, 'stdout': 1, 'stream': 1}), None)
+            if response.status >= 400:
+                _decode(response, response.read())
+        except BaseException:
+            connection.close()
+            raise
+        return response
+
+    def start(self, container_id):
+        self.request('POST', '/containers/{}/start'.format(container_id))
+
+    def wait(self, container_id):
+        """Wait for a container to stop, returning its exit code"""
+        return self.request(
+            'POST', '/containers/{}/wait'.format(container_id))['StatusCode']
+
+    def kill(self, container_id, signum):
+        self.request('POST', '/containers/{}/kill'.format(container_id),
+                     {'signal': int(signum)})
+
+    def remove(self, container_id):
+        self.request('DELETE', '/containers/{}'.format(container_id),
+                     {'force': 1, 'v': 1})
+
+
+def _decode(response, data):
+    """Return the JSON body of a response, raising DockerError on errors"""
+    value = None
+    if data:
+        try:
+            value = json.loads(data.decode('utf8'))
+        except ValueError:
+            value = data.decode('utf8', errors='replace').strip()
+    if response.status >= 400:
+        message = value
+        if isinstance(value, dict):
+            message = value.get('message', value)
+        raise DockerError(response.status, message)
+    return value
+
+
+class ContainerProcess(object):
+    """A step running in a container, used like subprocess.Popen.
+
+    Output is copied from the attach stream to `stdout` and `stderr`
+    pipes, so it can be read line by line like a child process's.
+    The container is removed once it has stopped.
+    """
+
+    def __init__(self, client, spec, workspace):
+        self.client = client
+        self.args = spec.image
+        self.returncode = None
+        self.done = threading.Event()
+        self.container_id = client.create(create_body(spec, workspace))
+        try:
+            stream = client.attach(self.container_id)
+            try:
+                client.start(self.container_id)
+            except BaseException:
+                stream.close()
+                raise
+        except BaseException:
+            self._remove()
+            raise
+        out_read, self.out_write = os.pipe()
+        err_read, self.err_write = os.pipe()
+        self.stdout = open(out_read, 'rb')
+        self.stderr = open(err_read, 'rb')
+        copier = threading.Thread(target=self._copy_output, args=(stream,))
+        copier.daemon = True
+        copier.start()
+
+    def _copy_output(self, stream):
+        try:
+            with stream:
+                for stream_id, payload in read_frames(stream):
+                    fd = self.err_write if stream_id == STDERR else (
+                        self.out_write)
+                    while payload:
+                        payload = payload[os.write(fd, payload):]
+        except (OSError, http.client.HTTPException):
+            # Lost the connection, or nobody reads the output any more
+            pass
+        finally:
+            os.close(self.out_write)
+            os.close(self.err_write)
+            try:
+                self.returncode = self.client.wait(self.container_id)
+            except (OSError, http.client.HTTPException, DockerError):
+                self.returncode = DAEMON_ERROR_EXIT_CODE
+            self._remove()
+            self.done.set()
+
+    def _remove(self):
+        try:
+            self.client.remove(self.container_id)
+        except (OSError, http.client.HTTPException, DockerError):
+            pass
+
+    def poll(self):
+        return self.returncode if self.done.is_set() else None
+
+    def wait(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise subprocess.TimeoutExpired(self.args, timeout)
+        return self.returncode
+
+    def send_signal(self, signum):
+        """Signal the container, ignoring containers that have stopped"""
+        try:
+            self.client.kill(self.container_id, signum)
+        except DockerError:
+            pass
@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit test for docker_api.py"""
+
+import io
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import pytest
+
+import docker_api
+
+
+@pytest.fixture
+def testdata_dir():
+    testdata_dir = os.path.join(os.path.dirname(__file__), 'testdata')
+    assert os.path.isdir(testdata_dir), (
+        'Could not run test: testdata directory not found')
+    return testdata_dir
+
+
+@pytest.fixture
+def docker_client(testdata_dir):
+    """Client of a stand-in Docker daemon"""
+    # Unix socket paths are limited to about 100 characters
+    socket_dir = tempfile.mkdtemp(prefix='dockerd_')
+    socket_path = os.path.join(socket_dir, 'docker.sock')
+    server = subprocess.Popen([
+        sys.executable, os.path.join(testdata_dir, 'fake_docker', 'dockerd'),
+        socket_path])
+    try:
+        for _ in range(500):
+            if os.path.exists(socket_path):
+                break
+            time.sleep(0.01)
+        client = docker_api.DockerClient(socket_path)
+        yield client
+        client.close()
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(socket_dir)
+
+
+def _spec(args, workspace):
+    return docker_api.ContainerSpec(
+        args=args,
+        env=['GREETING=hello'],
+        image='debian',
+        volumes=[workspace + ':/workspace'],
+        workdir='/workspace',
+    )
+
+
+@pytest.mark.parametrize('docker_host, expected', [
+    ('', '/var/run/docker.sock'),
+    ('unix:///tmp/docker.sock', '/tmp/docker.sock'),
+    ('tcp://127.0.0.1:2375', '/var/run/docker.sock'),
+])
+def test_default_socket_path(monkeypatch, docker_host, expected):
+    monkeypatch.setenv('DOCKER_HOST', docker_host)
+    assert docker_api.default_socket_path() == expected
+
+
+@pytest.mark.parametrize('image, expected', [
+    ('debian', ('debian', 'latest')),
+    ('gcr.io/google-appengine/debian8:2017-06-01',
+     ('gcr.io/google-appengine/debian8', '2017-06-01')),
+    ('localhost:5000/app', ('localhost:5000/app', 'latest')),
+    ('debian@sha256:abcd', ('debian@sha256:abcd', '')),
+])
+def test_split_image(image, expected):
+    assert docker_api.split_image(image) == expected
+
+
+def test_create_body():
+    spec = docker_api.ContainerSpec(
+        args=[], env=['A=1'], image='debian',
+        volumes=['${HOST_WORKSPACE}:/workspace'], workdir='/workspace/dir')
+    body = docker_api.create_body(spec, '/tmp/staging')
+    assert body['HostConfig']['Binds'] == ['/tmp/staging:/workspace']
+    assert body['Env'] == ['A=1']
+    assert body['WorkingDir'] == '/workspace/dir'
+    # No args means the image's default command
+    assert 'Cmd' not in body
+    assert docker_api.create_body(
+        spec._replace(args=['ls']), '/tmp')['Cmd'] == ['ls']
+
+
+def test_read_frames():
+    data = (docker_api.FRAME_HEADER.pack(1, 3) + b'out' +
+            docker_api.FRAME_HEADER.pack(2, 4) + b'err\n' +
+            docker_api.FRAME_HEADER.pack(1, 10) + b'cut')
+    assert list(docker_api.read_frames(io.BytesIO(data))) == [
+        (1, b'out'), (2, b'err\n'), (1, b'cut')]
+
+
+def test_keep_alive(docker_client):
+    for _ in range(5):
+        docker_client.ping()
+    assert docker_client.request('GET', '/fake/connections') == 1
+    # A connection closed by the daemon is replaced
+    docker_client.idle[0].sock.shutdown(socket.SHUT_RDWR)
+    docker_client.ping()
+    assert docker_client.request('GET', '/fake/connections') == 2
+
+
+def test_images(docker_client):
+    assert docker_client.image_id('debian').startswith('sha256:')
+    assert docker_client.image_id('missing') == ''
+    docker_client.pull('debian:8')
+    with pytest.raises(docker_api.DockerError) as excinfo:
+        docker_client.pull('missing')
+    assert excinfo.value.status == 404
+
+
+def test_container_process(tmpdir, docker_client):
+    process = docker_api.ContainerProcess(
+        docker_client,
+        _spec(['sh', '-c', 'echo $GREETING; echo oops >&2; exit 2'],
+              str(tmpdir)),
+        str(tmpdir))
+    assert process.stdout.read() == b'hello\n'
+    assert process.stderr.read() == b'oops\n'
+    assert process.wait(10) == 2
+    assert process.poll() == 2
+    # Removed after it stopped
+    with pytest.raises(docker_api.DockerError):
+        docker_client.wait(process.container_id)
+
+
+def test_container_process_signal(tmpdir, docker_client):
+    process = docker_api.ContainerProcess(
+        docker_client, _spec(['sleep', '30'], str(tmpdir)), str(tmpdir))
+    with pytest.raises(subprocess.TimeoutExpired):
+        process.wait(0.1)
+    assert process.poll() is None
+    process.send_signal(signal.SIGTERM)
+    assert process.wait(10) == 128 + signal.SIGTERM
+    # Signalling a removed container is ignored
+    process.send_signal(signal.SIGKILL)
+
+
+def test_create_missing_image(tmpdir, docker_client):
+    spec = _spec(['true'], str(tmpdir))._replace(image='missing')
+    with pytest.raises(docker_api.DockerError) as excinfo:
+        docker_api.ContainerProcess(docker_client, spec, str(tmpdir))
+    assert 'No such image' in str(excinfo.value)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
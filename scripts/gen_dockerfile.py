@@ -19,14 +19,23 @@
 import argparse
 import collections
 import collections.abc
+import concurrent.futures
 import functools
+import glob
+import hashlib
 import io
+import logging
 import os
 import re
 import sys
+import tempfile
 
 import yaml
 
+import async_frameworks
+import build_context
+import gunicorn_config
+import pinned_requirements
 import validation_utils
 
 # Validate characters for dockerfile image names.
@@ -63,11 +72,105 @@ GAE_APPLICATION_YAML_PATH = 'GAE_APPLICATION_YAML_PATH'
 # Validated application configuration
 AppConfig = collections.namedtuple(
     'AppConfig',
-    'base_image dockerfile_python_version entrypoint has_requirements_txt is_python_compat'
+    'base_image build_context cache_mounts compile_bytecode '
+    'dockerfile_python_version entrypoint gunicorn_settings '
+    'has_requirements_txt is_python_compat pinned_requirements '
+    'slim_base_image'
 )
 
+# A service of a batch: its configuration file and source directory
+Service = collections.namedtuple('Service', 'config_file source_dir')
 
-def get_app_config(raw_config, base_image, config_file, source_dir):
+# Outcome of generating files for one service of a batch.  `error` is
+# None on success, and `changed` lists the files whose contents changed.
+ServiceResult = collections.namedtuple(
+    'ServiceResult', 'changed error service')
+
+# First interpreter version that can write hash-based .pyc files, which
+# don't depend on source mtimes (PEP 552)
+HASH_PYC_VERSION = (3, 7)
+
+# Image the final stage of multi-stage Dockerfiles is built on.  It
+# should be the OS image the runtime image is built on, so that the
+# interpreter and the packages built for it find the same libraries.
+DEFAULT_SLIM_BASE_IMAGE = 'gcr.io/google-appengine/debian8:latest'
+
+# Permissions of newly generated files
+NEW_FILE_MODE = 0o644
+
+# Label of the fingerprint in generated Dockerfiles, and the file next
+# to them holding it too
+FINGERPRINT_LABEL = 'com.google.runtimes.python.fingerprint'
+FINGERPRINT_FILE = 'Dockerfile.fingerprint'
+
+# Changed whenever what the fingerprint covers changes
+FINGERPRINT_VERSION = 1
+
+
+def entrypoint_problem(entrypoint):
+    """Describe what is wrong with an entrypoint, if anything"""
+    if not PRINTABLE_REGEX.match(entrypoint):
+        return 'Invalid "entrypoint" value in app.yaml: {!r}'.format(
+            entrypoint)
+    return None
+
+
+def python_version_problem(python_version):
+    """Describe what is wrong with a python_version, if anything"""
+    if python_version not in PYTHON_INTERPRETER_VERSION_MAP:
+        valid_versions = str(sorted(PYTHON_INTERPRETER_VERSION_MAP.keys()))
+        return ('Invalid "python_version" field in "runtime_config" section '
+                'of app.yaml: {!r}.  Valid options are: {}'.format(
+                    python_version, valid_versions))
+    return None
+
+
+def positive_problem(value):
+    """Describe what is wrong with an amount of resources, if anything"""
+    if value <= 0:
+        return 'Expected a positive number, but found {!r}'.format(value)
+    return None
+
+
+def negative_problem(value):
+    """Describe what is wrong with a count where 0 means derived"""
+    if value < 0:
+        return 'Expected 0 or a positive number, but found {!r}'.format(value)
+    return None
+
+
+# Fields of app.yaml that get_app_config reads
+APP_YAML_SCHEMA = validation_utils.Record({
+    'entrypoint': validation_utils.Scalar(str, check=entrypoint_problem),
+    'resources': validation_utils.Record({
+        'cpu': validation_utils.Scalar(
+            float, check=positive_problem,
+            default=gunicorn_config.DEFAULT_CPU),
+        'memory_gb': validation_utils.Scalar(
+            float, check=positive_problem,
+            default=gunicorn_config.DEFAULT_MEMORY_GB),
+    }),
+    'runtime': validation_utils.Scalar(str),
+    'runtime_config': validation_utils.Record({
+        'async_worker': validation_utils.Scalar(bool),
+        'cache_mounts': validation_utils.Scalar(bool),
+        'compile_bytecode': validation_utils.Scalar(bool),
+        'gunicorn_keepalive': validation_utils.Scalar(
+            int, check=negative_problem),
+        'gunicorn_preload_app': validation_utils.Scalar(bool, default=False),
+        'gunicorn_threads': validation_utils.Scalar(
+            int, check=negative_problem),
+        'gunicorn_workers': validation_utils.Scalar(
+            int, check=negative_problem),
+        'python_version': validation_utils.Scalar(
+            str, check=python_version_problem),
+    }),
+})
+APP_YAML_VALIDATOR = validation_utils.Validator(APP_YAML_SCHEMA)
+
+
+def get_app_config(raw_config, base_image, config_file, source_dir,
+                   slim_base_image=None):
     """Read and validate the application runtime configuration.
 
     We validate the user input for security and better error messages.
@@ -87,6 +190,8 @@ def get_app_config(raw_config, base_image, config_file, source_dir):
         base_image (str): Docker image name to build on top of
         config_file (str): Path to user's app.yaml (might be <service>.yaml)
         source_dir (str): Directory containing user's source code
+        slim_base_image (str): Docker image name for the final stage of
+            a multi-stage Dockerfile, or None for a single stage
 
     Returns:
         AppConfig: valid configuration
@@ -102,16 +207,20 @@ def get_app_config(raw_config, base_image, config_file, source_dir):
         raw_config, 'runtime', str) == 'python-compat':
       return AppConfig(
           base_image=None,
+          build_context=None,
+          cache_mounts=None,
+          compile_bytecode=None,
           dockerfile_python_version=None,
           entrypoint=None,
+          gunicorn_settings=None,
           has_requirements_txt=None,
-          is_python_compat=True)
+          is_python_compat=True,
+          pinned_requirements=None,
+          slim_base_image=None)
 
-    entrypoint = validation_utils.get_field_value(
-        raw_config, 'entrypoint', str)
-    if not PRINTABLE_REGEX.match(entrypoint):
-        raise ValueError(
-            'Invalid "entrypoint" value in app.yaml: {!r}'.format(entrypoint))
+    # Report every invalid field at once
+    fields = APP_YAML_VALIDATOR.check(raw_config)
+    entrypoint = fields['entrypoint']
 
     # Mangle entrypoint in the same way as the Cloud SDK
     # (googlecloudsdk/third_party/appengine/api/validation.py)
@@ -121,32 +230,72 @@ def get_app_config(raw_config, base_image, config_file, source_dir):
     if entrypoint and not entrypoint.startswith('exec '):
         entrypoint = 'exec ' + entrypoint
 
-    raw_runtime_config = validation_utils.get_field_value(
-        raw_config, 'runtime_config', dict)
-    python_version = validation_utils.get_field_value(
-        raw_runtime_config, 'python_version', str)
+    dockerfile_python_version = PYTHON_INTERPRETER_VERSION_MAP[
+        fields['runtime_config']['python_version']]
 
-    dockerfile_python_version = PYTHON_INTERPRETER_VERSION_MAP.get(
-        python_version)
-    if dockerfile_python_version is None:
-        valid_versions = str(sorted(PYTHON_INTERPRETER_VERSION_MAP.keys()))
+    # The final stage copies one of the runtime image's interpreters
+    # from /opt, and Python 2.7 comes from Debian packages instead.
+    if slim_base_image and not dockerfile_python_version:
         raise ValueError(
-            'Invalid "python_version" field in "runtime_config" section '
-            'of app.yaml: {!r}.  Valid options are: {}'.
-            format(python_version, valid_versions))
+            'Multi-stage Dockerfiles need a Python 3 "python_version" in '
+            'the "runtime_config" section of app.yaml')
 
     # Examine user's files
     has_requirements_txt = os.path.isfile(
         os.path.join(source_dir, 'requirements.txt'))
+    pinned = pinned_requirements.get_pinned_requirements(source_dir)
+    # With --fingerprint, the generated .dockerignore lists FINGERPRINT_FILE
+    # as well, which isn't an entry of the user's
+    context = build_context.scan(
+        source_dir, get_data('dockerignore') + FINGERPRINT_FILE + '\n')
+
+    # Run applications of async frameworks on a worker class for them
+    if pinned and pinned.contents is not None:
+        requirements = pinned.contents
+    else:
+        requirements = async_frameworks.read_requirements(source_dir)
+    source = async_frameworks.read_module(
+        source_dir, async_frameworks.get_app_module(entrypoint))
+    framework = async_frameworks.detect(source, requirements)
+    if framework:
+        problem = async_frameworks.python_version_problem(
+            framework, dockerfile_python_version)
+        if problem:
+            logging.warning('%s: %s', config_file, problem)
+    if framework and fields['runtime_config']['async_worker']:
+        problem = async_frameworks.server_problem(framework, requirements)
+        if problem:
+            logging.warning('%s: %s', config_file, problem)
+        elif entrypoint or source:
+            # Without an entrypoint, only when there is a main.py to run
+            entrypoint = async_frameworks.get_entrypoint(
+                entrypoint, framework)
+
+    # Size gunicorn for the instance, unless the user configures it
+    if (entrypoint and gunicorn_config.is_requested(raw_config) and
+            gunicorn_config.is_plain_gunicorn(entrypoint) and
+            not gunicorn_config.has_own_config(source_dir)):
+        gunicorn_settings = gunicorn_config.get_settings(
+            fields['resources'], fields['runtime_config'])
+        entrypoint = gunicorn_config.add_config_flag(entrypoint)
+    else:
+        gunicorn_settings = None
 
     return AppConfig(
         base_image=base_image,
+        build_context=context,
+        cache_mounts=fields['runtime_config']['cache_mounts'],
+        compile_bytecode=fields['runtime_config']['compile_bytecode'],
         dockerfile_python_version=dockerfile_python_version,
         entrypoint=entrypoint,
+        gunicorn_settings=gunicorn_settings,
         has_requirements_txt=has_requirements_txt,
-        is_python_compat=False)
+        is_python_compat=False,
+        pinned_requirements=pinned,
+        slim_base_image=slim_base_image)
 
 
+@functools.lru_cache(maxsize=None)
 def get_data(name):
     """Return the contents of the named data resource
 
@@ -154,6 +303,8 @@ def get_data(name):
     google-cloud-sdk/platform/ext-runtime/python/data
     and the two should be kept in sync.
 
+    Files are only read once per process.
+
     Args:
         name (str): Name of file, without directory
 
@@ -165,6 +316,24 @@ def get_data(name):
         return template_file.read()
 
 
+def get_compileall_flags(python_version):
+    """Return the flags of `python -m compileall` for an interpreter.
+
+    Where the interpreter supports them, pycs are hash-based so they
+    stay valid whatever mtimes the files get in the image.
+
+    Args:
+        python_version (str): Value of AppConfig.dockerfile_python_version
+
+    Returns:
+        str: Command line flags
+    """
+    version = tuple(int(part) for part in python_version.split('.') if part)
+    if version >= HASH_PYC_VERSION:
+        return '-q --invalidation-mode checked-hash'
+    return '-q'
+
+
 def generate_files(app_config):
     """Generate a Dockerfile and helper files for an application.
 
@@ -174,8 +343,31 @@ def generate_files(app_config):
     Returns:
         dict: Map of filename to desired file contents
     """
-    if app_config.has_requirements_txt:
-        optional_requirements_txt = get_data('Dockerfile.requirements_txt')
+    # BuildKit cache mounts keep pip's download cache and the compiler
+    # cache between builds.  They need the Dockerfile syntax header.
+    if app_config.cache_mounts:
+        optional_syntax = get_data('Dockerfile.syntax')
+    else:
+        optional_syntax = ''
+
+    # Fully pinned dependencies are installed without resolving them.
+    # Multi-stage Dockerfiles build wheels on the runtime image and
+    # install them into the virtualenv, which the final stage copies.
+    pinned = app_config.pinned_requirements
+    if pinned:
+        requirements_txt = 'Dockerfile.requirements_pinned'
+    else:
+        requirements_txt = 'Dockerfile.requirements_txt'
+    if app_config.slim_base_image:
+        requirements_txt += '.wheels'
+    if app_config.cache_mounts:
+        requirements_txt += '.cache_mounts'
+    if pinned:
+        optional_requirements_txt = get_data(
+            requirements_txt + '.template').format(
+                requirements_file=pinned.filename)
+    elif app_config.has_requirements_txt:
+        optional_requirements_txt = get_data(requirements_txt)
     else:
         optional_requirements_txt = ''
 
@@ -186,52 +378,388 @@ def generate_files(app_config):
     else:
         optional_entrypoint = ''
 
+    # Compile the app and its packages to bytecode in the image, so
+    # that new instances don't spend their first requests on it
+    if app_config.compile_bytecode:
+        optional_compile_bytecode = get_data(
+            'Dockerfile.compile_bytecode.template').format(
+                compileall_flags=get_compileall_flags(
+                    app_config.dockerfile_python_version),
+                site_version=app_config.dockerfile_python_version or '2.7')
+    else:
+        optional_compile_bytecode = ''
+
+    # Leave what the scan of the source directory found out of the build
+    # context, along with what the user excluded
+    if app_config.build_context:
+        dockerignore = build_context.format_dockerignore(
+            get_data('dockerignore'), app_config.build_context)
+    else:
+        dockerignore = get_data('dockerignore')
+
     if app_config.is_python_compat:
       dockerfile = get_data('Dockerfile.python_compat')
       dockerignore = get_data('dockerignore.python_compat')
+    elif app_config.slim_base_image:
+      dockerfile = ''.join([
+          optional_syntax,
+          get_data('Dockerfile.builder_stage.template').format(
+              base_image=app_config.base_image),
+          get_data('Dockerfile.virtualenv.template').format(
+              python_version=app_config.dockerfile_python_version),
+          optional_requirements_txt,
+          get_data('Dockerfile.runtime_packages.template').format(
+              python_version=app_config.dockerfile_python_version),
+          get_data('Dockerfile.slim_stage.template').format(
+              python_version=app_config.dockerfile_python_version,
+              slim_base_image=app_config.slim_base_image),
+          get_data('Dockerfile.install_app'),
+          optional_compile_bytecode,
+          optional_entrypoint,
+      ])
     else:
       dockerfile = ''.join([
+          optional_syntax,
           get_data('Dockerfile.preamble.template').format(
               base_image=app_config.base_image),
           get_data('Dockerfile.virtualenv.template').format(
               python_version=app_config.dockerfile_python_version),
           optional_requirements_txt,
           get_data('Dockerfile.install_app'),
+          optional_compile_bytecode,
           optional_entrypoint,
       ])
-      dockerignore =  get_data('dockerignore')
 
-    return {
+    files = {
         'Dockerfile': dockerfile,
         '.dockerignore': dockerignore,
     }
+    if pinned and pinned.contents is not None:
+        files[pinned.filename] = pinned.contents
+    if app_config.gunicorn_settings:
+        files[gunicorn_config.GUNICORN_CONF_PY] = get_data(
+            'gunicorn.conf.py.template').format(
+                **app_config.gunicorn_settings._asdict())
+    return files
 
 
-def generate_dockerfile_command(base_image, config_file, source_dir):
-    """Write a Dockerfile and helper files for an application.
+def get_fingerprint(app_config, files, source_dir, jobs):
+    """Return a digest of everything an application image is built from.
+
+    That is the files the build context sends, the configuration with
+    the base image references, and every template.  Generated files
+    only depend on those, so they are left out, and generating them
+    again doesn't change the digest.
+
+    Args:
+        app_config (AppConfig): Validated configuration
+        files (dict): Generated files, from generate_files
+        source_dir (str): Directory containing user's source code
+        jobs (int): Maximum number of files hashed at once
+
+    Returns:
+        str: `sha256:` followed by a hex digest
+    """
+    if app_config.is_python_compat:
+        raise ValueError(
+            'Fingerprints are not supported for the python-compat runtime')
+    lines = ['version {}'.format(FINGERPRINT_VERSION)]
+    for field in AppConfig._fields:
+        if field != 'build_context':
+            lines.append('config {} {!r}'.format(
+                field, getattr(app_config, field)))
+    data_dir = os.path.join(os.path.dirname(__file__), 'data')
+    for name in sorted(os.listdir(data_dir)):
+        lines.append('template {} {}'.format(
+            name, hashlib.sha256(get_data(name).encode('utf8')).hexdigest()))
+    generated = set(files).union([FINGERPRINT_FILE])
+    lines.extend(build_context.hash_files(
+        source_dir,
+        sorted(path for path in app_config.build_context.files
+               if path not in generated),
+        jobs))
+    digest = hashlib.sha256()
+    for line in lines:
+        digest.update(line.encode('utf8', 'surrogateescape') + b'\n')
+    return 'sha256:' + digest.hexdigest()
+
+
+def _file_digest(path):
+    """Return the SHA-256 digest of a file, or None if it doesn't exist"""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).digest()
+    except FileNotFoundError:
+        return None
+
+
+def write_if_changed(path, contents, check=False):
+    """Write a generated file, unless it already has these contents.
+
+    Identical files are left untouched, so their mtime is kept for
+    caches and watchers downstream.  Other files are replaced
+    atomically, so an interrupted run never leaves half a file.
+
+    Args:
+        path (str): File to write
+        contents (str): Desired contents
+        check (bool): Only compare, without writing anything
+
+    Returns:
+        bool: True if the file changed, or would change with check
+    """
+    data = contents.encode('utf8')
+    if _file_digest(path) == hashlib.sha256(data).digest():
+        return False
+    if check:
+        return True
+    try:
+        mode = os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        mode = NEW_FILE_MODE
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(path)),
+        prefix='.' + os.path.basename(path) + '.')
+    try:
+        with os.fdopen(fd, 'wb') as outfile:
+            outfile.write(data)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return True
+
+
+def load_app_config(base_image, config_file, source_dir,
+                    slim_base_image=None):
+    """Read and validate the configuration file of an application.
 
     Args:
         base_image (str): Docker image name to build on top of
         config_file (str): Path to user's app.yaml (might be <service>.yaml)
-        source_dir (str): Directory container user's source code
+        source_dir (str): Directory containing user's source code
+        slim_base_image (str): Docker image name for the final stage of
+            a multi-stage Dockerfile, or None for a single stage
+
+    Returns:
+        AppConfig: valid configuration
     """
-    # Read yaml file.  Does not currently support multiple services
-    # with configuration filenames besides app.yaml
+    # Read yaml file
     with io.open(config_file, 'r', encoding='utf8') as yaml_config_file:
         raw_config = yaml.safe_load(yaml_config_file)
 
     # Determine complete configuration
-    app_config = get_app_config(raw_config, base_image, config_file,
-                                  source_dir)
+    return get_app_config(raw_config, base_image, config_file, source_dir,
+                          slim_base_image)
+
+
+def generate_dockerfile_command(base_image, config_file, source_dir,
+                                check=False, slim_base_image=None,
+                                report=False, fingerprint=False, jobs=1):
+    """Write a Dockerfile and helper files for an application.
+
+    Args:
+        base_image (str): Docker image name to build on top of
+        config_file (str): Path to user's app.yaml (might be <service>.yaml)
+        source_dir (str): Directory container user's source code
+        check (bool): Only report the files that would change
+        slim_base_image (str): Docker image name for the final stage of
+            a multi-stage Dockerfile, or None for a single stage
+        report (bool): Print the size of the build context before and
+            after the generated .dockerignore
+        fingerprint (bool): Label the Dockerfile with the fingerprint
+            of its inputs, and write it to FINGERPRINT_FILE.  The
+            python-compat runtime has no fingerprint.
+        jobs (int): Maximum number of files hashed at once
+
+    Returns:
+        [str]: Names of the files that changed, or would change with
+            check
+    """
+    app_config = load_app_config(base_image, config_file, source_dir,
+                                 slim_base_image)
 
     # Generate list of filenames and their textual contents
     files = generate_files(app_config)
+    if report and app_config.build_context:
+        print(build_context.format_report(build_context.measure(
+            source_dir, app_config.build_context)))
+    if fingerprint and not app_config.is_python_compat:
+        files['.dockerignore'] += '\n{}\n'.format(FINGERPRINT_FILE)
+        digest = get_fingerprint(app_config, files, source_dir, jobs)
+        files['Dockerfile'] += get_data(
+            'Dockerfile.fingerprint.template').format(
+                label=FINGERPRINT_LABEL, fingerprint=digest)
+        files[FINGERPRINT_FILE] = digest + '\n'
 
     # Write files
-    for filename, contents in files.items():
-        full_filename = os.path.join(source_dir, filename)
-        with io.open(full_filename, 'w', encoding='utf8') as outfile:
-            outfile.write(contents)
+    changed = [filename for filename in sorted(files)
+               if write_if_changed(os.path.join(source_dir, filename),
+                                   files[filename], check)]
+
+    # gunicorn 20 loads ./gunicorn.conf.py even without --config, so one
+    # generated before mustn't outlive the settings it came from
+    if (gunicorn_config.GUNICORN_CONF_PY not in files and
+            gunicorn_config.is_generated(source_dir)):
+        if not check:
+            os.remove(os.path.join(source_dir,
+                                   gunicorn_config.GUNICORN_CONF_PY))
+        changed = sorted(changed + [gunicorn_config.GUNICORN_CONF_PY])
+    return changed
+
+
+def fingerprint_command(base_image, config_file, source_dir, jobs,
+                        slim_base_image=None):
+    """Compute the fingerprint of an application, writing nothing.
+
+    Args:
+        base_image (str): Docker image name to build on top of
+        config_file (str): Path to user's app.yaml (might be <service>.yaml)
+        source_dir (str): Directory containing user's source code
+        jobs (int): Maximum number of files hashed at once
+        slim_base_image (str): Docker image name for the final stage of
+            a multi-stage Dockerfile, or None for a single stage
+
+    Returns:
+        str: Fingerprint, see get_fingerprint
+    """
+    app_config = load_app_config(base_image, config_file, source_dir,
+                                 slim_base_image)
+    return get_fingerprint(app_config, generate_files(app_config),
+                           source_dir, jobs)
+
+
+def get_services(specs):
+    """Expand the service specifications of a batch.
+
+    Each specification is `CONFIG[=SOURCE_DIR]`, where CONFIG may be a
+    glob pattern.  The source directory defaults to the directory of
+    each configuration file.
+
+    Args:
+        specs ([str]): Service specifications, from the command line
+
+    Returns:
+        ([Service], [ServiceResult]): Services to generate, and errors
+            for specifications that can't be generated
+    """
+    services = []
+    errors = []
+    for spec in specs:
+        pattern, _, source_dir = spec.partition('=')
+        config_files = sorted(glob.glob(pattern)) or [pattern]
+        for config_file in config_files:
+            services.append(Service(
+                config_file=config_file,
+                source_dir=source_dir or os.path.dirname(config_file) or '.'))
+
+    # Services sharing a source directory would overwrite each other's
+    # Dockerfile, so none of them is generated.
+    by_dir = collections.OrderedDict()
+    for service in services:
+        key = os.path.normpath(os.path.abspath(service.source_dir))
+        by_dir.setdefault(key, []).append(service)
+    valid = []
+    for group in by_dir.values():
+        if len(group) == 1:
+            valid.extend(group)
+            continue
+        for service in group:
+            errors.append(ServiceResult(
+                changed=[],
+                error='Source directory {} is shared by {}'.format(
+                    service.source_dir,
+                    ', '.join(other.config_file for other in group)),
+                service=service))
+    return valid, errors
+
+
+def generate_service(base_image, service, check=False, slim_base_image=None,
+                     fingerprint=False, jobs=1):
+    """Write the files of one service of a batch.
+
+    Args:
+        base_image (str): Docker image name to build on top of
+        service (Service): Service to generate files for
+        check (bool): Only report the files that would change
+        slim_base_image (str): Final stage image of multi-stage
+            Dockerfiles, or None
+        fingerprint (bool): Label the Dockerfile with its fingerprint
+        jobs (int): Maximum number of files hashed at once
+
+    Returns:
+        ServiceResult: Files changed, or why they couldn't be generated
+    """
+    try:
+        changed = generate_dockerfile_command(
+            base_image, service.config_file, service.source_dir, check,
+            slim_base_image, fingerprint=fingerprint, jobs=jobs)
+    except (OSError, ValueError, yaml.YAMLError) as e:
+        return ServiceResult(changed=[], error=str(e), service=service)
+    return ServiceResult(changed=changed, error=None, service=service)
+
+
+def generate_batch_command(base_image, specs, jobs, check=False,
+                           slim_base_image=None, fingerprint=False):
+    """Write a Dockerfile and helper files for many applications.
+
+    Services are generated in parallel, in up to `jobs` processes,
+    since parsing and formatting hold the GIL.  Each process reads the
+    templates once, and hashes the files of its service one at a time.
+    An invalid service doesn't stop the others.
+
+    Args:
+        base_image (str): Docker image name to build on top of
+        specs ([str]): Service specifications, see get_services
+        jobs (int): Maximum number of services generated at once
+        check (bool): Only report the files that would change
+        slim_base_image (str): Final stage image of multi-stage
+            Dockerfiles, or None
+        fingerprint (bool): Label the Dockerfiles with their fingerprint
+
+    Returns:
+        [ServiceResult]: Outcome of every service, in order
+    """
+    services, errors = get_services(specs)
+    generate = functools.partial(
+        generate_service, base_image, check=check,
+        slim_base_image=slim_base_image, fingerprint=fingerprint, jobs=1)
+    if jobs > 1 and len(services) > 1:
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=min(jobs, len(services))) as pool:
+            results = list(pool.map(generate, services))
+    else:
+        results = [generate(service) for service in services]
+    return sorted(errors + results,
+                  key=lambda result: result.service.config_file)
+
+
+def format_changes(source_dir, changed, check=False):
+    """Describe the files that changed in a source directory"""
+    if not changed:
+        return 'unchanged'
+    return '{} {}'.format(
+        'would update' if check else 'updated',
+        ', '.join(os.path.join(source_dir, filename) for filename in changed))
+
+
+def format_batch_report(results, check=False):
+    """Describe the outcome of a batch, one line per service"""
+    lines = []
+    for result in results:
+        if result.error is None:
+            outcome = format_changes(
+                result.service.source_dir, result.changed, check)
+        else:
+            outcome = 'error: {}'.format(result.error)
+        lines.append('{}: {}'.format(result.service.config_file, outcome))
+    failed = sum(1 for result in results if result.error is not None)
+    changed = sum(1 for result in results if result.changed)
+    lines.append('{} services, {} {}, {} failed'.format(
+        len(results), changed, 'would change' if check else 'changed',
+        failed))
+    return '\n'.join(lines)
 
 
 def parse_args(argv):
@@ -264,13 +792,84 @@ def parse_args(argv):
             validation_utils.validate_arg_regex, flag_regex=PRINTABLE_REGEX),
         default='.',
         help=('Application source and output directory'))
+    parser.add_argument(
+        '--services',
+        type=functools.partial(
+            validation_utils.validate_arg_regex, flag_regex=PRINTABLE_REGEX),
+        nargs='+',
+        metavar='CONFIG[=SOURCE_DIR]',
+        help=('Generate files for many services at once, instead of '
+              '--config and --source-dir.  CONFIG may be a glob pattern, '
+              'and SOURCE_DIR defaults to the directory of CONFIG.'))
+    parser.add_argument(
+        '--jobs',
+        type=validation_utils.validate_arg_positive_int,
+        default=os.cpu_count() or 1,
+        help=('Maximum number of services generated, or files hashed for '
+              'fingerprints, at the same time'))
+    parser.add_argument(
+        '--multi-stage',
+        action='store_true',
+        help=('Build dependencies on --base-image, and run the application '
+              'on --slim-base-image with only its interpreter, packages '
+              'and shared libraries'))
+    parser.add_argument(
+        '--slim-base-image',
+        type=functools.partial(
+            validation_utils.validate_arg_regex, flag_regex=IMAGE_REGEX),
+        default=DEFAULT_SLIM_BASE_IMAGE,
+        help='Name of Docker image the final stage of --multi-stage uses')
+    parser.add_argument(
+        '--check',
+        action='store_true',
+        help=('Write nothing, and exit with status 1 if any generated '
+              'file would change'))
+    parser.add_argument(
+        '--fingerprint',
+        action='store_true',
+        help=('Label the Dockerfile with a digest of everything the image '
+              'is built from, and write it to {} too.  Name --base-image '
+              'by digest (name@sha256:...), or a rebuilt base image '
+              'leaves the fingerprint unchanged'.format(FINGERPRINT_FILE)))
+    parser.add_argument(
+        '--fingerprint-only',
+        action='store_true',
+        help='Print the digest of --fingerprint, and write nothing')
     args = parser.parse_args(argv[1:])
+    if args.fingerprint_only and args.services:
+        parser.error('--fingerprint-only takes a single service, not '
+                     '--services')
     return args
 
 
 def main():
     args = parse_args(sys.argv)
-    generate_dockerfile_command(args.base_image, args.config, args.source_dir)
+    slim_base_image = args.slim_base_image if args.multi_stage else None
+    if args.fingerprint_only:
+        try:
+            digest = fingerprint_command(args.base_image, args.config,
+                                         args.source_dir, args.jobs,
+                                         slim_base_image)
+        except ValueError as e:
+            sys.exit('error: {}'.format(e))
+        print(digest)
+        return
+    if args.services:
+        results = generate_batch_command(
+            args.base_image, args.services, args.jobs, args.check,
+            slim_base_image, args.fingerprint)
+        print(format_batch_report(results, args.check))
+        if any(result.error is not None or (args.check and result.changed)
+               for result in results):
+            sys.exit(1)
+        return
+    changed = generate_dockerfile_command(
+        args.base_image, args.config, args.source_dir, args.check,
+        slim_base_image, report=True, fingerprint=args.fingerprint,
+        jobs=args.jobs)
+    print(format_changes(args.source_dir, changed, args.check))
+    if args.check and changed:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
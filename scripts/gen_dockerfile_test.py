@@ -18,15 +18,20 @@
 
 import argparse
 import filecmp
+import functools
+import json
 import os
 import shutil
 import subprocess
+import sys
 import unittest.mock
 
 import pytest
 import yaml
 
 import gen_dockerfile
+import gunicorn_config
+import pinned_requirements
 
 
 # Expected list of files generated
@@ -51,6 +56,8 @@ def compare_file(filename, dir1, dir2):
     # Basic app.yaml
     ('env: flex', {
         'base_image': 'some_image_name',
+        'cache_mounts': False,
+        'compile_bytecode': False,
         'dockerfile_python_version': '',
         'has_requirements_txt': False,
         'entrypoint': '',
@@ -58,9 +65,13 @@ def compare_file(filename, dir1, dir2):
     }),
     ('env: flex\nruntime: python-compat', {
         'base_image': None,
+        'build_context': None,
+        'cache_mounts': None,
+        'compile_bytecode': None,
         'dockerfile_python_version': None,
         'has_requirements_txt': None,
         'entrypoint': None,
+        'gunicorn_settings': None,
         'is_python_compat': True,
     }),
     # All supported python versions
@@ -88,6 +99,41 @@ def compare_file(filename, dir1, dir2):
     # entrypoint present
     ('entrypoint: my entrypoint', {
         'entrypoint': 'exec my entrypoint',
+        'gunicorn_settings': None,
+    }),
+    # gunicorn sized for the resources
+    ('entrypoint: gunicorn -b :$PORT main:app', {
+        'entrypoint': 'exec gunicorn -b :$PORT main:app',
+        'gunicorn_settings': None,
+    }),
+    ('entrypoint: gunicorn -b :$PORT main:app\n'
+     'resources:\n cpu: 2\n memory_gb: 4', {
+         'entrypoint': 'exec gunicorn --config /app/gunicorn.conf.py '
+                       '-b :$PORT main:app',
+         'gunicorn_settings': gunicorn_config.Settings(
+             cpu=2.0, keepalive=620, memory_gb=4.0, preload_app=False,
+             threads=4, workers=5),
+     }),
+    ('entrypoint: gunicorn main:app\n'
+     'runtime_config:\n gunicorn_workers: 2\n gunicorn_preload_app: true', {
+         'entrypoint': 'exec gunicorn --config /app/gunicorn.conf.py '
+                       'main:app',
+         'gunicorn_settings': gunicorn_config.Settings(
+             cpu=1.0, keepalive=620, memory_gb=0.6, preload_app=True,
+             threads=4, workers=2),
+     }),
+    # Explicit config files are left alone
+    ('entrypoint: gunicorn -c my.conf.py main:app\nresources:\n cpu: 2', {
+        'entrypoint': 'exec gunicorn -c my.conf.py main:app',
+        'gunicorn_settings': None,
+    }),
+    # BuildKit cache mounts
+    ('runtime_config:\n cache_mounts: true', {
+        'cache_mounts': True,
+    }),
+    # Bytecode compilation
+    ('runtime_config:\n compile_bytecode: true', {
+        'compile_bytecode': True,
     }),
 ])
 def test_get_app_config_valid(app_yaml, expected):
@@ -108,7 +154,10 @@ def test_get_app_config_requirements_txt():
     expected = {
         'has_requirements_txt': True,
     }
-    with unittest.mock.patch.object(os.path, 'isfile', return_value=True):
+    pinned_patch = unittest.mock.patch.object(
+        pinned_requirements, 'get_pinned_requirements', return_value=None)
+    with unittest.mock.patch.object(os.path, 'isfile', return_value=True), \
+            pinned_patch:
         test_get_app_config_valid(app_yaml, expected)
 
 
@@ -120,6 +169,11 @@ def test_get_app_config_requirements_txt():
     # Invalid python version
     'runtime_config:\n python_version: 1',
     'runtime_config:\n python_version: python2',
+    'runtime_config:\n cache_mounts: [pip]',
+    # Invalid resources and gunicorn tuning
+    'resources:\n cpu: 0',
+    'resources:\n memory_gb: lots',
+    'runtime_config:\n gunicorn_workers: -1',
 ])
 def test_get_app_config_invalid(app_yaml):
     config_file = 'some_config_file'
@@ -131,16 +185,114 @@ def test_get_app_config_invalid(app_yaml):
             raw_app_config, base_image, config_file, source_dir)
 
 
+@pytest.mark.parametrize('python_version, expected', [
+    ('2', None),
+    ('3', '3.6'),
+    ('3.7', '3.7'),
+])
+def test_get_app_config_multi_stage(python_version, expected):
+    raw_app_config = {'runtime_config': {'python_version': python_version}}
+    get_app_config = functools.partial(
+        gen_dockerfile.get_app_config, raw_app_config, 'some_image_name',
+        'some_config_file', 'some_source_dir', slim_base_image='slim_image')
+    if expected is None:
+        with pytest.raises(ValueError):
+            get_app_config()
+    else:
+        actual = get_app_config()
+        assert actual.dockerfile_python_version == expected
+        assert actual.slim_base_image == 'slim_image'
+
+
+def test_get_app_config_pinned_requirements(tmpdir):
+    tmpdir.join('requirements.txt').write('six==1.0 --hash=sha256:abc\n')
+    app_config = gen_dockerfile.get_app_config(
+        {}, 'some_image_name', 'some_config_file', str(tmpdir))
+    assert app_config.has_requirements_txt
+    assert app_config.pinned_requirements == _PINNED_TXT
+
+
+@pytest.mark.parametrize('app_yaml, main_py, requirements, expected', [
+    # Not opted in
+    ('', 'import fastapi\n', 'fastapi\nuvicorn\n', ''),
+    # ASGI application without an entrypoint
+    ('runtime_config:\n async_worker: true\n python_version: 3',
+     'from fastapi import FastAPI\n', 'fastapi\nuvicorn\n',
+     'exec gunicorn -b :$PORT --worker-class '
+     'uvicorn.workers.UvicornWorker main:app'),
+    # Greenlet application, like tests/eventlet, with resources
+    ('entrypoint: gunicorn -b :$PORT main:app\n'
+     'runtime_config:\n async_worker: true\nresources:\n cpu: 2',
+     'import flask\n', 'Flask==2.2.5\neventlet==0.24.1\n',
+     'exec gunicorn --config /app/gunicorn.conf.py --worker-class eventlet '
+     '-b :$PORT main:app'),
+    # uvicorn isn't installed
+    ('runtime_config:\n async_worker: true\n python_version: 3',
+     'import fastapi\n', 'fastapi\n', ''),
+    # A synchronous application
+    ('runtime_config:\n async_worker: true',
+     'import flask\n', 'Flask\n', ''),
+    # Nothing to run without an entrypoint
+    ('runtime_config:\n async_worker: true', None, 'gevent\n', ''),
+])
+def test_get_app_config_async_worker(tmpdir, app_yaml, main_py, requirements,
+                                     expected):
+    if main_py is not None:
+        tmpdir.join('main.py').write(main_py)
+    tmpdir.join('requirements.txt').write(requirements)
+    app_config = gen_dockerfile.get_app_config(
+        yaml.safe_load(app_yaml) or {}, 'some_image_name', 'some_config_file',
+        str(tmpdir))
+    assert app_config.entrypoint == expected
+
+
+def test_get_app_config_async_worker_python_version(tmpdir, caplog):
+    tmpdir.join('main.py').write('import quart\n')
+    tmpdir.join('requirements.txt').write('quart\nuvicorn\n')
+    gen_dockerfile.get_app_config(
+        {'runtime_config': {'async_worker': True, 'python_version': 3}},
+        'some_image_name', 'some_config_file', str(tmpdir))
+    assert ('Quart needs Python 3.7 or later, but the "python_version" of the '
+            '"runtime_config" section of app.yaml selects Python 3.6'
+            ) in caplog.text
+
+
+def test_get_app_config_reports_all_errors():
+    raw_app_config = yaml.safe_load(
+        'entrypoint: "bad \\n entrypoint"\n'
+        'runtime_config:\n python_version: python2\n')
+    with pytest.raises(ValueError) as excinfo:
+        gen_dockerfile.get_app_config(
+            raw_app_config, 'some_image_name', 'some_config_file',
+            'some_source_dir')
+    assert [error.split(':')[0] for error in excinfo.value.errors] == [
+        'entrypoint', 'runtime_config.python_version']
+
+
 # Basic AppConfig used below
 _BASE_APP_CONFIG = gen_dockerfile.AppConfig(
     base_image='',
+    build_context=None,
+    cache_mounts=False,
+    compile_bytecode=False,
     dockerfile_python_version='',
     entrypoint='',
+    gunicorn_settings=None,
     has_requirements_txt=False,
     is_python_compat=False,
+    pinned_requirements=None,
+    slim_base_image=None,
 )
 
 
+# Pinned requirements from requirements.txt and from a lock file
+_PINNED_TXT = pinned_requirements.Pinned(
+    contents=None, filename='requirements.txt', source='requirements.txt')
+_PINNED_LOCK = pinned_requirements.Pinned(
+    contents='six==1.0 --hash=sha256:abc\n',
+    filename='requirements.pinned.txt', source='Pipfile.lock')
+
+
 @pytest.mark.parametrize('app_config, should_find, test_string', [
     # Requirements.txt
     (_BASE_APP_CONFIG, False, 'ADD requirements.txt'),
@@ -158,13 +310,55 @@ _BASE_APP_CONFIG = gen_dockerfile.AppConfig(
     # Python version
     (_BASE_APP_CONFIG._replace(dockerfile_python_version='_my_version'), True,
      'python_version=python_my_version'),
+    # BuildKit cache mounts
+    (_BASE_APP_CONFIG._replace(cache_mounts=True), True,
+     '# syntax=docker/dockerfile:1'),
+    (_BASE_APP_CONFIG._replace(cache_mounts=True), False, '--mount'),
+    (_BASE_APP_CONFIG._replace(cache_mounts=True, has_requirements_txt=True),
+     True, '--mount=type=cache,target=/root/.cache/pip'),
+    (_BASE_APP_CONFIG._replace(has_requirements_txt=True), False, '--mount'),
+    # Bytecode compilation
+    (_BASE_APP_CONFIG, False, 'compileall'),
+    (_BASE_APP_CONFIG._replace(compile_bytecode=True), True,
+     'python -m compileall -q /app /env/lib/python2.7/site-packages; \\\n'
+     '    test $? -le 1; }'),
+    (_BASE_APP_CONFIG._replace(compile_bytecode=True,
+                               dockerfile_python_version='3.7'), True,
+     '--invalidation-mode checked-hash /app /env/lib/python3.7/'),
+    (_BASE_APP_CONFIG._replace(compile_bytecode=True,
+                               slim_base_image='my_slim_image'), True,
+     'ADD . /app/\n\n# Compile'),
+    # Fully pinned requirements
+    (_BASE_APP_CONFIG._replace(has_requirements_txt=True,
+                               pinned_requirements=_PINNED_TXT), True,
+     'RUN pip install --no-deps --require-hashes -r requirements.txt'),
+    (_BASE_APP_CONFIG._replace(pinned_requirements=_PINNED_LOCK), True,
+     'ADD requirements.pinned.txt /app/'),
+    (_BASE_APP_CONFIG._replace(pinned_requirements=_PINNED_LOCK,
+                               slim_base_image='my_slim_image'), True,
+     'pip wheel --no-deps --require-hashes --wheel-dir=/wheels '
+     '-r requirements.pinned.txt'),
+    # Multi-stage
+    (_BASE_APP_CONFIG._replace(slim_base_image='my_slim_image'), True,
+     'FROM my_slim_image'),
+    (_BASE_APP_CONFIG._replace(slim_base_image='my_slim_image'), False,
+     'pip wheel'),
+    (_BASE_APP_CONFIG._replace(slim_base_image='my_slim_image',
+                               has_requirements_txt=True), True,
+     'pip wheel --wheel-dir=/wheels'),
+    (_BASE_APP_CONFIG._replace(slim_base_image='my_slim_image',
+                               has_requirements_txt=True, cache_mounts=True),
+     True, '--mount=type=cache,target=/root/.cache/pip'),
     # python-compat runtime
     (_BASE_APP_CONFIG._replace(is_python_compat=True), True,
      'FROM gcr.io/google_appengine/python-compat-multicore'),
 ])
 def test_generate_files(app_config, should_find, test_string):
     result = gen_dockerfile.generate_files(app_config)
-    assert set(result.keys()) == EXPECTED_OUTPUT_FILES
+    expected_files = set(EXPECTED_OUTPUT_FILES)
+    if app_config.pinned_requirements == _PINNED_LOCK:
+        expected_files.add('requirements.pinned.txt')
+    assert set(result.keys()) == expected_files
     dockerfile = result['Dockerfile']
     if should_find:
         assert test_string in dockerfile
@@ -172,9 +366,20 @@ def test_generate_files(app_config, should_find, test_string):
         assert test_string not in dockerfile
 
 
-def compare_against_golden_files(app, config_dir, testdata_dir):
+@pytest.mark.parametrize('python_version, expected', [
+    ('', '-q'),
+    ('3.4', '-q'),
+    ('3.6', '-q'),
+    ('3.7', '-q --invalidation-mode checked-hash'),
+])
+def test_get_compileall_flags(python_version, expected):
+    assert gen_dockerfile.get_compileall_flags(python_version) == expected
+
+
+def compare_against_golden_files(app, config_dir, testdata_dir,
+                                 extra_files=()):
     golden_dir = os.path.join(testdata_dir, app + '_golden')
-    for filename in EXPECTED_OUTPUT_FILES:
+    for filename in EXPECTED_OUTPUT_FILES.union(extra_files):
         compare_file(filename, config_dir, golden_dir)
 
 
@@ -197,6 +402,51 @@ def test_generate_dockerfile_command(tmpdir, testdata_dir, app):
     compare_against_golden_files(app, config_dir, testdata_dir)
 
 
+def test_generate_dockerfile_command_multi_stage(tmpdir, testdata_dir):
+    config_dir = os.path.join(str(tmpdir), 'config')
+    shutil.copytree(os.path.join(testdata_dir, 'hello_world'), config_dir)
+    gen_dockerfile.generate_dockerfile_command(
+        base_image='gcr.io/google-appengine/python',
+        config_file=os.path.join(config_dir, 'app.yaml'),
+        source_dir=config_dir,
+        slim_base_image=gen_dockerfile.DEFAULT_SLIM_BASE_IMAGE)
+    compare_against_golden_files(
+        'hello_world_multi_stage', config_dir, testdata_dir)
+
+
+def test_generate_dockerfile_command_gunicorn(tmpdir, testdata_dir):
+    config_dir = tmpdir.join('config')
+    shutil.copytree(os.path.join(testdata_dir, 'hello_world'),
+                    str(config_dir))
+    config_dir.join('app.yaml').write(
+        '\nresources:\n  cpu: 2\n  memory_gb: 2\n', mode='a')
+    generate = functools.partial(
+        gen_dockerfile.generate_dockerfile_command,
+        base_image='gcr.io/google-appengine/python',
+        config_file=str(config_dir.join('app.yaml')),
+        source_dir=str(config_dir))
+    assert gunicorn_config.GUNICORN_CONF_PY in generate()
+    compare_against_golden_files(
+        'hello_world_gunicorn', str(config_dir), testdata_dir,
+        [gunicorn_config.GUNICORN_CONF_PY])
+
+    # The generated file is removed with the resources
+    config_dir.join('app.yaml').write(
+        config_dir.join('app.yaml').read().split('\nresources')[0])
+    assert generate(check=True) == [
+        'Dockerfile', gunicorn_config.GUNICORN_CONF_PY]
+    assert config_dir.join(gunicorn_config.GUNICORN_CONF_PY).check()
+    assert generate() == ['Dockerfile', gunicorn_config.GUNICORN_CONF_PY]
+    assert not config_dir.join(gunicorn_config.GUNICORN_CONF_PY).check()
+
+    # A user's own gunicorn.conf.py is left alone
+    config_dir.join(gunicorn_config.GUNICORN_CONF_PY).write('workers = 8\n')
+    config_dir.join('app.yaml').write('resources:\n  cpu: 2\n', mode='a')
+    assert generate() == []
+    assert config_dir.join(gunicorn_config.GUNICORN_CONF_PY).read() == (
+        'workers = 8\n')
+
+
 @pytest.mark.parametrize('app', [
     # Sampled from https://github.com/GoogleCloudPlatform/python-docs-samples
     'hello_world',
@@ -221,11 +471,209 @@ def test_generate_dockerfile_golden(tmpdir, testdata_dir, app):
     compare_against_golden_files(app, gen_config_dir, testdata_dir)
 
 
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_generate_batch_command(tmpdir, testdata_dir, jobs):
+    """A bad service is reported without stopping the others"""
+    for app in ('hello_world', 'hello_world_compat'):
+        shutil.copytree(os.path.join(testdata_dir, app),
+                        str(tmpdir.join('services', app)))
+    tmpdir.join('services', 'broken', 'app.yaml').write(
+        'runtime_config:\n  python_version: 1.5\n', ensure=True)
+    tmpdir.join('shared', 'a.yaml').write('runtime: python\n', ensure=True)
+    tmpdir.join('shared', 'b.yaml').write('runtime: python\n')
+
+    results = gen_dockerfile.generate_batch_command(
+        base_image='gcr.io/google-appengine/python',
+        specs=[str(tmpdir.join('services', '*', 'app.yaml')),
+               str(tmpdir.join('shared', '*.yaml')),
+               str(tmpdir.join('missing.yaml'))],
+        jobs=jobs)
+    errors = {os.path.relpath(result.service.config_file, str(tmpdir)):
+              result.error for result in results}
+    assert errors['services/hello_world/app.yaml'] is None
+    assert errors['services/hello_world_compat/app.yaml'] is None
+    assert 'python_version' in errors['services/broken/app.yaml']
+    assert 'shared by' in errors['shared/a.yaml']
+    assert 'shared by' in errors['shared/b.yaml']
+    assert errors['missing.yaml'] is not None
+    assert not tmpdir.join('shared', 'Dockerfile').check()
+    for app in ('hello_world', 'hello_world_compat'):
+        compare_against_golden_files(
+            app, str(tmpdir.join('services', app)), testdata_dir)
+
+    report = gen_dockerfile.format_batch_report(results)
+    assert report.splitlines()[-1] == '6 services, 2 changed, 4 failed'
+
+
+def test_generate_dockerfile_command_lock_file(tmpdir, testdata_dir):
+    app_dir = tmpdir.join('app')
+    shutil.copytree(os.path.join(testdata_dir, 'hello_world'), str(app_dir))
+    app_dir.join('requirements.txt').remove()
+    app_dir.join('Pipfile.lock').write(json.dumps({'default': {
+        'six': {'hashes': ['sha256:abc'], 'version': '==1.0'}}}))
+    generate = functools.partial(
+        gen_dockerfile.generate_dockerfile_command,
+        base_image='gcr.io/google-appengine/python',
+        config_file=str(app_dir.join('app.yaml')), source_dir=str(app_dir))
+
+    assert 'requirements.pinned.txt' in generate()
+    assert 'six==1.0' in app_dir.join('requirements.pinned.txt').read()
+    assert '-r requirements.pinned.txt' in app_dir.join('Dockerfile').read()
+    assert generate() == []
+
+
+def test_generate_dockerfile_command_dockerignore(tmpdir, testdata_dir):
+    app_dir = tmpdir.join('app')
+    shutil.copytree(os.path.join(testdata_dir, 'hello_world'), str(app_dir))
+    app_dir.join('env', 'pyvenv.cfg').write('home = /usr/bin\n', ensure=True)
+    app_dir.join('__pycache__', 'main.cpython-36.pyc').write('', ensure=True)
+    app_dir.join('.dockerignore').write('.git\n*.sqlite3\n')
+    generate = functools.partial(
+        gen_dockerfile.generate_dockerfile_command,
+        base_image='gcr.io/google-appengine/python',
+        config_file=str(app_dir.join('app.yaml')), source_dir=str(app_dir))
+
+    assert '.dockerignore' in generate()
+    dockerignore = app_dir.join('.dockerignore').read()
+    assert dockerignore.startswith(gen_dockerfile.get_data('dockerignore'))
+    assert dockerignore.endswith(
+        '\n**/__pycache__\nenv\n\n# Added to .dockerignore by hand\n'
+        '*.sqlite3\n')
+    assert generate() == []
+
+    # Patterns are dropped when what they matched is gone
+    app_dir.join('env').remove()
+    assert generate() == ['.dockerignore']
+    assert '\nenv\n' not in app_dir.join('.dockerignore').read()
+
+
+def test_generate_dockerfile_command_fingerprint(tmpdir, testdata_dir):
+    app_dir = tmpdir.join('app')
+    shutil.copytree(os.path.join(testdata_dir, 'hello_world'), str(app_dir))
+    generate = functools.partial(
+        gen_dockerfile.generate_dockerfile_command,
+        config_file=str(app_dir.join('app.yaml')), source_dir=str(app_dir),
+        fingerprint=True, jobs=2)
+    fingerprint = functools.partial(
+        gen_dockerfile.fingerprint_command,
+        config_file=str(app_dir.join('app.yaml')), source_dir=str(app_dir),
+        jobs=2)
+
+    base_image = 'gcr.io/google-appengine/python'
+    assert gen_dockerfile.FINGERPRINT_FILE in generate(base_image)
+    digest = fingerprint(base_image)
+    assert digest.startswith('sha256:')
+    assert app_dir.join(gen_dockerfile.FINGERPRINT_FILE).read() == (
+        digest + '\n')
+    assert app_dir.join('Dockerfile').read().endswith(
+        'LABEL {}={}\n'.format(gen_dockerfile.FINGERPRINT_LABEL, digest))
+    assert app_dir.join('.dockerignore').read().endswith(
+        '\n\n{}\n'.format(gen_dockerfile.FINGERPRINT_FILE))
+
+    # Generated files don't change the fingerprint, inputs do
+    assert generate(base_image) == []
+    assert fingerprint(base_image) == digest
+    assert fingerprint('gcr.io/google-appengine/python:other') != digest
+    assert fingerprint('gcr.io/google-appengine/python@sha256:' +
+                       '0' * 64) != digest
+    app_dir.join('main.py').write('# Changed\n', mode='a')
+    assert fingerprint(base_image) != digest
+
+    # Without --fingerprint, .dockerignore is back to the template
+    assert gen_dockerfile.generate_dockerfile_command(
+        base_image, str(app_dir.join('app.yaml')), str(app_dir)) == [
+            '.dockerignore', 'Dockerfile']
+    assert gen_dockerfile.FINGERPRINT_FILE not in (
+        app_dir.join('.dockerignore').read())
+
+
+def test_generate_dockerfile_command_fingerprint_compat(tmpdir, testdata_dir):
+    app_dir = tmpdir.join('app')
+    shutil.copytree(os.path.join(testdata_dir, 'hello_world_compat'),
+                    str(app_dir))
+    assert gen_dockerfile.generate_dockerfile_command(
+        'gcr.io/google-appengine/python', str(app_dir.join('app.yaml')),
+        str(app_dir), fingerprint=True, jobs=1) == sorted(
+            EXPECTED_OUTPUT_FILES)
+    with pytest.raises(ValueError):
+        gen_dockerfile.fingerprint_command(
+            'gcr.io/google-appengine/python', str(app_dir.join('app.yaml')),
+            str(app_dir), jobs=1)
+
+
+def test_main_fingerprint_only_compat(testdata_dir, capsys):
+    app_dir = os.path.join(testdata_dir, 'hello_world_compat')
+    argv = ['gen_dockerfile', '--fingerprint-only',
+            '--config', os.path.join(app_dir, 'app.yaml'),
+            '--source-dir', app_dir]
+    with unittest.mock.patch.object(sys, 'argv', argv), \
+            pytest.raises(SystemExit) as excinfo:
+        gen_dockerfile.main()
+    assert excinfo.value.code == (
+        'error: Fingerprints are not supported for the python-compat '
+        'runtime')
+    assert capsys.readouterr().out == ''
+
+
+def test_write_if_changed(tmpdir):
+    path = tmpdir.join('Dockerfile')
+    assert gen_dockerfile.write_if_changed(str(path), 'FROM a\n', check=True)
+    assert not path.check()
+    assert gen_dockerfile.write_if_changed(str(path), 'FROM a\n')
+    assert path.read() == 'FROM a\n'
+    assert path.stat().mode & 0o777 == gen_dockerfile.NEW_FILE_MODE
+
+    # Identical contents are left untouched
+    path.chmod(0o600)
+    path.setmtime(1000000000)
+    assert not gen_dockerfile.write_if_changed(str(path), 'FROM a\n')
+    assert path.mtime() == 1000000000
+
+    # Changes keep the permissions, without leaving temporary files
+    assert gen_dockerfile.write_if_changed(str(path), 'FROM b\n')
+    assert path.read() == 'FROM b\n'
+    assert path.stat().mode & 0o777 == 0o600
+    assert tmpdir.listdir() == [path]
+
+
+def test_generate_dockerfile_command_check(tmpdir, testdata_dir):
+    app_dir = str(tmpdir.join('app'))
+    shutil.copytree(os.path.join(testdata_dir, 'hello_world'), app_dir)
+    app_yaml = os.path.join(app_dir, 'app.yaml')
+    generate = functools.partial(
+        gen_dockerfile.generate_dockerfile_command,
+        base_image='gcr.io/google-appengine/python',
+        config_file=app_yaml, source_dir=app_dir)
+
+    all_files = sorted(EXPECTED_OUTPUT_FILES)
+    assert generate(check=True) == all_files
+    assert not os.path.exists(os.path.join(app_dir, 'Dockerfile'))
+    assert generate() == all_files
+    assert generate() == []
+    assert generate(check=True) == []
+
+    with open(app_yaml, 'a') as f:
+        f.write('entrypoint: gunicorn main:app\n')
+    assert generate(check=True) == ['Dockerfile']
+
+
+def test_get_services_source_dir(tmpdir):
+    config = str(tmpdir.join('app.yaml'))
+    services, errors = gen_dockerfile.get_services(
+        [config, 'other.yaml=src'])
+    assert services == [
+        gen_dockerfile.Service(config_file=config, source_dir=str(tmpdir)),
+        gen_dockerfile.Service(config_file='other.yaml', source_dir='src'),
+    ]
+    assert errors == []
+
+
 @pytest.mark.parametrize('argv', [
     [],
     ['argv0', '--base-image=nocolon'],
     ['argv0', '--base-image=name:andcolon'],
     ['argv0', '--base-image=name@sha256:digest'],
+    ['argv0', '--services', 'app.yaml', 'services/*.yaml=src'],
 ])
 def test_parse_args_valid(argv):
     args = gen_dockerfile.parse_args(argv)
@@ -236,6 +684,7 @@ def test_parse_args_valid(argv):
     ['argv0', '--base-image='],
     ['argv0', '--base-image=:'],
     ['argv0', '--base-image=:noname'],
+    ['argv0', '--fingerprint-only', '--services', 'app.yaml'],
 ])
 def test_parse_args_invalid(argv):
     def mock_error(*args):
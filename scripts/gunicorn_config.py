@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Size gunicorn for the resources of an instance.
+
+`gunicorn -b :$PORT main:app` runs a single synchronous worker, which
+leaves every other CPU of an instance idle.  When an app.yaml declares
+`resources`, or tunes gunicorn in `runtime_config`, and its entrypoint
+is a plain gunicorn command, a `gunicorn.conf.py` is generated.  It
+sets worker and thread counts derived from the CPUs and memory, and
+the entrypoint loads it with `--config`.
+
+gunicorn applies its command line and $GUNICORN_CMD_ARGS after the
+config file, so flags of the entrypoint always win.  Entrypoints that
+already pass `--config`, or source directories with their own
+`gunicorn.conf.py`, are left alone.
+"""
+
+import collections
+import collections.abc
+import os
+import re
+import shlex
+
+
+GUNICORN_CONF_PY = 'gunicorn.conf.py'
+
+# Where ADD . /app/ puts the generated file in the image
+IMAGE_CONF_PY = '/app/' + GUNICORN_CONF_PY
+
+# First line of generated files, which are replaced on every run
+HEADER = '# Generated by gen_dockerfile'
+
+# Resources of App Engine flexible instances that don't declare them
+DEFAULT_CPU = 1.0
+DEFAULT_MEMORY_GB = 0.6
+
+# Memory a worker is assumed to need of its own, with its copy of the
+# application
+WORKER_MEMORY_MB = 150
+
+# Requests handled at once per CPU, by workers and their threads, as
+# most requests of web applications wait on I/O
+REQUESTS_PER_CPU = 8
+
+# Seconds idle connections are kept open.  Google load balancers keep
+# idle connections to backends for 600 seconds, and the server must not
+# close one just as a request is sent on it.
+KEEPALIVE = 620
+
+# Keys of `runtime_config` that tune gunicorn.  Counts of 0 are derived
+# from the resources.
+TUNING_KEYS = (
+    'gunicorn_keepalive',
+    'gunicorn_preload_app',
+    'gunicorn_threads',
+    'gunicorn_workers',
+)
+
+# Characters that make an entrypoint more than a single command
+SHELL_SYNTAX_REGEX = re.compile(r'[;&|<>`\n]|\$\(')
+
+# Settings of a generated gunicorn.conf.py
+Settings = collections.namedtuple(
+    'Settings', 'cpu keepalive memory_gb preload_app threads workers')
+
+
+def _is_option(token, short, name, shortest):
+    """Return True if a command line argument sets a gunicorn option.
+
+    Args:
+        token (str): Argument
+        short (str): Short form of the option, like `-c`
+        name (str): Long form of the option, like `--config`
+        shortest (str): Shortest unambiguous prefix of the long form,
+            which argparse accepts too
+    """
+    if token.startswith('--'):
+        prefix = token.split('=', 1)[0]
+        return prefix.startswith(shortest) and name.startswith(prefix)
+    return token.startswith(short)
+
+
+def sets_config(arguments):
+    """Return True if gunicorn arguments load a config file"""
+    return any(_is_option(argument, '-c', '--config', '--con')
+               for argument in arguments)
+
+
+def sets_worker_class(arguments):
+    """Return True if gunicorn arguments choose a worker class"""
+    return any(_is_option(argument, '-k', '--worker-class', '--worker-cl')
+               for argument in arguments)
+
+
+def get_arguments(entrypoint):
+    """Return the arguments of an entrypoint that only runs gunicorn.
+
+    Args:
+        entrypoint (str): Entrypoint, with or without `exec `
+
+    Returns:
+        [str]: Arguments after `gunicorn`, or None if the entrypoint
+            runs something else, or more than gunicorn
+    """
+    if SHELL_SYNTAX_REGEX.search(entrypoint):
+        return None
+    try:
+        tokens = shlex.split(entrypoint)
+    except ValueError:
+        return None
+    if tokens[:1] == ['exec']:
+        tokens = tokens[1:]
+    if not tokens or os.path.basename(tokens[0]) != 'gunicorn':
+        return None
+    return tokens[1:]
+
+
+def is_plain_gunicorn(entrypoint):
+    """Return True if an entrypoint only runs gunicorn, without a config file.
+
+    Args:
+        entrypoint (str): Entrypoint, with or without `exec `
+    """
+    arguments = get_arguments(entrypoint)
+    return arguments is not None and not sets_config(arguments)
+
+
+def insert_arguments(entrypoint, arguments):
+    """Add arguments right after `gunicorn` in a gunicorn entrypoint"""
+    match = re.match(r'^((?:exec\s+)?\S*gunicorn)(?=\s|$)', entrypoint)
+    return '{} {}{}'.format(
+        match.group(1), ' '.join(arguments), entrypoint[match.end():])
+
+
+def add_config_flag(entrypoint):
+    """Make a plain gunicorn entrypoint load the generated config file"""
+    return insert_arguments(entrypoint, ['--config', IMAGE_CONF_PY])
+
+
+def _first_line(source_dir):
+    """Return the first line of gunicorn.conf.py, or None if there is none"""
+    try:
+        with open(os.path.join(source_dir, GUNICORN_CONF_PY), 'r',
+                  encoding='utf8') as f:
+            return f.readline().rstrip('\n')
+    except FileNotFoundError:
+        return None
+
+
+def has_own_config(source_dir):
+    """Return True if a source directory has a gunicorn.conf.py of its own"""
+    first_line = _first_line(source_dir)
+    return first_line is not None and first_line != HEADER
+
+
+def is_generated(source_dir):
+    """Return True if a source directory has a generated gunicorn.conf.py"""
+    return _first_line(source_dir) == HEADER
+
+
+def is_requested(raw_config):
+    """Return True if an app.yaml declares resources or tunes gunicorn"""
+    runtime_config = raw_config.get('runtime_config')
+    return 'resources' in raw_config or (
+        isinstance(runtime_config, collections.abc.Mapping) and
+        any(key in runtime_config for key in TUNING_KEYS))
+
+
+def get_settings(resources, runtime_config):
+    """Derive gunicorn settings from the validated fields of app.yaml.
+
+    There are two workers per CPU and one more, as long as each has
+    WORKER_MEMORY_MB of its own.  Each worker gets enough threads to
+    handle REQUESTS_PER_CPU requests per CPU between them.
+
+    Args:
+        resources (dict): Validated `resources` section
+        runtime_config (dict): Validated `runtime_config` section
+
+    Returns:
+        Settings: Settings of gunicorn.conf.py
+    """
+    cpu = resources['cpu']
+    memory_gb = resources['memory_gb']
+    workers = runtime_config['gunicorn_workers'] or max(1, min(
+        int(2 * cpu) + 1,
+        int(memory_gb * 1024) // WORKER_MEMORY_MB))
+    threads = runtime_config['gunicorn_threads'] or max(
+        1, -(-int(REQUESTS_PER_CPU * cpu) // workers))
+    return Settings(
+        cpu=cpu,
+        keepalive=runtime_config['gunicorn_keepalive'] or KEEPALIVE,
+        memory_gb=memory_gb,
+        preload_app=runtime_config['gunicorn_preload_app'],
+        threads=threads,
+        workers=workers)
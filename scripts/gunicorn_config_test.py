@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit test for gunicorn_config.py"""
+
+import pytest
+
+import gunicorn_config
+
+
+@pytest.mark.parametrize('entrypoint, expected', [
+    ('exec gunicorn -b :$PORT main:app', True),
+    ('gunicorn main:app', True),
+    ('exec /env/bin/gunicorn -w 4 -k gevent main:app', True),
+    ('exec gunicorn --certfile=cert.pem main:app', True),
+    # A config file of the user's
+    ('exec gunicorn -c gunicorn.py main:app', False),
+    ('exec gunicorn -cgunicorn.py main:app', False),
+    ('exec gunicorn --config gunicorn.py main:app', False),
+    ('exec gunicorn --config=gunicorn.py main:app', False),
+    ('exec gunicorn --conf gunicorn.py main:app', False),
+    # Something else, or more than gunicorn
+    ('exec python main.py', False),
+    ('exec uwsgi --http :$PORT', False),
+    ('exec gunicorn-wrapper main:app', False),
+    ('./migrate.sh && gunicorn main:app', False),
+    ('exec gunicorn main:app | tee log', False),
+    ('exec gunicorn $(cat flags) main:app', False),
+    ('exec gunicorn "main:app', False),
+])
+def test_is_plain_gunicorn(entrypoint, expected):
+    assert gunicorn_config.is_plain_gunicorn(entrypoint) == expected
+
+
+@pytest.mark.parametrize('entrypoint, expected', [
+    ('exec gunicorn -b :$PORT main:app',
+     'exec gunicorn --config /app/gunicorn.conf.py -b :$PORT main:app'),
+    ('exec /env/bin/gunicorn main:app',
+     'exec /env/bin/gunicorn --config /app/gunicorn.conf.py main:app'),
+])
+def test_add_config_flag(entrypoint, expected):
+    assert gunicorn_config.add_config_flag(entrypoint) == expected
+
+
+@pytest.mark.parametrize('arguments, expected', [
+    (['-b', ':8080', 'main:app'], False),
+    (['-k', 'gevent', 'main:app'], True),
+    (['-kgevent', 'main:app'], True),
+    (['--worker-class', 'gevent', 'main:app'], True),
+    (['--worker-class=gevent', 'main:app'], True),
+    (['--worker-cl', 'gevent', 'main:app'], True),
+    # --worker-connections
+    (['--worker-c', '100', 'main:app'], False),
+    (['--worker-connections', '100', 'main:app'], False),
+])
+def test_sets_worker_class(arguments, expected):
+    assert gunicorn_config.sets_worker_class(arguments) == expected
+
+
+def _tuning(**values):
+    tuning = {key: 0 for key in gunicorn_config.TUNING_KEYS}
+    tuning['gunicorn_preload_app'] = False
+    tuning.update(values)
+    return tuning
+
+
+@pytest.mark.parametrize('cpu, memory_gb, tuning, workers, threads', [
+    # App Engine flexible defaults
+    (1.0, 0.6, _tuning(), 3, 3),
+    (2.0, 4.0, _tuning(), 5, 4),
+    # Too little memory for more workers, so they get more threads
+    (4.0, 0.5, _tuning(), 3, 11),
+    (1.0, 0.1, _tuning(), 1, 8),
+    # Tuned
+    (2.0, 4.0, _tuning(gunicorn_workers=2), 2, 8),
+    (2.0, 4.0, _tuning(gunicorn_workers=2, gunicorn_threads=1), 2, 1),
+])
+def test_get_settings(cpu, memory_gb, tuning, workers, threads):
+    settings = gunicorn_config.get_settings(
+        {'cpu': cpu, 'memory_gb': memory_gb}, tuning)
+    assert (settings.workers, settings.threads) == (workers, threads)
+    assert settings.keepalive == gunicorn_config.KEEPALIVE
+    assert not settings.preload_app
+
+
+def test_get_settings_keepalive_preload():
+    settings = gunicorn_config.get_settings(
+        {'cpu': 1.0, 'memory_gb': 1.0},
+        _tuning(gunicorn_keepalive=5, gunicorn_preload_app=True))
+    assert settings.keepalive == 5
+    assert settings.preload_app
+
+
+@pytest.mark.parametrize('raw_config, expected', [
+    ({}, False),
+    ({'runtime_config': {'python_version': 3}}, False),
+    ({'runtime_config': None}, False),
+    ({'resources': {'cpu': 2}}, True),
+    ({'runtime_config': {'gunicorn_preload_app': False}}, True),
+])
+def test_is_requested(raw_config, expected):
+    assert gunicorn_config.is_requested(raw_config) == expected
+
+
+def test_has_own_config(tmpdir):
+    assert not gunicorn_config.has_own_config(str(tmpdir))
+    assert not gunicorn_config.is_generated(str(tmpdir))
+    conf = tmpdir.join(gunicorn_config.GUNICORN_CONF_PY)
+    conf.write(gunicorn_config.HEADER + '\nworkers = 2\n')
+    assert not gunicorn_config.has_own_config(str(tmpdir))
+    assert gunicorn_config.is_generated(str(tmpdir))
+    conf.write('workers = 2\n')
+    assert gunicorn_config.has_own_config(str(tmpdir))
+    assert not gunicorn_config.is_generated(str(tmpdir))
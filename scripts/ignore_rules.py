@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Decide which source files to leave out of a build.
+
+Rules are read from `.gcloudignore` in the source directory, or from
+`.dockerignore` if there is no `.gcloudignore`.
+
+`.gcloudignore` patterns work like `.gitignore` ones, as in `gcloud`:
+a pattern without a slash matches a name at any depth, one with a
+slash is relative to the source directory, a trailing slash only
+matches directories, `!` includes again what an earlier pattern
+excluded, and nothing below an excluded directory can be included
+again.  `#!include:FILE` adds the rules of another file, such as
+`.gitignore`.
+
+`.dockerignore` patterns work like they do for `docker build`: every
+pattern is relative to the source directory, a pattern also excludes
+everything below the directories it matches, and `!` exceptions can
+include files below an excluded directory.
+
+Either way, `*` matches within one path component, `**` matches any
+number of components, and the last matching pattern wins.
+"""
+
+import collections
+import os
+import re
+
+
+GCLOUDIGNORE = '.gcloudignore'
+DOCKERIGNORE = '.dockerignore'
+
+# How patterns are matched
+STYLE_GCLOUD = 'gcloud'
+STYLE_DOCKER = 'docker'
+
+INCLUDE_DIRECTIVE = '#!include:'
+
+# Single pattern from an ignore file.  `pattern` is the text after
+# removing `!`, and `regex` matches the paths it applies to.
+Rule = collections.namedtuple(
+    'Rule', 'anchored directory_only negated pattern regex')
+
+
+def translate(pattern):
+    """Translate a glob pattern to a regular expression string.
+
+    `*` and `?` don't match `/`.  `**` as a whole path component
+    matches any number of components, including none.
+    """
+    regex = ''
+    index = 0
+    length = len(pattern)
+    while index < length:
+        at_start = index == 0 or pattern[index - 1] == '/'
+        if at_start and pattern.startswith('**/', index):
+            regex += '(?:.*/)?'
+            index += 3
+        elif at_start and pattern[index:] == '**':
+            regex += '.*'
+            index += 2
+        elif pattern[index] == '*':
+            regex += '[^/]*'
+            index += 1
+        elif pattern[index] == '?':
+            regex += '[^/]'
+            index += 1
+        elif pattern[index] == '[':
+            end = pattern.find(']', index + 2)
+            if end < 0:
+                regex += re.escape('[')
+                index += 1
+                continue
+            contents = pattern[index + 1:end]
+            if contents[0] in '!^':
+                contents = '^' + contents[1:]
+            regex += '[' + contents.replace('\\', '\\\\') + ']'
+            index = end + 1
+        elif pattern[index] == '\\' and index + 1 < length:
+            regex += re.escape(pattern[index + 1])
+            index += 2
+        else:
+            regex += re.escape(pattern[index])
+            index += 1
+    return regex
+
+
+def _strip_trailing_spaces(line):
+    """Remove trailing spaces that aren't escaped with a backslash"""
+    stripped = line.rstrip(' \t')
+    if stripped.endswith('\\') and len(stripped) < len(line):
+        stripped += line[len(stripped)]
+    return stripped
+
+
+def parse_gcloudignore(path, root=None):
+    """Read the rules of a `.gcloudignore` file, with `.gitignore` syntax.
+
+    Args:
+        path (str): File to read
+        root (str): Directory that `#!include:` paths are relative to,
+                    by default the directory of `path`
+
+    Returns:
+        [Rule]: Rules in the order they appear
+    """
+    root = root or os.path.dirname(path)
+    rules = []
+    with open(path, 'r', encoding='utf8') as f:
+        lines = f.read().splitlines()
+    for line in lines:
+        if line.startswith(INCLUDE_DIRECTIVE):
+            included = os.path.join(
+                root, line[len(INCLUDE_DIRECTIVE):].strip())
+            if os.path.exists(included):
+                rules.extend(parse_gcloudignore(included, root))
+            continue
+        line = _strip_trailing_spaces(line)
+        if not line or line.startswith('#'):
+            continue
+        negated = line.startswith('!')
+        if negated:
+            line = line[1:]
+        directory_only = line.endswith('/')
+        pattern = line.rstrip('/')
+        if not pattern:
+            continue
+        anchored = '/' in pattern
+        pattern = pattern.lstrip('/')
+        regex = translate(pattern)
+        if not anchored:
+            regex = '(?:.*/)?' + regex
+        rules.append(Rule(
+            anchored=anchored, directory_only=directory_only,
+            negated=negated, pattern=pattern,
+            regex=re.compile('^' + regex + '$')))
+    return rules
+
+
+def parse_dockerignore(path):
+    """Read the rules of a `.dockerignore` file.
+
+    Returns:
+        [Rule]: Rules in the order they appear
+    """
+    with open(path, 'r', encoding='utf8') as f:
+        return dockerignore_rules(f.read().splitlines())
+
+
+def dockerignore_rules(lines):
+    """Parse lines with `.dockerignore` syntax.
+
+    Returns:
+        [Rule]: Rules in the order they appear
+    """
+    rules = []
+    for line in lines:
+        if line.startswith('#'):
+            continue
+        line = line.strip()
+        negated = line.startswith('!')
+        if negated:
+            line = line[1:].strip()
+        pattern = os.path.normpath(line).lstrip('/') if line else ''
+        if not pattern or pattern == '.':
+            continue
+        rules.append(Rule(
+            anchored=True, directory_only=False, negated=negated,
+            pattern=pattern,
+            regex=re.compile('^' + translate(pattern) + '$')))
+    return rules
+
+
+class IgnoreRules(object):
+    """Rules from an ignore file, applied to paths below its directory"""
+
+    def __init__(self, rules, style=STYLE_GCLOUD, source=''):
+        self.rules = rules
+        self.style = style
+        self.source = source
+        self.has_exceptions = any(rule.negated for rule in rules)
+
+    def _matches(self, rel_path, is_dir):
+        """Return True if the last rule matching a path excludes it"""
+        ignored = False
+        for rule in self.rules:
+            if rule.directory_only and not is_dir:
+                continue
+            if rule.regex.match(rel_path):
+                ignored = not rule.negated
+        return ignored
+
+    def is_ignored(self, rel_path, is_dir=False):
+        """Return True if a path relative to the source is left out.
+
+        Args:
+            rel_path (str): Path with `/` separators
+            is_dir (bool): Whether the path is a directory
+        """
+        rel_path = rel_path.replace(os.sep, '/')
+        parts = rel_path.split('/')
+        parents = ['/'.join(parts[:count]) for count in range(1, len(parts))]
+        if self.style == STYLE_DOCKER:
+            # A pattern matching a parent directory excludes the path,
+            # unless a later exception matches the path itself
+            ignored = False
+            for rule in self.rules:
+                if rule.regex.match(rel_path) or any(
+                        rule.regex.match(parent) for parent in parents):
+                    ignored = not rule.negated
+            return ignored
+        # Nothing below an excluded directory can be included again
+        if any(self._matches(parent, True) for parent in parents):
+            return True
+        return self._matches(rel_path, is_dir)
+
+    def can_skip_directory(self, rel_dir):
+        """Return True if nothing below an ignored directory is staged"""
+        return self.style == STYLE_GCLOUD or not self.has_exceptions
+
+
+def load(source_dir):
+    """Read the ignore rules of a source directory.
+
+    Returns:
+        IgnoreRules: From `.gcloudignore` or `.dockerignore`, or None if
+                     there is neither
+    """
+    gcloudignore = os.path.join(source_dir, GCLOUDIGNORE)
+    if os.path.isfile(gcloudignore):
+        return IgnoreRules(parse_gcloudignore(gcloudignore), STYLE_GCLOUD,
+                           GCLOUDIGNORE)
+    dockerignore = os.path.join(source_dir, DOCKERIGNORE)
+    if os.path.isfile(dockerignore):
+        return IgnoreRules(parse_dockerignore(dockerignore), STYLE_DOCKER,
+                           DOCKERIGNORE)
+    return None
+
+
+def rsync_filters(ignore):
+    """Translate ignore rules to rsync filter rules.
+
+    rsync uses the first matching rule while ignore files use the last,
+    so the order is reversed.  Exceptions below a directory that
+    `.dockerignore` excludes are not supported by rsync.
+
+    Returns:
+        [str]: Values for rsync --filter flags
+    """
+    filters = []
+    for rule in reversed(ignore.rules):
+        pattern = rule.pattern
+        anchored = rule.anchored
+        if pattern.startswith('**/') and '/' not in pattern[3:]:
+            # Any depth, which is what rsync does without an anchor
+            pattern = pattern[3:]
+            anchored = False
+        if anchored:
+            pattern = '/' + pattern
+        if rule.directory_only:
+            pattern += '/'
+        filters.append(('+ ' if rule.negated else '- ') + pattern)
+    return filters
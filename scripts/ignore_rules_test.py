@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit test for ignore_rules.py"""
+
+import re
+
+import pytest
+
+import ignore_rules
+
+
+def _gcloud_rules(tmpdir, contents):
+    path = tmpdir.join(ignore_rules.GCLOUDIGNORE)
+    path.write(contents)
+    return ignore_rules.IgnoreRules(
+        ignore_rules.parse_gcloudignore(str(path)))
+
+
+def _docker_rules(tmpdir, contents):
+    path = tmpdir.join(ignore_rules.DOCKERIGNORE)
+    path.write(contents)
+    return ignore_rules.IgnoreRules(
+        ignore_rules.parse_dockerignore(str(path)),
+        ignore_rules.STYLE_DOCKER)
+
+
+@pytest.mark.parametrize('pattern, path, expected', [
+    ('*.py', 'main.py', True),
+    ('*.py', 'dir/main.py', False),
+    ('a?c', 'abc', True),
+    ('a?c', 'a/c', False),
+    ('**/test', 'test', True),
+    ('**/test', 'a/b/test', True),
+    ('a/**/b', 'a/b', True),
+    ('a/**/b', 'a/x/y/b', True),
+    ('a/**', 'a/x/y', True),
+    ('[a-c].txt', 'b.txt', True),
+    ('[!a-c].txt', 'b.txt', False),
+    ('\\*.txt', '*.txt', True),
+    ('\\*.txt', 'a.txt', False),
+])
+def test_translate(pattern, path, expected):
+    regex = re.compile('^' + ignore_rules.translate(pattern) + '$')
+    assert bool(regex.match(path)) == expected
+
+
+@pytest.mark.parametrize('path, is_dir, expected', [
+    # Names without a slash match at any depth
+    ('debug.log', False, True),
+    ('src/debug.log', False, True),
+    # Paths with a slash are relative to the source directory
+    ('build/out.o', False, True),
+    ('src/build/out.o', False, False),
+    # A trailing slash only matches directories
+    ('cache', True, True),
+    ('cache', False, False),
+    ('src/cache/file', False, True),
+    # Exceptions
+    ('keep.log', False, False),
+    # Nothing below an excluded directory is included again
+    ('cache/keep.log', False, True),
+    ('main.py', False, False),
+])
+def test_gcloudignore(tmpdir, path, is_dir, expected):
+    ignore = _gcloud_rules(
+        tmpdir, '# comment\n\n*.log\n/build/out.o\ncache/\n!keep.log\n')
+    assert ignore.is_ignored(path, is_dir) == expected
+
+
+def test_gcloudignore_include(tmpdir):
+    tmpdir.join('.gitignore').write('*.pyc\n')
+    ignore = _gcloud_rules(tmpdir, '#!include:.gitignore\n.git\n')
+    assert ignore.is_ignored('pkg/module.pyc')
+    assert ignore.is_ignored('.git', is_dir=True)
+    assert not ignore.is_ignored('pkg/module.py')
+
+
+def test_gcloudignore_missing_include(tmpdir):
+    ignore = _gcloud_rules(tmpdir, '#!include:.gitignore\n*.pyc\n')
+    assert ignore.is_ignored('module.pyc')
+
+
+@pytest.mark.parametrize('path, expected', [
+    # Patterns are relative to the source directory
+    ('debug.log', True),
+    ('src/debug.log', False),
+    # A matching directory excludes everything below it
+    ('docs/index.md', True),
+    # Exceptions can include files below an excluded directory
+    ('docs/README.md', False),
+    ('main.py', False),
+])
+def test_dockerignore(tmpdir, path, expected):
+    ignore = _docker_rules(tmpdir, '*.log\n./docs/\n!docs/README.md\n')
+    assert ignore.is_ignored(path) == expected
+
+
+def test_can_skip_directory(tmpdir):
+    assert _gcloud_rules(tmpdir, 'a\n!b\n').can_skip_directory('a')
+    assert _docker_rules(tmpdir, 'a\n').can_skip_directory('a')
+    assert not _docker_rules(tmpdir, 'a\n!a/b\n').can_skip_directory('a')
+
+
+def test_load(tmpdir):
+    assert ignore_rules.load(str(tmpdir)) is None
+    tmpdir.join(ignore_rules.DOCKERIGNORE).write('a\n')
+    assert ignore_rules.load(str(tmpdir)).style == ignore_rules.STYLE_DOCKER
+    # .gcloudignore takes precedence
+    tmpdir.join(ignore_rules.GCLOUDIGNORE).write('b\n')
+    ignore = ignore_rules.load(str(tmpdir))
+    assert ignore.style == ignore_rules.STYLE_GCLOUD
+    assert ignore.source == ignore_rules.GCLOUDIGNORE
+
+
+def test_rsync_filters(tmpdir):
+    ignore = _gcloud_rules(tmpdir, '*.log\n/build\n**/tmp/\n!keep.log\n')
+    assert ignore_rules.rsync_filters(ignore) == [
+        '+ keep.log', '- tmp/', '- /build', '- *.log']
@@ -18,7 +18,8 @@
 
 The input is a local cloudbuild.yaml file.  This is translated into a
 series of commands for the locally installed Docker daemon.  These
-commands are output as a shell script and optionally executed.
+commands are output as a shell script and optionally executed, or run
+directly by step_executor.
 
 The output images are not pushed to the Google Container Registry.
 Not all cloudbuild.yaml functionality is supported.  In particular,
@@ -39,10 +40,20 @@ import re
 import shlex
 import subprocess
 import sys
+import tempfile
 
 import yaml
 
+import build_analysis
+import build_trace
+import buildkit_cache
+import docker_api
+import ignore_rules
+import source_watch
+import step_cache
+import step_executor
 import validation_utils
+import workspace_sync
 
 
 # Exclude non-printable control characters (including newlines)
@@ -61,6 +72,17 @@ SUBSTITUTION_REGEX = re.compile(r"""(?x)
     )
 """)
 
+# Cloud Build durations, like "10800s" or "1.5s"
+DURATION_REGEX = re.compile(r'^([0-9]+(?:[.][0-9]{0,9})?)s$')
+
+# Ways to run the build steps
+EXECUTOR_SCRIPT = 'script'
+EXECUTOR_PYTHON = 'python'
+
+# How the Python executor talks to Docker
+BACKEND_CLI = 'cli'
+BACKEND_API = 'api'
+
 # Default builtin substitutions
 DEFAULT_SUBSTITUTIONS = {
     'BRANCH_NAME': '',
@@ -75,6 +97,25 @@ DEFAULT_SUBSTITUTIONS = {
 # Use this image for cleanup actions
 DEBIAN_IMAGE = 'gcr.io/google-appengine/debian8'
 
+# Mounted into every step container
+STEP_VOLUMES = [
+    '/var/run/docker.sock:/var/run/docker.sock',
+    '/root/.docker:/root/.docker',
+    '${HOST_WORKSPACE}:/workspace',
+]
+
+# Named volumes can't be mounted at or below these paths
+RESERVED_VOLUME_PATHS = ['/workspace', '/var/run/docker.sock',
+                         '/root/.docker']
+
+# Allowed names of Docker volumes
+VOLUME_NAME_REGEX = re.compile(r'^[a-zA-Z0-9][a-zA-Z0-9_.-]*$')
+
+# Prepended to the names of the Docker volumes backing `volumes`
+# entries, so they don't clash with other volumes on the host.  The
+# volumes are kept between builds.
+VOLUME_PREFIX = 'local_cloudbuild_'
+
 # File template
 BUILD_SCRIPT_TEMPLATE = """\
 #!/bin/bash
@@ -98,7 +139,42 @@ trap cleanup EXIT
 
 # Copy source to staging directory
 echo "Copying source to staging directory ${{HOST_WORKSPACE}}"
-rsync -avzq --exclude=.git "${{SOURCE_DIR}}" "${{HOST_WORKSPACE}}"
+rsync -avzq {rsync_flags} "${{SOURCE_DIR}}" "${{HOST_WORKSPACE}}"
+
+# Build commands
+{docker_str}
+# End of build commands
+echo "Build completed successfully"
+"""
+
+
+# File template for a persistent workspace, which is brought up to date
+# instead of copied from scratch, and kept after the build
+PERSISTENT_BUILD_SCRIPT_TEMPLATE = """\
+#!/bin/bash
+# This is a generated file.  Do not edit.
+
+set -euo pipefail
+
+SOURCE_DIR=.
+
+# Persistent staging directory, shared by builds of the same source
+HOST_WORKSPACE={workspace}
+mkdir -p "${{HOST_WORKSPACE}}"
+function cleanup {{
+    # Keep the staging directory for the next build
+    true
+}}
+trap cleanup EXIT
+
+# Copy changed files to staging directory, and remove deleted ones
+echo "Updating staging directory ${{HOST_WORKSPACE}}"
+if ! rsync -a --delete {rsync_flags} "${{SOURCE_DIR}}/" \
+        "${{HOST_WORKSPACE}}/" 2>/dev/null; then
+    # Outputs of an earlier build may be owned by root
+    {cleanup_str} 2>/dev/null || true
+    rsync -a --delete {rsync_flags} "${{SOURCE_DIR}}/" "${{HOST_WORKSPACE}}/"
+fi
 
 # Build commands
 {docker_str}
@@ -106,18 +182,185 @@ rsync -avzq --exclude=.git "${{SOURCE_DIR}}" "${{HOST_WORKSPACE}}"
 echo "Build completed successfully"
 """
 
+# Run steps concurrently, as permitted by their waitFor fields.  The
+# step functions and dependency lists are filled in by generate_script.
+DAG_SCRIPT_TEMPLATE = """\
+# Steps run concurrently where their waitFor fields allow
+{step_functions}
+# Stop running steps and remove bookkeeping on exit
+function kill_tree {{
+    local child
+    for child in $(pgrep -P "$1" || true); do
+        kill_tree "${{child}}"
+    done
+    kill "$1" 2>/dev/null || true
+}}
+function cancel_steps {{
+    local pid
+    for pid in $(jobs -pr); do
+        kill_tree "${{pid}}"
+    done
+    wait 2>/dev/null || true
+    rm -rf "${{STATUS_DIR}}"
+}}
+STATUS_DIR=$(mktemp -d -t local_cloudbuild_status_XXXXXXXXXX)
+trap 'cancel_steps; cleanup' EXIT
+
+# Indices of the steps that each step waits for
+STEP_DEPS=(
+{step_deps})
+MAX_JOBS={jobs}
+
+STATE=()
+for i in "${{!STEP_DEPS[@]}}"; do
+    STATE[$i]=pending
+done
+RUNNING=0
+FAILED=0
+while true; do
+    # Collect finished steps
+    for i in "${{!STEP_DEPS[@]}}"; do
+        if [ "${{STATE[$i]}}" = running -a -f "${{STATUS_DIR}}/$i" ]; then
+            RUNNING=$((RUNNING - 1))
+            if [ "$(cat "${{STATUS_DIR}}/$i")" = 0 ]; then
+                STATE[$i]=ok
+                echo "Finished Step #$i"
+            else
+                STATE[$i]=failed
+                FAILED=1
+                echo "Step #$i failed"
+            fi
+        fi
+    done
+
+    # Cancel steps that depend on a failure, start steps that are ready
+    PENDING=0
+    for i in "${{!STEP_DEPS[@]}}"; do
+        if [ "${{STATE[$i]}}" != pending ]; then
+            continue
+        fi
+        READY=yes
+        for dep in ${{STEP_DEPS[$i]}}; do
+            case "${{STATE[$dep]}}" in
+                ok) ;;
+                failed|cancelled) READY=cancel; break ;;
+                *) READY=no ;;
+            esac
+        done
+        if [ "${{READY}}" = cancel ]; then
+            STATE[$i]=cancelled
+            echo "Cancelled Step #$i"
+        elif [ "${{READY}}" = yes -a "${{RUNNING}}" -lt "${{MAX_JOBS}}" ]; then
+            STATE[$i]=running
+            RUNNING=$((RUNNING + 1))
+            echo "Starting Step #$i"
+            (
+                set +e
+                step_$i 2>&1 |
+                    while IFS= read -r line || [ -n "${{line}}" ]; do
+                        echo "Step #$i: ${{line}}"
+                    done
+                echo "${{PIPESTATUS[0]}}" > "${{STATUS_DIR}}/$i.tmp"
+                mv "${{STATUS_DIR}}/$i.tmp" "${{STATUS_DIR}}/$i"
+            ) &
+        else
+            PENDING=$((PENDING + 1))
+        fi
+    done
+
+    if [ "${{RUNNING}}" -eq 0 -a "${{PENDING}}" -eq 0 ]; then
+        break
+    fi
+    sleep 0.2
+done
+
+if [ "${{FAILED}}" -ne 0 ]; then
+    echo "Build failed"
+    exit 1
+fi
+"""
+
+# waitFor value meaning "start when the build starts"
+WAIT_FOR_START = '-'
+
 
 # Validated cloudbuild recipe + flags
-CloudBuild = collections.namedtuple('CloudBuild',
-                                    'output_script run steps substitutions')
+#
+# `timeout` is in seconds, or 0 for no limit.  `workspace` is the
+# persistent staging directory, or '' to stage in a temporary directory.
+# `step_cache` enables caching the outputs of the steps whose ids or
+# images are in `cacheable_steps` in `cache_dir`, which the Python
+# executor keeps below `cache_max_size` bytes.  `trace_out` and
+# `summary_out` are files for timing reports, or None.  `cache_volumes`
+# are mounted into every step, in addition to each step's own `volumes`.
+# `backend` is how the Python executor runs containers, through
+# `docker_socket` for the Engine API.  If `docker_hosts` lists several
+# daemon sockets, steps are spread across them instead.  Up to
+# `pull_jobs` step images are pulled at once before they are needed.
+# With `watch`, the build is re-run whenever the source changes,
+# waiting `watch_debounce` seconds for changes to stop.  If `analyze` is
+# a timing summary file, the build is analyzed instead of run.  With
+# `buildkit_cache`, `docker build` steps keep their layer cache between
+# builds, see buildkit_cache.
+CloudBuild = collections.namedtuple(
+    'CloudBuild',
+    'analyze backend buildkit_cache cache_dir cache_max_size cache_volumes '
+    'cacheable_steps docker_hosts docker_socket executor jobs link_mode '
+    'output_script pull_jobs run step_cache steps substitutions summary_out '
+    'timeout trace_out watch watch_debounce workspace')
 
 # Single validated step in a cloudbuild recipe
-Step = collections.namedtuple('Step', 'args dir_ env name')
+#
+# `wait_for` is None when the step should wait for all previous steps,
+# which is the Cloud Build default.  `timeout` is in seconds, or 0 for
+# no limit.  `volumes` is a list of Volume.
+Step = collections.namedtuple(
+    'Step', 'args dir_ env id_ name timeout volumes wait_for')
+
+# Named volume mounted into a step
+Volume = collections.namedtuple('Volume', 'name path')
+
+# This deletes everything in /workspace including hidden files, but not
+# /workspace itself
+CLEANUP_STEP = Step(
+    args=['rm', '-rf', '/workspace'],
+    dir_='',
+    env=[],
+    id_='',
+    name=DEBIAN_IMAGE,
+    timeout=0,
+    volumes=[],
+    wait_for=None,
+)
+
+# Creates the BuildKit builder used by steps with `buildkit_cache`
+BUILDKIT_SETUP_STEP = Step(
+    args=buildkit_cache.SETUP_ARGS,
+    dir_='',
+    env=[],
+    id_='',
+    name=buildkit_cache.DOCKER_BUILDER_IMAGE,
+    timeout=0,
+    volumes=[],
+    wait_for=None,
+)
 
 
 def sub_and_quote(s, substitutions, substitutions_used):
     """Return a shell-escaped, variable substituted, version of the string s.
 
+    Args:
+        s (str): Any string
+        subs (dict): Substitution map to apply
+        subs_used (set): Updated with names from `subs.keys()` when those
+                         substitutions are encountered in `s`
+    """
+    return shlex.quote(substitute(s, substitutions, substitutions_used))
+
+
+def substitute(s, substitutions, substitutions_used):
+    """Return a variable substituted version of the string s.
+
     Args:
         s (str): Any string
         subs (dict): Substitution map to apply
@@ -143,9 +386,38 @@ def sub_and_quote(s, substitutions, substitutions_used):
         substitutions_used.add(variable_name)
         return value
 
-    substituted_s = re.sub(SUBSTITUTION_REGEX, sub, s)
-    quoted_s = shlex.quote(substituted_s)
-    return quoted_s
+    return re.sub(SUBSTITUTION_REGEX, sub, s)
+
+
+def get_duration(container, field_name):
+    """Fetch a Cloud Build duration field, in seconds
+
+    Args:
+        container (dict): Object decoded from yaml
+        field_name (str): Field that may be present in `container`
+
+    Returns:
+        float: Duration in seconds, or 0 if the field is not present
+    """
+    value = validation_utils.get_field_value(container, field_name, str)
+    problem = duration_problem(value)
+    if problem:
+        raise ValueError('Invalid "{}" field: {}'.format(field_name, problem))
+    return parse_duration(value)
+
+
+def duration_problem(value):
+    """Describe what is wrong with a Cloud Build duration, if anything"""
+    if value and not DURATION_REGEX.match(value):
+        return 'Expected a duration like "600s", but found {!r}'.format(value)
+    return None
+
+
+def parse_duration(value):
+    """Return the seconds of a valid duration, or 0 if it is empty"""
+    if not value:
+        return 0
+    return float(DURATION_REGEX.match(value).group(1))
 
 
 def get_cloudbuild(raw_config, args):
@@ -167,12 +439,62 @@ def get_cloudbuild(raw_config, args):
     if not raw_steps:
         raise ValueError('No steps defined in {}'.format(args.config))
 
-    steps = [get_step(raw_step) for raw_step in raw_steps]
+    if args.executor != EXECUTOR_PYTHON and (args.trace_out or
+                                             args.summary_out):
+        raise ValueError(
+            '--trace-out and --summary-out require --executor={}'.format(
+                EXECUTOR_PYTHON))
+    if args.executor != EXECUTOR_PYTHON and args.backend != BACKEND_CLI:
+        raise ValueError('--backend={} requires --executor={}'.format(
+            args.backend, EXECUTOR_PYTHON))
+    if args.watch and args.executor != EXECUTOR_PYTHON:
+        raise ValueError('--watch requires --executor={}'.format(
+            EXECUTOR_PYTHON))
+    if args.docker_hosts and args.executor != EXECUTOR_PYTHON:
+        raise ValueError('--docker-hosts requires --executor={}'.format(
+            EXECUTOR_PYTHON))
+    if args.watch and args.docker_hosts:
+        raise ValueError('--watch can\'t be used with --docker-hosts')
+    if args.watch and (args.trace_out or args.summary_out):
+        raise ValueError(
+            '--watch can\'t be used with --trace-out or --summary-out')
+
+    steps = get_steps(raw_steps)
+    # Reject unknown ids and cycles early
+    get_dependencies(steps)
+    for step in steps:
+        check_volumes(step.volumes + args.cache_volumes)
+
+    # The source directory of the build is the current directory
+    workspace = ''
+    if args.persistent_workspace:
+        workspace = workspace_sync.persistent_workspace_dir(
+            os.getcwd(), args.workspace_root)
     return CloudBuild(
+        analyze=args.analyze,
+        backend=args.backend,
+        buildkit_cache=args.buildkit_cache,
+        cache_dir=args.cache_dir,
+        cache_max_size=args.cache_max_size,
+        cache_volumes=args.cache_volumes,
+        cacheable_steps=args.cacheable_steps,
+        docker_hosts=args.docker_hosts,
+        docker_socket=args.docker_socket,
+        executor=args.executor,
+        jobs=args.jobs,
+        link_mode=args.link_mode,
         output_script=args.output_script,
+        pull_jobs=args.pull_jobs,
         run=args.run,
+        step_cache=args.step_cache,
         steps=steps,
         substitutions=args.substitutions,
+        summary_out=args.summary_out,
+        timeout=get_duration(raw_config, 'timeout'),
+        trace_out=args.trace_out,
+        watch=args.watch,
+        watch_debounce=args.watch_debounce,
+        workspace=workspace,
     )
 
 
@@ -184,27 +506,226 @@ def get_step(raw_step):
 
     Returns:
         Step: valid build step
+
+    Raises:
+        validation_utils.SchemaError: with every problem in the step
     """
-    if not isinstance(raw_step, dict):
-        raise ValueError(
-            'Expected step to be of type "dict", but found type "{}"'.
-            format(type(raw_step)))
-    raw_args = validation_utils.get_field_value(raw_step, 'args', list)
-    args = [validation_utils.get_field_value(raw_args, index, str)
-            for index in range(len(raw_args))]
-    dir_ = validation_utils.get_field_value(raw_step, 'dir', str)
-    raw_env = validation_utils.get_field_value(raw_step, 'env', list)
-    env = [validation_utils.get_field_value(raw_env, index, str)
-           for index in range(len(raw_env))]
-    name = validation_utils.get_field_value(raw_step, 'name', str)
+    return make_step(STEP_VALIDATOR.check(raw_step))
+
+
+def get_steps(raw_steps):
+    """Read and validate all cloudbuild steps in a single pass
+
+    Args:
+        raw_steps (list): deserialized steps
+
+    Returns:
+        [Step]: valid build steps
+
+    Raises:
+        validation_utils.SchemaError: with every problem in any step
+    """
+    records, errors = STEP_VALIDATOR.validate_batch(raw_steps, 'steps')
+    if errors:
+        raise validation_utils.SchemaError(errors)
+    return [make_step(record) for record in records]
+
+
+def make_step(record):
+    """Return the Step for a step validated with STEP_SCHEMA"""
+    wait_for = record['waitFor']
+    if wait_for == [WAIT_FOR_START]:
+        wait_for = []
     return Step(
-        args=args,
-        dir_=dir_,
-        env=env,
-        name=name,
+        args=record['args'],
+        dir_=record['dir'],
+        env=record['env'],
+        id_=record['id'],
+        name=record['name'],
+        timeout=parse_duration(record['timeout']),
+        volumes=[Volume(**volume) for volume in record['volumes']],
+        wait_for=wait_for,
     )
 
 
+def volume_name_problem(name):
+    """Describe what is wrong with a volume name, if anything"""
+    if not VOLUME_NAME_REGEX.match(name):
+        return 'Expected volume name to match "{}", but found {!r}'.format(
+            VOLUME_NAME_REGEX.pattern, name)
+    return None
+
+
+def volume_path_problem(path):
+    """Describe what is wrong with a volume path, if anything"""
+    if not path.startswith('/') or os.path.normpath(path) != path:
+        return ('Expected volume path to be a normalized absolute path, but '
+                'found {!r}'.format(path))
+    for reserved in RESERVED_VOLUME_PATHS:
+        if path == reserved or path.startswith(reserved + '/'):
+            return 'Volume path {!r} conflicts with reserved path {!r}'.format(
+                path, reserved)
+    return None
+
+
+def get_volume(raw_volume):
+    """Read and validate a single entry of a step's `volumes` field
+
+    Args:
+        raw_volume (dict): deserialized volume
+
+    Returns:
+        Volume: valid volume
+    """
+    name = validation_utils.get_field_value(raw_volume, 'name', str)
+    path = validation_utils.get_field_value(raw_volume, 'path', str)
+    problem = volume_name_problem(name) or volume_path_problem(path)
+    if problem:
+        raise ValueError(problem)
+    return Volume(name=name, path=path)
+
+
+def duplicate_volumes_problem(volumes):
+    """Describe volumes of a single step that overlap, if any"""
+    names = [volume.name for volume in volumes]
+    paths = [volume.path for volume in volumes]
+    for values, kind in [(names, 'name'), (paths, 'path')]:
+        duplicates = sorted(set(value for value in values
+                                if values.count(value) > 1))
+        if duplicates:
+            return 'Volume {} {!r} is used more than once in a step'.format(
+                kind, duplicates[0])
+    return None
+
+
+def check_volumes(volumes):
+    """Check that the volumes of a single step don't overlap"""
+    problem = duplicate_volumes_problem(volumes)
+    if problem:
+        raise ValueError(problem)
+
+
+def wait_for_problem(wait_for):
+    """Describe what is wrong with a step's waitFor list, if anything"""
+    if WAIT_FOR_START in wait_for and len(wait_for) != 1:
+        return ('Expected "waitFor" field to be either "{}" or a list of '
+                'step ids, but found {!r}'.format(WAIT_FOR_START, wait_for))
+    return None
+
+
+# Fields of a cloudbuild step that get_step reads
+STEP_SCHEMA = validation_utils.Record({
+    'args': validation_utils.ListOf(validation_utils.Scalar(str)),
+    'dir': validation_utils.Scalar(str),
+    'env': validation_utils.ListOf(validation_utils.Scalar(str)),
+    'id': validation_utils.Scalar(str),
+    'name': validation_utils.Scalar(str),
+    'timeout': validation_utils.Scalar(str, check=duration_problem),
+    'volumes': validation_utils.ListOf(
+        validation_utils.Record({
+            'name': validation_utils.Scalar(str, check=volume_name_problem),
+            'path': validation_utils.Scalar(str, check=volume_path_problem),
+        }),
+        check=lambda volumes: duplicate_volumes_problem(
+            [Volume(**volume) for volume in volumes])),
+    'waitFor': validation_utils.ListOf(
+        validation_utils.Scalar(str), optional=True, check=wait_for_problem),
+})
+STEP_VALIDATOR = validation_utils.Validator(STEP_SCHEMA)
+
+
+def validate_arg_docker_hosts(flag_value):
+    """Parse a comma separated list of Docker daemon socket paths"""
+    sockets = [socket.strip() for socket in flag_value.split(',')]
+    for socket in sockets:
+        if not socket or not PRINTABLE_REGEX.match(socket):
+            raise argparse.ArgumentTypeError(
+                'Invalid Docker socket path {!r} in {!r}'.format(
+                    socket, flag_value))
+    return sockets
+
+
+def validate_arg_volume(flag_value):
+    """Parse a NAME:PATH command line flag as a Volume"""
+    name, sep, path = flag_value.partition(':')
+    try:
+        if not sep:
+            raise ValueError('expected NAME:PATH')
+        return get_volume({'name': name, 'path': path})
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(
+            'Invalid volume "{}": {}'.format(flag_value, e))
+
+
+def get_dependencies(steps):
+    """Determine which steps each step must wait for.
+
+    Steps without a `waitFor` field wait for all previous steps.  Steps
+    with `waitFor: ['-']` can start immediately.
+
+    Args:
+        steps (list): Valid build steps
+
+    Returns:
+        [[int]]: For each step, the sorted indices of the steps it waits for
+
+    Raises:
+        ValueError: if ids are duplicated or unknown, or if the steps
+                    wait for each other in a cycle
+    """
+    indices_by_id = {}
+    for index, step in enumerate(steps):
+        if step.id_:
+            if step.id_ in indices_by_id:
+                raise ValueError(
+                    'Step id "{}" is used by more than one step'.format(
+                        step.id_))
+            indices_by_id[step.id_] = index
+
+    dependencies = []
+    for index, step in enumerate(steps):
+        if step.wait_for is None:
+            dependencies.append(list(range(index)))
+            continue
+        deps = set()
+        for wait_id in step.wait_for:
+            if wait_id not in indices_by_id:
+                raise ValueError(
+                    'Step #{} waits for unknown step id "{}"'.format(
+                        index, wait_id))
+            deps.add(indices_by_id[wait_id])
+        dependencies.append(sorted(deps))
+
+    # Check for cycles by repeatedly removing steps with no remaining
+    # dependencies (Kahn's algorithm)
+    remaining = [len(deps) for deps in dependencies]
+    dependents = [[] for _ in steps]
+    for index, deps in enumerate(dependencies):
+        for dep in deps:
+            dependents[dep].append(index)
+    ready = [index for index, count in enumerate(remaining) if count == 0]
+    visited = 0
+    while ready:
+        index = ready.pop()
+        visited += 1
+        for dependent in dependents[index]:
+            remaining[dependent] -= 1
+            if remaining[dependent] == 0:
+                ready.append(dependent)
+    if visited != len(steps):
+        cycle = [index for index, count in enumerate(remaining) if count]
+        raise ValueError(
+            'Steps {} wait for each other in a cycle'.format(
+                ', '.join('#{}'.format(index) for index in cycle)))
+    return dependencies
+
+
+def is_sequential(dependencies):
+    """Return True if every step waits for all previous steps"""
+    return all(deps == list(range(index))
+               for index, deps in enumerate(dependencies))
+
+
 def generate_command(step, substitutions, substitutions_used):
     """Generate a single shell command to run for a single cloudbuild step
 
@@ -228,43 +749,103 @@ def generate_command(step, substitutions, substitutions_used):
     if step.dir_:
         workdir = os.path.join(workdir, sub_and_quote(step.dir_, substitutions,
                                                       substitutions_used))
-    process_args = [
-        'docker',
-        'run',
-        '--volume',
-        '/var/run/docker.sock:/var/run/docker.sock',
-        '--volume',
-        '/root/.docker:/root/.docker',
-        '--volume',
-        '${HOST_WORKSPACE}:/workspace',
-        '--workdir',
-        workdir,
-    ] + quoted_env + [quoted_name] + quoted_args
-    return process_args
+    process_args = ['docker', 'run']
+    for volume in STEP_VOLUMES:
+        process_args.extend(['--volume', volume])
+    for volume in step.volumes:
+        process_args.extend(['--volume', shlex.quote(
+            VOLUME_PREFIX + volume.name + ':' + volume.path)])
+    process_args.extend(['--workdir', workdir])
+    return process_args + quoted_env + [quoted_name] + quoted_args
 
 
-def generate_script(cloudbuild):
-    """Generate the contents of a shell script
+def generate_container(step, substitutions, substitutions_used):
+    """Generate the container to create for a single cloudbuild step
+
+    This is the Engine API equivalent of generate_command, so values
+    are substituted but not quoted.
 
     Args:
-        cloudbuild (CloudBuild): Valid cloudbuild configuration
+        step (Step): Valid build step
+        subs (dict): Substitution map to apply
+        subs_used (set): Updated with names from `subs.keys()` when those
+                         substitutions are encountered in an element of `step`
 
     Returns:
-        (str): Contents of shell script
+        docker_api.ContainerSpec: Container for the step
     """
-    # This deletes everything in /workspace including hidden files,
-    # but not /workspace itself
-    cleanup_step = Step(
-        args=['rm', '-rf', '/workspace'],
-        dir_='',
-        env=[],
-        name=DEBIAN_IMAGE,
+    workdir = '/workspace'
+    if step.dir_:
+        workdir = os.path.join(workdir, substitute(step.dir_, substitutions,
+                                                   substitutions_used))
+    return docker_api.ContainerSpec(
+        args=[substitute(arg, substitutions, substitutions_used)
+              for arg in step.args],
+        env=[substitute(env, substitutions, substitutions_used)
+             for env in step.env],
+        image=substitute(step.name, substitutions, substitutions_used),
+        volumes=STEP_VOLUMES + [VOLUME_PREFIX + volume.name + ':' +
+                                volume.path for volume in step.volumes],
+        workdir=workdir,
     )
-    cleanup_command = generate_command(cleanup_step, {}, set())
+
+
+def step_with_cache_volumes(step, cloudbuild):
+    """Return a step with the --cache-volume flags added to its volumes"""
+    return step._replace(volumes=step.volumes + cloudbuild.cache_volumes)
+
+
+def get_buildkit_steps(cloudbuild):
+    """Return the indices of the steps that use the BuildKit cache"""
+    if not cloudbuild.buildkit_cache:
+        return []
+    return [index for index, step in enumerate(cloudbuild.steps)
+            if buildkit_cache.is_docker_build(
+                substitute(step.name, cloudbuild.substitutions, set()),
+                step.args)]
+
+
+def step_with_buildkit_cache(step, index, cloudbuild):
+    """Return a `docker build` step rewritten to use the BuildKit cache
+
+    Each image name gets its own cache directory, in a volume.
+    """
+    tag = buildkit_cache.get_tag(step.args)
+    if tag is not None:
+        tag = substitute(tag, cloudbuild.substitutions, set())
+    name = buildkit_cache.cache_name(tag, 'step_{}'.format(index))
+    return step._replace(
+        args=buildkit_cache.rewrite_args(step.args, name),
+        volumes=step.volumes + [Volume(name=buildkit_cache.CACHE_VOLUME,
+                                       path=buildkit_cache.CACHE_PATH)])
+
+
+def local_steps(cloudbuild):
+    """Return the steps as they are run locally, with the flags applied"""
+    buildkit_steps = get_buildkit_steps(cloudbuild)
+    steps = []
+    for index, step in enumerate(cloudbuild.steps):
+        step = step_with_cache_volumes(step, cloudbuild)
+        if index in buildkit_steps:
+            step = step_with_buildkit_cache(step, index, cloudbuild)
+        steps.append(step)
+    return steps
+
+
+def generate_commands(cloudbuild):
+    """Generate the shell commands for all steps and for cleanup
+
+    Args:
+        cloudbuild (CloudBuild): Valid cloudbuild configuration
+
+    Returns:
+        ([str], [[str]]): Cleanup command, and one command per step
+    """
+    cleanup_command = generate_command(CLEANUP_STEP, {}, set())
     subs_used = set()
     docker_commands = [
         generate_command(step, cloudbuild.substitutions, subs_used)
-        for step in cloudbuild.steps]
+        for step in local_steps(cloudbuild)]
 
     # Check that all user variables were referenced at least once
     user_subs_unused = [name for name in cloudbuild.substitutions.keys()
@@ -275,19 +856,125 @@ def generate_script(cloudbuild):
             'User substitution variables {} were defined in the '
             '--substitution flag but never used in the cloudbuild file.'.
             format(nice_list))
+    return cleanup_command, docker_commands
+
+
+def generate_containers(cloudbuild):
+    """Generate the containers for all steps and for cleanup
+
+    Args:
+        cloudbuild (CloudBuild): Valid cloudbuild configuration
 
+    Returns:
+        (docker_api.ContainerSpec, [docker_api.ContainerSpec]): Cleanup
+            container, and one container per step
+    """
+    cleanup_container = generate_container(CLEANUP_STEP, {}, set())
+    containers = [
+        generate_container(step, cloudbuild.substitutions, set())
+        for step in local_steps(cloudbuild)]
+    return cleanup_container, containers
+
+
+def get_images(cloudbuild):
+    """Return the substituted image names of all steps, each once
+
+    Args:
+        cloudbuild (CloudBuild): Valid cloudbuild configuration
+
+    Returns:
+        [str]: Image names in order of first use
+    """
+    images = []
+    for step in cloudbuild.steps:
+        image = substitute(step.name, cloudbuild.substitutions, set())
+        if image not in images:
+            images.append(image)
+    return images
+
+
+def generate_script(cloudbuild):
+    """Generate the contents of a shell script
+
+    Args:
+        cloudbuild (CloudBuild): Valid cloudbuild configuration
+
+    Returns:
+        (str): Contents of shell script
+    """
+    cleanup_command, docker_commands = generate_commands(cloudbuild)
     cleanup_str = ' '.join(cleanup_command)
-    docker_lines = []
-    for docker_command in docker_commands:
-        line = ' '.join(docker_command) + '\n\n'
-        docker_lines.append(line)
-    docker_str = ''.join(docker_lines)
-
-    s = BUILD_SCRIPT_TEMPLATE.format(cleanup_str=cleanup_str,
-                                     docker_str=docker_str)
+    dependencies = get_dependencies(cloudbuild.steps)
+    if is_sequential(dependencies):
+        docker_lines = []
+        for docker_command in docker_commands:
+            line = ' '.join(docker_command) + '\n\n'
+            docker_lines.append(line)
+        docker_str = ''.join(docker_lines)
+    else:
+        docker_str = generate_dag_str(
+            docker_commands, dependencies, cloudbuild.jobs)
+    if get_buildkit_steps(cloudbuild):
+        # Fails if the builder exists already
+        setup_command = generate_command(BUILDKIT_SETUP_STEP, {}, set())
+        docker_str = ' '.join(setup_command) + ' || true\n\n' + docker_str
+
+    if cloudbuild.workspace:
+        s = PERSISTENT_BUILD_SCRIPT_TEMPLATE.format(
+            cleanup_str=cleanup_str,
+            docker_str=docker_str,
+            rsync_flags=generate_rsync_flags(),
+            workspace=shlex.quote(cloudbuild.workspace))
+    else:
+        s = BUILD_SCRIPT_TEMPLATE.format(
+            cleanup_str=cleanup_str,
+            docker_str=docker_str,
+            rsync_flags=generate_rsync_flags())
     return s
 
 
+def generate_rsync_flags(source_dir='.'):
+    """Generate rsync flags that leave ignored files out of the workspace
+
+    The rules of the `.gcloudignore` or `.dockerignore` in `source_dir`
+    are translated to rsync filter rules, see ignore_rules.
+
+    Returns:
+        (str): Shell tokens
+    """
+    flags = ['--exclude=.git']
+    ignore = ignore_rules.load(source_dir)
+    if ignore is not None:
+        flags.extend(shlex.quote('--filter=' + rule)
+                     for rule in ignore_rules.rsync_filters(ignore))
+    return ' '.join(flags)
+
+
+def generate_dag_str(docker_commands, dependencies, jobs):
+    """Generate shell commands that run steps as a dependency graph
+
+    Args:
+        docker_commands ([[str]]): Shell command for each step
+        dependencies ([[int]]): Indices each step waits for, as returned
+                                by get_dependencies
+        jobs (int): Maximum number of steps to run at the same time
+
+    Returns:
+        (str): Shell commands
+    """
+    step_functions = []
+    for index, docker_command in enumerate(docker_commands):
+        step_functions.append('function step_{} {{\n    {}\n}}\n\n'.format(
+            index, ' '.join(docker_command)))
+    step_deps = ''.join(
+        "    '{}'\n".format(' '.join(str(dep) for dep in deps))
+        for deps in dependencies)
+    return DAG_SCRIPT_TEMPLATE.format(
+        step_functions=''.join(step_functions),
+        step_deps=step_deps,
+        jobs=jobs)
+
+
 def make_executable(path):
     """Set executable bit(s) on file"""
     # http://stackoverflow.com/questions/12791997
@@ -304,6 +991,215 @@ def write_script(cloudbuild, contents):
     make_executable(cloudbuild.output_script)
 
 
+def generate_executable_steps(cloudbuild, docker_commands, containers):
+    """Combine the commands and containers of all steps for step_executor
+
+    Returns:
+        [step_executor.ExecutableStep]: One per step
+    """
+    dependencies = get_dependencies(cloudbuild.steps)
+    return [
+        step_executor.ExecutableStep(
+            command=command,
+            container=container,
+            dependencies=deps,
+            id_=step.id_,
+            image=container.image,
+            timeout=step.timeout,
+        )
+        for step, command, container, deps in zip(
+            cloudbuild.steps, docker_commands, containers, dependencies)]
+
+
+def get_client(cloudbuild):
+    """Return a DockerClient for the API backend, or None for the CLI"""
+    if cloudbuild.backend != BACKEND_API:
+        return None
+    client = docker_api.DockerClient(cloudbuild.docker_socket)
+    # Fail early if the daemon can't be reached
+    client.ping()
+    return client
+
+
+def get_hosts(cloudbuild):
+    """Return a step_executor.DockerHost for each of --docker-hosts"""
+    hosts = []
+    for socket in cloudbuild.docker_hosts:
+        client = None
+        if cloudbuild.backend == BACKEND_API:
+            client = docker_api.DockerClient(socket)
+            client.ping()
+        hosts.append(step_executor.DockerHost(
+            client=client,
+            env=dict(os.environ, DOCKER_HOST='unix://' + socket)))
+    return hosts
+
+
+def first_affected_step(containers, paths):
+    """Find the first step that uses any of some changed files.
+
+    A step uses a file if its `dir` contains it, or if one of its
+    arguments names the file or a directory containing it.  Arguments
+    are split at `=` and `:`, so `--file=app/Dockerfile` names
+    `app/Dockerfile`, and `.` names the step's whole directory.
+
+    Args:
+        containers ([docker_api.ContainerSpec]): Container of each step
+        paths ([str]): Changed files, relative to the workspace
+
+    Returns:
+        int: Index of the first step that uses a path, or None
+    """
+    for index, container in enumerate(containers):
+        step_dir = os.path.relpath(container.workdir, '/workspace')
+        references = set()
+        if step_dir != '.':
+            references.add(step_dir)
+        for arg in container.args:
+            for token in re.split(r'[\s=:]+', arg):
+                if token == '/workspace' or token.startswith('/workspace/'):
+                    token = os.path.relpath(token, '/workspace')
+                elif not token or token.startswith('/'):
+                    continue
+                reference = os.path.normpath(os.path.join(step_dir, token))
+                if reference != '..' and not reference.startswith('../'):
+                    references.add(reference)
+        for path in paths:
+            if any(reference == '.' or path == reference or
+                   path.startswith(reference + '/')
+                   for reference in references):
+                return index
+    return None
+
+
+def setup_buildkit(cloudbuild, hosts):
+    """Create the BuildKit builder on each host, if any step uses it
+
+    Args:
+        cloudbuild (CloudBuild): Valid cloudbuild configuration
+        hosts ([step_executor.DockerHost]): Where steps run
+    """
+    if not get_buildkit_steps(cloudbuild):
+        return
+    command = generate_command(BUILDKIT_SETUP_STEP, {}, set())
+    container = generate_container(BUILDKIT_SETUP_STEP, {}, set())
+    workspace = tempfile.mkdtemp(prefix='local_cloudbuild_')
+    try:
+        for host in hosts:
+            # Fails if the builder exists already
+            step_executor.run_helper(command, workspace, host.client,
+                                     container, host.env)
+    finally:
+        os.rmdir(workspace)
+
+
+def watch_steps(cloudbuild):
+    """Run the build steps, and again whenever the source changes
+
+    Args:
+        cloudbuild (CloudBuild): Valid cloudbuild configuration
+    """
+    cleanup_command, docker_commands = generate_commands(cloudbuild)
+    cleanup_container, containers = generate_containers(cloudbuild)
+    executable_steps = generate_executable_steps(
+        cloudbuild, docker_commands, containers)
+    client = get_client(cloudbuild)
+    setup_buildkit(cloudbuild, [step_executor.DockerHost(
+        client=client, env=dict(os.environ))])
+    # The source directory of the build is the current directory
+    watcher = source_watch.make_watcher(os.getcwd())
+    print('Watching for changes with {}'.format(type(watcher).__name__))
+    step_executor.watch_build(
+        executable_steps,
+        functools.partial(first_affected_step, containers),
+        watcher, cleanup_command, cloudbuild.jobs,
+        workspace=cloudbuild.workspace, link_mode=cloudbuild.link_mode,
+        client=client, cleanup_container=cleanup_container,
+        debounce=cloudbuild.watch_debounce)
+    if client is not None:
+        client.close()
+
+
+def run_steps(cloudbuild):
+    """Run the build steps directly, without a shell script
+
+    Args:
+        cloudbuild (CloudBuild): Valid cloudbuild configuration
+
+    Raises:
+        subprocess.CalledProcessError: if any step did not succeed
+    """
+    cleanup_command, docker_commands = generate_commands(cloudbuild)
+    cleanup_container, containers = generate_containers(cloudbuild)
+    executable_steps = generate_executable_steps(
+        cloudbuild, docker_commands, containers)
+    hosts = get_hosts(cloudbuild)
+    client = None if hosts else get_client(cloudbuild)
+    cache = None
+    use_cache = cloudbuild.step_cache and bool(cloudbuild.cacheable_steps)
+    if use_cache and len(hosts) > 1:
+        print('Not using the step cache with several Docker hosts')
+    elif use_cache:
+        cache = step_cache.StepCache(
+            cloudbuild.cache_dir, cloudbuild.cache_max_size,
+            cloudbuild.cacheable_steps)
+    setup_buildkit(cloudbuild, hosts or [step_executor.DockerHost(
+        client=client, env=dict(os.environ))])
+    layer_stats = buildkit_cache.LayerStats(get_buildkit_steps(cloudbuild))
+    trace = build_trace.TraceRecorder()
+    results = step_executor.run_build(
+        executable_steps, cleanup_command, cloudbuild.jobs,
+        timeout=cloudbuild.timeout, workspace=cloudbuild.workspace,
+        link_mode=cloudbuild.link_mode, cache=cache, trace=trace,
+        client=client, cleanup_container=cleanup_container,
+        pull_jobs=cloudbuild.pull_jobs, hosts=hosts,
+        observer=layer_stats.feed)
+    for host_client in [client] + [host.client for host in hosts]:
+        if host_client is not None:
+            host_client.close()
+    elapsed = trace.now()
+    step_names = step_executor.step_names(executable_steps)
+    if layer_stats.vertices:
+        print(layer_stats.format(step_names))
+    if cloudbuild.trace_out:
+        build_trace.write_trace(cloudbuild.trace_out, trace, step_names)
+        print('Wrote trace to {}'.format(cloudbuild.trace_out))
+    if cloudbuild.summary_out:
+        build_trace.update_summary(
+            cloudbuild.summary_out, step_names, results, trace, elapsed)
+        print('Updated timing summary {}'.format(cloudbuild.summary_out))
+    failures = [(command, result)
+                for command, result in zip(docker_commands, results)
+                if result.status != step_executor.STATUS_SUCCESS]
+    if failures:
+        # Report a step that ran in preference to one that was cancelled
+        command, result = sorted(
+            failures, key=lambda failure: failure[1].exit_code is None)[0]
+        raise subprocess.CalledProcessError(
+            1 if result.exit_code is None else result.exit_code,
+            ' '.join(command))
+    print('Build completed successfully')
+
+
+def analyze_build(cloudbuild):
+    """Predict the timing of a build from the step times of earlier builds
+
+    Args:
+        cloudbuild (CloudBuild): Valid cloudbuild configuration
+
+    Returns:
+        str: Critical path, predicted wall time and slack of each step
+    """
+    dependencies = get_dependencies(cloudbuild.steps)
+    step_names = step_executor.step_names(cloudbuild.steps)
+    durations = build_analysis.load_durations(cloudbuild.analyze, step_names)
+    plans = build_analysis.plan_steps(step_names, durations, dependencies)
+    return build_analysis.format_analysis(
+        plans, dependencies, cloudbuild.jobs,
+        build_analysis.load_durations(
+            cloudbuild.analyze, step_names, 'max'))
+
+
 def local_cloudbuild(args):
     """Execute the steps of a cloudbuild.yaml locally
 
@@ -317,12 +1213,35 @@ def local_cloudbuild(args):
     # Determine configuration
     cloudbuild = get_cloudbuild(raw_config, args)
 
+    # Predict timing without running anything
+    if cloudbuild.analyze:
+        print(analyze_build(cloudbuild))
+        return
+
+    # Run steps directly
+    if cloudbuild.executor == EXECUTOR_PYTHON:
+        if cloudbuild.run and cloudbuild.watch:
+            watch_steps(cloudbuild)
+        elif cloudbuild.run:
+            run_steps(cloudbuild)
+        return
+
     # Create shell script
     contents = generate_script(cloudbuild)
     write_script(cloudbuild, contents)
 
     # Run shell script
     if cloudbuild.run:
+        # Pull all images at once, instead of each when its step starts
+        pulls = step_executor.pull_images(
+            get_images(cloudbuild), cloudbuild.pull_jobs)
+        print(step_executor.format_pulls(pulls))
+        # The script stages the current directory with rsync, which
+        # doesn't count what its filters leave out
+        ignore = ignore_rules.load('.')
+        if ignore is not None:
+            print(workspace_sync.format_savings(
+                workspace_sync.scan_tree('.', ignore=ignore), ignore.source))
         print('Running {}'.format(cloudbuild.output_script))
         args = [os.path.abspath(cloudbuild.output_script)]
         subprocess.check_call(args)
@@ -357,6 +1276,175 @@ def parse_args(argv):
         default={},
         help='Parameters to be substituted in the build specification',
     )
+    parser.add_argument(
+        '--executor',
+        choices=[EXECUTOR_SCRIPT, EXECUTOR_PYTHON],
+        default=EXECUTOR_SCRIPT,
+        help=('Run steps from a generated shell script, or directly from '
+              'Python with per-step timeouts and results'),
+    )
+    parser.add_argument(
+        '--backend',
+        choices=[BACKEND_CLI, BACKEND_API],
+        default=BACKEND_CLI,
+        help=('How the Python executor runs containers: a `docker run` '
+              'process per step, or the Docker Engine API over a unix '
+              'socket, which avoids starting the docker CLI each time'),
+    )
+    parser.add_argument(
+        '--docker-socket',
+        type=functools.partial(
+            validation_utils.validate_arg_regex, flag_regex=PRINTABLE_REGEX),
+        default=docker_api.default_socket_path(),
+        help='Unix socket of the Docker daemon, for --backend=api',
+    )
+    parser.add_argument(
+        '--docker-hosts',
+        type=validate_arg_docker_hosts,
+        default=[],
+        metavar='SOCKET,SOCKET,...',
+        help=('With the Python executor, spread steps across the Docker '
+              'daemons listening on these unix sockets.  Each ready step '
+              'goes to the host running the fewest steps, preferring the '
+              'one that last ran a step in the same dir.  Every host has '
+              'its own staging directory, and files that steps change '
+              'are copied to the other hosts before their next step'),
+    )
+    parser.add_argument(
+        '--jobs',
+        type=validation_utils.validate_arg_positive_int,
+        default=os.cpu_count() or 1,
+        help='Maximum number of steps to run at the same time',
+    )
+    parser.add_argument(
+        '--pull-jobs',
+        type=validation_utils.validate_arg_positive_int,
+        default=step_executor.PULL_JOBS,
+        help=('Maximum number of step images to pull at the same time.  '
+              'Images are pulled before their steps start, and images '
+              'already present are not pulled again'),
+    )
+    parser.add_argument(
+        '--cache-volume',
+        type=validate_arg_volume,
+        action='append',
+        default=[],
+        dest='cache_volumes',
+        metavar='NAME:PATH',
+        help=('Mount a named Docker volume, kept between builds, at PATH '
+              'in every step, for example pip:/root/.cache/pip.  May be '
+              'repeated'),
+    )
+    parser.add_argument(
+        '--persistent-workspace',
+        action='store_true',
+        help=('Reuse a staging directory for each source directory, and '
+              'only copy files that changed since the last build'),
+    )
+    parser.add_argument(
+        '--workspace-root',
+        type=functools.partial(
+            validation_utils.validate_arg_regex, flag_regex=PRINTABLE_REGEX),
+        default=workspace_sync.default_workspace_root(),
+        help='Directory holding persistent staging directories',
+    )
+    parser.add_argument(
+        '--link-mode',
+        choices=workspace_sync.LINK_MODES,
+        default=workspace_sync.LINK_MODE_AUTO,
+        help=('How the Python executor stages files: "auto" clones files '
+              'where the filesystem supports it, "hardlink" shares them '
+              'with the source tree, so steps must not modify them in '
+              'place'),
+    )
+    parser.add_argument(
+        '--cacheable-step',
+        action='append',
+        default=[],
+        dest='cacheable_steps',
+        metavar='ID_OR_IMAGE',
+        help=('With the Python executor, restore the workspace outputs of '
+              'the step with this id, or of steps of this image, when its '
+              'command, image and inputs are unchanged since a successful '
+              'run, instead of running it.  Only mark steps whose effects '
+              'stay in /workspace: the steps after other steps always run.  '
+              'Outputs are only stored for steps that ran alone, so use '
+              '--jobs=1 to fill the cache for steps that run in parallel.  '
+              'May be repeated'),
+    )
+    parser.add_argument(
+        '--no-step-cache',
+        action='store_false',
+        dest='step_cache',
+        help='Run every step, even those marked with --cacheable-step',
+    )
+    parser.add_argument(
+        '--cache-dir',
+        type=functools.partial(
+            validation_utils.validate_arg_regex, flag_regex=PRINTABLE_REGEX),
+        default=step_cache.default_cache_dir(),
+        help='Directory holding cached step outputs',
+    )
+    parser.add_argument(
+        '--cache-max-size',
+        type=validation_utils.validate_arg_size,
+        default='10G',
+        help=('Evict least recently used step outputs beyond this size, '
+              'like 500M or 10G'),
+    )
+    parser.add_argument(
+        '--buildkit-cache',
+        action='store_true',
+        help=('Run `docker build` steps of {} with BuildKit, without '
+              '--no-cache, and keep their layer cache between builds in '
+              'the {}{} volume, a directory per image name.  With the '
+              'Python executor, the share of layers taken from the cache '
+              'is reported for each step'.format(
+                  buildkit_cache.DOCKER_BUILDER_IMAGE, VOLUME_PREFIX,
+                  buildkit_cache.CACHE_VOLUME)),
+    )
+    parser.add_argument(
+        '--trace-out',
+        type=functools.partial(
+            validation_utils.validate_arg_regex, flag_regex=PRINTABLE_REGEX),
+        help=('With the Python executor, write the timing of each build '
+              'phase to this file in Chrome trace event format'),
+    )
+    parser.add_argument(
+        '--summary-out',
+        type=functools.partial(
+            validation_utils.validate_arg_regex, flag_regex=PRINTABLE_REGEX),
+        help=('With the Python executor, add the step timings of this '
+              'build to this JSON file, which also holds the median and '
+              'maximum time of each step across recent builds'),
+    )
+    parser.add_argument(
+        '--watch',
+        action='store_true',
+        help=('With the Python executor, keep the staging directory after '
+              'the build and watch the source for changes.  Changed files '
+              'are copied into it, and the build is re-run from the first '
+              'step whose dir or arguments name one of them.  Stop with '
+              'Ctrl-C'),
+    )
+    parser.add_argument(
+        '--watch-debounce',
+        type=float,
+        default=source_watch.DEFAULT_DEBOUNCE,
+        help=('Seconds the source must stay unchanged before --watch '
+              're-runs the build'),
+    )
+    parser.add_argument(
+        '--analyze',
+        type=functools.partial(
+            validation_utils.validate_arg_regex, flag_regex=PRINTABLE_REGEX),
+        metavar='SUMMARY_FILE',
+        help=('Don\'t run the build.  Instead, use the step times recorded '
+              'in SUMMARY_FILE by --summary-out to print the critical '
+              'path, the predicted wall time with --jobs steps at a time, '
+              'and how much each step could slip without delaying the '
+              'build'),
+    )
     args = parser.parse_args(argv[1:])
     if not args.output_script:
         args.output_script = args.config + "_local.sh"
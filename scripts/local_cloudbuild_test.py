@@ -18,16 +18,21 @@
 
 import argparse
 import contextlib
+import json
 import os
 import re
 import shutil
 import subprocess
+import sys
+import tempfile
+import time
 import unittest.mock
 
 import pytest
 import yaml
 
 import local_cloudbuild
+import validation_utils
 
 
 # Matches script boilerplate
@@ -99,18 +104,77 @@ def have_docker():
 
 
 _args = argparse.Namespace(
+    analyze=None,
+    backend='cli',
+    buildkit_cache=False,
+    cache_dir='',
+    cache_max_size=0,
+    cache_volumes=[],
+    cacheable_steps=[],
     config='some_config_file',
+    docker_hosts=[],
+    docker_socket='',
+    executor='script',
+    jobs=1,
+    link_mode='auto',
     output_script='some_output_script',
+    persistent_workspace=False,
+    pull_jobs=2,
     run=False,
+    step_cache=False,
     substitutions={},
+    summary_out=None,
+    trace_out=None,
+    watch=False,
+    watch_debounce=0.2,
+    workspace_root='',
 )
 
 
+def _make_args(**kwargs):
+    """Return a copy of _args with some flags changed"""
+    return argparse.Namespace(**dict(vars(_args), **kwargs))
+
+
 def test_get_cloudbuild_valid():
     raw_yaml = 'steps:\n- name: step1\n- name: step2\n'
     raw_config = yaml.safe_load(raw_yaml)
     actual = local_cloudbuild.get_cloudbuild(raw_config, _args)
     assert len(actual.steps) == 2
+    assert actual.timeout == 0
+
+
+def test_get_cloudbuild_timeout():
+    raw_yaml = 'timeout: 10800s\nsteps:\n- name: step1\n'
+    raw_config = yaml.safe_load(raw_yaml)
+    actual = local_cloudbuild.get_cloudbuild(raw_config, _args)
+    assert actual.timeout == 10800
+
+
+@pytest.mark.parametrize('raw_value, expected', [
+    (None, 0),
+    ('', 0),
+    ('600s', 600),
+    ('1.5s', 1.5),
+    ('0.000000001s', 0.000000001),
+])
+def test_get_duration_valid(raw_value, expected):
+    container = {'timeout': raw_value}
+    assert local_cloudbuild.get_duration(container, 'timeout') == expected
+
+
+@pytest.mark.parametrize('raw_value', [
+    '600',
+    '10m',
+    '-1s',
+    's',
+    600,
+    [],
+])
+def test_get_duration_invalid(raw_value):
+    container = {'timeout': raw_value}
+    with pytest.raises(ValueError):
+        local_cloudbuild.get_duration(container, 'timeout')
 
 
 @pytest.mark.parametrize('raw_yaml', [
@@ -133,18 +197,63 @@ def test_get_cloudbuild_invalid(raw_yaml):
         args=[],
         dir_='',
         env=[],
+        id_='',
         name='',
+        timeout=0,
+        volumes=[],
+        wait_for=None,
     )),
     # Full step
     ({'name': 'aname',
       'args': ['arg1', 2, 'arg3 with \n newline'],
       'env': ['ENV1=value1', 'ENV2=space in value2'],
       'dir': 'adir',
+      'id': 'anid',
+      'waitFor': ['id1', 'id2'],
       }, local_cloudbuild.Step(
         args=['arg1', '2', 'arg3 with \n newline'],
         env=['ENV1=value1', 'ENV2=space in value2'],
         dir_='adir',
+        id_='anid',
         name='aname',
+        timeout=0,
+        volumes=[],
+        wait_for=['id1', 'id2'],
+    )),
+    # Step timeout
+    ({'timeout': '30s'}, local_cloudbuild.Step(
+        args=[],
+        dir_='',
+        env=[],
+        id_='',
+        name='',
+        timeout=30,
+        volumes=[],
+        wait_for=None,
+    )),
+    # Volumes
+    ({'volumes': [{'name': 'pip', 'path': '/root/.cache/pip'}]},
+     local_cloudbuild.Step(
+        args=[],
+        dir_='',
+        env=[],
+        id_='',
+        name='',
+        timeout=0,
+        volumes=[local_cloudbuild.Volume(
+            name='pip', path='/root/.cache/pip')],
+        wait_for=None,
+    )),
+    # Start immediately
+    ({'waitFor': ['-']}, local_cloudbuild.Step(
+        args=[],
+        dir_='',
+        env=[],
+        id_='',
+        name='',
+        timeout=0,
+        volumes=[],
+        wait_for=[],
     )),
 ])
 def test_get_step_valid(raw_step, expected):
@@ -162,18 +271,105 @@ def test_get_step_valid(raw_step, expected):
     {'env': [{}]},
     {'dir': {}},
     {'name': []},
+    {'id': []},
+    {'timeout': '30'},
+    {'waitFor': 'not_a_list'},
+    {'waitFor': [[]]},
+    # Start immediately combined with step ids
+    {'waitFor': ['-', 'anid']},
+    # Invalid volumes
+    {'volumes': 'not_a_list'},
+    {'volumes': ['not_a_dict']},
+    {'volumes': [{'name': 'pip'}]},
+    {'volumes': [{'path': '/cache'}]},
+    {'volumes': [{'name': 'bad name', 'path': '/cache'}]},
+    {'volumes': [{'name': 'pip', 'path': 'relative'}]},
+    {'volumes': [{'name': 'pip', 'path': '/cache/../etc'}]},
+    {'volumes': [{'name': 'pip', 'path': '/workspace'}]},
+    {'volumes': [{'name': 'pip', 'path': '/workspace/cache'}]},
+    {'volumes': [{'name': 'pip', 'path': '/var/run/docker.sock'}]},
+    # Duplicate volume names or paths
+    {'volumes': [{'name': 'pip', 'path': '/a'},
+                 {'name': 'pip', 'path': '/b'}]},
+    {'volumes': [{'name': 'a', 'path': '/cache'},
+                 {'name': 'b', 'path': '/cache'}]},
 ])
 def test_get_step_invalid(raw_step):
     with pytest.raises(ValueError):
         local_cloudbuild.get_step(raw_step)
 
 
+def test_get_steps_reports_all_errors():
+    with pytest.raises(validation_utils.SchemaError) as excinfo:
+        local_cloudbuild.get_steps([
+            {'name': 'ok'},
+            {'args': 'not_a_list', 'timeout': '30'},
+            {'volumes': [{'name': 'bad name', 'path': '/cache'}]},
+        ])
+    assert [error.split(':')[0] for error in excinfo.value.errors] == [
+        'steps[1].args', 'steps[1].timeout', 'steps[2].volumes[0].name']
+
+
+def _dag_step(id_='', wait_for=None):
+    return local_cloudbuild.Step(
+        args=[], dir_='', env=[], id_=id_, name='aname', timeout=0,
+        volumes=[], wait_for=wait_for)
+
+
+@pytest.mark.parametrize('steps, expected', [
+    # Default is to wait for all previous steps
+    ([_dag_step(), _dag_step(), _dag_step()], [[], [0], [0, 1]]),
+    # Start immediately
+    ([_dag_step(), _dag_step(wait_for=[])], [[], []]),
+    # Fan out and fan in
+    ([_dag_step(id_='a'),
+      _dag_step(id_='b', wait_for=['a']),
+      _dag_step(id_='c', wait_for=['a']),
+      _dag_step(wait_for=['c', 'b'])],
+     [[], [0], [0], [1, 2]]),
+    # Waiting for a later step is allowed
+    ([_dag_step(wait_for=['b']), _dag_step(id_='b', wait_for=[])],
+     [[1], []]),
+])
+def test_get_dependencies_valid(steps, expected):
+    assert local_cloudbuild.get_dependencies(steps) == expected
+
+
+@pytest.mark.parametrize('steps, message', [
+    # Unknown id
+    ([_dag_step(wait_for=['missing'])], 'unknown step id'),
+    # Duplicate id
+    ([_dag_step(id_='a'), _dag_step(id_='a')], 'more than one step'),
+    # Cycles
+    ([_dag_step(id_='a', wait_for=['a'])], 'cycle'),
+    ([_dag_step(id_='a', wait_for=['b']),
+      _dag_step(id_='b', wait_for=['a'])], 'cycle'),
+    ([_dag_step(id_='a', wait_for=[]),
+      _dag_step(id_='b', wait_for=['c']),
+      _dag_step(id_='c')], 'cycle'),
+])
+def test_get_dependencies_invalid(steps, message):
+    with pytest.raises(ValueError, match=message):
+        local_cloudbuild.get_dependencies(steps)
+
+
+def test_get_cloudbuild_unknown_wait_for():
+    raw_yaml = 'steps:\n- name: step1\n  waitFor: [missing]\n'
+    raw_config = yaml.safe_load(raw_yaml)
+    with pytest.raises(ValueError, match='unknown step id'):
+        local_cloudbuild.get_cloudbuild(raw_config, _args)
+
+
 # Basic valid case
 _base_step = local_cloudbuild.Step(
     args=['arg1', 'arg2'],
     dir_='',
     env=['ENV1=value1', 'ENV2=value2'],
+    id_='',
     name='aname',
+    timeout=0,
+    volumes=[],
+    wait_for=None,
 )
 _subs = {'BUILTIN': 'builtin', '_USER': '_user'}
 
@@ -231,6 +427,97 @@ def test_generate_command_valid(step, args):
         assert arg in command
 
 
+def test_generate_command_volumes():
+    step = _base_step._replace(volumes=[
+        local_cloudbuild.Volume(name='pip', path='/root/.cache/pip')])
+    command = local_cloudbuild.generate_command(step, _subs, set())
+    assert '--volume local_cloudbuild_pip:/root/.cache/pip' in (
+        ' '.join(command))
+    container = local_cloudbuild.generate_container(step, _subs, set())
+    assert container.volumes[-1] == 'local_cloudbuild_pip:/root/.cache/pip'
+
+
+def test_generate_commands_cache_volumes():
+    raw_config = yaml.safe_load(
+        'steps:\n'
+        '- name: step1\n'
+        '  volumes: [{name: apt, path: /var/cache/apt}]\n'
+        '- name: step2\n')
+    cache_volume = local_cloudbuild.Volume(name='pip', path='/root/.pip')
+    cloudbuild = local_cloudbuild.get_cloudbuild(
+        raw_config, _make_args(cache_volumes=[cache_volume]))
+    _, commands = local_cloudbuild.generate_commands(cloudbuild)
+    assert 'local_cloudbuild_apt:/var/cache/apt' in commands[0]
+    assert 'local_cloudbuild_apt:/var/cache/apt' not in commands[1]
+    for command in commands:
+        assert 'local_cloudbuild_pip:/root/.pip' in command
+    _, containers = local_cloudbuild.generate_containers(cloudbuild)
+    assert containers[1].volumes[-1] == 'local_cloudbuild_pip:/root/.pip'
+
+
+_BUILDKIT_CONFIG = (
+    'steps:\n'
+    '- name: gcr.io/cloud-builders/docker\n'
+    '  args: [build, "--tag=${_REPO}/python:${_TAG}", --no-cache, dir/]\n'
+    '- name: gcr.io/cloud-builders/docker\n'
+    '  args: [push, "${_REPO}/python:${_TAG}"]\n')
+
+
+def test_generate_commands_buildkit_cache():
+    raw_config = yaml.safe_load(_BUILDKIT_CONFIG)
+    args = _make_args(buildkit_cache=True,
+                      substitutions={'_REPO': 'gcr.io/p', '_TAG': 'v1'})
+    cloudbuild = local_cloudbuild.get_cloudbuild(raw_config, args)
+    assert local_cloudbuild.get_buildkit_steps(cloudbuild) == [0]
+    _, commands = local_cloudbuild.generate_commands(cloudbuild)
+    command = ' '.join(commands[0])
+    assert 'buildx build --builder local_cloudbuild' in command
+    assert 'type=local,src=/buildkit_cache/gcr.io_p_python' in command
+    assert 'local_cloudbuild_buildkit_cache:/buildkit_cache' in command
+    assert '--no-cache' not in command
+    assert commands[1][-2:] == ['push', 'gcr.io/p/python:v1']
+    script = local_cloudbuild.generate_script(cloudbuild)
+    assert 'buildx create --name local_cloudbuild' in script
+
+
+def test_generate_commands_buildkit_cache_off():
+    raw_config = yaml.safe_load(_BUILDKIT_CONFIG)
+    args = _make_args(substitutions={'_REPO': 'gcr.io/p', '_TAG': 'v1'})
+    cloudbuild = local_cloudbuild.get_cloudbuild(raw_config, args)
+    assert local_cloudbuild.get_buildkit_steps(cloudbuild) == []
+    _, commands = local_cloudbuild.generate_commands(cloudbuild)
+    assert '--no-cache' in commands[0]
+    assert 'buildx' not in local_cloudbuild.generate_script(cloudbuild)
+
+
+def test_get_cloudbuild_cache_volume_conflict():
+    raw_config = yaml.safe_load(
+        'steps:\n'
+        '- name: step1\n'
+        '  volumes: [{name: pip, path: /root/.pip}]\n')
+    cache_volume = local_cloudbuild.Volume(name='pip', path='/root/.pip')
+    with pytest.raises(ValueError, match='more than once'):
+        local_cloudbuild.get_cloudbuild(
+            raw_config, _make_args(cache_volumes=[cache_volume]))
+
+
+def test_generate_container():
+    step = _base_step._replace(
+        args=['arg with \n newline', '$_USER'], dir_='dir/ with space',
+        name='a $BUILTIN name')
+    subs_used = set()
+    container = local_cloudbuild.generate_container(step, _subs, subs_used)
+    # Values are substituted but not quoted
+    assert container == local_cloudbuild.docker_api.ContainerSpec(
+        args=['arg with \n newline', '_user'],
+        env=['ENV1=value1', 'ENV2=value2'],
+        image='a builtin name',
+        volumes=local_cloudbuild.STEP_VOLUMES,
+        workdir='/workspace/dir/ with space',
+    )
+    assert subs_used == {'BUILTIN', '_USER'}
+
+
 @pytest.mark.parametrize('step', [
     _base_step._replace(name='a $UNSET_BUILTIN substitution'),
     _base_step._replace(name='a $_UNSET_USER substitution'),
@@ -245,23 +532,51 @@ def test_generate_script_golden(testdata_dir):
     expected_output_script = os.path.join(
         testdata_dir, config_name + '_golden.sh')
     cloudbuild = local_cloudbuild.CloudBuild(
+        analyze=None,
+        backend='cli',
+        buildkit_cache=False,
+        cache_dir='',
+        cache_max_size=0,
+        cache_volumes=[],
+        cacheable_steps=[],
+        docker_hosts=[],
+        docker_socket='',
+        executor='script',
+        jobs=1,
+        link_mode='auto',
         output_script='test_generate_script',
+        pull_jobs=2,
         run=False,
+        step_cache=False,
         steps=[
             local_cloudbuild.Step(
                 args=['/bin/sh', '-c', 'printenv MESSAGE'],
                 dir_='',
                 env=['MESSAGE=Hello World!'],
+                id_='',
                 name='debian',
+                timeout=0,
+                volumes=[],
+                wait_for=None,
             ),
             local_cloudbuild.Step(
                 args=['/bin/sh', '-c', 'printenv MESSAGE'],
                 dir_='',
                 env=['MESSAGE=Goodbye\\n And Farewell!', 'UNUSED=unused'],
+                id_='',
                 name='debian',
+                timeout=0,
+                volumes=[],
+                wait_for=None,
             )
         ],
         substitutions=local_cloudbuild.DEFAULT_SUBSTITUTIONS,
+        summary_out=None,
+        timeout=0,
+        trace_out=None,
+        watch=False,
+        watch_debounce=0.2,
+        workspace='',
     )
     actual = local_cloudbuild.generate_script(cloudbuild)
     # Compare output against golden
@@ -270,12 +585,121 @@ def test_generate_script_golden(testdata_dir):
         assert actual == expected
 
 
+def test_generate_script_dag_golden(testdata_dir):
+    config_name = 'cloudbuild_dag.yaml'
+    expected_output_script = os.path.join(
+        testdata_dir, config_name + '_golden.sh')
+    with open(os.path.join(testdata_dir, config_name), 'r',
+              encoding='utf8') as config_file:
+        raw_config = yaml.safe_load(config_file)
+    args = _make_args(jobs=4)
+    cloudbuild = local_cloudbuild.get_cloudbuild(raw_config, args)
+    actual = local_cloudbuild.generate_script(cloudbuild)
+    # Compare output against golden
+    with open(expected_output_script, 'r', encoding='utf8') as expected_file:
+        expected = expected_file.read()
+        assert actual == expected
+
+
+def test_generate_script_persistent_workspace():
+    cloudbuild = local_cloudbuild.CloudBuild(
+        analyze=None,
+        backend='cli',
+        buildkit_cache=False,
+        cache_dir='',
+        cache_max_size=0,
+        cache_volumes=[],
+        cacheable_steps=[],
+        docker_hosts=[],
+        docker_socket='',
+        executor='script',
+        jobs=1,
+        link_mode='auto',
+        output_script='',
+        pull_jobs=2,
+        run=False,
+        step_cache=False,
+        steps=[_base_step],
+        substitutions={},
+        summary_out=None,
+        timeout=0,
+        trace_out=None,
+        watch=False,
+        watch_debounce=0.2,
+        workspace='/cache/dir with space',
+    )
+    actual = local_cloudbuild.generate_script(cloudbuild)
+    assert "HOST_WORKSPACE='/cache/dir with space'\n" in actual
+    assert 'mktemp' not in actual
+    assert 'rsync -a --delete' in actual
+
+
+def test_generate_rsync_flags(tmpdir):
+    assert local_cloudbuild.generate_rsync_flags(str(tmpdir)) == (
+        '--exclude=.git')
+    tmpdir.join('.gcloudignore').write('*.log\n!keep.log\n')
+    assert local_cloudbuild.generate_rsync_flags(str(tmpdir)) == (
+        "--exclude=.git '--filter=+ keep.log' '--filter=- *.log'")
+
+
+def test_local_cloudbuild_script_savings(testdata_dir, tmpdir, capsys):
+    """The script executor reports what ignore rules leave out"""
+    source_dir = tmpdir.mkdir('source')
+    source_dir.join('.gcloudignore').write('*.log\n')
+    source_dir.join('debug.log').write('log')
+    source_dir.join('main.py').write('print()')
+    args = _make_args(
+        config=os.path.join(testdata_dir, 'cloudbuild_ok.yaml'),
+        output_script=str(tmpdir.join('local.sh')),
+        run=True,
+    )
+    with chdir(str(source_dir)), \
+            unittest.mock.patch.object(subprocess, 'check_call') as run, \
+            unittest.mock.patch.object(
+                local_cloudbuild.step_executor, 'pull_images',
+                return_value=[]):
+        local_cloudbuild.local_cloudbuild(args)
+    run.assert_called_once_with([str(tmpdir.join('local.sh'))])
+    assert ('Skipped 1 of 3 files (3 bytes) matching .gcloudignore' in
+            capsys.readouterr().out)
+
+
+def test_get_cloudbuild_persistent_workspace(tmpdir):
+    raw_config = yaml.safe_load('steps:\n- name: step1\n')
+    args = _make_args(persistent_workspace=True, workspace_root=str(tmpdir))
+    with chdir(str(tmpdir)):
+        first = local_cloudbuild.get_cloudbuild(raw_config, args)
+        second = local_cloudbuild.get_cloudbuild(raw_config, args)
+    assert first.workspace.startswith(str(tmpdir))
+    assert first.workspace == second.workspace
+
+
 def test_generate_script_unused_user_substitution():
     cloudbuild = local_cloudbuild.CloudBuild(
+        analyze=None,
+        backend='cli',
+        buildkit_cache=False,
+        cache_dir='',
+        cache_max_size=0,
+        cache_volumes=[],
+        cacheable_steps=[],
+        docker_hosts=[],
+        docker_socket='',
+        executor='script',
+        jobs=1,
+        link_mode='auto',
         output_script='',
+        pull_jobs=2,
         run=False,
+        step_cache=False,
         steps=[],
         substitutions={'_FOO': '_foo'},
+        summary_out=None,
+        timeout=0,
+        trace_out=None,
+        watch=False,
+        watch_debounce=0.2,
+        workspace='',
     )
     with pytest.raises(ValueError, match='User substitution variables'):
         local_cloudbuild.generate_script(cloudbuild)
@@ -294,10 +718,30 @@ def test_write_script(tmpdir):
     contents = 'The contents\n'
     output_script_filename = tmpdir.join('test_write_script')
     cloudbuild = local_cloudbuild.CloudBuild(
+        analyze=None,
+        backend='cli',
+        buildkit_cache=False,
+        cache_dir='',
+        cache_max_size=0,
+        cache_volumes=[],
+        cacheable_steps=[],
+        docker_hosts=[],
+        docker_socket='',
+        executor='script',
+        jobs=1,
+        link_mode='auto',
         output_script=str(output_script_filename),
+        pull_jobs=2,
         run=False,
+        step_cache=False,
         steps=[],
         substitutions={},
+        summary_out=None,
+        timeout=0,
+        trace_out=None,
+        watch=False,
+        watch_debounce=0.2,
+        workspace='',
     )
     local_cloudbuild.write_script(cloudbuild, contents)
     with output_script_filename.open('r', encoding='utf8') as output_script:
@@ -360,7 +804,7 @@ def test_local_cloudbuild(testdata_dir, tmpdir, config_name, substitutions,
         should_succeed = (exception is None)
         config = os.path.join(testdata_dir, config_name)
         actual_output_script = tmpdir.join(config_name + '_local.sh')
-        args = argparse.Namespace(
+        args = _make_args(
             config=config,
             output_script=str(actual_output_script),
             run=True,
@@ -385,6 +829,196 @@ def test_local_cloudbuild(testdata_dir, tmpdir, config_name, substitutions,
             assert not os.path.isdir(staging_dir)
 
 
+@pytest.fixture
+def fake_docker(testdata_dir, monkeypatch):
+    """Put a stand-in for the docker CLI first on $PATH"""
+    fake_docker_dir = os.path.join(testdata_dir, 'fake_docker')
+    monkeypatch.setenv(
+        'PATH', fake_docker_dir + os.pathsep + os.environ['PATH'])
+    return fake_docker_dir
+
+
+@pytest.mark.skipif(not shutil.which('rsync'), reason='rsync not installed')
+@pytest.mark.parametrize('config_name, jobs, should_succeed, expected', [
+    # Fan out and fan in
+    ('cloudbuild_dag.yaml', 4, True, [b'Finished Step #3']),
+    ('cloudbuild_dag.yaml', 1, True, [b'Finished Step #3']),
+    # Steps run at the same time
+    ('cloudbuild_dag_concurrent.yaml', 2, True, [b'Finished Step #0']),
+    # A failure cancels dependent steps only
+    ('cloudbuild_dag_err.yaml', 2, False,
+     [b'Step #0 failed', b'Cancelled Step #1',
+      b'Step #2: Independent step']),
+])
+def test_local_cloudbuild_dag(testdata_dir, tmpdir, fake_docker, config_name,
+                              jobs, should_succeed, expected):
+    args = _make_args(
+        config=os.path.join(testdata_dir, config_name),
+        jobs=jobs,
+        output_script=str(tmpdir.join(config_name + '_local.sh')),
+        substitutions=local_cloudbuild.DEFAULT_SUBSTITUTIONS,
+    )
+    local_cloudbuild.local_cloudbuild(args)
+    source_dir = tmpdir.mkdir('source')
+    with chdir(str(source_dir)):
+        process = subprocess.Popen(
+            [args.output_script], stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT)
+        output, _ = process.communicate()
+    print(output.decode('utf8'))
+    assert (process.returncode == 0) == should_succeed
+    for line in expected:
+        assert line in output
+    assert b'Should have been cancelled' not in output
+
+
+@pytest.mark.parametrize('config_name, substitutions, exception', [
+    ('cloudbuild_ok.yaml', None, None),
+    ('cloudbuild_builtin_substitutions.yaml', None, None),
+    ('cloudbuild_user_substitutions.yaml',
+     {'_FOO': 'this is foo value'}, None),
+    ('cloudbuild_user_substitutions.yaml', None, ValueError),
+    ('cloudbuild_err_rc1.yaml', None, subprocess.CalledProcessError),
+    ('cloudbuild_err_not_found.yaml', None, subprocess.CalledProcessError),
+    ('cloudbuild_difficult_cleanup.yaml', None, None),
+    ('cloudbuild_dag.yaml', None, None),
+    ('cloudbuild_dag_concurrent.yaml', None, None),
+    ('cloudbuild_dag_err.yaml', None, subprocess.CalledProcessError),
+])
+def test_local_cloudbuild_python_executor(testdata_dir, tmpdir, fake_docker,
+                                          config_name, substitutions,
+                                          exception):
+    if substitutions is None:
+        substitutions = local_cloudbuild.DEFAULT_SUBSTITUTIONS
+    args = _make_args(
+        config=os.path.join(testdata_dir, config_name),
+        executor='python',
+        jobs=2,
+        output_script=str(tmpdir.join(config_name + '_local.sh')),
+        run=True,
+        substitutions=substitutions,
+    )
+    source_dir = tmpdir.mkdir('source')
+    with chdir(str(source_dir)):
+        if exception is None:
+            local_cloudbuild.local_cloudbuild(args)
+        else:
+            with pytest.raises(exception):
+                local_cloudbuild.local_cloudbuild(args)
+    # No shell script is written
+    assert not os.path.exists(args.output_script)
+
+
+@pytest.fixture
+def docker_socket(testdata_dir):
+    """Path of a stand-in Docker daemon's socket"""
+    # Unix socket paths are limited to about 100 characters
+    socket_dir = tempfile.mkdtemp(prefix='dockerd_')
+    socket_path = os.path.join(socket_dir, 'docker.sock')
+    server = subprocess.Popen([
+        sys.executable, os.path.join(testdata_dir, 'fake_docker', 'dockerd'),
+        socket_path])
+    try:
+        for _ in range(500):
+            if os.path.exists(socket_path):
+                break
+            time.sleep(0.01)
+        yield socket_path
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(socket_dir)
+
+
+@pytest.mark.parametrize('config_name, exception', [
+    ('cloudbuild_ok.yaml', None),
+    ('cloudbuild_err_rc1.yaml', subprocess.CalledProcessError),
+    ('cloudbuild_dag.yaml', None),
+    ('cloudbuild_dag_err.yaml', subprocess.CalledProcessError),
+])
+def test_local_cloudbuild_api_backend(testdata_dir, tmpdir, docker_socket,
+                                      config_name, exception):
+    args = _make_args(
+        backend='api',
+        config=os.path.join(testdata_dir, config_name),
+        docker_socket=docker_socket,
+        executor='python',
+        jobs=2,
+        run=True,
+        substitutions=local_cloudbuild.DEFAULT_SUBSTITUTIONS,
+    )
+    source_dir = tmpdir.mkdir('source')
+    with chdir(str(source_dir)):
+        if exception is None:
+            local_cloudbuild.local_cloudbuild(args)
+        else:
+            with pytest.raises(exception):
+                local_cloudbuild.local_cloudbuild(args)
+
+
+def test_get_cloudbuild_api_backend_needs_python_executor():
+    raw_config = yaml.safe_load('steps:\n- name: step1\n')
+    with pytest.raises(ValueError):
+        local_cloudbuild.get_cloudbuild(raw_config, _make_args(backend='api'))
+
+
+def test_local_cloudbuild_persistent_workspace(testdata_dir, tmpdir,
+                                               fake_docker, capsys):
+    args = _make_args(
+        config=os.path.join(testdata_dir, 'cloudbuild_ok.yaml'),
+        executor='python',
+        link_mode='copy',
+        persistent_workspace=True,
+        run=True,
+        substitutions=local_cloudbuild.DEFAULT_SUBSTITUTIONS,
+        workspace_root=str(tmpdir.join('workspaces')),
+    )
+    source_dir = tmpdir.mkdir('source')
+    source_dir.join('app.py').write('contents')
+    with chdir(str(source_dir)):
+        local_cloudbuild.local_cloudbuild(args)
+        assert '0 files unchanged, 1 copied' in capsys.readouterr().out
+        # Nothing to copy the second time
+        local_cloudbuild.local_cloudbuild(args)
+        assert '1 files unchanged, 0 copied' in capsys.readouterr().out
+    workspaces = tmpdir.join('workspaces').listdir()
+    assert len(workspaces) == 1
+    assert workspaces[0].join('app.py').read() == 'contents'
+
+
+def test_local_cloudbuild_timing_reports(testdata_dir, tmpdir, fake_docker):
+    args = _make_args(
+        config=os.path.join(testdata_dir, 'cloudbuild_dag.yaml'),
+        executor='python',
+        jobs=2,
+        run=True,
+        substitutions=local_cloudbuild.DEFAULT_SUBSTITUTIONS,
+        summary_out=str(tmpdir.join('summary.json')),
+        trace_out=str(tmpdir.join('trace.json')),
+    )
+    source_dir = tmpdir.mkdir('source')
+    with chdir(str(source_dir)):
+        local_cloudbuild.local_cloudbuild(args)
+        local_cloudbuild.local_cloudbuild(args)
+
+    trace = json.loads(tmpdir.join('trace.json').read())
+    names = set(event['name'] for event in trace['traceEvents'])
+    assert {'stage', 'wait for pull', 'run', 'cleanup'} <= names
+    assert 'pull debian' in names
+    summary = json.loads(tmpdir.join('summary.json').read())
+    assert len(summary['runs']) == 2
+    for stats in summary['steps'].values():
+        assert stats['count'] == 2
+        assert stats['p50'] <= stats['max']
+
+
+def test_get_cloudbuild_timing_reports_need_python_executor():
+    raw_config = yaml.safe_load('steps:\n- name: step1\n')
+    with pytest.raises(ValueError):
+        local_cloudbuild.get_cloudbuild(
+            raw_config, _make_args(trace_out='trace.json'))
+
+
 @pytest.mark.parametrize('argv, expected', [
     # Test explicit output_script
     (['argv0', '--output_script=my_output'], 'my_output'),
@@ -406,5 +1040,251 @@ def test_parse_args_run_flag(argv, expected):
     assert args.run == expected
 
 
+@pytest.mark.parametrize('argv, expected', [
+    (['argv0', '--jobs=1'], 1),
+    (['argv0', '--jobs=8'], 8),
+])
+def test_parse_args_jobs(argv, expected):
+    args = local_cloudbuild.parse_args(argv)
+    assert args.jobs == expected
+
+
+@pytest.mark.parametrize('argv, expected', [
+    (['argv0'], 'script'),
+    (['argv0', '--executor=python'], 'python'),
+])
+def test_parse_args_executor(argv, expected):
+    args = local_cloudbuild.parse_args(argv)
+    assert args.executor == expected
+
+
+def test_parse_args_workspace():
+    args = local_cloudbuild.parse_args(['argv0'])
+    assert not args.persistent_workspace
+    assert args.link_mode == 'auto'
+    args = local_cloudbuild.parse_args([
+        'argv0', '--persistent-workspace', '--workspace-root=/some/dir',
+        '--link-mode=hardlink'])
+    assert args.persistent_workspace
+    assert args.workspace_root == '/some/dir'
+    assert args.link_mode == 'hardlink'
+
+
+def test_parse_args_step_cache():
+    args = local_cloudbuild.parse_args(['argv0'])
+    assert args.step_cache
+    assert args.cacheable_steps == []
+    assert args.cache_max_size == 10 * 1024 ** 3
+    args = local_cloudbuild.parse_args([
+        'argv0', '--cacheable-step=compile', '--cacheable-step=python:3',
+        '--cache-dir=/some/dir', '--cache-max-size=500M'])
+    assert args.cacheable_steps == ['compile', 'python:3']
+    assert args.cache_dir == '/some/dir'
+    assert args.cache_max_size == 500 * 1024 ** 2
+    assert not local_cloudbuild.parse_args(
+        ['argv0', '--no-step-cache']).step_cache
+
+
+def test_parse_args_buildkit_cache():
+    assert not local_cloudbuild.parse_args(['argv0']).buildkit_cache
+    assert local_cloudbuild.parse_args(
+        ['argv0', '--buildkit-cache']).buildkit_cache
+
+
+def test_parse_args_backend():
+    args = local_cloudbuild.parse_args(['argv0'])
+    assert args.backend == 'cli'
+    args = local_cloudbuild.parse_args([
+        'argv0', '--backend=api', '--docker-socket=/tmp/docker.sock'])
+    assert args.backend == 'api'
+    assert args.docker_socket == '/tmp/docker.sock'
+
+
+def test_parse_args_cache_volume():
+    args = local_cloudbuild.parse_args(['argv0'])
+    assert args.cache_volumes == []
+    args = local_cloudbuild.parse_args([
+        'argv0', '--cache-volume=pip:/root/.cache/pip',
+        '--cache-volume', 'ccache:/ccache'])
+    assert args.cache_volumes == [
+        local_cloudbuild.Volume(name='pip', path='/root/.cache/pip'),
+        local_cloudbuild.Volume(name='ccache', path='/ccache'),
+    ]
+
+
+@pytest.mark.parametrize('flag_value', [
+    'pip', 'pip:', ':/cache', 'pip:relative', 'pip:/workspace/x'])
+def test_parse_args_cache_volume_invalid(flag_value):
+    with pytest.raises(SystemExit):
+        local_cloudbuild.parse_args(['argv0', '--cache-volume', flag_value])
+
+
+def test_parse_args_pull_jobs():
+    args = local_cloudbuild.parse_args(['argv0'])
+    assert args.pull_jobs == local_cloudbuild.step_executor.PULL_JOBS
+    args = local_cloudbuild.parse_args(['argv0', '--pull-jobs=8'])
+    assert args.pull_jobs == 8
+
+
+def test_get_images():
+    raw_config = yaml.safe_load(
+        'steps:\n'
+        '- name: gcr.io/$PROJECT_ID/app\n'
+        '- name: debian\n'
+        '- name: gcr.io/my-project/app\n')
+    cloudbuild = local_cloudbuild.get_cloudbuild(
+        raw_config, _make_args(substitutions={'PROJECT_ID': 'my-project'}))
+    assert local_cloudbuild.get_images(cloudbuild) == [
+        'gcr.io/my-project/app', 'debian']
+
+
+def test_parse_args_timing_reports():
+    args = local_cloudbuild.parse_args(['argv0'])
+    assert args.trace_out is None
+    assert args.summary_out is None
+    args = local_cloudbuild.parse_args([
+        'argv0', '--trace-out=trace.json', '--summary-out=summary.json'])
+    assert args.trace_out == 'trace.json'
+    assert args.summary_out == 'summary.json'
+
+
 if __name__ == '__main__':
     pytest.main([__file__])
+
+
+def _container(args=(), workdir='/workspace'):
+    return local_cloudbuild.docker_api.ContainerSpec(
+        args=list(args), env=[], image='debian', volumes=[], workdir=workdir)
+
+
+@pytest.mark.parametrize('containers, paths, expected', [
+    # Nothing refers to the file
+    ([_container(['echo', 'hi'])], ['app.py'], None),
+    # Named in an argument, alone or after `=` or `:`
+    ([_container(['true']), _container(['python', 'app.py'])],
+     ['app.py'], 1),
+    ([_container(['docker', 'build', '--file=docker/Dockerfile'])],
+     ['docker/Dockerfile'], 0),
+    ([_container(['cp', 'src:/dst'])], ['src/main.py'], 0),
+    # Absolute paths in /workspace, and the whole directory
+    ([_container(['cat', '/workspace/app/main.py'])], ['app/main.py'], 0),
+    ([_container(['docker', 'build', '.'])], ['anything/at/all'], 0),
+    # Relative to the step's dir
+    ([_container(['cat', 'main.py'], '/workspace/app')], ['app/main.py'], 0),
+    ([_container(['true'], '/workspace/app')], ['app/sub/x'], 0),
+    ([_container(['true'], '/workspace/app')], ['application.py'], None),
+    ([_container(['cat', '../other'], '/workspace/app')], ['other'], 0),
+    # Outside the workspace
+    ([_container(['cat', '/etc/app.py'])], ['app.py'], None),
+    ([_container(['cat', '../app.py'])], ['app.py'], None),
+    # The first matching step wins
+    ([_container(['cat', 'b']), _container(['cat', 'a'])], ['a', 'b'], 0),
+])
+def test_first_affected_step(containers, paths, expected):
+    assert local_cloudbuild.first_affected_step(containers, paths) == (
+        expected)
+
+
+def test_get_cloudbuild_watch_needs_python_executor():
+    raw_config = yaml.safe_load('steps:\n- name: step1\n')
+    with pytest.raises(ValueError):
+        local_cloudbuild.get_cloudbuild(raw_config, _make_args(watch=True))
+    with pytest.raises(ValueError):
+        local_cloudbuild.get_cloudbuild(raw_config, _make_args(
+            executor='python', trace_out='trace.json', watch=True))
+    cloudbuild = local_cloudbuild.get_cloudbuild(
+        raw_config, _make_args(executor='python', watch=True))
+    assert cloudbuild.watch
+
+
+def test_parse_args_watch():
+    args = local_cloudbuild.parse_args(['argv0'])
+    assert not args.watch
+    args = local_cloudbuild.parse_args([
+        'argv0', '--watch', '--watch-debounce=1.5'])
+    assert args.watch
+    assert args.watch_debounce == 1.5
+
+
+def test_local_cloudbuild_docker_hosts(testdata_dir, tmpdir, fake_docker,
+                                       capsys):
+    # The fake docker CLI ignores DOCKER_HOST, but each host still gets
+    # a staging directory of its own
+    args = _make_args(
+        config=os.path.join(testdata_dir, 'cloudbuild_dag.yaml'),
+        docker_hosts=['/tmp/first.sock', '/tmp/second.sock'],
+        executor='python',
+        jobs=2,
+        run=True,
+        substitutions=local_cloudbuild.DEFAULT_SUBSTITUTIONS,
+    )
+    source_dir = tmpdir.mkdir('source')
+    with chdir(str(source_dir)):
+        local_cloudbuild.local_cloudbuild(args)
+    out = capsys.readouterr().out
+    assert 'on unix:///tmp/first.sock' in out
+    assert 'on unix:///tmp/second.sock' in out
+    assert out.count('Copied source to staging directory') == 2
+
+
+def test_get_cloudbuild_docker_hosts():
+    raw_config = yaml.safe_load('steps:\n- name: step1\n')
+    sockets = ['/tmp/first.sock', '/tmp/second.sock']
+    with pytest.raises(ValueError):
+        local_cloudbuild.get_cloudbuild(
+            raw_config, _make_args(docker_hosts=sockets))
+    with pytest.raises(ValueError):
+        local_cloudbuild.get_cloudbuild(raw_config, _make_args(
+            docker_hosts=sockets, executor='python', watch=True))
+    cloudbuild = local_cloudbuild.get_cloudbuild(
+        raw_config, _make_args(docker_hosts=sockets, executor='python'))
+    hosts = local_cloudbuild.get_hosts(cloudbuild)
+    assert [host.env['DOCKER_HOST'] for host in hosts] == [
+        'unix:///tmp/first.sock', 'unix:///tmp/second.sock']
+    assert [host.client for host in hosts] == [None, None]
+
+
+def test_parse_args_docker_hosts():
+    args = local_cloudbuild.parse_args(['argv0'])
+    assert args.docker_hosts == []
+    args = local_cloudbuild.parse_args([
+        'argv0', '--docker-hosts=/tmp/a.sock, /tmp/b.sock'])
+    assert args.docker_hosts == ['/tmp/a.sock', '/tmp/b.sock']
+    with pytest.raises(SystemExit):
+        local_cloudbuild.parse_args(['argv0', '--docker-hosts=/tmp/a.sock,'])
+
+
+def test_local_cloudbuild_analyze(testdata_dir, tmpdir, capsys,
+                                  monkeypatch):
+    summary = tmpdir.join('summary.json')
+    summary.write(json.dumps({'runs': [], 'steps': {
+        'first': {'count': 1, 'max': 1.0, 'p50': 1.0},
+        'second': {'count': 1, 'max': 4.0, 'p50': 3.0},
+        'third': {'count': 1, 'max': 2.0, 'p50': 2.0},
+        'Step #3': {'count': 1, 'max': 1.0, 'p50': 1.0},
+    }}))
+    # Nothing is run, so no docker is needed
+    monkeypatch.setenv('PATH', '')
+    args = _make_args(
+        analyze=str(summary),
+        config=os.path.join(testdata_dir, 'cloudbuild_dag.yaml'),
+        jobs=1,
+        output_script=str(tmpdir.join('script.sh')),
+        run=True,
+    )
+    local_cloudbuild.local_cloudbuild(args)
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == 'Critical path (5.00s): first -> second -> Step #3'
+    assert lines[1] == ('Predicted wall time: 5.00s with unlimited '
+                        'parallelism, 7.00s with --jobs=1')
+    assert lines[2] == ('Predicted wall time with the slowest recorded '
+                        'step times: 8.00s with --jobs=1')
+    assert '1 steps have no recorded time' in lines[-1]
+    assert not tmpdir.join('script.sh').check()
+
+
+def test_parse_args_analyze():
+    args = local_cloudbuild.parse_args(['argv0'])
+    assert args.analyze is None
+    args = local_cloudbuild.parse_args(['argv0', '--analyze=summary.json'])
+    assert args.analyze == 'summary.json'
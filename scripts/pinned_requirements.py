@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Find fully pinned dependencies of an application.
+
+Dependencies are fully pinned when every package, including indirect
+dependencies, has an exact version and the hashes of its files.  pip
+can then install them without resolving anything.  They come from,
+in order of precedence:
+
+* `requirements.txt`, if every requirement in it is pinned with `==`
+  and has `--hash` options, as `pip-compile --generate-hashes` writes.
+  A `requirements.txt` that isn't is used as before, and lock files
+  are not looked at.
+* `Pipfile.lock`, whose default packages are converted to a
+  requirements file.
+* `poetry.lock`, whose packages needed by the main dependencies of
+  `pyproject.toml` are converted to a requirements file.
+
+A lock file must match its manifest (`Pipfile` or `pyproject.toml`),
+by the hash that pipenv or poetry record in it.
+"""
+
+import collections
+import hashlib
+import io
+import json
+import os
+import re
+
+
+REQUIREMENTS_TXT = 'requirements.txt'
+PIPFILE = 'Pipfile'
+PIPFILE_LOCK = 'Pipfile.lock'
+PYPROJECT_TOML = 'pyproject.toml'
+POETRY_LOCK = 'poetry.lock'
+
+# Requirements file generated from a lock file
+PINNED_REQUIREMENTS_TXT = 'requirements.pinned.txt'
+
+# Options of requirements files that pull in requirements which
+# can't be checked here
+UNPINNED_OPTIONS = ('-c', '-e', '-r', '--constraint', '--editable',
+                    '--requirement')
+
+# `--hash` options of a requirement
+HASH_OPTION_REGEX = re.compile(r'\s--hash[=\s]\s*\S+')
+
+# Requirement with an exact version and optional extras and markers
+PINNED_REGEX = re.compile(r"""(?x)
+    ^
+    [A-Za-z0-9][A-Za-z0-9._-]*  # Project name
+    (\[[^\]]*\])?               # Extras
+    \s*===?\s*
+    [^\s;,*]+                   # Version, without wildcards
+    \s*(;.*)?                   # Environment markers
+    $
+""")
+
+# Sections of a Pipfile that are not package categories
+PIPFILE_SECTIONS = ('dev-packages', 'packages', 'pipenv', 'requires',
+                    'scripts', 'source')
+
+# Package index pipenv assumes when a Pipfile has no [[source]]
+PIPFILE_DEFAULT_SOURCE = {
+    'name': 'pypi', 'url': 'https://pypi.org/simple', 'verify_ssl': True}
+
+# Sections of pyproject.toml that poetry hashes.  The legacy keys of
+# [tool.poetry] are hashed even when they are missing, unless there
+# are [project] or [dependency-groups] sections to hash.
+POETRY_PROJECT_KEYS = ('requires-python', 'dependencies',
+                       'optional-dependencies')
+POETRY_LEGACY_KEYS = ('dependencies', 'source', 'extras', 'dev-dependencies')
+POETRY_KEYS = POETRY_LEGACY_KEYS + ('group',)
+
+# Dependency group of the packages an application needs to run
+POETRY_MAIN_GROUP = 'main'
+
+HEADER = ('# Generated by gen_dockerfile.py from {}.  Do not edit, '
+          'regenerate\n# it instead.\n')
+
+# Fully pinned dependencies.  `filename` is the requirements file to
+# install in the image, and `source` the file of the application they
+# come from.  `contents` is None when both are requirements.txt, and
+# the contents to write to `filename` otherwise.
+Pinned = collections.namedtuple('Pinned', 'contents filename source')
+
+
+def _read(path):
+    with io.open(path, 'r', encoding='utf8') as f:
+        return f.read()
+
+
+def _load_toml(path):
+    """Parse a TOML file"""
+    try:
+        import tomllib as toml
+    except ImportError:
+        try:
+            import toml
+        except ImportError:
+            raise ValueError(
+                'Reading {} needs the "toml" package on Python < 3.11'.format(
+                    path))
+    try:
+        return toml.loads(_read(path))
+    except ValueError as e:
+        # Both parsers raise subclasses of ValueError
+        raise ValueError('Could not parse {}: {}'.format(path, e))
+
+
+def _logical_lines(text):
+    """Yield the lines of a requirements file, without comments"""
+    for line in re.sub(r'\\\n', ' ', text).splitlines():
+        line = re.sub(r'(^|\s+)#.*$', '', line).strip()
+        if line:
+            yield line
+
+
+def is_pinned(text):
+    """Return True if a requirements file pins every requirement.
+
+    Args:
+        text (str): Contents of the requirements file
+
+    Returns:
+        bool: True if there is at least one requirement, and each has
+            an exact version and hashes
+    """
+    requirements = 0
+    for line in _logical_lines(text):
+        if line.startswith('-'):
+            option = line.split('=')[0].split()[0]
+            # Short options may be followed by their value directly
+            if option in UNPINNED_OPTIONS or option[:2] in UNPINNED_OPTIONS:
+                return False
+            continue
+        if not HASH_OPTION_REGEX.search(' ' + line):
+            return False
+        if not PINNED_REGEX.match(HASH_OPTION_REGEX.sub('', ' ' + line)
+                                  .strip()):
+            return False
+        requirements += 1
+    return requirements > 0
+
+
+def format_requirement(name, version, hashes, extras=(), markers=None):
+    """Return a hash-checked requirement line.
+
+    Args:
+        name (str): Project name
+        version (str): Exact version
+        hashes ([str]): Hashes of its files, like `sha256:...`
+        extras ([str]): Extras to install
+        markers (str): Environment markers, or None
+
+    Returns:
+        str: Requirement, followed by a newline
+    """
+    requirement = name
+    if extras:
+        requirement += '[{}]'.format(','.join(sorted(extras)))
+    requirement += '=={}'.format(version)
+    if markers:
+        requirement += ' ; {}'.format(markers)
+    return ''.join([requirement] + [
+        ' \\\n    --hash={}'.format(digest) for digest in sorted(hashes)]) + (
+            '\n')
+
+
+def pipfile_hash(pipfile):
+    """Return the hash pipenv records in Pipfile.lock for a Pipfile.
+
+    Args:
+        pipfile (dict): Parsed Pipfile
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    data = {
+        '_meta': {
+            'requires': pipfile.get('requires', {}),
+            'sources': pipfile.get('source', [PIPFILE_DEFAULT_SOURCE]),
+        },
+        'default': pipfile.get('packages', {}),
+        'develop': pipfile.get('dev-packages', {}),
+    }
+    for category, packages in pipfile.items():
+        if category not in PIPFILE_SECTIONS:
+            data[category] = packages
+    content = json.dumps(data, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(content.encode('utf8')).hexdigest()
+
+
+def from_pipfile_lock(source_dir):
+    """Convert the default packages of Pipfile.lock to requirements.
+
+    Args:
+        source_dir (str): Directory containing Pipfile.lock
+
+    Returns:
+        str: Contents of a hash-checked requirements file
+
+    Raises:
+        ValueError: if the lock file is stale, or a package can't be
+            installed from a hash-checked requirements file
+    """
+    lock_path = os.path.join(source_dir, PIPFILE_LOCK)
+    try:
+        lock = json.loads(_read(lock_path))
+    except ValueError as e:
+        raise ValueError('Could not parse {}: {}'.format(lock_path, e))
+
+    pipfile_path = os.path.join(source_dir, PIPFILE)
+    if os.path.isfile(pipfile_path):
+        expected = lock.get('_meta', {}).get('hash', {}).get('sha256')
+        if pipfile_hash(_load_toml(pipfile_path)) != expected:
+            raise ValueError(
+                '{} is out of date with {}.  Run `pipenv lock` to update '
+                'it.'.format(lock_path, pipfile_path))
+
+    lines = [HEADER.format(PIPFILE_LOCK)]
+    for name, entry in sorted(lock.get('default', {}).items()):
+        if 'version' not in entry or not entry.get('hashes'):
+            raise ValueError(
+                '{} has no pinned version and hashes for "{}", which '
+                'comes from a VCS, a path or a URL.'.format(lock_path, name))
+        lines.append(format_requirement(
+            name, entry['version'].lstrip('='), entry['hashes'],
+            entry.get('extras', ()), entry.get('markers')))
+    return ''.join(lines)
+
+
+def poetry_hash(pyproject, with_dependency_groups=True):
+    """Return the hash poetry records in poetry.lock for a project.
+
+    Args:
+        pyproject (dict): Parsed pyproject.toml
+        with_dependency_groups (bool): Hash [dependency-groups], which
+            poetry only does since version 2.3
+
+    Returns:
+        str: Hex SHA-256 digest
+    """
+    project = {key: pyproject['project'][key]
+               for key in POETRY_PROJECT_KEYS
+               if pyproject.get('project', {}).get(key) is not None}
+    groups = (pyproject.get('dependency-groups', {})
+              if with_dependency_groups else {})
+    config = pyproject.get('tool', {}).get('poetry', {})
+    poetry = {}
+    for key in POETRY_KEYS:
+        if config.get(key) is not None or (
+                key in POETRY_LEGACY_KEYS and not project and not groups):
+            poetry[key] = config.get(key)
+
+    content = {}
+    if project:
+        content['project'] = project
+    if groups:
+        content['dependency-groups'] = groups
+    if content:
+        content['tool'] = {'poetry': poetry}
+    else:
+        content = poetry
+    return hashlib.sha256(
+        json.dumps(content, sort_keys=True).encode('utf8')).hexdigest()
+
+
+def _normalize(name):
+    """Normalize a project name, as in PEP 503"""
+    return re.sub(r'[-_.]+', '-', name).lower()
+
+
+def _dependency_markers(constraint):
+    """Return the environment markers of a poetry dependency.
+
+    Returns:
+        str: Markers, None if it is always needed, or False if it is
+            optional
+    """
+    if not isinstance(constraint, dict):
+        return None
+    if constraint.get('optional'):
+        return False
+    markers = []
+    if constraint.get('markers'):
+        markers.append(constraint['markers'])
+    if constraint.get('platform'):
+        markers.append('sys_platform == "{}"'.format(constraint['platform']))
+    return ' and '.join(markers) or None
+
+
+def _main_dependencies(pyproject):
+    """Yield the names and constraints of a project's dependencies"""
+    for requirement in pyproject.get('project', {}).get('dependencies', []):
+        name = re.match(r'\s*([A-Za-z0-9._-]+)', requirement).group(1)
+        markers = requirement.partition(';')[2].strip()
+        yield name, {'markers': markers} if markers else None
+    dependencies = pyproject.get('tool', {}).get('poetry', {}).get(
+        'dependencies', {})
+    for name, constraint in dependencies.items():
+        if _normalize(name) != 'python':
+            yield name, constraint
+
+
+def _walk_dependencies(lock_path, packages, pyproject):
+    """Find the packages needed by a project, from an older poetry.lock.
+
+    Lock files before format 2.1 don't record the dependency groups of
+    packages, so the dependency graph is walked from the project.  A
+    package reached through a conditional dependency only gets its
+    markers if no unconditional dependency reaches it too.
+
+    Returns:
+        [(dict, str)]: Packages, with their markers or None
+    """
+    markers = {}
+    pending = list(_main_dependencies(pyproject))
+    while pending:
+        name, constraint = pending.pop()
+        name = _normalize(name)
+        dependency_markers = _dependency_markers(constraint)
+        if dependency_markers is False:
+            continue
+        if name not in packages:
+            raise ValueError('{} has no package "{}"'.format(lock_path, name))
+        if name in markers:
+            if markers[name] and dependency_markers:
+                if dependency_markers not in markers[name]:
+                    markers[name].append(dependency_markers)
+            else:
+                markers[name] = []
+            continue
+        markers[name] = [dependency_markers] if dependency_markers else []
+        for package in packages[name]:
+            pending.extend(package.get('dependencies', {}).items())
+
+    selected = []
+    for name in sorted(markers):
+        joined = ' or '.join('({})'.format(marker) for marker in markers[name])
+        for package in packages[name]:
+            selected.append((package, joined or None))
+    return selected
+
+
+def _locked_markers(package):
+    """Return the markers poetry.lock records for the main group"""
+    markers = package.get('markers')
+    if isinstance(markers, dict):
+        markers = markers.get(POETRY_MAIN_GROUP)
+    return markers or None
+
+
+def from_poetry_lock(source_dir):
+    """Convert the packages of poetry.lock to requirements.
+
+    Only the packages of the main dependency group are included, not
+    the development ones.
+
+    Args:
+        source_dir (str): Directory containing poetry.lock and
+            pyproject.toml
+
+    Returns:
+        str: Contents of a hash-checked requirements file
+
+    Raises:
+        ValueError: if the lock file is stale, or a package can't be
+            installed from a hash-checked requirements file
+    """
+    lock_path = os.path.join(source_dir, POETRY_LOCK)
+    pyproject_path = os.path.join(source_dir, PYPROJECT_TOML)
+    if not os.path.isfile(pyproject_path):
+        raise ValueError('{} needs a {} next to it'.format(
+            lock_path, pyproject_path))
+    lock = _load_toml(lock_path)
+    pyproject = _load_toml(pyproject_path)
+    expected = lock.get('metadata', {}).get('content-hash')
+    if expected not in (poetry_hash(pyproject), poetry_hash(pyproject, False)):
+        raise ValueError(
+            '{} is out of date with {}.  Run `poetry lock` to update '
+            'it.'.format(lock_path, pyproject_path))
+
+    packages = collections.defaultdict(list)
+    for package in lock.get('package', []):
+        packages[_normalize(package['name'])].append(package)
+    if any('groups' in package for package in lock.get('package', [])):
+        selected = [
+            (package, _locked_markers(package))
+            for name in sorted(packages) for package in packages[name]
+            if POETRY_MAIN_GROUP in package.get('groups', [])]
+    else:
+        selected = _walk_dependencies(lock_path, packages, pyproject)
+
+    # Older lock files list the files of every package in a table
+    metadata_files = {
+        _normalize(name): files
+        for name, files in lock.get('metadata', {}).get('files', {}).items()}
+    lines = [HEADER.format(POETRY_LOCK)]
+    for package, markers in selected:
+        files = (package.get('files') or
+                 metadata_files.get(_normalize(package['name']), []))
+        hashes = [entry['hash'] for entry in files if entry.get('hash')]
+        if package.get('source', {}).get('type') or not hashes:
+            raise ValueError(
+                '{} has no hashes for "{}", which comes from a VCS, a path '
+                'or a URL.'.format(lock_path, package['name']))
+        lines.append(format_requirement(
+            package['name'], package['version'], hashes, markers=markers))
+    return ''.join(lines)
+
+
+def get_pinned_requirements(source_dir):
+    """Find the fully pinned dependencies of an application.
+
+    Args:
+        source_dir (str): Directory containing user's source code
+
+    Returns:
+        Pinned: Requirements to install, or None if dependencies are
+            not fully pinned
+
+    Raises:
+        ValueError: if a lock file is stale, or can't be converted
+    """
+    requirements_txt = os.path.join(source_dir, REQUIREMENTS_TXT)
+    if os.path.isfile(requirements_txt):
+        if is_pinned(_read(requirements_txt)):
+            return Pinned(contents=None, filename=REQUIREMENTS_TXT,
+                          source=REQUIREMENTS_TXT)
+        return None
+    if os.path.isfile(os.path.join(source_dir, PIPFILE_LOCK)):
+        return Pinned(contents=from_pipfile_lock(source_dir),
+                      filename=PINNED_REQUIREMENTS_TXT, source=PIPFILE_LOCK)
+    if os.path.isfile(os.path.join(source_dir, POETRY_LOCK)):
+        return Pinned(contents=from_poetry_lock(source_dir),
+                      filename=PINNED_REQUIREMENTS_TXT, source=POETRY_LOCK)
+    return None
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit test for pinned_requirements.py"""
+
+import importlib
+import json
+
+import pytest
+
+import pinned_requirements
+
+
+def _has_toml_parser():
+    for name in ('tomllib', 'toml'):
+        try:
+            importlib.import_module(name)
+            return True
+        except ImportError:
+            pass
+    return False
+
+
+requires_toml = pytest.mark.skipif(
+    not _has_toml_parser(), reason='No TOML parser is installed')
+
+# Hashes of made-up files
+HASH_A = 'sha256:' + 'a' * 64
+HASH_B = 'sha256:' + 'b' * 64
+
+# Pipfile and the hash `pipenv lock` recorded for it
+PIPFILE = """\
+[[source]]
+url = "https://pypi.org/simple"
+verify_ssl = true
+name = "pypi"
+
+[packages]
+six = "==1.16.0"
+requests = {version = "*", extras = ["socks"]}
+
+[dev-packages]
+pytest = "*"
+
+[requires]
+python_version = "3.11"
+"""
+PIPFILE_HASH = (
+    '113b4ef18af744d8fb763a4e130a61eaf5541867239659fb15afd0699c2637c2')
+
+# pyproject.toml files and the hashes poetry computes for them, with
+# and without [dependency-groups]
+PYPROJECT_TOOL_POETRY = """\
+[tool.poetry]
+name = "app"
+
+[tool.poetry.dependencies]
+python = "^3.7"
+flask = "^1.0"
+
+[tool.poetry.group.dev.dependencies]
+pytest = "*"
+"""
+PYPROJECT_TOOL_POETRY_HASH = (
+    '8666219db60051adc23aba0ef10bdc41af9dcc7d30f87208f1bade4498f0a8e0')
+PYPROJECT_PROJECT = """\
+[project]
+name = "app"
+dependencies = ["flask>=1.0"]
+
+[dependency-groups]
+dev = ["pytest"]
+"""
+PYPROJECT_PROJECT_HASHES = (
+    '850aaa6bab0bc21ddcbc259e3315ed650930842680ece24dcea03f8dd3cd4ed8',
+    'a42f58889334184d6ed99421d3f277b5069a5726644f723696e0e0c9ef3408a8')
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('', False),
+    ('flask==1.0.2 --hash=sha256:abc\n', True),
+    ('flask==1.0.2 \\\n    --hash=sha256:abc \\\n    --hash=sha256:def\n',
+     True),
+    ('# comment\n--index-url https://example.com\n'
+     'flask[async]==1.0.2 ; python_version >= "3" --hash=sha256:abc\n', True),
+    ('flask==1.0.2\n', False),
+    ('flask>=1.0 --hash=sha256:abc\n', False),
+    ('flask==1.* --hash=sha256:abc\n', False),
+    ('flask==1.0.2 --hash=sha256:abc\n-r other.txt\n', False),
+    ('flask==1.0.2 --hash=sha256:abc\n-egit+https://example.com\n', False),
+])
+def test_is_pinned(text, expected):
+    assert pinned_requirements.is_pinned(text) == expected
+
+
+def test_format_requirement():
+    assert pinned_requirements.format_requirement(
+        'requests', '2.0', [HASH_B, HASH_A], ['socks'], 'os_name == "posix"'
+    ) == ('requests[socks]==2.0 ; os_name == "posix" \\\n'
+          '    --hash={} \\\n    --hash={}\n'.format(HASH_A, HASH_B))
+
+
+@requires_toml
+def test_pipfile_hash(tmpdir):
+    path = tmpdir.join('Pipfile')
+    path.write(PIPFILE)
+    assert pinned_requirements.pipfile_hash(
+        pinned_requirements._load_toml(str(path))) == PIPFILE_HASH
+
+
+@requires_toml
+@pytest.mark.parametrize('pyproject, expected', [
+    (PYPROJECT_TOOL_POETRY, (PYPROJECT_TOOL_POETRY_HASH,) * 2),
+    (PYPROJECT_PROJECT, PYPROJECT_PROJECT_HASHES),
+])
+def test_poetry_hash(tmpdir, pyproject, expected):
+    path = tmpdir.join('pyproject.toml')
+    path.write(pyproject)
+    parsed = pinned_requirements._load_toml(str(path))
+    assert (pinned_requirements.poetry_hash(parsed),
+            pinned_requirements.poetry_hash(parsed, False)) == expected
+
+
+def _write_pipfile_lock(tmpdir, default, pipfile_hash=PIPFILE_HASH):
+    tmpdir.join('Pipfile').write(PIPFILE)
+    tmpdir.join('Pipfile.lock').write(json.dumps({
+        '_meta': {'hash': {'sha256': pipfile_hash}},
+        'default': default,
+        'develop': {'pytest': {'hashes': [HASH_A], 'version': '==7.0'}},
+    }))
+
+
+@requires_toml
+def test_from_pipfile_lock(tmpdir):
+    _write_pipfile_lock(tmpdir, {
+        'six': {'hashes': [HASH_A], 'version': '==1.16.0'},
+        'requests': {'extras': ['socks'], 'hashes': [HASH_B],
+                     'markers': "python_version >= '3.7'",
+                     'version': '==2.0'},
+    })
+    text = pinned_requirements.from_pipfile_lock(str(tmpdir))
+    assert text.splitlines()[2:] == [
+        "requests[socks]==2.0 ; python_version >= '3.7' \\",
+        '    --hash={}'.format(HASH_B),
+        'six==1.16.0 \\',
+        '    --hash={}'.format(HASH_A),
+    ]
+    assert pinned_requirements.is_pinned(text)
+
+
+@requires_toml
+def test_from_pipfile_lock_stale(tmpdir):
+    _write_pipfile_lock(tmpdir, {}, pipfile_hash='0' * 64)
+    with pytest.raises(ValueError, match='out of date'):
+        pinned_requirements.from_pipfile_lock(str(tmpdir))
+
+
+@requires_toml
+def test_from_pipfile_lock_vcs(tmpdir):
+    _write_pipfile_lock(tmpdir, {
+        'app': {'git': 'https://example.com/app.git', 'ref': 'abc'}})
+    with pytest.raises(ValueError, match='"app"'):
+        pinned_requirements.from_pipfile_lock(str(tmpdir))
+
+
+# poetry.lock of PYPROJECT_TOOL_POETRY in the format before 2.1, where
+# files are listed under [metadata.files] and the main packages are
+# found by walking the dependencies
+POETRY_LOCK_1 = """\
+[[package]]
+name = "Flask"
+version = "1.0.2"
+category = "main"
+
+[package.dependencies]
+Werkzeug = ">=0.14"
+colorama = {{version = "*", markers = "sys_platform == 'win32'"}}
+simplejson = {{version = "*", optional = true}}
+
+[[package]]
+name = "werkzeug"
+version = "0.14.1"
+category = "main"
+
+[[package]]
+name = "colorama"
+version = "0.4.0"
+category = "main"
+
+[[package]]
+name = "simplejson"
+version = "3.0"
+category = "main"
+
+[[package]]
+name = "pytest"
+version = "3.7.3"
+category = "dev"
+
+[metadata]
+content-hash = "{content_hash}"
+
+[metadata.files]
+flask = [{{file = "Flask-1.0.2.whl", hash = "{hash_a}"}}]
+werkzeug = [{{file = "Werkzeug-0.14.1.whl", hash = "{hash_b}"}}]
+colorama = [{{file = "colorama-0.4.0.whl", hash = "{hash_a}"}}]
+simplejson = [{{file = "simplejson-3.0.tar.gz", hash = "{hash_b}"}}]
+pytest = [{{file = "pytest-3.7.3.whl", hash = "{hash_a}"}}]
+"""
+
+# The same in format 2.1, with dependency groups and markers
+POETRY_LOCK_2 = """\
+[[package]]
+name = "colorama"
+version = "0.4.0"
+groups = ["main", "dev"]
+markers = {{main = "sys_platform == \\"win32\\"", dev = "true"}}
+files = [{{file = "colorama-0.4.0.whl", hash = "{hash_a}"}}]
+
+[[package]]
+name = "flask"
+version = "1.0.2"
+groups = ["main"]
+files = [{{file = "Flask-1.0.2.whl", hash = "{hash_a}"}}]
+
+[[package]]
+name = "pytest"
+version = "3.7.3"
+groups = ["dev"]
+files = [{{file = "pytest-3.7.3.whl", hash = "{hash_a}"}}]
+
+[[package]]
+name = "werkzeug"
+version = "0.14.1"
+groups = ["main"]
+files = [{{file = "Werkzeug-0.14.1.whl", hash = "{hash_b}"}}]
+
+[metadata]
+lock-version = "2.1"
+content-hash = "{content_hash}"
+"""
+
+
+def _write_poetry_lock(tmpdir, lock, content_hash=PYPROJECT_TOOL_POETRY_HASH):
+    tmpdir.join('pyproject.toml').write(PYPROJECT_TOOL_POETRY)
+    tmpdir.join('poetry.lock').write(lock.format(
+        content_hash=content_hash, hash_a=HASH_A, hash_b=HASH_B))
+
+
+@requires_toml
+@pytest.mark.parametrize('lock, expected', [
+    (POETRY_LOCK_1, ["colorama==0.4.0 ; (sys_platform == 'win32') \\",
+                     'Flask==1.0.2 \\', 'werkzeug==0.14.1 \\']),
+    (POETRY_LOCK_2, ['colorama==0.4.0 ; sys_platform == "win32" \\',
+                     'flask==1.0.2 \\', 'werkzeug==0.14.1 \\']),
+])
+def test_from_poetry_lock(tmpdir, lock, expected):
+    _write_poetry_lock(tmpdir, lock)
+    text = pinned_requirements.from_poetry_lock(str(tmpdir))
+    assert [line for line in text.splitlines()[2:]
+            if not line.startswith('    --hash')] == expected
+    assert pinned_requirements.is_pinned(text)
+
+
+@requires_toml
+def test_from_poetry_lock_stale(tmpdir):
+    _write_poetry_lock(tmpdir, POETRY_LOCK_2, content_hash='0' * 64)
+    with pytest.raises(ValueError, match='out of date'):
+        pinned_requirements.from_poetry_lock(str(tmpdir))
+
+
+@requires_toml
+def test_get_pinned_requirements(tmpdir):
+    assert pinned_requirements.get_pinned_requirements(str(tmpdir)) is None
+
+    _write_poetry_lock(tmpdir, POETRY_LOCK_2)
+    pinned = pinned_requirements.get_pinned_requirements(str(tmpdir))
+    assert pinned.filename == pinned_requirements.PINNED_REQUIREMENTS_TXT
+    assert pinned.source == pinned_requirements.POETRY_LOCK
+
+    # Pipfile.lock takes precedence over poetry.lock
+    _write_pipfile_lock(tmpdir, {})
+    pinned = pinned_requirements.get_pinned_requirements(str(tmpdir))
+    assert pinned.source == pinned_requirements.PIPFILE_LOCK
+
+    # requirements.txt takes precedence over both, pinned or not
+    requirements_txt = tmpdir.join('requirements.txt')
+    requirements_txt.write('flask==1.0.2 --hash={}\n'.format(HASH_A))
+    assert pinned_requirements.get_pinned_requirements(str(tmpdir)) == (
+        pinned_requirements.Pinned(
+            contents=None, filename='requirements.txt',
+            source='requirements.txt'))
+    requirements_txt.write('flask\n')
+    assert pinned_requirements.get_pinned_requirements(str(tmpdir)) is None
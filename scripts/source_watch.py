@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Wait for files in a source tree to change.
+
+On Linux, inotify is used to sleep until something happens in the
+tree.  Elsewhere, or if inotify is unavailable, the tree is polled.
+Either way, what changed is found by comparing the size and mtime of
+every file before and after, so events that inotify drops or
+coalesces don't matter.  Directories that are created or deleted are
+reported too, even when they are empty.  Bursts of changes, like an
+editor saving or a `git checkout`, are reported together once the tree
+has been quiet for a short while.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import stat
+import struct
+import time
+
+import workspace_sync
+
+
+# Seconds between scans of the tree when polling
+POLL_INTERVAL = 0.5
+
+# Seconds without changes before a burst of changes is reported
+DEFAULT_DEBOUNCE = 0.2
+
+# inotify flags, from <sys/inotify.h>
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_DELETE_SELF = 0x400
+IN_IGNORED = 0x8000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+              IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF)
+
+# Header of each event read from an inotify file descriptor
+INOTIFY_EVENT = struct.Struct('iIII')
+
+
+def snapshot(root, excludes=workspace_sync.DEFAULT_EXCLUDES,
+             directories=False):
+    """Record the type, size and mtime of every file below a directory.
+
+    Args:
+        root (str): Directory to scan
+        excludes ([str]): Names of files and directories to skip
+        directories (bool): Record directories too, with a size and
+            mtime of 0, so only their creation and deletion show
+
+    Returns:
+        dict: Map of path relative to `root` to (type, size, mtime_ns)
+    """
+    state = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [name for name in dirnames if name not in excludes]
+        if directories and dirpath != root:
+            state[os.path.relpath(dirpath, root)] = (stat.S_IFDIR, 0, 0)
+        for name in filenames:
+            if name in excludes:
+                continue
+            path = os.path.join(dirpath, name)
+            path_state = file_state(path)
+            if path_state is not None:
+                state[os.path.relpath(path, root)] = path_state
+    return state
+
+
+def file_state(path):
+    """Return (type, size, mtime_ns) of a file, or None if it is missing"""
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return None
+    return stat.S_IFMT(st.st_mode), st.st_size, st.st_mtime_ns
+
+
+def changed_paths(before, after):
+    """Return the sorted paths that differ between two snapshots"""
+    return sorted(path for path in set(before).union(after)
+                  if before.get(path) != after.get(path))
+
+
+class PollingWatcher(object):
+    """Watches a tree by scanning it every POLL_INTERVAL seconds"""
+
+    def __init__(self, root, excludes=workspace_sync.DEFAULT_EXCLUDES,
+                 interval=POLL_INTERVAL):
+        self.root = root
+        self.excludes = excludes
+        self.interval = interval
+        self.state = self.scan()
+        self.seen = self.state
+
+    def scan(self):
+        """Return a snapshot of the tree, with its directories"""
+        return snapshot(self.root, self.excludes, directories=True)
+
+    def wait_for_event(self, timeout=None):
+        """Sleep until the tree may have changed.
+
+        Returns:
+            bool: False if nothing happened within `timeout` seconds
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            current = self.scan()
+            if current != self.seen:
+                self.seen = current
+                return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            delay = self.interval
+            if deadline is not None:
+                delay = min(delay, max(deadline - time.monotonic(), 0))
+            time.sleep(delay)
+
+    def wait_for_changes(self, debounce=DEFAULT_DEBOUNCE):
+        """Wait until files change and then stay unchanged for a while.
+
+        Returns:
+            [str]: Paths relative to the root of files that were
+                   created, modified or deleted since the last call,
+                   and of directories that were created or deleted
+        """
+        while True:
+            self.wait_for_event()
+            while self.wait_for_event(debounce):
+                pass
+            current = self.scan()
+            changes = changed_paths(self.state, current)
+            self.state = current
+            self.seen = current
+            if changes:
+                return changes
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(PollingWatcher):
+    """Watches a tree by sleeping on inotify events for its directories"""
+
+    def __init__(self, root, excludes=workspace_sync.DEFAULT_EXCLUDES):
+        self.libc = _load_libc()
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        # Map of watch descriptor to the directory it watches
+        self.watches = {}
+        try:
+            self.add_watches(root, excludes)
+            super().__init__(root, excludes)
+        except BaseException:
+            os.close(self.fd)
+            raise
+
+    def add_watches(self, root, excludes):
+        """Watch every directory below `root` that isn't watched yet"""
+        watched = set(self.watches.values())
+        for dirpath, dirnames, _ in os.walk(root):
+            dirnames[:] = [name for name in dirnames if name not in excludes]
+            if dirpath in watched:
+                continue
+            # Returns the existing watch of a directory that was moved
+            wd = self.libc.inotify_add_watch(
+                self.fd, os.fsencode(dirpath), WATCH_MASK)
+            if wd >= 0:
+                self.watches[wd] = dirpath
+
+    def wait_for_event(self, timeout=None):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return False
+        # The watches of deleted directories are gone, and new ones,
+        # including directories deleted and created again, need watches
+        # of their own
+        created = False
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            wd, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size + length
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                created = True
+        if created:
+            self.add_watches(self.root, self.excludes)
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _load_libc():
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                       use_errno=True)
+    # Raises AttributeError where inotify doesn't exist
+    libc.inotify_init1.argtypes = [ctypes.c_int]
+    libc.inotify_add_watch.argtypes = [
+        ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    return libc
+
+
+def make_watcher(root, excludes=workspace_sync.DEFAULT_EXCLUDES):
+    """Return an InotifyWatcher if possible, or else a PollingWatcher"""
+    try:
+        return InotifyWatcher(root, excludes)
+    except (OSError, AttributeError):
+        return PollingWatcher(root, excludes)
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit test for source_watch.py"""
+
+import os
+import threading
+import time
+
+import pytest
+
+import source_watch
+
+
+@pytest.fixture
+def source_dir(tmpdir):
+    source_dir = tmpdir.mkdir('source')
+    source_dir.join('kept.txt').write('kept')
+    source_dir.join('deleted.txt').write('deleted')
+    source_dir.join('modified.txt').write('before')
+    source_dir.mkdir('.git').join('HEAD').write('ref')
+    return source_dir
+
+
+def _make_watcher(kind, root):
+    if kind == 'inotify':
+        try:
+            return source_watch.InotifyWatcher(root)
+        except (OSError, AttributeError):
+            pytest.skip('inotify is not available')
+    return source_watch.PollingWatcher(root, interval=0.05)
+
+
+def _in_background(delay, function):
+    timer = threading.Timer(delay, function)
+    timer.start()
+    return timer
+
+
+def test_changed_paths():
+    before = {'a': (1, 1, 1), 'b': (1, 1, 1), 'c': (1, 1, 1)}
+    after = {'a': (1, 1, 1), 'b': (1, 2, 1), 'd': (1, 1, 1)}
+    assert source_watch.changed_paths(before, after) == ['b', 'c', 'd']
+
+
+def test_snapshot_excludes(source_dir):
+    assert sorted(source_watch.snapshot(str(source_dir))) == [
+        'deleted.txt', 'kept.txt', 'modified.txt']
+
+
+@pytest.mark.parametrize('kind', ['inotify', 'polling'])
+def test_wait_for_changes(source_dir, kind):
+    watcher = _make_watcher(kind, str(source_dir))
+
+    def change():
+        source_dir.join('deleted.txt').remove()
+        source_dir.join('modified.txt').write('after, and longer')
+        source_dir.mkdir('new').join('created.txt').write('created')
+        source_dir.join('.git', 'HEAD').write('ignored')
+
+    try:
+        timer = _in_background(0.1, change)
+        changes = watcher.wait_for_changes(debounce=0.2)
+        timer.join()
+        assert changes == [
+            'deleted.txt', 'modified.txt', 'new',
+            os.path.join('new', 'created.txt')]
+
+        # Files in directories created since the watch started are seen
+        timer = _in_background(0.1, lambda: source_dir.join(
+            'new', 'created.txt').write('modified later'))
+        assert watcher.wait_for_changes(debounce=0.2) == [
+            os.path.join('new', 'created.txt')]
+        timer.join()
+    finally:
+        watcher.close()
+
+
+@pytest.mark.parametrize('kind', ['inotify', 'polling'])
+def test_wait_for_changes_directories(source_dir, kind):
+    source_dir.mkdir('sub').join('file.txt').write('before')
+    watcher = _make_watcher(kind, str(source_dir))
+    try:
+        # Creating and deleting empty directories is reported
+        timer = _in_background(0.1, lambda: source_dir.mkdir('empty'))
+        assert watcher.wait_for_changes(debounce=0.2) == ['empty']
+        timer.join()
+        timer = _in_background(0.1, source_dir.join('empty').remove)
+        assert watcher.wait_for_changes(debounce=0.2) == ['empty']
+        timer.join()
+
+        # A directory deleted and created again is still watched
+        def recreate():
+            source_dir.join('sub').remove()
+            source_dir.mkdir('sub').join('file.txt').write('after')
+
+        timer = _in_background(0.1, recreate)
+        watcher.wait_for_changes(debounce=0.2)
+        timer.join()
+        timer = _in_background(0.1, lambda: source_dir.join(
+            'sub', 'file.txt').write('edited later'))
+        assert watcher.wait_for_changes(debounce=0.2) == [
+            os.path.join('sub', 'file.txt')]
+        timer.join()
+    finally:
+        watcher.close()
+
+
+@pytest.mark.parametrize('kind', ['inotify', 'polling'])
+def test_wait_for_changes_debounce(source_dir, kind):
+    watcher = _make_watcher(kind, str(source_dir))
+
+    def burst():
+        for index in range(5):
+            source_dir.join('file{}.txt'.format(index)).write('x')
+            time.sleep(0.05)
+
+    try:
+        timer = _in_background(0.1, burst)
+        # The whole burst is reported at once
+        changes = watcher.wait_for_changes(debounce=0.5)
+        timer.join()
+        assert changes == ['file{}.txt'.format(index)
+                           for index in range(5)]
+    finally:
+        watcher.close()
+
+
+def test_make_watcher(source_dir):
+    watcher = source_watch.make_watcher(str(source_dir))
+    try:
+        assert isinstance(watcher, source_watch.PollingWatcher)
+    finally:
+        watcher.close()
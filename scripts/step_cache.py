@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Cache the workspace outputs of build steps.
+
+Each step gets a key computed from everything that can affect what it
+does: its command (image name, substituted args, env and dir), the
+local image ID if the image is present, a digest of the staged source
+tree, and the keys of the steps it waits for.  After a successful run,
+the files the step created, changed or deleted in the workspace are
+stored under that key.  When a later build computes the same key, the
+files are restored instead of running the step.
+
+Only changes to the workspace are cached.  Other effects of a step,
+like images left in the local Docker daemon, pushes and deployments,
+are not, and any image can have them.  So only steps marked cacheable,
+by id or by image name, are cached, and the others always run.  Steps
+that wait for them always run too.
+
+File contents are stored once per SHA-256 digest, and whole entries
+are evicted least recently used first when the cache grows too big.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import shutil
+import stat
+import subprocess
+import tempfile
+
+import workspace_sync
+
+
+# Bump to invalidate all existing entries when the format changes
+CACHE_FORMAT_VERSION = 1
+
+# Read files in pieces of this size when hashing
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# Stat fields that identify an unchanged file
+FileState = collections.namedtuple('FileState', 'mtime_ns size')
+
+# Workspace changes made by one step.  `files` maps relative paths to
+# FileState, `deleted` is a list of relative paths.
+Changes = collections.namedtuple('Changes', 'deleted files')
+
+
+def default_cache_dir():
+    """Return the default step cache directory"""
+    cache_home = (os.environ.get('XDG_CACHE_HOME') or
+                  os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_home, 'local_cloudbuild', 'steps')
+
+
+def hash_file(path):
+    """Return the hex SHA-256 digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def snapshot_tree(root):
+    """Record the state of every regular file below a directory.
+
+    Returns:
+        dict: Map of relative path to FileState
+    """
+    snapshot = {}
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            try:
+                st = os.lstat(path)
+            except FileNotFoundError:
+                continue
+            if stat.S_ISREG(st.st_mode):
+                snapshot[os.path.relpath(path, root)] = FileState(
+                    mtime_ns=st.st_mtime_ns, size=st.st_size)
+    return snapshot
+
+
+def diff_snapshots(before, after):
+    """Return the Changes between two snapshots of the same tree"""
+    files = {path: state for path, state in after.items()
+             if before.get(path) != state}
+    deleted = sorted(path for path in before if path not in after)
+    return Changes(deleted=deleted, files=files)
+
+
+def is_cacheable(step_id, image, cacheable):
+    """Return True if a step was marked as only changing the workspace.
+
+    Args:
+        step_id (str): Id of the step, or ''
+        image (str): Image name of the step
+        cacheable (set): Step ids and image names, without tag or
+            digest, of the steps that may be cached
+
+    Returns:
+        bool: True if the step's id or image is in `cacheable`
+    """
+    if step_id and step_id in cacheable:
+        return True
+    name = image.split('@')[0]
+    if ':' in name.rsplit('/', 1)[-1]:
+        name = name.rsplit(':', 1)[0]
+    return name in cacheable
+
+
+def image_id(image, env=None):
+    """Return the local ID of a Docker image, or '' if it isn't present.
+
+    Args:
+        image (str): Image name
+        env (dict): Environment for the docker CLI, which may select
+                    the daemon with DOCKER_HOST
+    """
+    try:
+        output = subprocess.check_output(
+            ['docker', 'image', 'inspect', '--format', '{{.Id}}', image],
+            env=env, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+    return output.decode('utf8').strip()
+
+
+class StepCache(object):
+    """Content-addressed store of step outputs, with LRU eviction.
+
+    Layout of `cache_dir`:
+        blobs/<sha256>           file contents
+        entries/<key>.json       files and deletions of a step run
+        index/<source>.json      hashes of staged files by size and mtime
+
+    `cacheable` holds the step ids and image names of the steps that
+    may be cached, see is_cacheable.
+    """
+
+    def __init__(self, cache_dir, max_size, cacheable=()):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.cacheable = frozenset(cacheable)
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self.uncacheable = 0
+        for subdir in ('blobs', 'entries', 'index'):
+            os.makedirs(os.path.join(cache_dir, subdir), exist_ok=True)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.cache_dir, 'blobs', digest)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, 'entries', key + '.json')
+
+    def _write_json(self, path, value):
+        """Write a JSON file atomically"""
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'w', encoding='utf8') as f:
+            json.dump(value, f, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def tree_digest(self, root, source_dir):
+        """Return a digest of the contents of a staged source tree.
+
+        File hashes are remembered by path, size and mtime for each
+        source directory, so unchanged files are not read again.
+        """
+        index_path = os.path.join(
+            self.cache_dir, 'index',
+            hashlib.sha256(os.path.realpath(source_dir).encode('utf8')).
+            hexdigest() + '.json')
+        try:
+            with open(index_path, 'r', encoding='utf8') as f:
+                old_index = json.load(f)
+        except (OSError, ValueError):
+            old_index = {}
+        index = {}
+        for path, state in sorted(snapshot_tree(root).items()):
+            cached = old_index.get(path)
+            if cached and cached[:2] == [state.size, state.mtime_ns]:
+                index[path] = cached
+            else:
+                index[path] = [state.size, state.mtime_ns,
+                               hash_file(os.path.join(root, path))]
+        self._write_json(index_path, index)
+        digest = hashlib.sha256()
+        for path, (_, _, file_digest) in sorted(index.items()):
+            digest.update('{}\0{}\0'.format(path, file_digest).encode('utf8'))
+        return digest.hexdigest()
+
+    @staticmethod
+    def step_key(command, image, source_digest, dependency_keys):
+        """Compute the cache key of a step.
+
+        Args:
+            command ([str]): Shell tokens of the step's docker command
+            image (str): Local image ID, or '' if unknown
+            source_digest (str): Digest of the staged source tree
+            dependency_keys ([str]): Keys of the steps it waits for
+
+        Returns:
+            str: Hex digest
+        """
+        material = json.dumps({
+            'command': command,
+            'dependencies': dependency_keys,
+            'image': image,
+            'source': source_digest,
+            'version': CACHE_FORMAT_VERSION,
+        }, sort_keys=True)
+        return hashlib.sha256(material.encode('utf8')).hexdigest()
+
+    def lookup(self, key):
+        """Return the stored entry for a key, or None"""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not all(os.path.exists(self._blob_path(file_entry['sha256']))
+                   for file_entry in entry['files'].values()):
+            return None
+        # Mark as recently used
+        os.utime(path)
+        return entry
+
+    def restore(self, entry, workspace):
+        """Apply a stored entry's changes to a workspace"""
+        for rel_path in entry['deleted']:
+            path = os.path.join(workspace, rel_path)
+            if os.path.lexists(path):
+                workspace_sync.remove_path(path)
+        for rel_path, file_entry in sorted(entry['files'].items()):
+            path = os.path.join(workspace, rel_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if os.path.lexists(path):
+                workspace_sync.remove_path(path)
+            shutil.copyfile(self._blob_path(file_entry['sha256']), path)
+            os.chmod(path, file_entry['mode'])
+
+    def store(self, key, workspace, changes):
+        """Save the changes a step made to a workspace"""
+        files = {}
+        for rel_path in sorted(changes.files):
+            path = os.path.join(workspace, rel_path)
+            try:
+                digest = hash_file(path)
+                mode = stat.S_IMODE(os.stat(path).st_mode)
+                blob_path = self._blob_path(digest)
+                if not os.path.exists(blob_path):
+                    fd, tmp_path = tempfile.mkstemp(
+                        dir=os.path.dirname(blob_path))
+                    os.close(fd)
+                    shutil.copyfile(path, tmp_path)
+                    os.replace(tmp_path, blob_path)
+            except FileNotFoundError:
+                # Removed again before the step finished
+                continue
+            files[rel_path] = {'mode': mode, 'sha256': digest}
+        self._write_json(self._entry_path(key), {
+            'deleted': changes.deleted,
+            'files': files,
+        })
+        self.evict()
+
+    def size(self):
+        """Return the total size of stored file contents in bytes"""
+        blobs_dir = os.path.join(self.cache_dir, 'blobs')
+        return sum(os.path.getsize(os.path.join(blobs_dir, name))
+                   for name in os.listdir(blobs_dir))
+
+    def evict(self):
+        """Remove least recently used entries until under max_size"""
+        entries_dir = os.path.join(self.cache_dir, 'entries')
+        blobs_dir = os.path.join(self.cache_dir, 'blobs')
+        entries = []
+        for name in os.listdir(entries_dir):
+            path = os.path.join(entries_dir, name)
+            try:
+                with open(path, 'r', encoding='utf8') as f:
+                    entry = json.load(f)
+                entries.append((os.path.getmtime(path), path, entry))
+            except (OSError, ValueError):
+                continue
+        entries.sort(key=lambda item: item[0])
+
+        blob_sizes = {name: os.path.getsize(os.path.join(blobs_dir, name))
+                      for name in os.listdir(blobs_dir)}
+        refcounts = collections.Counter()
+        for _, _, entry in entries:
+            for file_entry in entry['files'].values():
+                refcounts[file_entry['sha256']] += 1
+
+        # Blobs no longer referenced by any entry
+        for digest in list(blob_sizes):
+            if not refcounts[digest]:
+                os.remove(os.path.join(blobs_dir, digest))
+                del blob_sizes[digest]
+        total = sum(blob_sizes.values())
+
+        for _, path, entry in entries:
+            if total <= self.max_size:
+                break
+            os.remove(path)
+            for digest in set(file_entry['sha256']
+                              for file_entry in entry['files'].values()):
+                refcounts[digest] -= 1
+                if not refcounts[digest] and digest in blob_sizes:
+                    os.remove(os.path.join(blobs_dir, digest))
+                    total -= blob_sizes.pop(digest)
+
+    def format_stats(self):
+        """Describe cache activity in one line"""
+        return ('Step cache: {} hits, {} misses, {} not stored because '
+                'steps overlapped, {} not cacheable, {} of {} bytes '
+                'used'.format(
+                    self.hits, self.misses, self.skipped, self.uncacheable,
+                    self.size(), self.max_size))
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit test for step_cache.py"""
+
+import os
+
+import pytest
+
+import step_cache
+
+
+@pytest.fixture
+def cache(tmpdir):
+    return step_cache.StepCache(str(tmpdir.join('cache')), max_size=2**20)
+
+
+def test_snapshot_and_diff(tmpdir):
+    workspace = tmpdir.mkdir('workspace')
+    workspace.join('unchanged.txt').write('same')
+    workspace.join('changed.txt').write('before')
+    workspace.join('deleted.txt').write('gone soon')
+    before = step_cache.snapshot_tree(str(workspace))
+
+    workspace.join('changed.txt').write('after, and longer')
+    workspace.join('deleted.txt').remove()
+    workspace.mkdir('subdir').join('created.txt').write('new')
+    changes = step_cache.diff_snapshots(
+        before, step_cache.snapshot_tree(str(workspace)))
+    assert sorted(changes.files) == [
+        'changed.txt', os.path.join('subdir', 'created.txt')]
+    assert changes.deleted == ['deleted.txt']
+
+
+def test_step_key():
+    key = step_cache.StepCache.step_key(['docker', 'run'], 'sha256:1', 'src',
+                                        ['dep'])
+    assert key == step_cache.StepCache.step_key(
+        ['docker', 'run'], 'sha256:1', 'src', ['dep'])
+    for args in [
+            (['docker', 'run', 'x'], 'sha256:1', 'src', ['dep']),
+            (['docker', 'run'], 'sha256:2', 'src', ['dep']),
+            (['docker', 'run'], 'sha256:1', 'other', ['dep']),
+            (['docker', 'run'], 'sha256:1', 'src', []),
+    ]:
+        assert step_cache.StepCache.step_key(*args) != key
+
+
+def test_tree_digest(tmpdir, cache):
+    workspace = tmpdir.mkdir('workspace')
+    workspace.join('a.txt').write('a')
+    first = cache.tree_digest(str(workspace), '/some/source')
+    assert first == cache.tree_digest(str(workspace), '/some/source')
+    workspace.join('a.txt').write('b')
+    assert first != cache.tree_digest(str(workspace), '/some/source')
+
+
+def test_store_and_restore(tmpdir, cache):
+    workspace = tmpdir.mkdir('workspace')
+    workspace.join('input.txt').write('input')
+    before = step_cache.snapshot_tree(str(workspace))
+    workspace.mkdir('out').join('result.bin').write('result')
+    os.chmod(str(workspace.join('out', 'result.bin')), 0o755)
+    workspace.join('input.txt').remove()
+    changes = step_cache.diff_snapshots(
+        before, step_cache.snapshot_tree(str(workspace)))
+    cache.store('key1', str(workspace), changes)
+
+    assert cache.lookup('missing') is None
+    entry = cache.lookup('key1')
+    assert entry is not None
+
+    other = tmpdir.mkdir('other')
+    other.join('input.txt').write('input')
+    cache.restore(entry, str(other))
+    assert not other.join('input.txt').exists()
+    assert other.join('out', 'result.bin').read() == 'result'
+    assert os.stat(str(other.join('out', 'result.bin'))).st_mode & 0o777 == (
+        0o755)
+
+
+def _store_file(cache, tmpdir, key, contents):
+    workspace = tmpdir.join(key).ensure(dir=True)
+    workspace.join('file').write(contents)
+    changes = step_cache.diff_snapshots(
+        {}, step_cache.snapshot_tree(str(workspace)))
+    cache.store(key, str(workspace), changes)
+
+
+def test_evict_lru(tmpdir):
+    cache = step_cache.StepCache(str(tmpdir.join('cache')), max_size=250)
+    _store_file(cache, tmpdir, 'old', 'o' * 100)
+    _store_file(cache, tmpdir, 'middle', 'm' * 100)
+    # Use 'old' so that 'middle' is the least recently used
+    os.utime(cache._entry_path('middle'), (0, 0))
+    assert cache.lookup('old') is not None
+    _store_file(cache, tmpdir, 'new', 'n' * 100)
+    assert cache.lookup('middle') is None
+    assert cache.lookup('old') is not None
+    assert cache.lookup('new') is not None
+    assert cache.size() == 200
+
+
+def test_evict_shared_blobs(tmpdir):
+    cache = step_cache.StepCache(str(tmpdir.join('cache')), max_size=150)
+    # Same contents are stored once
+    _store_file(cache, tmpdir, 'first', 'x' * 100)
+    _store_file(cache, tmpdir, 'second', 'x' * 100)
+    assert cache.size() == 100
+    assert cache.lookup('first') is not None
+    assert cache.lookup('second') is not None
+
+
+def test_image_id_missing_docker(monkeypatch):
+    monkeypatch.setenv('PATH', '')
+    assert step_cache.image_id('debian') == ''
+
+
+@pytest.mark.parametrize('step_id, image, expected', [
+    ('', 'debian', False),
+    ('compile', 'debian', True),
+    ('', 'python', True),
+    ('', 'python:3.7', True),
+    ('', 'python@sha256:abc', True),
+    ('', 'localhost:5000/python', False),
+    ('test', 'localhost:5000/python', False),
+    ('', 'gcr.io/cloud-builders/gsutil', False),
+])
+def test_is_cacheable(step_id, image, expected):
+    assert step_cache.is_cacheable(
+        step_id, image, {'compile', 'python'}) == expected
+
+
+def test_format_stats(cache):
+    cache.hits = 2
+    cache.misses = 1
+    assert cache.format_stats().startswith('Step cache: 2 hits, 1 misses')
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,987 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Run the steps of a local cloudbuild without a generated shell script.
+
+Each step is the shell command built by local_cloudbuild, which
+remains the only place that knows how a step maps to `docker run`.
+The commands are started directly as subprocesses, as many at a time
+as the dependency graph and the job limit allow.  Alternatively, steps
+run as containers created through the Docker Engine API, see
+docker_api.  Output is forwarded line by line with a step prefix,
+timeouts are enforced per step and per build, and a result is
+recorded for every step.  The time spent in each phase of the build
+is recorded with build_trace.
+"""
+
+import collections
+import concurrent.futures
+import os
+import queue
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+import build_trace
+import docker_api
+import ignore_rules
+import source_watch
+import step_cache
+import workspace_sync
+
+
+# Step statuses, named as in the Cloud Build API
+STATUS_SUCCESS = 'SUCCESS'
+STATUS_FAILURE = 'FAILURE'
+STATUS_TIMEOUT = 'TIMEOUT'
+STATUS_CANCELLED = 'CANCELLED'
+
+# Longer lines of step output are forwarded in pieces
+MAX_LINE_BYTES = 64 * 1024
+
+# Lines of step output waiting to be printed.  When this fills up,
+# steps block on writing output until the console catches up.
+MAX_QUEUED_LINES = 1024
+
+# Seconds between asking a step to stop and killing it
+KILL_GRACE_SECONDS = 10
+
+# Default number of images to pull at the same time
+PULL_JOBS = 4
+
+# Single step, ready to run
+#
+# `command` is a list of shell tokens which may refer to
+# ${HOST_WORKSPACE}.  `container` is the same step as a
+# docker_api.ContainerSpec, used instead of `command` when running
+# through the Engine API.  `dependencies` are the indices of the steps
+# that must succeed first.  `image` is the substituted image name.
+# `timeout` is in seconds, or 0 for no limit.
+ExecutableStep = collections.namedtuple(
+    'ExecutableStep', 'command container dependencies id_ image timeout')
+
+# Outcome of a single step.  `cached` is True if the step's outputs
+# were restored from the step cache instead of running it.  `elapsed`
+# is wall time in seconds and `exit_code` is None for steps that never
+# ran.
+StepResult = collections.namedtuple(
+    'StepResult', 'cached elapsed exit_code output_bytes status')
+
+# Outcome of making an image available locally.  `image_id` is '' if
+# the image is still missing.  `pulled` is False if the image was
+# already present.
+PullResult = collections.namedtuple(
+    'PullResult', 'elapsed image image_id pulled')
+
+# Docker daemon that steps run on.  `client` is a
+# docker_api.DockerClient for the Engine API, or None to use the docker
+# CLI.  `env` is the environment of docker CLI commands, where
+# DOCKER_HOST selects the daemon.  Once the host's workspace is staged,
+# `env` also holds HOST_WORKSPACE.
+DockerHost = collections.namedtuple('DockerHost', 'client env')
+
+
+def stage_workspace(source_dir, workspace='',
+                    link_mode=workspace_sync.LINK_MODE_AUTO, ignore=None):
+    """Copy a source tree to a staging directory.
+
+    Args:
+        source_dir (str): Directory to copy, excluding `.git`
+        workspace (str): Persistent staging directory to bring up to
+                         date, or '' to create a temporary one
+        link_mode (str): How to copy files, see workspace_sync
+        ignore (ignore_rules.IgnoreRules): Source files to leave out,
+                                           or None
+
+    Returns:
+        (str, workspace_sync.SyncStats): Staging directory, and what
+                                         was copied
+    """
+    if not workspace:
+        workspace = tempfile.mkdtemp(prefix='local_cloudbuild_')
+    stats = workspace_sync.sync_tree(source_dir, workspace, link_mode,
+                                     ignore=ignore)
+    return workspace, stats
+
+
+def empty_workspace(workspace, cleanup_command, client=None,
+                    cleanup_container=None, env=None):
+    """Remove everything in a staging directory.
+
+    Files created by steps may be owned by root.  If they can't be
+    removed directly, they are removed from inside a container, created
+    with `client` and `cleanup_container` if given, or else by running
+    `cleanup_command` with `env`, default os.environ.
+    """
+    try:
+        for name in os.listdir(workspace):
+            workspace_sync.remove_path(os.path.join(workspace, name))
+    except PermissionError:
+        run_helper(cleanup_command, workspace, client, cleanup_container,
+                   env)
+
+
+def run_helper(command, workspace, client=None, container=None, env=None):
+    """Run a container that isn't a step, discarding its output.
+
+    Args:
+        command ([str]): Shell tokens that run the container with the
+                         docker CLI
+        workspace (str): Directory to mount at /workspace
+        client (docker_api.DockerClient): Run `container` through the
+                                          Engine API instead
+        container (docker_api.ContainerSpec): Required with `client`
+        env (dict): Environment for `command`, default os.environ
+
+    Returns:
+        int: Exit code, or None if the container couldn't be created
+    """
+    if client is None:
+        return subprocess.call(shell_args(command),
+                               env=dict(env or os.environ,
+                                        HOST_WORKSPACE=workspace),
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL)
+    try:
+        process = docker_api.ContainerProcess(client, container, workspace)
+    except docker_api.DockerError:
+        return None
+    process.stdout.close()
+    process.stderr.close()
+    return process.wait()
+
+
+def step_names(steps):
+    """Return a display name for each step: its id, or its index"""
+    return [step.id_ or 'Step #{}'.format(index)
+            for index, step in enumerate(steps)]
+
+
+def pull_image(image, client=None, env=None):
+    """Pull an image unless it is present locally.
+
+    Pulling separately from `docker run` keeps pull time out of the
+    step's own time, as Cloud Build does.  A failed pull is ignored,
+    leaving `docker run` to report the problem.
+
+    Args:
+        image (str): Image name
+        client (docker_api.DockerClient): Pull through the Engine API
+                                          instead of the docker CLI
+        env (dict): Environment for the docker CLI, default os.environ
+
+    Returns:
+        PullResult: Local image ID, and whether it had to be pulled
+    """
+    start = time.monotonic()
+    pulled = False
+    if client is not None:
+        try:
+            image_id = client.image_id(image)
+            if not image_id:
+                pulled = True
+                client.pull(image)
+                image_id = client.image_id(image)
+        except docker_api.DockerError:
+            image_id = ''
+    else:
+        image_id = step_cache.image_id(image, env)
+        if not image_id:
+            pulled = True
+            try:
+                subprocess.call(['docker', 'pull', image], env=env,
+                                stdin=subprocess.DEVNULL,
+                                stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL)
+            except OSError:
+                pass
+            image_id = step_cache.image_id(image, env)
+    return PullResult(elapsed=time.monotonic() - start, image=image,
+                      image_id=image_id, pulled=pulled)
+
+
+def distinct_images(steps):
+    """Return the images used by steps, each once, in order of first use"""
+    images = []
+    for step in steps:
+        if step.image and step.image not in images:
+            images.append(step.image)
+    return images
+
+
+def start_pulls(pool, images, client=None, trace=None, env=None):
+    """Start pulling images in a thread pool.
+
+    Args:
+        pool (concurrent.futures.Executor): Runs the pulls, and bounds
+                                            how many run at once
+        images ([str]): Distinct image names
+        client (docker_api.DockerClient): Pull through the Engine API
+                                          instead of the docker CLI
+        trace (build_trace.TraceRecorder): Records each pull, if given
+        env (dict): Environment for the docker CLI, default os.environ
+
+    Returns:
+        dict: Map of image name to a future PullResult
+    """
+    trace = trace or build_trace.TraceRecorder()
+
+    def pull(image):
+        lane = trace.acquire_lane()
+        try:
+            with trace.phase('pull ' + image, lane):
+                return pull_image(image, client, env)
+        finally:
+            trace.release_lane(lane)
+
+    return {image: pool.submit(pull, image) for image in images}
+
+
+def pull_images(images, jobs=PULL_JOBS, client=None, trace=None):
+    """Pull images concurrently, skipping ones that are present.
+
+    Returns:
+        [PullResult]: Result for each image, in the same order
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        futures = start_pulls(pool, images, client, trace)
+        return [futures[image].result() for image in images]
+
+
+def format_pulls(results):
+    """Summarize pull results, one line per image"""
+    return '\n'.join(
+        'Image {:<60} {:<8} {:>8.2f}s'.format(
+            result.image,
+            'pulled' if result.pulled else 'present',
+            result.elapsed) + ('' if result.image_id else ' (not found)')
+        for result in results)
+
+
+def place_step(loads, preferred, backlogs):
+    """Choose the Docker host to run a step on.
+
+    The least loaded host wins.  Among equally loaded hosts, the one
+    that last ran a step in the same directory is preferred, and then
+    the one with the fewest outputs of other hosts' steps to copy in.
+
+    Args:
+        loads ([int]): Number of steps running on each host
+        preferred (int): Host that last ran a step in the same
+                         directory, or None
+        backlogs ([int]): Number of files each host has yet to copy
+
+    Returns:
+        int: Index of the chosen host
+    """
+    return min(range(len(loads)), key=lambda host: (
+        loads[host], host != preferred, backlogs[host], host))
+
+
+def shell_args(command):
+    """Return process args that run a list of shell tokens"""
+    return ['/bin/bash', '-c', 'exec ' + ' '.join(command)]
+
+
+def terminate(process):
+    """Stop a step, killing it if it doesn't exit in time.
+
+    Steps are started in their own process group, so that anything
+    they started is stopped too and doesn't hold their output open.
+    """
+    if process.poll() is not None:
+        return
+    _signal_group(process, signal.SIGTERM)
+    try:
+        process.wait(timeout=KILL_GRACE_SECONDS)
+    except subprocess.TimeoutExpired:
+        _signal_group(process, signal.SIGKILL)
+        process.wait()
+
+
+def _signal_group(process, signum):
+    if isinstance(process, docker_api.ContainerProcess):
+        process.send_signal(signum)
+        return
+    try:
+        os.killpg(process.pid, signum)
+    except ProcessLookupError:
+        pass
+
+
+class _Build(object):
+    """State shared by the threads running a single build"""
+
+    def __init__(self, steps, hosts, jobs, deadline, cache, source_digest,
+                 trace, pulls, observer, out, err):
+        self.steps = steps
+        self.hosts = hosts
+        self.jobs = jobs
+        self.deadline = deadline
+        self.cache = cache
+        self.source_digest = source_digest
+        self.trace = trace
+        self.pulls = pulls
+        self.observer = observer
+        self.out = out
+        self.err = err
+        self.lines = queue.Queue(maxsize=MAX_QUEUED_LINES)
+        self.lock = threading.Lock()
+        self.cache_lock = threading.Lock()
+        self.processes = {}
+        self.cancelled = False
+        # Cache keys of steps that have started
+        self.keys = {}
+        # Number of steps started so far, and currently running, used
+        # to tell if a step's workspace changes are its own
+        self.started = 0
+        self.active = 0
+        # Steps running on each host, and the host that last ran a step
+        # in each working directory
+        self.loads = [0] * len(hosts)
+        self.dir_hosts = {}
+        # Files changed by steps, as (host, paths), and how many of
+        # these each host has copied into its workspace.  `imported`
+        # is the state of each file a host copied, so those aren't
+        # mistaken for outputs of its own steps.
+        self.outputs = []
+        self.synced = [0] * len(hosts)
+        self.imported = [{} for _ in hosts]
+        self.sync_locks = [threading.Lock() for _ in hosts]
+        # Map of (host, image) to a future PullResult
+        self.host_pulls = {}
+
+    def say(self, message):
+        """Queue a progress message, keeping it in order with step output"""
+        self.lines.put((self.out, '', message.encode('utf8')))
+
+    def print_lines(self):
+        """Write queued step output to the console until told to stop"""
+        while True:
+            item = self.lines.get()
+            if item is None:
+                return
+            stream, prefix, line = item
+            text = line.decode('utf8', errors='replace')
+            if not text.endswith('\n'):
+                text += '\n'
+            stream.write(prefix + text)
+            stream.flush()
+
+    def forward(self, pipe, stream, index, counts):
+        """Queue lines read from a step's pipe, counting bytes"""
+        prefix = 'Step #{}: '.format(index)
+        with pipe:
+            for line in iter(lambda: pipe.readline(MAX_LINE_BYTES), b''):
+                counts.append(len(line))
+                if self.observer is not None:
+                    self.observer(index, line)
+                self.lines.put((stream, prefix, line))
+
+    def host_name(self, host):
+        return self.hosts[host].env.get('DOCKER_HOST') or (
+            'host #{}'.format(host))
+
+    def place(self, index):
+        """Choose the host for a step that is about to start"""
+        workdir = self.steps[index].container.workdir
+        with self.lock:
+            backlogs = [
+                sum(len(paths) for origin, paths in
+                    self.outputs[self.synced[host]:] if origin != host)
+                for host in range(len(self.hosts))]
+            host = place_step(self.loads, self.dir_hosts.get(workdir),
+                              backlogs)
+            self.loads[host] += 1
+            self.dir_hosts[workdir] = host
+        return host
+
+    def pull(self, host, image):
+        """Pull an image on a host, once however many steps need it"""
+        with self.lock:
+            future = self.host_pulls.get((host, image))
+            owner = future is None
+            if owner:
+                future = concurrent.futures.Future()
+                self.host_pulls[host, image] = future
+        if owner:
+            future.set_result(pull_image(
+                image, self.hosts[host].client, self.hosts[host].env))
+        return future.result()
+
+    def sync_host(self, host):
+        """Copy the outputs of steps on other hosts into a host's workspace"""
+        workspace = self.hosts[host].env['HOST_WORKSPACE']
+        with self.sync_locks[host]:
+            with self.lock:
+                pending = self.outputs[self.synced[host]:]
+                self.synced[host] = len(self.outputs)
+            for origin, paths in pending:
+                if origin == host:
+                    continue
+                workspace_sync.sync_paths(
+                    self.hosts[origin].env['HOST_WORKSPACE'], workspace,
+                    paths)
+                for path in paths:
+                    self.imported[host][path] = source_watch.file_state(
+                        os.path.join(workspace, path))
+
+    def record_outputs(self, host, before, after):
+        """Queue files changed on a host for copying to the other hosts"""
+        with self.sync_locks[host]:
+            imported = self.imported[host]
+            paths = [path for path in source_watch.changed_paths(before, after)
+                     if path not in imported or
+                     imported[path] != after.get(path)]
+        if paths:
+            with self.lock:
+                self.outputs.append((host, paths))
+
+    def run_step(self, index, host=0):
+        """Run a single step, or restore its outputs from the cache.
+
+        Returns:
+            StepResult: outcome of the step
+        """
+        lane = self.trace.acquire_lane()
+        trace_start = self.trace.now()
+        try:
+            return self.run_step_in_lane(index, lane, host)
+        finally:
+            self.trace.add(build_trace.STEP_PHASE, trace_start,
+                           self.trace.now(), lane, index)
+            self.trace.release_lane(lane)
+            with self.lock:
+                self.loads[host] -= 1
+
+    def run_step_in_lane(self, index, lane, host):
+        """Pull, restore or run a step, recording phases in `lane`"""
+        step = self.steps[index]
+        workspace = self.hosts[host].env['HOST_WORKSPACE']
+        image = ''
+        if host == 0 and step.image in self.pulls:
+            with self.trace.phase('wait for pull', lane, index):
+                image = self.pulls[step.image].result().image_id
+        elif step.image:
+            with self.trace.phase('pull', lane, index):
+                image = self.pull(host, step.image).image_id
+        several_hosts = len(self.hosts) > 1
+        if several_hosts:
+            with self.trace.phase('sync', lane, index):
+                self.sync_host(host)
+                before = source_watch.snapshot(workspace, ())
+        start = time.monotonic()
+        key = None
+        if self.cache and not step_cache.is_cacheable(
+                step.id_, step.image, self.cache.cacheable):
+            with self.cache_lock:
+                # A key no later build has, so steps waiting for this one
+                # always run too
+                self.keys[index] = uuid.uuid4().hex
+                self.cache.uncacheable += 1
+        elif self.cache:
+            key = self.cache.step_key(
+                step.command, image, self.source_digest,
+                [self.keys[dep] for dep in step.dependencies])
+            with self.cache_lock:
+                self.keys[index] = key
+                entry = self.cache.lookup(key)
+                if entry is not None:
+                    self.cache.hits += 1
+                    with self.lock:
+                        self.started += 1
+                    with self.trace.phase('cache restore', lane, index):
+                        self.cache.restore(entry, workspace)
+                    return StepResult(
+                        cached=True, elapsed=time.monotonic() - start,
+                        exit_code=0, output_bytes=0, status=STATUS_SUCCESS)
+                self.cache.misses += 1
+            with self.trace.phase('snapshot', lane, index):
+                before = step_cache.snapshot_tree(workspace)
+
+        result, exclusive = self.run_process(index, start, lane, host)
+        if several_hosts:
+            with self.trace.phase('snapshot', lane, index):
+                self.record_outputs(
+                    host, before, source_watch.snapshot(workspace, ()))
+        if key is not None and result.status == STATUS_SUCCESS:
+            if exclusive:
+                with self.trace.phase('cache store', lane, index):
+                    changes = step_cache.diff_snapshots(
+                        before, step_cache.snapshot_tree(workspace))
+                    with self.cache_lock:
+                        self.cache.store(key, workspace, changes)
+            else:
+                with self.cache_lock:
+                    self.cache.skipped += 1
+        return result
+
+    def run_process(self, index, start, lane, host):
+        """Run a single step to completion, or until it times out.
+
+        Returns:
+            (StepResult, bool): outcome of the step, and whether no
+                                other step ran at the same time
+        """
+        step = self.steps[index]
+        deadline = self.deadline
+        if step.timeout:
+            step_deadline = start + step.timeout
+            deadline = (step_deadline if deadline is None
+                        else min(deadline, step_deadline))
+
+        with self.lock:
+            if self.cancelled:
+                return StepResult(cached=False, elapsed=0.0, exit_code=None,
+                                  output_bytes=0,
+                                  status=STATUS_CANCELLED), False
+            alone_at_start = self.active == 0
+            started_before = self.started
+            self.started += 1
+            self.active += 1
+
+        # Starting a container through the API takes round trips to the
+        # daemon, so steps start in parallel, outside the lock
+        try:
+            process = self.start_process(step, host)
+        except docker_api.DockerError as e:
+            with self.lock:
+                self.active -= 1
+            self.lines.put((self.err, 'Step #{}: '.format(index),
+                            str(e).encode('utf8')))
+            return StepResult(
+                cached=False, elapsed=time.monotonic() - start,
+                exit_code=docker_api.DAEMON_ERROR_EXIT_CODE,
+                output_bytes=0, status=STATUS_FAILURE), False
+        with self.lock:
+            self.processes[index] = process
+            run_start = self.trace.now()
+            cancelled = self.cancelled
+        # cancel() missed a process started in the meantime
+        if cancelled:
+            terminate(process)
+
+        counts = []
+        readers = [
+            threading.Thread(target=self.forward,
+                             args=(process.stdout, self.out, index, counts)),
+            threading.Thread(target=self.forward,
+                             args=(process.stderr, self.err, index, counts)),
+        ]
+        for reader in readers:
+            reader.daemon = True
+            reader.start()
+
+        status = None
+        try:
+            timeout = None
+            if deadline is not None:
+                timeout = max(deadline - time.monotonic(), 0)
+            process.wait(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            status = STATUS_TIMEOUT
+            terminate(process)
+        for reader in readers:
+            reader.join(KILL_GRACE_SECONDS)
+        self.trace.add('run', run_start, self.trace.now(), lane, index)
+        with self.lock:
+            del self.processes[index]
+            self.active -= 1
+            exclusive = (alone_at_start and
+                         self.started == started_before + 1)
+            if self.cancelled and status is None:
+                status = STATUS_CANCELLED
+
+        if status is None:
+            status = (STATUS_SUCCESS if process.returncode == 0
+                      else STATUS_FAILURE)
+        return StepResult(
+            cached=False,
+            elapsed=time.monotonic() - start,
+            exit_code=process.returncode,
+            output_bytes=sum(counts),
+            status=status,
+        ), exclusive
+
+    def start_process(self, step, host):
+        """Start a step as a subprocess, or a container with the API"""
+        client, env = self.hosts[host]
+        if client is not None:
+            return docker_api.ContainerProcess(
+                client, step.container, env['HOST_WORKSPACE'])
+        return subprocess.Popen(
+            shell_args(step.command), env=env,
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, start_new_session=True)
+
+    def cancel(self):
+        """Stop all running steps and don't start any more"""
+        with self.lock:
+            self.cancelled = True
+            processes = list(self.processes.values())
+        for process in processes:
+            terminate(process)
+
+
+def run_steps(steps, env, jobs, timeout=0, cache=None, source_digest='',
+              trace=None, client=None, pulls=None, previous=None,
+              hosts=None, observer=None, out=None, err=None):
+    """Run steps concurrently, as allowed by their dependencies.
+
+    A step that doesn't succeed causes the steps that depend on it to
+    be cancelled.  Independent steps keep running.
+
+    Args:
+        steps ([ExecutableStep]): Steps to run
+        env (dict): Environment for the step processes, including
+                    HOST_WORKSPACE
+        jobs (int): Maximum number of steps to run at the same time
+        timeout (float): Seconds allowed for the whole build, or 0 for
+                         no limit
+        cache (step_cache.StepCache): Cache of step outputs, or None
+        source_digest (str): Digest of the staged source, for the cache
+        trace (build_trace.TraceRecorder): Records the phases of each
+                                           step, if given
+        client (docker_api.DockerClient): Run steps through the Engine
+                                          API instead of the docker CLI
+        pulls (dict): Map of image name to a future PullResult, from
+                      start_pulls.  Steps with other images pull them
+                      when they start.
+        previous (dict): Map of step index to the StepResult of an
+                         earlier run, for steps that are not run again
+        hosts ([DockerHost]): Docker daemons to spread steps across,
+            with their own HOST_WORKSPACE each, instead of `client` and
+            `env`.  Files that steps change on one host are copied to
+            the others before their next step starts, and to the first
+            host at the end.  Each host pulls images as its steps need
+            them, ignoring `pulls`.
+        observer (callable): Called with the index of a step and each
+                             line of its output, as bytes, if given
+        out (file): Stream for step stdout, default sys.stdout
+        err (file): Stream for step stderr, default sys.stderr
+
+    Returns:
+        [StepResult]: Result of each step, in the same order as `steps`
+    """
+    out = out or sys.stdout
+    err = err or sys.stderr
+    deadline = time.monotonic() + timeout if timeout else None
+    trace = trace or build_trace.TraceRecorder()
+    hosts = hosts or [DockerHost(client=client, env=env)]
+    if cache and len(hosts) > 1:
+        raise ValueError(
+            'The step cache can\'t be used with several Docker hosts')
+    build = _Build(steps, hosts, jobs, deadline, cache, source_digest, trace,
+                   pulls or {}, observer, out, err)
+    printer = threading.Thread(target=build.print_lines)
+    printer.start()
+
+    results = dict(previous or {})
+    pending = set(range(len(steps))) - set(results)
+    running = {}
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+            while pending or running:
+                expired = deadline is not None and time.monotonic() > deadline
+                for index in sorted(pending):
+                    deps = steps[index].dependencies
+                    if expired or any(
+                            results[dep].status != STATUS_SUCCESS
+                            for dep in deps if dep in results):
+                        build.say('Cancelled Step #{}'.format(index))
+                        results[index] = StepResult(
+                            cached=False, elapsed=0.0, exit_code=None,
+                            output_bytes=0, status=STATUS_CANCELLED)
+                        pending.remove(index)
+                    elif (all(dep in results for dep in deps) and
+                          len(running) < jobs):
+                        host = build.place(index)
+                        if len(hosts) > 1:
+                            build.say('Starting Step #{} on {}'.format(
+                                index, build.host_name(host)))
+                        else:
+                            build.say('Starting Step #{}'.format(index))
+                        running[pool.submit(
+                            build.run_step, index, host)] = index
+                        pending.remove(index)
+                if not running:
+                    # Every remaining step waits for a step in `pending`,
+                    # which get_dependencies rules out.
+                    assert not pending, 'Steps wait for each other'
+                    break
+                done, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    results[index] = future.result()
+                    build.say('Step #{} finished with status {}{}'.format(
+                        index, results[index].status,
+                        ' (cached)' if results[index].cached else ''))
+        if len(hosts) > 1:
+            with trace.phase('sync'):
+                build.sync_host(0)
+    except BaseException:
+        build.cancel()
+        raise
+    finally:
+        build.lines.put(None)
+        printer.join()
+    return [results[index] for index in range(len(steps))]
+
+
+def format_results(steps, results):
+    """Summarize step results as a table, one line per step"""
+    lines = []
+    for index, (step, result) in enumerate(zip(steps, results)):
+        exit_code = '-' if result.exit_code is None else result.exit_code
+        lines.append('Step #{:<3} {:<24} {:<9} exit {:<4} {:>9.2f}s {:>10} '
+                     'bytes{}'.format(index, step.id_ or '-', result.status,
+                                      exit_code, result.elapsed,
+                                      result.output_bytes,
+                                      ' (cached)' if result.cached else ''))
+    return '\n'.join(lines)
+
+
+def _stage_host(source_dir, workspace, link_mode, cleanup_command, host,
+                cleanup_container, ignore):
+    """Stage the workspace of one host, see run_build"""
+    try:
+        return stage_workspace(source_dir, workspace, link_mode, ignore)
+    except PermissionError:
+        if not workspace:
+            raise
+        # Outputs of an earlier build that are owned by root
+        empty_workspace(workspace, cleanup_command, host.client,
+                        cleanup_container, host.env)
+        return stage_workspace(source_dir, workspace, link_mode, ignore)
+
+
+def run_build(steps, cleanup_command, jobs, timeout=0, source_dir='.',
+              workspace='', link_mode=workspace_sync.LINK_MODE_AUTO,
+              cache=None, trace=None, client=None, cleanup_container=None,
+              pull_jobs=PULL_JOBS, hosts=None, observer=None, out=None,
+              err=None):
+    """Stage a workspace, run all steps, and clean up.
+
+    The images of all steps are pulled concurrently, while the
+    workspace is staged and earlier steps run, so each step only waits
+    for its own image.  Files matched by the `.gcloudignore` or
+    `.dockerignore` of `source_dir` are not staged, see ignore_rules.
+
+    Args:
+        steps ([ExecutableStep]): Steps to run
+        cleanup_command ([str]): Shell tokens that empty the workspace
+        jobs (int): Maximum number of steps to run at the same time
+        timeout (float): Seconds allowed for the whole build, or 0 for
+                         no limit
+        source_dir (str): Directory to copy into the workspace
+        workspace (str): Persistent staging directory, kept after the
+                         build, or '' to use a temporary one
+        link_mode (str): How to copy files, see workspace_sync
+        cache (step_cache.StepCache): Cache of step outputs, or None
+        trace (build_trace.TraceRecorder): Records the phases of the
+                                           build, if given
+        client (docker_api.DockerClient): Run steps through the Engine
+                                          API instead of the docker CLI
+        cleanup_container (docker_api.ContainerSpec): Container that
+            empties the workspace, required with `client`
+        pull_jobs (int): Maximum number of images to pull at once
+        hosts ([DockerHost]): Docker daemons to spread steps across,
+            instead of `client`, see run_steps.  Each gets a staging
+            directory of its own.  A persistent `workspace` is used for
+            the first, which ends up with the outputs of all steps, and
+            `workspace` with a suffix for the others.
+        observer (callable): Sees the output of each step, see run_steps
+        out (file): Stream for progress and step stdout
+        err (file): Stream for step stderr
+
+    Returns:
+        [StepResult]: Result of each step, in the same order as `steps`
+    """
+    out = out or sys.stdout
+    trace = trace or build_trace.TraceRecorder()
+    persistent = bool(workspace)
+    hosts = hosts or [DockerHost(client=client, env=dict(os.environ))]
+    workspaces = [workspace] + [
+        '{}.{}'.format(workspace, index) if persistent else ''
+        for index in range(1, len(hosts))]
+    # With several hosts, each pulls images when its steps need them
+    images = distinct_images(steps) if len(hosts) == 1 else []
+    pool = concurrent.futures.ThreadPoolExecutor(max_workers=pull_jobs)
+    pulls = {}
+    staged = []
+    try:
+        pulls = start_pulls(pool, images, hosts[0].client, trace,
+                            hosts[0].env)
+        with trace.phase('stage'):
+            ignore = ignore_rules.load(source_dir)
+            for host, host_workspace in zip(hosts, workspaces):
+                host_workspace, stats = _stage_host(
+                    source_dir, host_workspace, link_mode, cleanup_command,
+                    host, cleanup_container, ignore)
+                staged.append(host._replace(
+                    env=dict(host.env, HOST_WORKSPACE=host_workspace)))
+                print('Copied source to staging directory {}: {}'.format(
+                    host_workspace, workspace_sync.format_stats(stats)),
+                    file=out)
+            if ignore is not None:
+                print(workspace_sync.format_savings(stats, ignore.source),
+                      file=out)
+        source_digest = ''
+        if cache:
+            with trace.phase('hash source'):
+                source_digest = cache.tree_digest(
+                    staged[0].env['HOST_WORKSPACE'], source_dir)
+        results = run_steps(steps, staged[0].env, jobs, timeout, cache,
+                            source_digest, trace, staged[0].client, pulls,
+                            hosts=staged if len(hosts) > 1 else None,
+                            observer=observer, out=out, err=err)
+    finally:
+        try:
+            if not persistent:
+                with trace.phase('cleanup'):
+                    for host in staged:
+                        host_workspace = host.env['HOST_WORKSPACE']
+                        empty_workspace(host_workspace, cleanup_command,
+                                        host.client, cleanup_container,
+                                        host.env)
+                        try:
+                            os.rmdir(host_workspace)
+                        except OSError as e:
+                            print('Could not remove {}: {}'.format(
+                                host_workspace, e), file=out)
+        finally:
+            # Pulls for steps that never started are not waited for
+            for future in pulls.values():
+                future.cancel()
+            pool.shutdown()
+    print(format_results(steps, results), file=out)
+    pull_results = [pulls[image].result() for image in images
+                    if not pulls[image].cancelled()]
+    if pull_results:
+        print(format_pulls(pull_results), file=out)
+    if cache:
+        print(cache.format_stats(), file=out)
+    return results
+
+
+def watch_build(steps, first_affected, watcher, cleanup_command, jobs,
+                source_dir='.', workspace='',
+                link_mode=workspace_sync.LINK_MODE_AUTO, client=None,
+                cleanup_container=None,
+                debounce=source_watch.DEFAULT_DEBOUNCE, out=None, err=None):
+    """Run all steps, then run them again whenever the source changes.
+
+    The workspace is staged once and kept.  After each change, only
+    the changed files are copied into it, and the build is re-run from
+    the first step affected by them, or from the first step that didn't
+    succeed if that comes earlier.  Steps before that are not run again
+    and keep their earlier results.  Changes to files that are left
+    out by ignore rules, see ignore_rules, are not acted on.  Returns on
+    KeyboardInterrupt.
+
+    Args:
+        steps ([ExecutableStep]): Steps to run
+        first_affected (callable): Takes the changed paths, relative to
+            `source_dir`, and returns the index of the first step that
+            uses one of them, or None
+        watcher (source_watch.PollingWatcher): Watches `source_dir`
+        cleanup_command ([str]): Shell tokens that empty the workspace
+        jobs (int): Maximum number of steps to run at the same time
+        source_dir (str): Directory to copy into the workspace
+        workspace (str): Persistent staging directory, kept afterwards,
+                         or '' to use a temporary one
+        link_mode (str): How to copy files, see workspace_sync
+        client (docker_api.DockerClient): Run steps through the Engine
+                                          API instead of the docker CLI
+        cleanup_container (docker_api.ContainerSpec): Container that
+            empties the workspace, required with `client`
+        debounce (float): Seconds the source must stay unchanged before
+                          a cycle starts
+        out (file): Stream for progress and step stdout
+        err (file): Stream for step stderr
+
+    Returns:
+        [StepResult]: Result of each step in the last cycle
+    """
+    out = out or sys.stdout
+    persistent = bool(workspace)
+    results = []
+    ignore = ignore_rules.load(source_dir)
+    try:
+        start = time.monotonic()
+        workspace, stats = stage_workspace(source_dir, workspace, link_mode,
+                                           ignore)
+        print('Copied source to staging directory {}: {}'.format(
+            workspace, workspace_sync.format_stats(stats)), file=out)
+        if ignore is not None:
+            print(workspace_sync.format_savings(stats, ignore.source),
+                  file=out)
+        env = dict(os.environ, HOST_WORKSPACE=workspace)
+        results = run_steps(steps, env, jobs, client=client, out=out,
+                            err=err)
+        print(format_results(steps, results), file=out)
+        print('Cycle took {:.2f}s'.format(time.monotonic() - start),
+              file=out)
+        while True:
+            print('Watching {} for changes'.format(
+                os.path.abspath(source_dir)), file=out)
+            changed = watcher.wait_for_changes(debounce)
+            if ignore is not None:
+                changed = [path for path in changed
+                           if not ignore.is_ignored(path)]
+                if not changed:
+                    continue
+            start = time.monotonic()
+            stats = workspace_sync.sync_paths(
+                source_dir, workspace, changed, link_mode)
+            first = first_affected(changed)
+            failed = [index for index, result in enumerate(results)
+                      if result.status != STATUS_SUCCESS]
+            if failed and (first is None or failed[0] < first):
+                first = failed[0]
+            if first is None:
+                print('{} files changed, no step uses them'.format(
+                    len(changed)), file=out)
+                continue
+            print('{} files changed ({}), re-running from Step #{}'.format(
+                len(changed), workspace_sync.format_stats(stats), first),
+                file=out)
+            previous = {index: result for index, result in
+                        enumerate(results) if index < first}
+            results = run_steps(steps, env, jobs, client=client,
+                                previous=previous, out=out, err=err)
+            print(format_results(steps, results), file=out)
+            print('Cycle took {:.2f}s: {} of {} steps run'.format(
+                time.monotonic() - start, len(steps) - first, len(steps)),
+                file=out)
+    except KeyboardInterrupt:
+        print('Stopped watching', file=out)
+    finally:
+        watcher.close()
+        if not persistent and workspace:
+            empty_workspace(workspace, cleanup_command, client,
+                            cleanup_container)
+            try:
+                os.rmdir(workspace)
+            except OSError as e:
+                print('Could not remove {}: {}'.format(workspace, e),
+                      file=out)
+    return results
@@ -0,0 +1,665 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit test for step_executor.py"""
+
+import contextlib
+import io
+import os
+import re
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+import docker_api
+import ignore_rules
+import step_executor
+
+
+@pytest.fixture
+def testdata_dir():
+    testdata_dir = os.path.join(os.path.dirname(__file__), 'testdata')
+    assert os.path.isdir(testdata_dir), (
+        'Could not run test: testdata directory not found')
+    return testdata_dir
+
+
+@pytest.fixture
+def fake_docker(testdata_dir, monkeypatch):
+    """Put a stand-in for the docker CLI first on $PATH"""
+    fake_docker_dir = os.path.join(testdata_dir, 'fake_docker')
+    monkeypatch.setenv(
+        'PATH', fake_docker_dir + os.pathsep + os.environ['PATH'])
+    return fake_docker_dir
+
+
+@contextlib.contextmanager
+def _fake_daemon(testdata_dir):
+    """Start a stand-in Docker daemon, yielding a client"""
+    # Unix socket paths are limited to about 100 characters
+    socket_dir = tempfile.mkdtemp(prefix='dockerd_')
+    socket_path = os.path.join(socket_dir, 'docker.sock')
+    server = subprocess.Popen([
+        sys.executable, os.path.join(testdata_dir, 'fake_docker', 'dockerd'),
+        socket_path])
+    try:
+        for _ in range(500):
+            if os.path.exists(socket_path):
+                break
+            time.sleep(0.01)
+        client = docker_api.DockerClient(socket_path)
+        yield client
+        client.close()
+    finally:
+        server.terminate()
+        server.wait()
+        shutil.rmtree(socket_dir)
+
+
+@pytest.fixture
+def docker_client(testdata_dir):
+    """Client of a stand-in Docker daemon"""
+    with _fake_daemon(testdata_dir) as client:
+        yield client
+
+
+def _step(script, dependencies=(), id_='', timeout=0):
+    """Step that runs a shell script in the workspace"""
+    return step_executor.ExecutableStep(
+        command=[
+            'docker', 'run',
+            '--volume', '${HOST_WORKSPACE}:/workspace',
+            '--workdir', '/workspace',
+            'debian', '/bin/sh', '-c', shlex.quote(script),
+        ],
+        container=docker_api.ContainerSpec(
+            args=['/bin/sh', '-c', script],
+            env=[],
+            image='debian',
+            volumes=['${HOST_WORKSPACE}:/workspace'],
+            workdir='/workspace',
+        ),
+        dependencies=list(dependencies),
+        id_=id_,
+        image='debian',
+        timeout=timeout,
+    )
+
+
+_CLEANUP_COMMAND = [
+    'docker', 'run',
+    '--volume', '${HOST_WORKSPACE}:/workspace',
+    '--workdir', '/workspace',
+    'debian', 'rm', '-rf', '/workspace',
+]
+
+_CLEANUP_CONTAINER = docker_api.ContainerSpec(
+    args=['rm', '-rf', '/workspace'],
+    env=[],
+    image='debian',
+    volumes=['${HOST_WORKSPACE}:/workspace'],
+    workdir='/workspace',
+)
+
+
+def _statuses(results):
+    return [result.status for result in results]
+
+
+def test_stage_workspace(tmpdir):
+    tmpdir.join('file.txt').write('contents')
+    tmpdir.mkdir('subdir').join('nested.txt').write('nested')
+    tmpdir.mkdir('.git').join('HEAD').write('ref')
+    workspace, stats = step_executor.stage_workspace(str(tmpdir))
+    try:
+        assert sorted(os.listdir(workspace)) == ['file.txt', 'subdir']
+        with open(os.path.join(workspace, 'subdir', 'nested.txt')) as f:
+            assert f.read() == 'nested'
+        assert stats.copied + stats.linked == 2
+    finally:
+        shutil.rmtree(workspace)
+
+
+def test_stage_workspace_persistent(tmpdir):
+    source_dir = tmpdir.mkdir('source')
+    source_dir.join('file.txt').write('contents')
+    persistent = str(tmpdir.join('workspace'))
+    workspace, stats = step_executor.stage_workspace(
+        str(source_dir), persistent)
+    assert workspace == persistent
+    workspace, stats = step_executor.stage_workspace(
+        str(source_dir), persistent)
+    assert stats.unchanged == 1
+
+
+def test_stage_workspace_ignore(tmpdir):
+    source_dir = tmpdir.mkdir('source')
+    source_dir.join('file.txt').write('contents')
+    source_dir.join('.gcloudignore').write('*.txt\n')
+    ignore = ignore_rules.load(str(source_dir))
+    workspace, stats = step_executor.stage_workspace(
+        str(source_dir), str(tmpdir.join('workspace')), ignore=ignore)
+    assert os.listdir(workspace) == ['.gcloudignore']
+    assert stats.ignored == 1
+
+
+def test_empty_workspace(tmpdir):
+    tmpdir.mkdir('subdir').join('file.txt').write('contents')
+    tmpdir.join('.hidden').write('contents')
+    step_executor.empty_workspace(str(tmpdir), _CLEANUP_COMMAND)
+    assert tmpdir.listdir() == []
+
+
+def test_run_build_success(tmpdir, fake_docker):
+    tmpdir.join('input.txt').write('from source\n')
+    steps = [
+        _step('cat input.txt && echo to stderr >&2 && touch output.txt',
+              id_='first'),
+        _step('test -f output.txt', dependencies=[0]),
+    ]
+    out = io.StringIO()
+    err = io.StringIO()
+    results = step_executor.run_build(
+        steps, _CLEANUP_COMMAND, jobs=2, source_dir=str(tmpdir),
+        out=out, err=err)
+    assert _statuses(results) == ['SUCCESS', 'SUCCESS']
+    assert [result.exit_code for result in results] == [0, 0]
+    assert results[0].output_bytes == len('from source\nto stderr\n')
+    assert 'Step #0: from source\n' in out.getvalue()
+    assert 'Step #0: to stderr\n' in err.getvalue()
+    assert 'first' in out.getvalue()
+
+    # Workspace was removed
+    match = re.search('staging directory ([^:]+):', out.getvalue())
+    assert match
+    assert not os.path.exists(match.group(1))
+
+
+def test_run_steps_failure_cancels_dependents(tmpdir, fake_docker):
+    steps = [
+        _step('exit 3'),
+        _step('echo should not run', dependencies=[0]),
+        _step('echo should not run either', dependencies=[1]),
+        _step('echo independent'),
+    ]
+    out = io.StringIO()
+    results = step_executor.run_steps(
+        steps, dict(os.environ, HOST_WORKSPACE=str(tmpdir)), jobs=2,
+        out=out, err=io.StringIO())
+    assert _statuses(results) == [
+        'FAILURE', 'CANCELLED', 'CANCELLED', 'SUCCESS']
+    assert results[0].exit_code == 3
+    assert results[1].exit_code is None
+    assert 'should not run' not in out.getvalue()
+    assert 'Step #3: independent' in out.getvalue()
+
+
+def test_run_steps_start_outside_lock(tmpdir, fake_docker, monkeypatch):
+    """Slow container starts of parallel steps overlap"""
+    start_process = step_executor._Build.start_process
+
+    def slow_start_process(self, step, host):
+        time.sleep(0.5)
+        return start_process(self, step, host)
+
+    monkeypatch.setattr(step_executor._Build, 'start_process',
+                        slow_start_process)
+    start = time.monotonic()
+    results = step_executor.run_steps(
+        [_step('true'), _step('true')],
+        dict(os.environ, HOST_WORKSPACE=str(tmpdir)), jobs=2,
+        out=io.StringIO(), err=io.StringIO())
+    assert _statuses(results) == ['SUCCESS', 'SUCCESS']
+    assert time.monotonic() - start < 1.0
+
+
+def test_run_steps_cancel_while_starting(tmpdir, fake_docker, monkeypatch):
+    """A step started while the build was cancelled is stopped"""
+    start_process = step_executor._Build.start_process
+
+    def cancelling_start_process(self, step, host):
+        process = start_process(self, step, host)
+        self.cancel()
+        return process
+
+    monkeypatch.setattr(step_executor._Build, 'start_process',
+                        cancelling_start_process)
+    start = time.monotonic()
+    results = step_executor.run_steps(
+        [_step('sleep 10')], dict(os.environ, HOST_WORKSPACE=str(tmpdir)),
+        jobs=1, out=io.StringIO(), err=io.StringIO())
+    assert _statuses(results) == ['CANCELLED']
+    assert time.monotonic() - start < 5
+
+
+def test_run_steps_observer(tmpdir, fake_docker):
+    seen = []
+    steps = [_step('echo out && echo err >&2'), _step('echo second')]
+    step_executor.run_steps(
+        steps, dict(os.environ, HOST_WORKSPACE=str(tmpdir)), jobs=1,
+        observer=lambda index, line: seen.append((index, line)),
+        out=io.StringIO(), err=io.StringIO())
+    assert sorted(seen) == [(0, b'err\n'), (0, b'out\n'), (1, b'second\n')]
+
+
+def test_run_helper(tmpdir, fake_docker):
+    command = ['docker', 'run', '--volume', '${HOST_WORKSPACE}:/workspace',
+               '--workdir', '/workspace', 'debian', '/bin/sh', '-c',
+               shlex.quote('exit 4')]
+    assert step_executor.run_helper(command, str(tmpdir)) == 4
+
+
+def test_run_steps_concurrent(tmpdir, fake_docker):
+    steps = [
+        # Only succeeds if the next step runs at the same time
+        _step('for i in $(seq 100); do test -f flag && exit 0; '
+              'sleep 0.1; done; exit 1'),
+        _step('touch flag'),
+    ]
+    results = step_executor.run_steps(
+        steps, dict(os.environ, HOST_WORKSPACE=str(tmpdir)), jobs=2,
+        out=io.StringIO(), err=io.StringIO())
+    assert _statuses(results) == ['SUCCESS', 'SUCCESS']
+
+
+def test_run_steps_step_timeout(tmpdir, fake_docker):
+    steps = [
+        _step('sleep 30', timeout=0.5),
+        _step('echo after', dependencies=[0]),
+    ]
+    results = step_executor.run_steps(
+        steps, dict(os.environ, HOST_WORKSPACE=str(tmpdir)), jobs=1,
+        out=io.StringIO(), err=io.StringIO())
+    assert _statuses(results) == ['TIMEOUT', 'CANCELLED']
+    assert results[0].elapsed < 10
+
+
+def test_run_steps_build_timeout(tmpdir, fake_docker):
+    steps = [
+        _step('sleep 30'),
+        _step('echo after'),
+    ]
+    results = step_executor.run_steps(
+        steps, dict(os.environ, HOST_WORKSPACE=str(tmpdir)), jobs=1,
+        timeout=0.5, out=io.StringIO(), err=io.StringIO())
+    assert _statuses(results) == ['TIMEOUT', 'CANCELLED']
+
+
+def test_run_steps_long_lines(tmpdir, fake_docker, monkeypatch):
+    monkeypatch.setattr(step_executor, 'MAX_LINE_BYTES', 4)
+    out = io.StringIO()
+    results = step_executor.run_steps(
+        [_step('echo abcdefgh')],
+        dict(os.environ, HOST_WORKSPACE=str(tmpdir)), jobs=1,
+        out=out, err=io.StringIO())
+    assert results[0].output_bytes == 9
+    assert 'Step #0: abcd\nStep #0: efgh\n' in out.getvalue()
+
+
+def test_run_build_api(tmpdir, docker_client):
+    tmpdir.join('input.txt').write('from source\n')
+    steps = [
+        _step('cat input.txt && echo to stderr >&2 && touch output.txt',
+              id_='first'),
+        _step('test -f output.txt', dependencies=[0]),
+        _step('exit 3', dependencies=[1]),
+    ]
+    out = io.StringIO()
+    err = io.StringIO()
+    results = step_executor.run_build(
+        steps, _CLEANUP_COMMAND, jobs=2, source_dir=str(tmpdir),
+        client=docker_client, cleanup_container=_CLEANUP_CONTAINER,
+        out=out, err=err)
+    assert _statuses(results) == ['SUCCESS', 'SUCCESS', 'FAILURE']
+    assert [result.exit_code for result in results] == [0, 0, 3]
+    assert results[0].output_bytes == len('from source\nto stderr\n')
+    assert 'Step #0: from source\n' in out.getvalue()
+    assert 'Step #0: to stderr\n' in err.getvalue()
+    # Short requests share a single connection, each attach needs one
+    assert docker_client.request('GET', '/fake/connections') == 4
+
+
+def test_run_steps_api_timeout(tmpdir, docker_client):
+    steps = [
+        _step('sleep 30', timeout=0.5),
+        _step('echo after', dependencies=[0]),
+    ]
+    results = step_executor.run_steps(
+        steps, dict(os.environ, HOST_WORKSPACE=str(tmpdir)), jobs=1,
+        client=docker_client, out=io.StringIO(), err=io.StringIO())
+    assert _statuses(results) == ['TIMEOUT', 'CANCELLED']
+    assert results[0].elapsed < 10
+
+
+def test_run_steps_api_missing_image(tmpdir, docker_client):
+    step = _step('true')
+    step = step._replace(
+        container=step.container._replace(image='missing'), image='missing')
+    err = io.StringIO()
+    results = step_executor.run_steps(
+        [step], dict(os.environ, HOST_WORKSPACE=str(tmpdir)), jobs=1,
+        client=docker_client, out=io.StringIO(), err=err)
+    assert _statuses(results) == ['FAILURE']
+    assert results[0].exit_code == docker_api.DAEMON_ERROR_EXIT_CODE
+    assert 'No such image' in err.getvalue()
+
+
+def test_run_build_step_cache(tmpdir, fake_docker):
+    source_dir = tmpdir.mkdir('source')
+    source_dir.join('input.txt').write('input')
+    cache = step_executor.step_cache.StepCache(
+        str(tmpdir.join('cache')), max_size=2**20, cacheable=['debian'])
+    steps = [
+        _step('cp input.txt output.txt && echo ran first', id_='first'),
+        _step('test -f output.txt && echo ran second', dependencies=[0]),
+    ]
+
+    def build():
+        out = io.StringIO()
+        results = step_executor.run_build(
+            steps, _CLEANUP_COMMAND, jobs=1, source_dir=str(source_dir),
+            workspace=str(tmpdir.join('workspace')), cache=cache, out=out,
+            err=io.StringIO())
+        assert _statuses(results) == ['SUCCESS', 'SUCCESS']
+        return [result.cached for result in results], out.getvalue()
+
+    assert build()[0] == [False, False]
+    assert (cache.hits, cache.misses) == (0, 2)
+
+    # Outputs of the first step are restored, the second step sees them
+    cached, output = build()
+    assert cached == [True, True]
+    assert 'ran first' not in output
+    assert tmpdir.join('workspace', 'output.txt').read() == 'input'
+    assert 'Step cache: 2 hits' in output
+
+    # Changing the source invalidates both steps
+    source_dir.join('input.txt').write('changed')
+    assert build()[0] == [False, False]
+
+
+def test_run_build_step_cache_uncacheable(tmpdir, fake_docker):
+    """Steps not marked cacheable, and the steps after them, always run"""
+    source_dir = tmpdir.mkdir('source')
+    cache = step_executor.step_cache.StepCache(
+        str(tmpdir.join('cache')), max_size=2**20,
+        cacheable=['second', 'independent'])
+    steps = [
+        _step('echo ran build', id_='build'),
+        _step('echo ran second', dependencies=[0], id_='second'),
+        _step('echo ran independent', id_='independent'),
+    ]
+
+    def build():
+        results = step_executor.run_build(
+            steps, _CLEANUP_COMMAND, jobs=1, source_dir=str(source_dir),
+            workspace=str(tmpdir.join('workspace')), cache=cache,
+            out=io.StringIO(), err=io.StringIO())
+        assert _statuses(results) == ['SUCCESS'] * 3
+        return [result.cached for result in results]
+
+    assert build() == [False, False, False]
+    assert build() == [False, False, True]
+    assert cache.uncacheable == 2
+
+
+def test_run_steps_step_cache_overlap(tmpdir, fake_docker):
+    """Outputs of steps that ran in parallel are not stored"""
+    cache = step_executor.step_cache.StepCache(
+        str(tmpdir.join('cache')), max_size=2**20, cacheable=['debian'])
+    workspace = tmpdir.mkdir('workspace')
+    steps = [
+        _step('sleep 0.5 && touch first'),
+        _step('sleep 0.5 && touch second'),
+    ]
+    results = step_executor.run_steps(
+        steps, dict(os.environ, HOST_WORKSPACE=str(workspace)), jobs=2,
+        cache=cache, out=io.StringIO(), err=io.StringIO())
+    assert _statuses(results) == ['SUCCESS', 'SUCCESS']
+    assert cache.skipped == 2
+
+
+def test_pull_images_concurrent(monkeypatch):
+    lock = threading.Lock()
+    running = []
+    most_running = []
+
+    def pull_image(image, client=None, env=None):
+        with lock:
+            running.append(image)
+            most_running.append(len(running))
+        time.sleep(0.2)
+        with lock:
+            running.remove(image)
+        return step_executor.PullResult(
+            elapsed=0.2, image=image, image_id='sha256:' + image,
+            pulled=True)
+
+    monkeypatch.setattr(step_executor, 'pull_image', pull_image)
+    images = ['a', 'b', 'c', 'd', 'e']
+    results = step_executor.pull_images(images, jobs=3)
+    assert [result.image for result in results] == images
+    assert max(most_running) == 3
+
+
+def test_pull_images_api(docker_client):
+    results = step_executor.pull_images(
+        ['debian', 'missing'], client=docker_client)
+    assert [result.pulled for result in results] == [False, True]
+    assert results[0].image_id.startswith('sha256:')
+    assert results[1].image_id == ''
+    lines = step_executor.format_pulls(results).splitlines()
+    assert lines[0].split() == ['Image', 'debian', 'present',
+                                '{:.2f}s'.format(results[0].elapsed)]
+    assert lines[1].endswith('(not found)')
+
+
+def test_distinct_images():
+    steps = [_step('true'), _step('true')._replace(image='other'),
+             _step('true'), _step('true')._replace(image='')]
+    assert step_executor.distinct_images(steps) == ['debian', 'other']
+
+
+def test_run_build_reports_pulls(tmpdir, docker_client):
+    out = io.StringIO()
+    step_executor.run_build(
+        [_step('true'), _step('true')], _CLEANUP_COMMAND, jobs=2,
+        source_dir=str(tmpdir), client=docker_client,
+        cleanup_container=_CLEANUP_CONTAINER, out=out, err=io.StringIO())
+    assert len(re.findall('Image debian +present', out.getvalue())) == 1
+
+
+class _ScriptedWatcher(object):
+    """Reports changes made by callbacks, then stops watching"""
+
+    def __init__(self, changes):
+        self.changes = list(changes)
+        self.closed = False
+
+    def wait_for_changes(self, debounce):
+        if not self.changes:
+            raise KeyboardInterrupt()
+        return self.changes.pop(0)()
+
+    def close(self):
+        self.closed = True
+
+
+def test_watch_build(tmpdir, fake_docker):
+    source_dir = tmpdir.mkdir('source')
+    source_dir.join('a.txt').write('a1')
+    source_dir.join('b.txt').write('b1')
+    log = tmpdir.join('log.txt')
+    steps = [
+        _step('cat a.txt >> {}'.format(log)),
+        _step('cat b.txt >> {} && touch output'.format(log),
+              dependencies=[0]),
+        _step('test -f output && echo c >> {}'.format(log),
+              dependencies=[1]),
+    ]
+
+    def first_affected(paths):
+        return {'a.txt': 0, 'b.txt': 1}.get(paths[0])
+
+    def change(name, contents):
+        source_dir.join(name).write(contents)
+        return [name]
+
+    watcher = _ScriptedWatcher([
+        lambda: change('b.txt', 'b2'),
+        lambda: change('other.txt', 'unused'),
+        lambda: change('a.txt', 'a2'),
+    ])
+    workspace = str(tmpdir.join('workspace'))
+    out = io.StringIO()
+    results = step_executor.watch_build(
+        steps, first_affected, watcher, _CLEANUP_COMMAND, jobs=1,
+        source_dir=str(source_dir), workspace=workspace, out=out,
+        err=io.StringIO())
+    assert _statuses(results) == ['SUCCESS', 'SUCCESS', 'SUCCESS']
+    # Only the steps from the first affected one on ran again, and the
+    # outputs of earlier steps were kept
+    assert log.read() == 'a1b1c\nb2c\na2b2c\n'
+    assert 're-running from Step #1' in out.getvalue()
+    assert '1 files changed, no step uses them' in out.getvalue()
+    assert 'Cycle took' in out.getvalue()
+    assert watcher.closed
+    # A persistent workspace is kept
+    assert os.path.exists(os.path.join(workspace, 'output'))
+
+
+def test_watch_build_reruns_failed_steps(tmpdir, fake_docker):
+    source_dir = tmpdir.mkdir('source')
+    source_dir.join('a.txt').write('fail')
+    steps = [
+        _step('test "$(cat a.txt)" = ok'),
+        _step('true', dependencies=[0]),
+    ]
+
+    def fix():
+        source_dir.join('a.txt').write('ok')
+        return ['a.txt']
+
+    out = io.StringIO()
+    results = step_executor.watch_build(
+        steps, lambda paths: None, _ScriptedWatcher([fix]),
+        _CLEANUP_COMMAND, jobs=1, source_dir=str(source_dir), out=out,
+        err=io.StringIO())
+    assert _statuses(results) == ['SUCCESS', 'SUCCESS']
+    assert 're-running from Step #0' in out.getvalue()
+    # The temporary workspace was removed
+    match = re.search('staging directory ([^:]+):', out.getvalue())
+    assert not os.path.exists(match.group(1))
+
+
+@pytest.mark.parametrize('loads, preferred, backlogs, expected', [
+    ([0, 0, 0], None, [0, 0, 0], 0),
+    ([1, 0, 0], None, [0, 0, 0], 1),
+    # Equally loaded hosts: same dir first, then least to copy
+    ([1, 1, 0], 0, [0, 0, 0], 2),
+    ([0, 0, 0], 2, [0, 0, 0], 2),
+    ([0, 0, 0], None, [5, 1, 3], 1),
+    ([0, 0, 0], 2, [5, 1, 3], 2),
+])
+def test_place_step(loads, preferred, backlogs, expected):
+    assert step_executor.place_step(loads, preferred, backlogs) == expected
+
+
+def _check_several_hosts(tmpdir, hosts):
+    steps = [
+        _step('pwd > host_a && echo a > a.txt'),
+        _step('pwd > host_b && echo b > b.txt'),
+        _step('cat a.txt b.txt && rm a.txt', dependencies=[0, 1]),
+        _step('test ! -f a.txt && cat b.txt', dependencies=[2]),
+    ]
+    source_dir = tmpdir.mkdir('source')
+    source_dir.join('input.txt').write('input')
+    workspace = tmpdir.join('workspace')
+    out = io.StringIO()
+    results = step_executor.run_build(
+        steps, _CLEANUP_COMMAND, jobs=2, source_dir=str(source_dir),
+        workspace=str(workspace), hosts=hosts, out=out, err=io.StringIO())
+    assert _statuses(results) == ['SUCCESS'] * 4
+    # The first two steps ran at the same time on different hosts, and
+    # the later steps saw the outputs and deletions of both
+    assert 'Step #2: a\nStep #2: b\n' in out.getvalue()
+    assert 'Step #3: b\n' in out.getvalue()
+    # The first host's workspace has the outputs of every step
+    assert sorted(workspace.listdir()) == sorted(
+        workspace.join(name) for name in
+        ['b.txt', 'host_a', 'host_b', 'input.txt'])
+    assert workspace.join('host_a').read() != workspace.join(
+        'host_b').read()
+    assert tmpdir.join('workspace.1').check(dir=True)
+    return out.getvalue()
+
+
+def test_run_build_several_hosts(tmpdir, fake_docker):
+    hosts = [
+        step_executor.DockerHost(client=None, env=dict(
+            os.environ, DOCKER_HOST='unix:///tmp/{}.sock'.format(name)))
+        for name in ['first', 'second']]
+    out = _check_several_hosts(tmpdir, hosts)
+    assert 'Step #0 on unix:///tmp/first.sock' in out
+    assert 'Step #1 on unix:///tmp/second.sock' in out
+
+
+def test_run_build_several_hosts_api(tmpdir, testdata_dir):
+    with _fake_daemon(testdata_dir) as first, _fake_daemon(
+            testdata_dir) as second:
+        hosts = [step_executor.DockerHost(client=client, env={})
+                 for client in [first, second]]
+        _check_several_hosts(tmpdir, hosts)
+
+
+def test_run_steps_several_hosts_no_cache(tmpdir):
+    hosts = [step_executor.DockerHost(client=None, env={})] * 2
+    with pytest.raises(ValueError):
+        step_executor.run_steps(
+            [_step('true')], {}, jobs=1, cache=object(), hosts=hosts)
+
+
+def test_format_results():
+    steps = [_step('true', id_='anid'), _step('false')]
+    results = [
+        step_executor.StepResult(
+            cached=False, elapsed=1.5, exit_code=0, output_bytes=10,
+            status='SUCCESS'),
+        step_executor.StepResult(
+            cached=False, elapsed=0.0, exit_code=None, output_bytes=0,
+            status='CANCELLED'),
+        step_executor.StepResult(
+            cached=True, elapsed=0.1, exit_code=0, output_bytes=0,
+            status='SUCCESS'),
+    ]
+    steps.append(_step('true'))
+    lines = step_executor.format_results(steps, results).splitlines()
+    assert len(lines) == 3
+    assert lines[0].split() == [
+        'Step', '#0', 'anid', 'SUCCESS', 'exit', '0', '1.50s', '10', 'bytes']
+    assert lines[1].split() == [
+        'Step', '#1', '-', 'CANCELLED', 'exit', '-', '0.00s', '0', 'bytes']
+    assert lines[2].endswith('(cached)')
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
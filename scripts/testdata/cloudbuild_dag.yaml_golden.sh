@@ -0,0 +1,145 @@
+#!/bin/bash
+# This is a generated file.  Do not edit.
+
+set -euo pipefail
+
+SOURCE_DIR=.
+
+# Setup staging directory
+HOST_WORKSPACE=$(mktemp -d -t local_cloudbuild_XXXXXXXXXX)
+function cleanup {
+    if [ "${HOST_WORKSPACE}" != '/' -a -d "${HOST_WORKSPACE}" ]; then
+        # Expect a single error message about /workspace busy
+        docker run --volume /var/run/docker.sock:/var/run/docker.sock --volume /root/.docker:/root/.docker --volume ${HOST_WORKSPACE}:/workspace --workdir /workspace gcr.io/google-appengine/debian8 rm -rf /workspace 2>/dev/null || true
+        # Do not expect error messages here.  Display but ignore.
+        rmdir "${HOST_WORKSPACE}" || true
+    fi
+}
+trap cleanup EXIT
+
+# Copy source to staging directory
+echo "Copying source to staging directory ${HOST_WORKSPACE}"
+rsync -avzq --exclude=.git "${SOURCE_DIR}" "${HOST_WORKSPACE}"
+
+# Build commands
+# Steps run concurrently where their waitFor fields allow
+function step_0 {
+    docker run --volume /var/run/docker.sock:/var/run/docker.sock --volume /root/.docker:/root/.docker --volume ${HOST_WORKSPACE}:/workspace --workdir /workspace debian /bin/sh -c 'touch first'
+}
+
+function step_1 {
+    docker run --volume /var/run/docker.sock:/var/run/docker.sock --volume /root/.docker:/root/.docker --volume ${HOST_WORKSPACE}:/workspace --workdir /workspace debian /bin/sh -c 'test -f first && touch second'
+}
+
+function step_2 {
+    docker run --volume /var/run/docker.sock:/var/run/docker.sock --volume /root/.docker:/root/.docker --volume ${HOST_WORKSPACE}:/workspace --workdir /workspace debian /bin/sh -c 'test -f first && touch third'
+}
+
+function step_3 {
+    docker run --volume /var/run/docker.sock:/var/run/docker.sock --volume /root/.docker:/root/.docker --volume ${HOST_WORKSPACE}:/workspace --workdir /workspace debian /bin/sh -c 'test -f second -a -f third'
+}
+
+function step_4 {
+    docker run --volume /var/run/docker.sock:/var/run/docker.sock --volume /root/.docker:/root/.docker --volume ${HOST_WORKSPACE}:/workspace --workdir /workspace debian /bin/sh -c 'echo "Started immediately"'
+}
+
+
+# Stop running steps and remove bookkeeping on exit
+function kill_tree {
+    local child
+    for child in $(pgrep -P "$1" || true); do
+        kill_tree "${child}"
+    done
+    kill "$1" 2>/dev/null || true
+}
+function cancel_steps {
+    local pid
+    for pid in $(jobs -pr); do
+        kill_tree "${pid}"
+    done
+    wait 2>/dev/null || true
+    rm -rf "${STATUS_DIR}"
+}
+STATUS_DIR=$(mktemp -d -t local_cloudbuild_status_XXXXXXXXXX)
+trap 'cancel_steps; cleanup' EXIT
+
+# Indices of the steps that each step waits for
+STEP_DEPS=(
+    ''
+    '0'
+    '0'
+    '1 2'
+    ''
+)
+MAX_JOBS=4
+
+STATE=()
+for i in "${!STEP_DEPS[@]}"; do
+    STATE[$i]=pending
+done
+RUNNING=0
+FAILED=0
+while true; do
+    # Collect finished steps
+    for i in "${!STEP_DEPS[@]}"; do
+        if [ "${STATE[$i]}" = running -a -f "${STATUS_DIR}/$i" ]; then
+            RUNNING=$((RUNNING - 1))
+            if [ "$(cat "${STATUS_DIR}/$i")" = 0 ]; then
+                STATE[$i]=ok
+                echo "Finished Step #$i"
+            else
+                STATE[$i]=failed
+                FAILED=1
+                echo "Step #$i failed"
+            fi
+        fi
+    done
+
+    # Cancel steps that depend on a failure, start steps that are ready
+    PENDING=0
+    for i in "${!STEP_DEPS[@]}"; do
+        if [ "${STATE[$i]}" != pending ]; then
+            continue
+        fi
+        READY=yes
+        for dep in ${STEP_DEPS[$i]}; do
+            case "${STATE[$dep]}" in
+                ok) ;;
+                failed|cancelled) READY=cancel; break ;;
+                *) READY=no ;;
+            esac
+        done
+        if [ "${READY}" = cancel ]; then
+            STATE[$i]=cancelled
+            echo "Cancelled Step #$i"
+        elif [ "${READY}" = yes -a "${RUNNING}" -lt "${MAX_JOBS}" ]; then
+            STATE[$i]=running
+            RUNNING=$((RUNNING + 1))
+            echo "Starting Step #$i"
+            (
+                set +e
+                step_$i 2>&1 |
+                    while IFS= read -r line || [ -n "${line}" ]; do
+                        echo "Step #$i: ${line}"
+                    done
+                echo "${PIPESTATUS[0]}" > "${STATUS_DIR}/$i.tmp"
+                mv "${STATUS_DIR}/$i.tmp" "${STATUS_DIR}/$i"
+            ) &
+        else
+            PENDING=$((PENDING + 1))
+        fi
+    done
+
+    if [ "${RUNNING}" -eq 0 -a "${PENDING}" -eq 0 ]; then
+        break
+    fi
+    sleep 0.2
+done
+
+if [ "${FAILED}" -ne 0 ]; then
+    echo "Build failed"
+    exit 1
+fi
+
+# End of build commands
+echo "Build completed successfully"
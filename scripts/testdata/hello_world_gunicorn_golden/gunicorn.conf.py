@@ -0,0 +1,27 @@
+# Generated by gen_dockerfile
+#
+# gunicorn settings for the resources of app.yaml: 2 CPUs and
+# 2 GB of memory.  Flags of the entrypoint and $GUNICORN_CMD_ARGS
+# take precedence over these.  To change them, use the gunicorn_* keys
+# of "runtime_config", or add your own gunicorn.conf.py, which is then
+# left alone.
+import os
+
+bind = ['0.0.0.0:' + os.environ.get('PORT', '8080')]
+
+# Workers use the CPUs, and their threads serve requests waiting on I/O
+workers = 5
+threads = 4
+
+# Import the application once, before forking workers, which then start
+# faster and share its memory until they change it.  Only with
+# gunicorn_preload_app, as gevent and eventlet workers must patch the
+# standard library before the application is imported.
+preload_app = False
+
+# Worker heartbeats go to memory, since writes to the container's disk
+# can block workers long enough for them to be killed
+worker_tmp_dir = '/dev/shm'
+
+# Keep idle connections open for longer than the load balancer does
+keepalive = 620
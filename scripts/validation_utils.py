@@ -17,6 +17,7 @@
 """Utilities for schema and command line validation"""
 
 import argparse
+import collections.abc
 import re
 
 
@@ -24,6 +25,10 @@ import re
 # --substitutions=PROJECT_ID=foo even though gcloud doesn't.
 KEY_VALUE_REGEX = re.compile(r'^([A-Z_][A-Z0-9_]*)=(.*)$')
 
+# Sizes like 512, 100K, 500M or 10G
+SIZE_REGEX = re.compile(r'^([0-9]+)([KMGT]?)$')
+SIZE_MULTIPLIERS = {'': 1, 'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+
 
 def get_field_value(container, field_name, field_type):
     """Fetch a field from a container with typechecking and default values.
@@ -64,14 +69,7 @@ def get_field_value(container, field_name, field_type):
         # list('some string') is a successful type cast as far as Python
         # is concerned, but doesn't exactly produce the results we want.
         # We have a whitelist of conversions we will attempt.
-        whitelist = (
-            (float, str),
-            (int, str),
-            (str, float),
-            (str, int),
-            (int, float),
-            )
-        if (type(value), field_type) not in whitelist:
+        if (type(value), field_type) not in CONVERSION_WHITELIST:
             raise ValueError(msg.format(field_name, field_type, type(value)))
 
     try:
@@ -82,6 +80,248 @@ def get_field_value(container, field_name, field_type):
     return value
 
 
+# Conversions get_field_value attempts when a value doesn't already
+# have the wanted type, as (found type, wanted type)
+CONVERSION_WHITELIST = (
+    (float, str),
+    (int, str),
+    (str, float),
+    (str, int),
+    (int, float),
+)
+
+
+class SchemaError(ValueError):
+    """Every problem found while validating a document against a schema.
+
+    `errors` lists each problem, starting with the path of its field.
+    """
+
+    def __init__(self, errors):
+        super().__init__('\n'.join(errors))
+        self.errors = errors
+
+
+def format_path(path):
+    """Return the text of a path built by the compiled validators.
+
+    Validators pass paths along as nested `(parent, key)` tuples, which
+    are only formatted once a problem is found.
+
+    Args:
+        path (str|tuple): Prefix, or a parent path and a field name or
+                          list index
+
+    Returns:
+        str: Path like `volumes[1].name`
+    """
+    if not isinstance(path, tuple):
+        return path
+    parent, key = path
+    parent = format_path(parent)
+    if isinstance(key, int):
+        return '{}[{}]'.format(parent, key)
+    return parent + '.' + key if parent else key
+
+
+class Scalar(object):
+    """Schema of a str, int or float field, converted like get_field_value
+
+    Args:
+        field_type (type): Expected type of the value
+        check (callable): Takes the converted value and returns a
+                          description of what is wrong with it, or None
+        default (Any): Value of a missing or null field, instead of
+                       `field_type()`
+    """
+
+    def __init__(self, field_type, check=None, default=None):
+        self.field_type = field_type
+        self.check = check
+        self.default = default
+
+    def compile(self):
+        field_type = self.field_type
+        check = self.check
+        default = field_type() if self.default is None else self.default
+        convertible = frozenset(found for found, wanted in
+                                CONVERSION_WHITELIST if wanted is field_type)
+        msg = 'Expected type "{}", but found type "{}"'
+
+        def validate(value, path, errors):
+            if value is None:
+                value = default
+            elif type(value) is not field_type:
+                if not isinstance(value, field_type) and (
+                        type(value) not in convertible):
+                    errors.append('{}: {}'.format(
+                        format_path(path), msg.format(field_type,
+                                                      type(value))))
+                    return field_type()
+                try:
+                    value = field_type(value)
+                except ValueError:
+                    errors.append('{}: {}'.format(
+                        format_path(path), msg.format(field_type,
+                                                      type(value))))
+                    return field_type()
+            # Missing values are checked too
+            if check is not None:
+                problem = check(value)
+                if problem:
+                    errors.append('{}: {}'.format(format_path(path), problem))
+            return value
+        return validate
+
+
+class ListOf(object):
+    """Schema of a list field, with a schema for its items
+
+    Args:
+        item (Scalar|ListOf|Record): Schema of each item
+        optional (bool): Return None instead of [] if the field is
+                         missing or null
+        check (callable): Takes the converted list and returns a
+                          description of what is wrong with it, or None
+    """
+
+    def __init__(self, item, optional=False, check=None):
+        self.item = item
+        self.optional = optional
+        self.check = check
+
+    def compile(self):
+        validate_item = self.item.compile()
+        optional = self.optional
+        check = self.check
+        # Plain scalars usually have the right type already, and are then
+        # copied as they are, without a call for each one
+        exact_type = None
+        if isinstance(self.item, Scalar) and self.item.check is None:
+            exact_type = self.item.field_type
+
+        def validate(value, path, errors):
+            if value is None:
+                return None if optional else []
+            if not isinstance(value, list):
+                errors.append(
+                    '{}: Expected type "{}", but found type "{}"'.format(
+                        format_path(path), list, type(value)))
+                return None if optional else []
+            if exact_type is not None and all(
+                    type(item) is exact_type for item in value):
+                items = list(value)
+            else:
+                items = [validate_item(item, (path, index), errors)
+                         for index, item in enumerate(value)]
+            if check is not None:
+                problem = check(items)
+                if problem:
+                    errors.append('{}: {}'.format(format_path(path), problem))
+            return items
+        return validate
+
+
+class Record(object):
+    """Schema of a mapping with known fields.  Other fields are ignored.
+
+    The validated record is a dict with every field of the schema.
+    Missing fields get the default of their type, like get_field_value.
+
+    Args:
+        fields (dict): Map of field name to its schema
+        check (callable): Takes the validated dict and returns a
+                          description of what is wrong with it, or None
+    """
+
+    def __init__(self, fields, check=None):
+        self.fields = fields
+        self.check = check
+
+    def compile(self):
+        fields = [(name, schema.compile())
+                  for name, schema in sorted(self.fields.items())]
+        check = self.check
+
+        def validate(value, path, errors):
+            if value is None:
+                value = {}
+            elif not isinstance(value, collections.abc.Mapping):
+                errors.append(
+                    '{}: Expected type "{}", but found type "{}"'.format(
+                        format_path(path) or '<document>', dict,
+                        type(value)))
+                value = {}
+            record = {}
+            count = len(errors)
+            for name, validate_field in fields:
+                record[name] = validate_field(
+                    value.get(name), (path, name), errors)
+            # Checks of the whole record assume valid fields
+            if check is not None and len(errors) == count:
+                problem = check(record)
+                if problem:
+                    errors.append('{}: {}'.format(
+                        format_path(path) or '<document>', problem))
+            return record
+        return validate
+
+
+class Validator(object):
+    """A schema compiled once, to validate any number of documents.
+
+    Each document is walked a single time, and every problem is
+    collected with the path of the field it is in, like
+    `volumes[1].name`, so all of them can be reported together.
+    """
+
+    def __init__(self, schema):
+        self._validate = schema.compile()
+
+    def validate(self, document, path=''):
+        """Validate and convert a document.
+
+        Args:
+            document (Any): Object decoded from yaml
+            path (str): Prefix of the paths in error messages
+
+        Returns:
+            (Any, [str]): Converted document, with defaults for missing
+                          fields, and each problem found
+        """
+        errors = []
+        value = self._validate(document, path, errors)
+        return value, errors
+
+    def check(self, document, path=''):
+        """Return the converted document.
+
+        Raises:
+            SchemaError: With every problem found
+        """
+        value, errors = self.validate(document, path)
+        if errors:
+            raise SchemaError(errors)
+        return value
+
+    def validate_batch(self, documents, path=''):
+        """Validate many documents.
+
+        Args:
+            documents ([Any]): Objects decoded from yaml
+            path (str): Prefix of the paths in error messages, followed
+                        by the index of the document
+
+        Returns:
+            ([Any], [str]): Converted documents, and every problem found
+                            in any of them
+        """
+        errors = []
+        values = [self._validate(document, (path, index), errors)
+                  for index, document in enumerate(documents)]
+        return values, errors
+
+
 def validate_arg_regex(flag_value, flag_regex):
     """Check a named command line flag against a regular expression"""
     if not re.match(flag_regex, flag_value):
@@ -91,6 +331,27 @@ def validate_arg_regex(flag_value, flag_regex):
     return flag_value
 
 
+def validate_arg_positive_int(flag_value):
+    """Parse a command line flag as an integer greater than zero"""
+    try:
+        value = int(flag_value)
+    except ValueError:
+        value = 0
+    if value < 1:
+        raise argparse.ArgumentTypeError(
+            'Value "{}" should be a positive integer'.format(flag_value))
+    return value
+
+
+def validate_arg_size(flag_value):
+    """Parse a command line flag as a size in bytes, like 10G"""
+    match = re.match(SIZE_REGEX, flag_value.upper())
+    if not match:
+        raise argparse.ArgumentTypeError(
+            'Value "{}" should be a size like 500M or 10G'.format(flag_value))
+    return int(match.group(1)) * SIZE_MULTIPLIERS[match.group(2)]
+
+
 def validate_arg_dict(flag_value):
     """Parse a command line flag as a key=val,... dict"""
     if not flag_value:
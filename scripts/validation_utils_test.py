@@ -57,6 +57,117 @@ def test_get_field_value_invalid(container, field_name, field_type):
         validation_utils.get_field_value(container, field_name, field_type)
 
 
+@pytest.mark.parametrize('container, field_name, field_type', [
+    ({'present': 1}, 'present', int),
+    ({'present': '1'}, 'present', str),
+    ({'present': True}, 'present', int),
+    ({}, 'missing', str),
+    ({'str_to_int': '1'}, 'str_to_int', int),
+    ({'int_to_str': 1}, 'int_to_str', str),
+    ({'int_to_float': 1}, 'int_to_float', float),
+    ({'None_to_int': None}, 'None_to_int', int),
+    ({'bad_list_to_str': [1]}, 'bad_list_to_str', str),
+    ({'bad_str_to_int': 'not_an_int'}, 'bad_str_to_int', int),
+    ({'bad_bool_to_str': False}, 'bad_bool_to_str', str),
+])
+def test_scalar_matches_get_field_value(container, field_name, field_type):
+    validator = validation_utils.Validator(validation_utils.Record(
+        {field_name: validation_utils.Scalar(field_type)}))
+    value, errors = validator.validate(container)
+    try:
+        expected = validation_utils.get_field_value(
+            container, field_name, field_type)
+    except ValueError:
+        assert errors and errors[0].startswith(field_name + ': ')
+    else:
+        assert value == {field_name: expected}
+        assert errors == []
+
+
+_SCHEMA = validation_utils.Record({
+    'name': validation_utils.Scalar(
+        str, check=lambda name: None if name else 'Name is required'),
+    'items': validation_utils.ListOf(validation_utils.Record({
+        'count': validation_utils.Scalar(int),
+    })),
+    'tags': validation_utils.ListOf(validation_utils.Scalar(str),
+                                    optional=True),
+}, check=lambda record: (
+    'Too many items' if len(record['items']) > 2 else None))
+
+
+def test_validator_defaults():
+    validator = validation_utils.Validator(_SCHEMA)
+    assert validator.check({'name': 'a', 'other': 'ignored'}) == {
+        'items': [], 'name': 'a', 'tags': None}
+
+
+def test_scalar_default():
+    validator = validation_utils.Validator(validation_utils.Record({
+        'enabled': validation_utils.Scalar(bool, default=True),
+        'size': validation_utils.Scalar(float, default=0.5),
+    }))
+    assert validator.check({}) == {'enabled': True, 'size': 0.5}
+    assert validator.check({'enabled': None, 'size': None}) == {
+        'enabled': True, 'size': 0.5}
+    assert validator.check({'enabled': False, 'size': 2}) == {
+        'enabled': False, 'size': 2.0}
+
+
+def test_validator_collects_all_errors():
+    validator = validation_utils.Validator(_SCHEMA)
+    value, errors = validator.validate({
+        'items': [{'count': '1'}, {'count': 'x'}, 'not_a_dict'],
+        'tags': 'not_a_list',
+    })
+    assert value['items'][0] == {'count': 1}
+    assert [error.split(':')[0] for error in errors] == [
+        'items[1].count', 'items[2]', 'name', 'tags']
+    # The record check only runs without other errors
+    assert not any('Too many' in error for error in errors)
+    with pytest.raises(validation_utils.SchemaError) as excinfo:
+        validator.check({'items': [{}, {}, {}], 'name': 'a'})
+    assert excinfo.value.errors == ['<document>: Too many items']
+
+
+def test_validator_batch():
+    validator = validation_utils.Validator(_SCHEMA)
+    values, errors = validator.validate_batch(
+        [{'name': 'a'}, {}, [], {'name': 'b'}], 'docs')
+    assert [value['name'] for value in values] == ['a', '', '', 'b']
+    assert errors == [
+        'docs[1].name: Name is required',
+        'docs[2]: Expected type "<class \'dict\'>", but found type '
+        '"<class \'list\'>"',
+        'docs[2].name: Name is required',
+    ]
+
+
+def test_list_of_scalars():
+    validator = validation_utils.Validator(validation_utils.Record({
+        'args': validation_utils.ListOf(validation_utils.Scalar(str)),
+    }))
+    args = ['a', 'b']
+    value = validator.check({'args': args})
+    assert value == {'args': ['a', 'b']}
+    assert value['args'] is not args
+    assert validator.check({'args': ['a', 1, 2.5, None]}) == {
+        'args': ['a', '1', '2.5', '']}
+    value, errors = validator.validate({'args': ['a', [1]]})
+    assert [error.split(':')[0] for error in errors] == ['args[1]']
+
+
+@pytest.mark.parametrize('path, expected', [
+    ('', ''),
+    ('steps', 'steps'),
+    (('', 'name'), 'name'),
+    ((('steps', 2), 'volumes'), 'steps[2].volumes'),
+    (((('', 'volumes'), 1), 'name'), 'volumes[1].name'),
+])
+def test_format_path(path, expected):
+    assert validation_utils.format_path(path) == expected
+
+
 def test_validate_arg_regex():
     assert validation_utils.validate_arg_regex(
         'abc', re.compile('a[b]c')) == 'abc'
@@ -64,6 +175,37 @@ def test_validate_arg_regex():
         validation_utils.validate_arg_regex('abc', re.compile('a[d]c'))
 
 
+@pytest.mark.parametrize('arg, expected', [
+    ('1', 1),
+    ('16', 16),
+])
+def test_validate_arg_positive_int_valid(arg, expected):
+    assert validation_utils.validate_arg_positive_int(arg) == expected
+
+
+@pytest.mark.parametrize('arg', ['', '0', '-1', '1.5', 'one'])
+def test_validate_arg_positive_int_invalid(arg):
+    with pytest.raises(argparse.ArgumentTypeError):
+        validation_utils.validate_arg_positive_int(arg)
+
+
+@pytest.mark.parametrize('arg, expected', [
+    ('0', 0),
+    ('1024', 1024),
+    ('2K', 2048),
+    ('500M', 500 * 1024 ** 2),
+    ('10g', 10 * 1024 ** 3),
+])
+def test_validate_arg_size_valid(arg, expected):
+    assert validation_utils.validate_arg_size(arg) == expected
+
+
+@pytest.mark.parametrize('arg', ['', '-1', '1.5G', '10X', 'G'])
+def test_validate_arg_size_invalid(arg):
+    with pytest.raises(argparse.ArgumentTypeError):
+        validation_utils.validate_arg_size(arg)
+
+
 @pytest.mark.parametrize('arg, expected', [
     # Normal case, field present and correct type
     ('', {}),
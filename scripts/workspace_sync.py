@@ -0,0 +1,435 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Keep a build workspace in sync with a source tree.
+
+A persistent workspace is reused by every build of the same source
+directory.  Only files whose size or modification time changed are
+copied, and files that no longer exist in the source are removed.
+Where the filesystem allows it, files are cloned (reflinked) or
+hardlinked rather than copied.
+"""
+
+import collections
+import errno
+import fcntl
+import hashlib
+import os
+import shutil
+import stat
+
+
+# How to put a file into the workspace.  `auto` clones files when the
+# filesystem supports it and copies them otherwise.  `hardlink` shares
+# files with the source tree, so steps must not modify them in place.
+LINK_MODE_AUTO = 'auto'
+LINK_MODE_COPY = 'copy'
+LINK_MODE_HARDLINK = 'hardlink'
+LINK_MODES = (LINK_MODE_AUTO, LINK_MODE_COPY, LINK_MODE_HARDLINK)
+
+# Linux ioctl to share the data blocks of one file with another
+FICLONE = 0x40049409
+
+# Never copied to the workspace, at any depth
+DEFAULT_EXCLUDES = ('.git',)
+
+# Counts of what a sync did.  `ignored` and `bytes_ignored` count the
+# source files left out by ignore rules.
+SyncStats = collections.namedtuple(
+    'SyncStats',
+    'bytes_copied bytes_ignored copied deleted ignored linked unchanged')
+
+
+def default_workspace_root():
+    """Return the directory holding persistent workspaces"""
+    cache_home = (os.environ.get('XDG_CACHE_HOME') or
+                  os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_home, 'local_cloudbuild', 'workspaces')
+
+
+def persistent_workspace_dir(source_dir, workspace_root):
+    """Return the persistent workspace for a source directory.
+
+    Args:
+        source_dir (str): Directory containing the build source
+        workspace_root (str): Directory holding persistent workspaces
+
+    Returns:
+        str: Path that is the same for every build of `source_dir`
+    """
+    real_source_dir = os.path.realpath(source_dir)
+    key = hashlib.sha256(real_source_dir.encode('utf8')).hexdigest()[:16]
+    name = '{}-{}'.format(os.path.basename(real_source_dir) or 'root', key)
+    return os.path.join(workspace_root, name)
+
+
+def _unchanged(src_stat, dst_stat, link_mode):
+    """Return True if the workspace copy of a file is up to date"""
+    if link_mode == LINK_MODE_HARDLINK:
+        return (src_stat.st_dev, src_stat.st_ino) == (
+            dst_stat.st_dev, dst_stat.st_ino)
+    return (stat.S_IFMT(src_stat.st_mode) == stat.S_IFMT(dst_stat.st_mode) and
+            src_stat.st_size == dst_stat.st_size and
+            src_stat.st_mtime_ns == dst_stat.st_mtime_ns)
+
+
+def remove_path(path):
+    """Remove a file, symlink or directory tree"""
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+class _Syncer(object):
+    """Copies files for a single sync, remembering what the filesystem
+    doesn't support so it is only tried once."""
+
+    def __init__(self, link_mode):
+        self.link_mode = link_mode
+        self.can_clone = link_mode == LINK_MODE_AUTO
+        self.can_link = link_mode == LINK_MODE_HARDLINK
+        self.bytes_copied = 0
+        self.copied = 0
+        self.linked = 0
+
+    def put_file(self, src, dst, src_stat):
+        """Create `dst` with the contents and metadata of `src`"""
+        if self.can_link:
+            try:
+                os.link(src, dst)
+                self.linked += 1
+                return
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+                self.can_link = False
+        if self.can_clone:
+            try:
+                self._clone(src, dst)
+                shutil.copystat(src, dst)
+                self.linked += 1
+                return
+            except OSError as e:
+                if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY,
+                                   errno.EXDEV, errno.EINVAL,
+                                   errno.ENOSYS):
+                    raise
+                self.can_clone = False
+                os.remove(dst)
+        shutil.copy2(src, dst)
+        self.bytes_copied += src_stat.st_size
+        self.copied += 1
+
+    @staticmethod
+    def _clone(src, dst):
+        with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+            fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+
+
+def _tree_size(path):
+    """Return the number of files below a directory and their total size"""
+    count = 0
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                size += os.lstat(os.path.join(dirpath, name)).st_size
+            except FileNotFoundError:
+                continue
+            count += 1
+    return count, size
+
+
+def _drop_ignored(src_root, rel_root, dirnames, filenames, excludes, ignore):
+    """Remove the names an os.walk step lists that ignore rules match.
+
+    Returns:
+        (int, int): Number of files left out and their total size
+    """
+    ignored = 0
+    bytes_ignored = 0
+    prefix = '' if rel_root == '.' else rel_root + os.sep
+    kept = []
+    for name in dirnames:
+        if (ignore.is_ignored(prefix + name, is_dir=True) and
+                ignore.can_skip_directory(prefix + name)):
+            count, size = _tree_size(os.path.join(src_root, name))
+            ignored += count
+            bytes_ignored += size
+        else:
+            kept.append(name)
+    dirnames[:] = kept
+    kept = []
+    for name in filenames:
+        if name in excludes:
+            continue
+        if ignore.is_ignored(prefix + name):
+            ignored += 1
+            bytes_ignored += os.lstat(os.path.join(src_root, name)).st_size
+        else:
+            kept.append(name)
+    filenames[:] = kept
+    return ignored, bytes_ignored
+
+
+def scan_tree(source_dir, excludes=DEFAULT_EXCLUDES, ignore=None):
+    """Count what sync_tree would stage into an empty directory.
+
+    Nothing is copied.  Files that would be staged count as copied.
+
+    Args:
+        source_dir (str): Directory to copy from
+        excludes (tuple): File and directory names to skip at any depth
+        ignore (ignore_rules.IgnoreRules): Rules for source paths to
+                                           skip, or None
+
+    Returns:
+        SyncStats: What a sync would do
+    """
+    copied = 0
+    bytes_copied = 0
+    ignored = 0
+    bytes_ignored = 0
+    for src_root, dirnames, filenames in os.walk(source_dir):
+        dirnames[:] = [name for name in dirnames if name not in excludes]
+        rel_root = os.path.relpath(src_root, source_dir)
+        if ignore is not None:
+            count, size = _drop_ignored(
+                src_root, rel_root, dirnames, filenames, excludes, ignore)
+            ignored += count
+            bytes_ignored += size
+        # os.walk lists symlinks to directories with directories
+        links = [name for name in dirnames
+                 if os.path.islink(os.path.join(src_root, name))]
+        for name in filenames + links:
+            if name not in excludes:
+                copied += 1
+                bytes_copied += os.lstat(os.path.join(src_root, name)).st_size
+    return SyncStats(
+        bytes_copied=bytes_copied,
+        bytes_ignored=bytes_ignored,
+        copied=copied,
+        deleted=0,
+        ignored=ignored,
+        linked=0,
+        unchanged=0,
+    )
+
+
+def sync_tree(source_dir, dest_dir, link_mode=LINK_MODE_AUTO,
+              excludes=DEFAULT_EXCLUDES, ignore=None, ignore_prefix=''):
+    """Make `dest_dir` a copy of `source_dir`, doing as little as possible.
+
+    Args:
+        source_dir (str): Directory to copy from
+        dest_dir (str): Directory to copy to, created if missing
+        link_mode (str): One of LINK_MODES
+        excludes (tuple): File and directory names to skip at any depth
+        ignore (ignore_rules.IgnoreRules): Rules for source paths to
+                                           skip, or None
+        ignore_prefix (str): Path of `source_dir` relative to the
+                             directory the ignore rules are for
+
+    Returns:
+        SyncStats: What was done
+    """
+    if link_mode not in LINK_MODES:
+        raise ValueError('Invalid link mode {!r}, expected one of {}'.format(
+            link_mode, LINK_MODES))
+    syncer = _Syncer(link_mode)
+    deleted = 0
+    unchanged = 0
+    ignored = 0
+    bytes_ignored = 0
+    os.makedirs(dest_dir, exist_ok=True)
+    for src_root, dirnames, filenames in os.walk(source_dir):
+        dirnames[:] = [name for name in dirnames if name not in excludes]
+        rel_root = os.path.relpath(src_root, source_dir)
+        dst_root = os.path.normpath(os.path.join(dest_dir, rel_root))
+        if ignore is not None:
+            count, size = _drop_ignored(
+                src_root, os.path.normpath(os.path.join(ignore_prefix,
+                                                        rel_root)),
+                dirnames, filenames, excludes, ignore)
+            ignored += count
+            bytes_ignored += size
+
+        # Remove anything the source no longer has
+        wanted = set(dirnames).union(filenames).difference(excludes)
+        for name in os.listdir(dst_root):
+            if name not in wanted:
+                remove_path(os.path.join(dst_root, name))
+                deleted += 1
+
+        for name in dirnames:
+            dst = os.path.join(dst_root, name)
+            src = os.path.join(src_root, name)
+            if os.path.islink(src):
+                # os.walk lists symlinks to directories with directories
+                filenames.append(name)
+            elif os.path.lexists(dst) and not (
+                    os.path.isdir(dst) and not os.path.islink(dst)):
+                remove_path(dst)
+                os.mkdir(dst)
+            elif not os.path.lexists(dst):
+                os.mkdir(dst)
+
+        for name in filenames:
+            if name in excludes:
+                continue
+            src = os.path.join(src_root, name)
+            dst = os.path.join(dst_root, name)
+            src_stat = os.lstat(src)
+            try:
+                dst_stat = os.lstat(dst)
+            except FileNotFoundError:
+                dst_stat = None
+            if dst_stat is not None:
+                if stat.S_ISLNK(src_stat.st_mode):
+                    if (stat.S_ISLNK(dst_stat.st_mode) and
+                            os.readlink(src) == os.readlink(dst)):
+                        unchanged += 1
+                        continue
+                elif _unchanged(src_stat, dst_stat, link_mode):
+                    unchanged += 1
+                    continue
+                # Never write through the old file, which might be a
+                # hardlink to the source
+                remove_path(dst)
+            if stat.S_ISLNK(src_stat.st_mode):
+                os.symlink(os.readlink(src), dst)
+                syncer.copied += 1
+            else:
+                syncer.put_file(src, dst, src_stat)
+    return SyncStats(
+        bytes_copied=syncer.bytes_copied,
+        bytes_ignored=bytes_ignored,
+        copied=syncer.copied,
+        deleted=deleted,
+        ignored=ignored,
+        linked=syncer.linked,
+        unchanged=unchanged,
+    )
+
+
+def sync_paths(source_dir, dest_dir, paths, link_mode=LINK_MODE_AUTO,
+               ignore=None):
+    """Bring only some files of `dest_dir` up to date with `source_dir`.
+
+    Unlike sync_tree, files that exist only in `dest_dir` are kept
+    unless they are listed, so outputs of earlier build steps survive.
+
+    Args:
+        source_dir (str): Directory to copy from
+        dest_dir (str): Directory to copy to
+        paths ([str]): Files relative to `source_dir` that were created,
+                       modified or deleted
+        link_mode (str): One of LINK_MODES
+        ignore (ignore_rules.IgnoreRules): Rules for source paths to
+                                           skip, or None
+
+    Returns:
+        SyncStats: What was done
+    """
+    if link_mode not in LINK_MODES:
+        raise ValueError('Invalid link mode {!r}, expected one of {}'.format(
+            link_mode, LINK_MODES))
+    syncer = _Syncer(link_mode)
+    deleted = 0
+    ignored = 0
+    bytes_ignored = 0
+    for rel_path in paths:
+        src = os.path.join(source_dir, rel_path)
+        dst = os.path.join(dest_dir, rel_path)
+        is_dir = os.path.isdir(src) and not os.path.islink(src)
+        if ignore is not None and ignore.is_ignored(rel_path, is_dir=is_dir):
+            if not is_dir:
+                ignored += 1
+                if os.path.lexists(src):
+                    bytes_ignored += os.lstat(src).st_size
+                continue
+            # Unless rules bring back some of its contents, which
+            # sync_tree then stages
+            if ignore.can_skip_directory(rel_path):
+                count, size = _tree_size(src)
+                ignored += count
+                bytes_ignored += size
+                continue
+        if os.path.lexists(dst):
+            remove_path(dst)
+            if not os.path.lexists(src):
+                deleted += 1
+        try:
+            src_stat = os.lstat(src)
+        except FileNotFoundError:
+            continue
+        parent = os.path.dirname(dst)
+        if os.path.lexists(parent) and not os.path.isdir(parent):
+            remove_path(parent)
+        os.makedirs(parent, exist_ok=True)
+        if stat.S_ISLNK(src_stat.st_mode):
+            os.symlink(os.readlink(src), dst)
+            syncer.copied += 1
+        elif stat.S_ISDIR(src_stat.st_mode):
+            stats = sync_tree(src, dst, link_mode, ignore=ignore,
+                              ignore_prefix=rel_path)
+            syncer.copied += stats.copied
+            syncer.linked += stats.linked
+            syncer.bytes_copied += stats.bytes_copied
+            ignored += stats.ignored
+            bytes_ignored += stats.bytes_ignored
+        else:
+            syncer.put_file(src, dst, src_stat)
+    return SyncStats(
+        bytes_copied=syncer.bytes_copied,
+        bytes_ignored=bytes_ignored,
+        copied=syncer.copied,
+        deleted=deleted,
+        ignored=ignored,
+        linked=syncer.linked,
+        unchanged=0,
+    )
+
+
+def format_stats(stats):
+    """Describe a sync in one line"""
+    line = ('{} files unchanged, {} copied ({} bytes), {} linked, '
+            '{} removed'.format(stats.unchanged, stats.copied,
+                                stats.bytes_copied, stats.linked,
+                                stats.deleted))
+    if stats.ignored:
+        line += ', {} ignored ({} bytes)'.format(
+            stats.ignored, stats.bytes_ignored)
+    return line
+
+
+def format_savings(stats, source):
+    """Describe how much staging was saved by ignore rules.
+
+    Args:
+        stats (SyncStats): Result of a full sync_tree
+        source (str): Name of the file the rules came from
+
+    Returns:
+        str: One line
+    """
+    staged = stats.unchanged + stats.copied + stats.linked
+    total = staged + stats.ignored
+    return ('Skipped {} of {} files ({} bytes) matching {}'.format(
+        stats.ignored, total, stats.bytes_ignored, source) +
+        (', {:.0%} of the files'.format(stats.ignored / total)
+         if total else ''))
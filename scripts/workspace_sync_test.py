@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+
+# Copyright 2017 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Unit test for workspace_sync.py"""
+
+import os
+
+import pytest
+
+import ignore_rules
+import workspace_sync
+
+
+@pytest.fixture
+def source_dir(tmpdir):
+    source_dir = tmpdir.mkdir('source')
+    source_dir.join('top.txt').write('top')
+    source_dir.mkdir('subdir').join('nested.txt').write('nested')
+    source_dir.mkdir('.git').join('HEAD').write('ref')
+    source_dir.join('subdir', 'link').mksymlinkto('nested.txt')
+    return source_dir
+
+
+def _tree(root):
+    """Map of relative path to contents (or symlink target)"""
+    tree = {}
+    for dirpath, dirnames, filenames in os.walk(str(root)):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            rel_path = os.path.relpath(path, str(root))
+            if os.path.islink(path):
+                tree[rel_path] = '-> ' + os.readlink(path)
+            else:
+                with open(path) as f:
+                    tree[rel_path] = f.read()
+    return tree
+
+
+def test_persistent_workspace_dir():
+    first = workspace_sync.persistent_workspace_dir('/src/app', '/root')
+    assert first == workspace_sync.persistent_workspace_dir(
+        '/src/app/', '/root')
+    assert first.startswith('/root/app-')
+    assert first != workspace_sync.persistent_workspace_dir(
+        '/other/app', '/root')
+
+
+@pytest.mark.parametrize('link_mode', workspace_sync.LINK_MODES)
+def test_sync_tree(tmpdir, source_dir, link_mode):
+    dest_dir = tmpdir.join('dest')
+    stats = workspace_sync.sync_tree(str(source_dir), str(dest_dir),
+                                     link_mode)
+    expected = {
+        'top.txt': 'top',
+        os.path.join('subdir', 'nested.txt'): 'nested',
+        os.path.join('subdir', 'link'): '-> nested.txt',
+    }
+    assert _tree(dest_dir) == expected
+    assert stats.copied + stats.linked == 3
+    assert stats.unchanged == 0
+
+    # Nothing to do the second time
+    stats = workspace_sync.sync_tree(str(source_dir), str(dest_dir),
+                                     link_mode)
+    assert stats == workspace_sync.SyncStats(
+        bytes_copied=0, bytes_ignored=0, copied=0, deleted=0, ignored=0,
+        linked=0, unchanged=3)
+
+    # Changes and deletions are picked up, leftover outputs are removed
+    source_dir.join('top.txt').remove()
+    source_dir.join('top.txt').write('changed top')
+    source_dir.join('subdir', 'nested.txt').remove()
+    dest_dir.join('output.txt').write('from an earlier build')
+    stats = workspace_sync.sync_tree(str(source_dir), str(dest_dir),
+                                     link_mode)
+    assert _tree(dest_dir) == {
+        'top.txt': 'changed top',
+        os.path.join('subdir', 'link'): '-> nested.txt',
+    }
+    assert stats.deleted == 2
+    assert stats.unchanged == 1
+
+
+def test_sync_tree_ignore(tmpdir, source_dir):
+    source_dir.mkdir('node_modules').join('big.js').write('x' * 100)
+    source_dir.join('subdir', 'debug.log').write('log')
+    ignore_file = tmpdir.join('.gcloudignore')
+    ignore_file.write('node_modules/\n*.log\n')
+    ignore = ignore_rules.IgnoreRules(
+        ignore_rules.parse_gcloudignore(str(ignore_file)))
+    dest_dir = tmpdir.join('dest')
+    dest_dir.ensure('node_modules', 'stale.js').write('stale')
+    stats = workspace_sync.sync_tree(str(source_dir), str(dest_dir), 'copy',
+                                     ignore=ignore)
+    # Ignored files are not staged, and removed if they were before
+    assert _tree(dest_dir) == {
+        'top.txt': 'top',
+        os.path.join('subdir', 'nested.txt'): 'nested',
+        os.path.join('subdir', 'link'): '-> nested.txt',
+    }
+    assert stats.ignored == 2
+    assert stats.bytes_ignored == 103
+    assert workspace_sync.format_savings(stats, '.gcloudignore') == (
+        'Skipped 2 of 5 files (103 bytes) matching .gcloudignore, 40% of '
+        'the files')
+
+
+def test_scan_tree(tmpdir, source_dir):
+    source_dir.mkdir('node_modules').join('big.js').write('x' * 100)
+    source_dir.join('subdir', 'debug.log').write('log')
+    ignore_file = tmpdir.join('.gcloudignore')
+    ignore_file.write('node_modules/\n*.log\n')
+    ignore = ignore_rules.IgnoreRules(
+        ignore_rules.parse_gcloudignore(str(ignore_file)))
+    stats = workspace_sync.scan_tree(str(source_dir), ignore=ignore)
+    # The same counts as a sync into an empty directory
+    dest_dir = tmpdir.join('dest')
+    synced = workspace_sync.sync_tree(str(source_dir), str(dest_dir), 'copy',
+                                      ignore=ignore)
+    assert (stats.copied, stats.ignored, stats.bytes_ignored) == (
+        synced.copied, synced.ignored, synced.bytes_ignored)
+    assert workspace_sync.scan_tree(str(source_dir)).ignored == 0
+
+
+def test_sync_tree_ignore_exceptions(tmpdir, source_dir):
+    source_dir.mkdir('docs').join('keep.md').write('keep')
+    source_dir.join('docs', 'drop.md').write('drop')
+    ignore_file = tmpdir.join('.dockerignore')
+    ignore_file.write('docs\n!docs/keep.md\n')
+    ignore = ignore_rules.IgnoreRules(
+        ignore_rules.parse_dockerignore(str(ignore_file)),
+        ignore_rules.STYLE_DOCKER)
+    dest_dir = tmpdir.join('dest')
+    stats = workspace_sync.sync_tree(str(source_dir), str(dest_dir), 'copy',
+                                     ignore=ignore)
+    assert os.path.join('docs', 'keep.md') in _tree(dest_dir)
+    assert os.path.join('docs', 'drop.md') not in _tree(dest_dir)
+    assert stats.ignored == 1
+
+
+def test_sync_tree_copy_does_not_share_files(tmpdir, source_dir):
+    dest_dir = tmpdir.join('dest')
+    workspace_sync.sync_tree(str(source_dir), str(dest_dir), 'copy')
+    dest_dir.join('top.txt').write('modified by a step')
+    assert source_dir.join('top.txt').read() == 'top'
+
+
+def test_sync_tree_hardlink(tmpdir, source_dir):
+    dest_dir = tmpdir.join('dest')
+    workspace_sync.sync_tree(str(source_dir), str(dest_dir), 'hardlink')
+    assert os.path.samefile(str(source_dir.join('top.txt')),
+                            str(dest_dir.join('top.txt')))
+
+
+def test_sync_tree_type_changes(tmpdir, source_dir):
+    dest_dir = tmpdir.join('dest')
+    workspace_sync.sync_tree(str(source_dir), str(dest_dir), 'copy')
+    # File replaced by directory and vice versa
+    source_dir.join('top.txt').remove()
+    source_dir.mkdir('top.txt').join('inside.txt').write('inside')
+    source_dir.join('subdir').remove()
+    source_dir.join('subdir').write('now a file')
+    workspace_sync.sync_tree(str(source_dir), str(dest_dir), 'copy')
+    assert _tree(dest_dir) == {
+        os.path.join('top.txt', 'inside.txt'): 'inside',
+        'subdir': 'now a file',
+    }
+
+
+def test_sync_tree_invalid_link_mode(tmpdir, source_dir):
+    with pytest.raises(ValueError):
+        workspace_sync.sync_tree(str(source_dir), str(tmpdir.join('dest')),
+                                 'bogus')
+
+
+@pytest.mark.parametrize('link_mode', workspace_sync.LINK_MODES)
+def test_sync_paths(tmpdir, source_dir, link_mode):
+    dest_dir = tmpdir.join('dest')
+    workspace_sync.sync_tree(str(source_dir), str(dest_dir), link_mode)
+    dest_dir.join('output.txt').write('from a step')
+    source_dir.join('top.txt').remove()
+    source_dir.join('top.txt').write('changed top')
+    source_dir.mkdir('new').join('file.txt').write('new')
+    source_dir.join('subdir', 'nested.txt').remove()
+    stats = workspace_sync.sync_paths(
+        str(source_dir), str(dest_dir),
+        ['top.txt', os.path.join('new', 'file.txt'),
+         os.path.join('subdir', 'nested.txt')], link_mode)
+    # Step outputs that weren't listed are kept
+    assert _tree(dest_dir) == {
+        'top.txt': 'changed top',
+        'output.txt': 'from a step',
+        os.path.join('new', 'file.txt'): 'new',
+        os.path.join('subdir', 'link'): '-> nested.txt',
+    }
+    assert stats.copied + stats.linked == 2
+    assert stats.deleted == 1
+
+
+def test_sync_paths_ignore(tmpdir, source_dir):
+    dest_dir = tmpdir.join('dest')
+    workspace_sync.sync_tree(str(source_dir), str(dest_dir), 'copy')
+    source_dir.join('debug.log').write('log')
+    ignore_file = tmpdir.join('.gcloudignore')
+    ignore_file.write('*.log\n')
+    ignore = ignore_rules.IgnoreRules(
+        ignore_rules.parse_gcloudignore(str(ignore_file)))
+    stats = workspace_sync.sync_paths(str(source_dir), str(dest_dir),
+                                      ['debug.log'], 'copy', ignore)
+    assert not dest_dir.join('debug.log').check()
+    assert stats.ignored == 1
+
+
+def test_sync_paths_ignore_directory(tmpdir, source_dir):
+    """New directories are staged without their ignored contents"""
+    dest_dir = tmpdir.join('dest')
+    workspace_sync.sync_tree(str(source_dir), str(dest_dir), 'copy')
+    package = source_dir.mkdir('pkg')
+    package.join('main.py').write('main')
+    package.join('secret.txt').write('secret')
+    package.mkdir('__pycache__').join('main.pyc').write('pyc')
+    source_dir.mkdir('build').join('out.bin').write('binary')
+    ignore_file = tmpdir.join('.gcloudignore')
+    ignore_file.write('__pycache__/\nbuild/\npkg/secret.txt\n')
+    ignore = ignore_rules.IgnoreRules(
+        ignore_rules.parse_gcloudignore(str(ignore_file)))
+    stats = workspace_sync.sync_paths(str(source_dir), str(dest_dir),
+                                      ['pkg', 'build'], 'copy', ignore)
+    assert dest_dir.join('pkg', 'main.py').check()
+    assert not dest_dir.join('pkg', 'secret.txt').check()
+    assert not dest_dir.join('pkg', '__pycache__').check()
+    assert not dest_dir.join('build').check()
+    assert (stats.copied, stats.ignored, stats.bytes_ignored) == (1, 3, 15)
+
+
+def test_format_stats():
+    stats = workspace_sync.SyncStats(
+        bytes_copied=100, bytes_ignored=0, copied=2, deleted=3, ignored=0,
+        linked=4, unchanged=5)
+    assert workspace_sync.format_stats(stats) == (
+        '5 files unchanged, 2 copied (100 bytes), 4 linked, 3 removed')
+    stats = stats._replace(bytes_ignored=50, ignored=6)
+    assert workspace_sync.format_stats(stats) == (
+        '5 files unchanged, 2 copied (100 bytes), 4 linked, 3 removed, '
+        '6 ignored (50 bytes)')
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])